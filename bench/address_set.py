@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+"""Measure the memory and the lookup time of a monitor watch list, as a set of address strings and as a compact
+address set, and the false positive rate of the compact set Bloom filter.
+
+Usage: python bench/address_set.py [num_addresses]
+"""
+
+import os
+import sys
+from time import time
+import tracemalloc
+
+from stellar_base.utils import encode_check
+
+from kin.stellar.address_set import CompactAddressSet, _address_hash
+
+
+def random_addresses(n):
+    return [encode_check('account', os.urandom(32)).decode() for _ in range(n)]
+
+
+def measure(name, build, addresses, others):
+    start = time()
+    build(addresses)
+    built = time() - start
+
+    tracemalloc.start()
+    watched = build(addresses)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # the addresses are copied, as the operation addresses of the monitored transactions are
+    hits = [str(address + ' ')[:-1] for address in addresses[:len(others)]]
+    start = time()
+    assert all(address in watched for address in hits)
+    hit = (time() - start) / len(hits)
+    start = time()
+    assert not any(address in watched for address in others)
+    miss = (time() - start) / len(others)
+    print('{:<20} {:>7.1f} MB, built in {:5.1f} sec, {:5.2f} us per address in the set, {:5.2f} us per other '
+          'address'.format(name + ':', memory / 1e6, built, hit * 1e6, miss * 1e6))
+    return watched
+
+
+def main():
+    num_addresses = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    addresses = random_addresses(num_addresses)
+    others = random_addresses(100000)
+
+    print('addresses: {}'.format(num_addresses))
+    # the strings are copied, so that their memory is counted
+    measure('set of strings', lambda strings: set(string.encode().decode() for string in strings), addresses, others)
+    compact = measure('compact address set', CompactAddressSet, addresses, others)
+
+    _, bloom, _, _ = compact._state
+    passed = sum(bloom.check(_address_hash(address)) for address in others)
+    print('bloom filter false positives: {:.2%}'.format(passed / float(len(others))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+"""Measure how fast the past transactions of a set of accounts are found in a range of ledgers, against a fake Horizon
+with request latency: walking the transactions page by page in one thread, and with a sharded LedgerBackfill.
+
+Usage: python bench/backfill.py [num_transactions] [latency_sec] [workers]
+"""
+
+import logging
+import sys
+from time import time
+
+from stellar_base.keypair import Keypair
+
+import kin
+from kin.monitor import get_operations, match_transaction
+from kin.stellar.builder import Builder
+from kin.stellar.fake_horizon import FakeHorizonServer
+from kin.stellar.horizon import Horizon, MAX_PAGE_LIMIT
+from kin.stellar.horizon_models import TransactionData
+
+
+def submit_payments(server, addresses, num_transactions):
+    """Apply payments to the addresses, a ledger each."""
+    keypair = Keypair.random()
+    server.fund(keypair.address().decode())
+    builder = Builder(secret=keypair.seed(), horizon=Horizon(horizon_uri=server.url), network='TESTNET',
+                      manage_sequence=True)
+    for i in range(num_transactions):
+        builder.append_payment_op(addresses[i % len(addresses)], 1)
+        builder.sign()
+        server.network.submit(builder.gen_xdr())
+        builder.next()
+
+
+def walk(horizon, watched, first, last):
+    """Find the transactions the way it is done without a backfill: one page after the other."""
+    found = []
+    params = {'cursor': str(first << 32), 'limit': MAX_PAGE_LIMIT}
+    for tx in horizon.iterate('/transactions/', params=params, prefetch=False):
+        if tx['ledger'] > last:
+            break
+        tx['operations'] = get_operations(horizon, tx)
+        tx_data = TransactionData(tx, strict=False)
+        address = match_transaction(tx_data, watched)
+        if address is not None:
+            found.append((address, tx_data))
+    return found
+
+
+def main():
+    num_transactions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    logging.getLogger().setLevel(logging.ERROR)
+
+    with FakeHorizonServer() as server:
+        addresses = [Keypair.random().address().decode() for _ in range(100)]
+        for address in addresses:
+            server.fund(address)
+        first = server.network.ledger_sequence + 1
+        submit_payments(server, addresses, num_transactions)
+        last = server.network.ledger_sequence
+        watched = set(addresses[:10])
+
+        server.latency = latency
+        horizon = Horizon(horizon_uri=server.url)
+        print('transactions: {}, ledgers: {}, latency: {} sec'.format(num_transactions, last - first + 1, latency))
+
+        start = time()
+        found = walk(horizon, watched, first, last)
+        elapsed = time() - start
+        print('{:<30} {} found in {:.2f} sec, {:.0f} transactions/sec'.format(
+            'one thread:', len(found), elapsed, num_transactions / elapsed))
+
+        shard_size = max(1, (last - first + 1) // (workers * 2))
+        start = time()
+        found = list(kin.LedgerBackfill(horizon, watched, first, last, shard_size=shard_size, workers=workers))
+        elapsed = time() - start
+        print('{:<30} {} found in {:.2f} sec, {:.0f} transactions/sec'.format(
+            'backfill, {} workers:'.format(workers), len(found), elapsed, num_transactions / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+"""Measure several processes sending transactions with the same channels against a fake Horizon, like the workers of
+a pre-fork server, with every process using all the channels and with channel leases.
+
+Usage: python bench/channel_leases.py [num_processes] [num_channels] [transactions_per_process]
+"""
+
+from functools import partial
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+from time import time
+
+from stellar_base.keypair import Keypair
+
+from kin.stellar.channel_leases import ChannelLeases
+from kin.stellar.channel_manager import ChannelManager
+from kin.stellar.fake_horizon import FakeHorizonServer
+from kin.stellar.horizon import Horizon
+
+
+def worker(url, base_key, channel_keys, lease_directory, num_transactions, results):
+    leases = ChannelLeases(lease_directory) if lease_directory else None
+    channel_manager = ChannelManager(base_key, channel_keys, 'TESTNET', Horizon(horizon_uri=url, backoff_factor=0.05),
+                                     leases=leases)
+    address = Keypair.from_seed(base_key).address().decode()
+    errors = 0
+    for i in range(num_transactions):
+        try:
+            # a unique memo, so that colliding transactions do not have the same hash
+            channel_manager.send_transaction(lambda builder: partial(builder.append_payment_op, address, 1),
+                                             memo_text='{}-{}'.format(os.getpid(), i))
+        except Exception:
+            errors += 1
+    results.put(errors)
+
+
+def run(server, num_processes, num_channels, num_transactions, lease_directory):
+    keypair = Keypair.random()
+    server.fund(keypair.address().decode())
+    channel_keys = []
+    for _ in range(num_channels):
+        channel = Keypair.random()
+        server.fund(channel.address().decode())
+        channel_keys.append(channel.seed().decode())
+    posts = server.request_counts['POST /transactions']
+
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(server.url, keypair.seed().decode(), channel_keys,
+                                                              lease_directory, num_transactions, results))
+                 for _ in range(num_processes)]
+    start = time()
+    for p in processes:
+        p.start()
+    errors = sum(results.get() for _ in processes)
+    for p in processes:
+        p.join()
+    elapsed = time() - start
+
+    sent = num_processes * num_transactions
+    return (sent - errors) / elapsed, errors, (server.request_counts['POST /transactions'] - posts) / float(sent)
+
+
+def main():
+    num_processes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    num_channels = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    num_transactions = int(sys.argv[3]) if len(sys.argv) > 3 else 25
+
+    print('processes: {}, channels: {}, transactions per process: {}'.format(
+        num_processes, num_channels, num_transactions))
+    lease_directory = tempfile.mkdtemp()
+    try:
+        with FakeHorizonServer(latency=0.02) as server:
+            for name, directory in [('all channels per process', None), ('channel leases', lease_directory)]:
+                rate, errors, posts = run(server, num_processes, num_channels, num_transactions, directory)
+                print('{:<25} {:.1f} transactions/sec, {} failed, {:.2f} submits per transaction'.format(
+                    name + ':', rate, errors, posts))
+    finally:
+        shutil.rmtree(lease_directory)
+
+
+if __name__ == '__main__':
+    main()
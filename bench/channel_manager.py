@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+"""Measure ChannelManager throughput per channel against a fake Horizon with simulated latency, and with several
+transactions in flight per channel against a fake Horizon closing ledgers periodically.
+
+Usage: python bench/channel_manager.py [latency_ms] [num_transactions]
+"""
+
+from functools import partial
+import sys
+import threading
+from time import time
+
+from stellar_base.keypair import Keypair
+
+from kin.stellar.channel_manager import ChannelManager
+from kin.stellar.fake_horizon import FakeHorizonServer
+from kin.stellar.horizon import Horizon
+
+
+def run(server, manage_sequence, num_transactions):
+    keypair = Keypair.random()
+    server.fund(keypair.address().decode())
+    base_key = keypair.seed()
+    channel_manager = ChannelManager(base_key, [base_key], 'TESTNET', Horizon(horizon_uri=server.url))
+    channel_manager.channel_builders.queue[0].manage_sequence = manage_sequence
+
+    address = keypair.address().decode()
+    start = time()
+    for _ in range(num_transactions):
+        channel_manager.send_transaction(lambda builder: partial(builder.append_payment_op, address, 1))
+    return num_transactions / (time() - start)
+
+
+def run_pipelined(server, max_in_flight, num_transactions):
+    keypair = Keypair.random()
+    address = keypair.address().decode()
+    server.fund(address)
+    base_key = keypair.seed()
+    horizon = Horizon(horizon_uri=server.url, pool_size=max_in_flight)
+    channel_manager = ChannelManager(base_key, [base_key], 'TESTNET', horizon, max_in_flight=max_in_flight)
+
+    def send(count):
+        for _ in range(count):
+            channel_manager.send_transaction(lambda builder: partial(builder.append_payment_op, address, 1))
+
+    # as many senders as transactions in flight
+    threads = [threading.Thread(target=send, args=(num_transactions // max_in_flight,)) for _ in range(max_in_flight)]
+    start = time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return num_transactions // max_in_flight * max_in_flight / (time() - start)
+
+
+def main():
+    latency = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.02
+    num_transactions = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    print('latency: {:.0f} ms, transactions: {}'.format(latency * 1000, num_transactions))
+    with FakeHorizonServer(latency=latency) as server:
+        print('sequence fetched per transaction: {:.1f} submits/sec per channel'.format(
+            run(server, False, num_transactions)))
+        print('sequence tracked locally:         {:.1f} submits/sec per channel'.format(
+            run(server, True, num_transactions)))
+
+    ledger_close_time = 0.5
+    print('ledger close time: {} sec, transactions: {}'.format(ledger_close_time, num_transactions))
+    with FakeHorizonServer(ledger_close_time=ledger_close_time, sequence_wait=10) as server:
+        for max_in_flight in [1, 5, 25]:
+            print('{:>2} transactions in flight:        {:.1f} submits/sec per channel'.format(
+                max_in_flight, run_pipelined(server, max_in_flight, num_transactions)))
+
+
+if __name__ == '__main__':
+    main()
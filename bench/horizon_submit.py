@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+"""Measure transaction submit through ChannelManager and Horizon.submit when a fraction of the submit requests fail,
+against a fake Horizon with injected failures.
+
+Usage: python bench/horizon_submit.py [num_transactions] [backoff_factor]
+"""
+
+from functools import partial
+import logging
+import sys
+from time import time
+
+from stellar_base.keypair import Keypair
+
+from kin.stellar.channel_manager import ChannelManager
+from kin.stellar.fake_horizon import FakeHorizonServer
+from kin.stellar.horizon import Horizon
+
+FAULTS = [
+    # status, rate, whether the transaction still gets into the ledger
+    (None, 0, False),
+    (504, 0.1, False),
+    (504, 0.1, True),
+    (429, 0.1, False),
+    (503, 0.1, False),
+]
+
+
+def run(status, rate, apply, num_transactions, backoff_factor):
+    with FakeHorizonServer(seed=1) as server:
+        keypair = Keypair.random()
+        address = keypair.address().decode()
+        server.fund(address)
+        # the fake closes a ledger on every transaction, no need to wait long for a timed out one
+        horizon = Horizon(horizon_uri=server.url, backoff_factor=backoff_factor, settle_timeout=0.1)
+        channel_manager = ChannelManager(keypair.seed(), [keypair.seed()], 'TESTNET', horizon)
+        if status:
+            server.fail_randomly(status, rate, method='POST', apply=apply)
+
+        errors = 0
+        start = time()
+        for _ in range(num_transactions):
+            try:
+                channel_manager.send_transaction(lambda builder: partial(builder.append_payment_op, address, 1))
+            except Exception:
+                errors += 1
+        elapsed = time() - start
+        return errors, num_transactions / elapsed, server.request_counts['POST /transactions'] / num_transactions
+
+
+def main():
+    num_transactions = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    backoff_factor = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+    logging.getLogger().setLevel(logging.ERROR)  # no retry warnings
+
+    print('transactions: {}, backoff factor: {}'.format(num_transactions, backoff_factor))
+    print('{:<24} {:>8} {:>12} {:>14}'.format('failures', 'errors', 'submits/sec', 'POSTs per tx'))
+    for status, rate, apply in FAULTS:
+        errors, rate_per_sec, posts = run(status, rate, apply, num_transactions, backoff_factor)
+        name = '{} {:.0%}{}'.format(status, rate, ' (applied)' if apply else '') if status else 'none'
+        print('{:<24} {:>8} {:>12.1f} {:>14.2f}'.format(name, errors, rate_per_sec, posts))
+
+
+if __name__ == '__main__':
+    main()
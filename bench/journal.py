@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+"""Measure how many transactions a second the transaction journal records, with concurrent senders sharing disk syncs.
+
+Usage: python bench/journal.py [directory] [num_transactions]
+"""
+
+import binascii
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from time import time
+
+from kin.stellar.journal import TransactionJournal, APPLIED
+
+ENVELOPE = 'A' * 300  # about the size of a base64 encoded payment envelope
+
+
+def run(directory, num_threads, num_transactions):
+    path = os.path.join(directory, 'journal-{}'.format(num_threads))
+    journal = TransactionJournal(path)
+
+    def send(count):
+        for _ in range(count):
+            tx_hash = binascii.hexlify(os.urandom(32)).decode()
+            journal.record(tx_hash, ENVELOPE)
+            journal.resolve(tx_hash, APPLIED)
+
+    threads = [threading.Thread(target=send, args=(num_transactions // num_threads,)) for _ in range(num_threads)]
+    start = time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time() - start
+
+    stats = journal.stats()
+    journal.close()
+    os.remove(path)
+    return num_transactions // num_threads * num_threads / elapsed, stats['records'] / 2.0 / stats['syncs']
+
+
+def main():
+    directory = sys.argv[1] if len(sys.argv) > 1 else None
+    num_transactions = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    tmp_directory = None
+    if directory is None:
+        directory = tmp_directory = tempfile.mkdtemp(dir='.')
+    try:
+        print('directory: {}, transactions: {}'.format(directory, num_transactions))
+        for num_threads in [1, 10, 50]:
+            rate, per_sync = run(directory, num_threads, num_transactions)
+            print('{:>2} senders: {:8.0f} transactions/sec, {:5.1f} transactions per disk sync'.format(
+                num_threads, rate, per_sync))
+    finally:
+        if tmp_directory:
+            shutil.rmtree(tmp_directory)
+
+
+if __name__ == '__main__':
+    main()
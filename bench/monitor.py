@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+"""Measure how fast the SDK transaction monitor delivers transactions, against a fake Horizon.
+The transactions are applied to the fake network first, and their records are then replayed to the monitor as
+transaction stream events, so that the monitor is the bottleneck. The events are replayed twice: without their
+envelopes, so that the monitor fetches the operations of every transaction from Horizon, and as streamed, with the
+operations decoded from the envelopes.
+
+Usage: python bench/monitor.py [num_transactions] [num_addresses]
+"""
+
+from collections import namedtuple
+import json
+import logging
+import sys
+import threading
+from time import time
+
+from stellar_base.keypair import Keypair
+
+import kin
+from kin.stellar.builder import Builder
+from kin.stellar.fake_horizon import FakeHorizonServer
+from kin.stellar.horizon import Horizon
+
+Event = namedtuple('Event', 'event data')
+
+
+def sign_payments(server, addresses, num_transactions):
+    keypair = Keypair.random()
+    server.fund(keypair.address().decode())
+    builder = Builder(secret=keypair.seed(), horizon=Horizon(horizon_uri=server.url), network='TESTNET',
+                      manage_sequence=True)
+    envelopes = []
+    for i in range(num_transactions):
+        builder.append_payment_op(addresses[i % len(addresses)], 1)
+        builder.sign()
+        envelopes.append(builder.gen_xdr())
+        builder.next()
+    return envelopes
+
+
+def record_events(server, addresses, num_transactions):
+    """Apply the transactions and get their stream events."""
+    for envelope in sign_payments(server, addresses, num_transactions):
+        server.network.submit(envelope)
+    records = list(Horizon(horizon_uri=server.url).iterate('/transactions/', params={'order': 'desc', 'limit': 200}))
+    return [Event('message', json.dumps(record)) for record in reversed(records[:num_transactions])]
+
+
+def replay(server, addresses, events):
+    """Replay the events to a monitor of the addresses, and measure how long it takes to deliver them."""
+    received = []
+    done = threading.Event()
+
+    def callback(address, tx_data):
+        received.append(tx_data)
+        if len(received) == len(events):
+            done.set()
+
+    # several addresses are monitored with the global transactions stream
+    sdk = kin.SDK(horizon_endpoint_uri=server.url, network='TESTNET')
+    query = sdk.horizon.transactions
+    sdk.horizon.transactions = lambda params=None, sse=False: iter(events) if sse else query(params)
+    server.request_counts.clear()
+
+    start = time()
+    monitor = sdk.monitor_accounts_transactions(addresses, callback)
+    done.wait(300)
+    elapsed = time() - start
+    monitor.stop()
+    gets = sum(count for request, count in server.request_counts.items() if request.startswith('GET'))
+    return len(received), elapsed, gets
+
+
+def strip_envelope(event):
+    record = json.loads(event.data)
+    del record['envelope_xdr']
+    return Event(event.event, json.dumps(record))
+
+
+def main():
+    num_transactions = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    num_addresses = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    logging.getLogger().setLevel(logging.ERROR)
+
+    with FakeHorizonServer() as server:
+        addresses = [Keypair.random().address().decode() for _ in range(num_addresses)]
+        for address in addresses:
+            server.fund(address)
+        events = record_events(server, addresses, num_transactions)
+
+        print('transactions: {}, monitored addresses: {}'.format(num_transactions, num_addresses))
+        for name, replayed in [('operations fetched', [strip_envelope(event) for event in events]),
+                               ('operations decoded', events)]:
+            received, elapsed, gets = replay(server, addresses, replayed)
+            print('{:<20} {} delivered in {:.2f} sec, {:.1f} transactions/sec, {:.2f} GET requests per '
+                  'transaction'.format(name + ':', received, elapsed, received / elapsed,
+                                       gets / float(num_transactions)))
+
+
+if __name__ == '__main__':
+    main()
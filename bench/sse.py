@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+"""Measure how fast server-sent events are read from a stream of transaction records, with the built-in SSE reader
+and with sseclient, if installed. The records of transactions applied to a fake network are served by a local HTTP
+server as a chunked event stream, an event per chunk, like Horizon does, so that the readers are the bottleneck.
+
+Usage: python bench/sse.py [num_transactions] [rounds]
+"""
+
+import json
+import logging
+import sys
+import threading
+from time import time
+
+from stellar_base.keypair import Keypair
+
+from kin.stellar.builder import Builder
+from kin.stellar.fake_horizon import FakeHorizonServer
+from kin.stellar.horizon import Horizon
+from kin.stellar.sse import EventStream
+
+try:
+    from sseclient import SSEClient
+except ImportError:
+    SSEClient = None
+
+if sys.version[0] == '2':
+    # noinspection PyUnresolvedReferences
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    # noinspection PyUnresolvedReferences
+    from SocketServer import ThreadingMixIn
+else:
+    # noinspection PyUnresolvedReferences
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    # noinspection PyUnresolvedReferences
+    from socketserver import ThreadingMixIn
+
+
+def record_events(num_transactions):
+    """Apply payments to a fake network, and get the stream events of their transaction records."""
+    with FakeHorizonServer() as server:
+        keypair = Keypair.random()
+        server.fund(keypair.address().decode())
+        address = Keypair.random().address().decode()
+        server.fund(address)
+        builder = Builder(secret=keypair.seed(), horizon=Horizon(horizon_uri=server.url), network='TESTNET',
+                          manage_sequence=True)
+        for _ in range(num_transactions):
+            builder.append_payment_op(address, 1)
+            builder.sign()
+            server.network.submit(builder.gen_xdr())
+            builder.next()
+        records = Horizon(horizon_uri=server.url).iterate('/transactions/', params={'limit': 200})
+        return [u'id: {}\ndata: {}\n\n'.format(record['paging_token'], json.dumps(record)).encode('utf-8')
+                for record in records]
+
+
+class StreamServer(ThreadingMixIn, HTTPServer):
+    """Serves the events as a chunked stream, and keeps the connection open once they are sent."""
+    daemon_threads = True
+
+    def __init__(self, events):
+        self.events = events
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StreamHandler)
+        self.url = 'http://127.0.0.1:{}/transactions'.format(self.server_address[1])
+
+
+class StreamHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for event in self.server.events:
+                self.wfile.write('{:x}\r\n'.format(len(event)).encode() + event + b'\r\n')
+            self.wfile.flush()
+            self.rfile.read(1)  # until the client is gone
+        except IOError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def read(stream, num_events):
+    """Read the data of the events, and the time it took."""
+    start = time()
+    size = 0
+    for i, event in enumerate(stream):
+        size += len(event.data)
+        if i + 1 == num_events:
+            break
+    return time() - start, size
+
+
+def main():
+    num_transactions = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    logging.getLogger().setLevel(logging.ERROR)
+
+    events = record_events(num_transactions)
+    server = StreamServer(events)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    print('events: {}, average size: {} bytes'.format(len(events), sum(len(event) for event in events) // len(events)))
+
+    readers = [('built-in reader:', lambda: EventStream(server.url))]
+    if SSEClient is not None:
+        readers.append(('sseclient:', lambda: SSEClient(server.url)))
+    else:
+        print('sseclient not installed, not compared')
+
+    for name, reader in readers:
+        best = None
+        for _ in range(rounds):
+            stream = reader()
+            elapsed, size = read(stream, len(events))
+            stream.resp.close()
+            best = elapsed if best is None else min(best, elapsed)
+        print('{:<20} {:.3f} sec, {:.0f} events/sec, {:.1f} MB/sec'.format(
+            name, best, len(events) / best, size / best / 1e6))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
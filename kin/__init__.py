@@ -1,5 +1,20 @@
 from .sdk import SDK
+from .backfill import LedgerBackfill
 from .config import *
 from .errors import *
+from .monitor import TransactionMonitor
+from .payment_batcher import PaymentBatcher, PaymentFuture
+from .stellar.address_set import CompactAddressSet
+from .stellar.channel_leases import ChannelLeases
+from .stellar.checkpoint import FileCheckpoint, SqliteCheckpoint
+from .stellar.channel_manager import PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+from .stellar.channel_scaler import ChannelScaler
+from .stellar.journal import TransactionJournal
 from .stellar.horizon_models import AccountData, TransactionData
+from .stellar.query_cache import QueryCache, PermanentCache
+from .stellar.throttling import RateLimiter, CircuitBreaker
 from .version import __version__
+
+import sys
+if sys.version_info >= (3, 6):  # asyncio support
+    from .async_sdk import AsyncSDK
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+import json
+from functools import partial
+
+from stellar_base.keypair import Keypair
+
+from .config import *
+from .errors import *
+from .monitor import match_transaction
+from .stellar.address_set import CompactAddressSet
+from .stellar.async_channel_manager import AsyncChannelManager
+from .stellar.async_horizon import AsyncHorizon
+from .stellar.envelope import decode_operations
+from .stellar.horizon import HORIZON_LIVE, HORIZON_TEST
+from .stellar.horizon_models import AccountData, TransactionData
+from .stellar.utils import *
+from .version import __version__
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class AsyncSDK(object):
+    """
+    The :class:`kin.AsyncSDK` class is an asyncio counterpart of :class:`kin.SDK`, having the same functions as
+    coroutines. Monitoring functions are asynchronous generators instead of callbacks.
+
+    The wallet and channel accounts are checked by :meth:`check_setup`, which is called automatically when the
+    SDK is used as an asynchronous context manager:
+
+        async with kin.AsyncSDK(secret_key='my key') as sdk:
+            await sdk.send_kin('address', 1000)
+    """
+
+    def __init__(self, secret_key='', horizon_endpoint_uri='', network='PUBLIC',
+                 channel_secret_keys=None, kin_asset=None):
+        """Create a new instance of the asynchronous KIN SDK for Stellar. The parameters are the same as
+        for :class:`kin.SDK`.
+
+        :raises: ValueError: if some of the configuration parameters are invalid.
+        """
+        channel_secret_keys = channel_secret_keys or []
+        self.network = network or 'PUBLIC'
+
+        # init our asset
+        if kin_asset:
+            self.kin_asset = kin_asset
+        else:
+            self.kin_asset = KIN_ASSET_PROD if self.network == 'PUBLIC' else KIN_ASSET_TEST
+
+        # set connection pool size for channels + monitoring connection + extra
+        pool_size = max(1, len(channel_secret_keys)) + 2
+
+        if not horizon_endpoint_uri:
+            horizon_endpoint_uri = HORIZON_TEST if self.network == 'TESTNET' else HORIZON_LIVE
+        self.horizon = AsyncHorizon(horizon_uri=horizon_endpoint_uri, pool_size=pool_size, user_agent=SDK_USER_AGENT)
+
+        # init sdk wallet account if a secret key is supplied
+        self.base_keypair = None
+        if secret_key:
+            # check wallet key
+            if not is_valid_secret_key(secret_key):
+                raise ValueError('invalid secret key: {}'.format(secret_key))
+
+            # check channel keys
+            for channel_key in channel_secret_keys:
+                if not is_valid_secret_key(channel_key):
+                    raise ValueError('invalid channel key: {}'.format(channel_key))
+
+            self.base_keypair = Keypair.from_seed(secret_key)
+            self.base_address = self.base_keypair.address().decode()
+            self.channel_addresses = [Keypair.from_seed(channel_key).address().decode()
+                                      for channel_key in channel_secret_keys]
+
+            # init channel manager
+            self.channel_manager = AsyncChannelManager(secret_key, channel_secret_keys or [secret_key],
+                                                       self.network, self.horizon)
+
+        logger.info('Kin async SDK inited on network {}, horizon endpoint {}'
+                    .format(self.network, self.horizon.horizon_uri))
+
+    async def __aenter__(self):
+        await self.check_setup()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def check_setup(self):
+        """Check that the SDK wallet account exists and is activated, and that the channel accounts exist.
+
+        :raises: :class:`kin.AccountNotFoundError`: if SDK wallet or channel account is not yet created.
+        :raises: :class:`kin.AccountNotActivatedError`: if SDK wallet account is not yet activated.
+        :raises: :class:`kin.NetworkError`: if there is a problem connecting to Horizon.
+        """
+        if not self.base_keypair:
+            return
+        await self._get_account_asset_balance(self.base_address, self.kin_asset)
+        for channel_address in self.channel_addresses:
+            await self.get_account_data(channel_address)
+
+    async def close(self):
+        """Close the connections to Horizon."""
+        await self.horizon.close()
+
+    async def get_status(self):
+        """Get system configuration data and online status."""
+        status = {
+            'sdk_version': __version__,
+            'network': self.network,
+            'address': None,
+            'kin_asset': {
+                'code': self.kin_asset.code,
+                'issuer': self.kin_asset.issuer
+            },
+            'horizon': {
+                'uri': self.horizon.horizon_uri,
+                'online': False,
+                'error': None,
+            },
+            'transport': {
+                'pool_size': self.horizon.pool_size,
+                'num_retries': self.horizon.num_retries,
+                'request_timeout': self.horizon.request_timeout,
+                'retry_statuses': self.horizon.status_forcelist,
+                'backoff_factor': self.horizon.backoff_factor,
+            },
+            'channels': None,
+        }
+        if self.base_keypair:
+            status['address'] = self.get_address()
+            status['channels'] = {
+                'all': self.channel_manager.num_channels,
+                'free': self.channel_manager.channel_builders.qsize()
+            }
+
+        # now check Horizon connection
+        try:
+            await self.horizon.query('')
+            status['horizon']['online'] = True
+        except Exception as e:
+            status['horizon']['error'] = str(e)
+
+        return status
+
+    def get_address(self):
+        """Get the address of the SDK wallet account.
+
+        :return: public address of the wallet.
+        :rtype: str
+
+        :raises: :class:`kin.SdkError`: if the SDK wallet is not configured.
+        """
+        if not self.base_keypair:
+            raise SdkError('address not configured')
+        return self.base_address
+
+    async def get_native_balance(self):
+        """Get native (lumen) balance of the SDK wallet. See :meth:`kin.SDK.get_native_balance`."""
+        return await self.get_account_native_balance(self.get_address())
+
+    async def get_kin_balance(self):
+        """Get KIN balance of the SDK wallet. See :meth:`kin.SDK.get_kin_balance`."""
+        return await self.get_account_kin_balance(self.get_address())
+
+    async def get_account_native_balance(self, address):
+        """Get native (lumen) balance of an account. See :meth:`kin.SDK.get_account_native_balance`."""
+        return await self._get_account_asset_balance(address, Asset.native())
+
+    async def get_account_kin_balance(self, address):
+        """Get KIN balance of an account. See :meth:`kin.SDK.get_account_kin_balance`."""
+        return await self._get_account_asset_balance(address, self.kin_asset)
+
+    async def create_account(self, address, starting_balance=MIN_ACCOUNT_BALANCE, memo_text=None, activate=False):
+        """Create an account identified by the provided address. See :meth:`kin.SDK.create_account`."""
+        if not self.base_keypair:
+            raise SdkError('address not configured')
+
+        if not is_valid_address(address):
+            raise ValueError('invalid address: {}'.format(address))
+
+        try:
+            pretrusted_asset = self.kin_asset if activate else None
+            reply = await self.channel_manager.send_transaction(lambda builder:
+                                                                partial(builder.append_create_account_op, address,
+                                                                        starting_balance,
+                                                                        pretrusted_asset=pretrusted_asset),
+                                                                memo_text=memo_text)
+            return reply['hash']
+        except Exception as e:
+            raise translate_error(e)
+
+    async def check_account_exists(self, address):
+        """Check whether an account exists. See :meth:`kin.SDK.check_account_exists`."""
+        try:
+            await self.get_account_data(address)
+            return True
+        except AccountNotFoundError:
+            return False
+
+    async def check_account_activated(self, address):
+        """Check if an account is activated. See :meth:`kin.SDK.check_account_activated`."""
+        return await self._check_asset_trusted(address, self.kin_asset)
+
+    async def send_native(self, address, amount, memo_text=None):
+        """Send lumens to an account. See :meth:`kin.SDK.send_native`."""
+        return await self._send_asset(Asset.native(), address, amount, memo_text)
+
+    async def send_kin(self, address, amount, memo_text=None):
+        """Send KIN to an account. See :meth:`kin.SDK.send_kin`."""
+        return await self._send_asset(self.kin_asset, address, amount, memo_text)
+
+    async def get_account_data(self, address):
+        """Get account data. See :meth:`kin.SDK.get_account_data`."""
+        if not is_valid_address(address):
+            raise ValueError('invalid address: {}'.format(address))
+
+        try:
+            acc = await self.horizon.account(address)
+            return AccountData(acc, strict=False)
+        except Exception as e:
+            err = translate_error(e)
+            raise AccountNotFoundError(address) if isinstance(err, ResourceNotFoundError) else err
+
+    async def get_transaction_data(self, tx_hash):
+        """Get transaction data. See :meth:`kin.SDK.get_transaction_data`."""
+        if not is_valid_transaction_hash(tx_hash):
+            raise ValueError('invalid transaction hash: {}'.format(tx_hash))
+
+        try:
+            tx = await self.horizon.transaction(tx_hash)
+
+            tx['operations'] = await self._get_transaction_operations(tx['hash'])
+            return TransactionData(tx, strict=False)
+        except Exception as e:
+            raise translate_error(e)
+
+    def monitor_kin_payments(self):
+        """Monitor KIN payment transactions related to the SDK wallet account.
+
+        :return: an asynchronous generator of `(address, tx_data)` tuples.
+        :rtype: async generator of (str, :class:`kin.TransactionData`)
+
+        :raises: :class:`kin.SdkError` if the SDK wallet is not configured.
+        """
+        return self.monitor_accounts_kin_payments([self.get_address()])
+
+    def monitor_accounts_kin_payments(self, addresses):
+        """Monitor KIN payment transactions related to the accounts identified by provided addresses.
+
+        :param addresses: the addresses of the accounts to query. See :meth:`kin.SDK.monitor_accounts_transactions`.
+        :type: list of str or :class:`kin.CompactAddressSet`
+
+        :return: an asynchronous generator of `(address, tx_data)` tuples.
+        :rtype: async generator of (str, :class:`kin.TransactionData`)
+        """
+        return self._monitor_accounts_asset_transactions(self.kin_asset, addresses, only_payments=True)
+
+    def monitor_accounts_transactions(self, addresses):
+        """Monitor transactions related to the accounts identified by provided addresses (all transaction types).
+
+        :param addresses: the addresses of the accounts to query. See :meth:`kin.SDK.monitor_accounts_transactions`.
+        :type: list of str or :class:`kin.CompactAddressSet`
+
+        :return: an asynchronous generator of `(address, tx_data)` tuples.
+        :rtype: async generator of (str, :class:`kin.TransactionData`)
+        """
+        return self._monitor_accounts_asset_transactions(None, addresses)
+
+    # Helpers
+
+    async def _get_account_asset_balance(self, address, asset):
+        if not asset.is_native() and not is_valid_address(asset.issuer):
+            raise ValueError('invalid asset issuer: {}'.format(asset.issuer))
+
+        acc_data = await self.get_account_data(address)
+
+        for balance in acc_data.balances:
+            if (balance.asset_type == 'native' and asset.code == 'XLM') \
+                    or (balance.asset_code == asset.code and balance.asset_issuer == asset.issuer):
+                return balance.balance
+
+        raise AccountNotActivatedError(address)
+
+    async def _get_transaction_operations(self, tx_hash):
+        """Get all the operations of a transaction, however many pages they take."""
+        return [op async for op in self.horizon.iterate('/transactions/' + tx_hash + '/operations/', prefetch=False)]
+
+    async def _get_streamed_operations(self, tx):
+        """Get the operations of a streamed transaction, as :func:`kin.monitor.get_operations` does."""
+        try:
+            return decode_operations(tx)
+        except ValueError as e:
+            logger.debug(e)
+            return await self._get_transaction_operations(tx['hash'])
+
+    async def _check_asset_trusted(self, address, asset):
+        try:
+            await self._get_account_asset_balance(address, asset)
+            return True
+        except AccountNotActivatedError:
+            return False
+
+    async def _send_asset(self, asset, address, amount, memo_text=None):
+        if not self.base_keypair:
+            raise SdkError('address not configured')
+
+        if not is_valid_address(address):
+            raise ValueError('invalid address: {}'.format(address))
+
+        if amount <= 0:
+            raise ValueError('amount must be positive')
+
+        if not asset.is_native() and not is_valid_address(asset.issuer):
+            raise ValueError('invalid asset issuer: {}'.format(asset.issuer))
+
+        try:
+            reply = await self.channel_manager.send_transaction(lambda builder:
+                                                                partial(builder.append_payment_op, address, amount,
+                                                                        asset_type=asset.code,
+                                                                        asset_issuer=asset.issuer),
+                                                                memo_text=memo_text)
+            return reply['hash']
+        except Exception as e:
+            raise translate_error(e)
+
+    async def _monitor_accounts_asset_transactions(self, asset, addresses, only_payments=False):
+        """An asynchronous generator of transactions related to the accounts identified by provided addresses.
+        If asset is given, only the transactions for this asset will be returned.
+        """
+        if asset and not asset.is_native() and not is_valid_address(asset.issuer):
+            raise ValueError('invalid asset issuer: {}'.format(asset.issuer))
+
+        if not addresses:
+            raise ValueError('no addresses to monitor')
+
+        if isinstance(addresses, CompactAddressSet):
+            watched = addresses  # validated when added. Not checked to exist, that takes a request per address
+        else:
+            for address in addresses:
+                if not is_valid_address(address):
+                    raise ValueError('invalid address: {}'.format(address))
+
+            for address in addresses:
+                if not await self.check_account_exists(address):
+                    raise AccountNotFoundError(addresses)
+            watched = set(addresses)  # matched against every operation
+        single = next(iter(watched)) if len(watched) == 1 else None
+
+        # Currently, due to nonstandard SSE implementation in Horizon, using cursor=now will hang.
+        # Instead, we determine the cursor ourselves.
+        params = {}
+        if single:
+            reply = await self.horizon.account_transactions(single, params={'order': 'desc', 'limit': 2})
+        else:
+            reply = await self.horizon.transactions(params={'order': 'desc', 'limit': 2})
+
+        if len(reply['_embedded']['records']) == 2:
+            cursor = TransactionData(reply['_embedded']['records'][1], strict=False).paging_token
+            params = {'cursor': cursor}
+
+        if single:
+            events = await self.horizon.account_transactions(single, sse=True, params=params)
+        else:
+            events = await self.horizon.transactions(sse=True, params=params)
+
+        try:
+            async for event in events:
+                if event.event != 'message':
+                    continue
+                try:
+                    tx = json.loads(event.data)
+
+                    tx['operations'] = await self._get_streamed_operations(tx)
+
+                    # deserialize
+                    tx_data = TransactionData(tx, strict=False)
+                except Exception as ex:
+                    logger.exception(ex)
+                    continue
+
+                address = match_transaction(tx_data, watched, asset, only_payments, single)
+                if address is not None:
+                    yield address, tx_data
+        finally:
+            events.close()
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+import threading
+
+from .monitor import get_operations, match_transaction
+from .stellar.address_set import CompactAddressSet
+from .stellar.horizon import MAX_PAGE_LIMIT
+from .stellar.horizon_models import TransactionData
+from .stellar.utils import is_valid_address
+
+import logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARD_SIZE = 1000  # ledgers per shard
+DEFAULT_WORKERS = 4  # shards fetched at once
+SHARDS_AHEAD = 2  # shards fetched ahead of the one being yielded, per worker
+
+
+class LedgerBackfill(object):
+    """
+    The class :class:`kin.LedgerBackfill` finds the past transactions related to a set of accounts in a range of
+    ledgers, to rebuild a record of payments, for example. The range is split into shards of `shard_size` ledgers,
+    fetched at once by `workers` threads, and the matching transactions are yielded in ledger order.
+
+    A shard is fetched page by page from the transactions endpoint, starting at the paging token of its first ledger,
+    so that empty ledgers take no request. The requests go through the Horizon rate limiter, if any, shared with the
+    other users of the Horizon. At most `workers` * `SHARDS_AHEAD` shards are fetched ahead of the one being yielded.
+
+    With a checkpoint store, the last ledger of every shard whose transactions were all yielded is saved, and a
+    backfill created with the same store resumes from the next shard.
+    """
+
+    def __init__(self, horizon, addresses, first_ledger, last_ledger, asset=None, only_payments=False,
+                 shard_size=DEFAULT_SHARD_SIZE, workers=DEFAULT_WORKERS, checkpoint=None):
+        """Create a backfill. Nothing is fetched until it is iterated over.
+
+        :param horizon: the Horizon to fetch the transactions from.
+        :type: :class:`kin.stellar.horizon.Horizon`
+
+        :param addresses: the addresses of the accounts to find the transactions of.
+        :type: list of str or :class:`kin.CompactAddressSet`
+
+        :param int first_ledger: the sequence of the first ledger of the range.
+
+        :param int last_ledger: the sequence of the last ledger of the range, included.
+
+        :param asset: (optional) the asset of the operations to match. All the operations are matched if not given.
+        :type: :class:`stellar_base.asset.Asset`
+
+        :param boolean only_payments: (optional) whether to match payment operations only.
+
+        :param int shard_size: (optional) the number of ledgers per shard.
+
+        :param int workers: (optional) the number of shards fetched at once.
+
+        :param checkpoint: (optional) the store to save the last ledger backfilled to, and to resume from.
+        :type: :class:`kin.FileCheckpoint` or :class:`kin.SqliteCheckpoint`
+
+        :raises: ValueError: if one of the provided addresses has a wrong format.
+        :raises: ValueError: if the ledger range, shard size or number of workers is invalid.
+        """
+        if not 0 < first_ledger <= last_ledger:
+            raise ValueError('invalid ledger range: {} - {}'.format(first_ledger, last_ledger))
+        if shard_size < 1 or workers < 1:
+            raise ValueError('shard size and workers must be positive')
+
+        if isinstance(addresses, CompactAddressSet):
+            self.watched = addresses
+        else:
+            for address in addresses:
+                if not is_valid_address(address):
+                    raise ValueError('invalid address: {}'.format(address))
+            self.watched = set(addresses)
+
+        self.horizon = horizon
+        self.asset = asset
+        self.only_payments = only_payments
+        self.workers = workers
+        self.checkpoint = checkpoint
+
+        saved = checkpoint.load() if checkpoint is not None else None
+        if saved:
+            first_ledger = max(first_ledger, int(saved) + 1)
+        self.shards = [(start, min(start + shard_size - 1, last_ledger))
+                       for start in range(first_ledger, last_ledger + 1, shard_size)]
+
+        self.shards_done = 0  # shards whose transactions were all yielded
+        self.transactions = 0  # transactions fetched
+        self.matched = 0  # transactions yielded
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        """Fetch the shards, and yield the matching transactions in ledger order.
+
+        :return: a generator of the addresses the transactions matched, and the transactions.
+        :rtype: generator of (str, :class:`kin.TransactionData`)
+
+        :raises: :class:`kin.stellar.errors.HorizonError`: if a shard cannot be fetched, once the shards before it
+            are yielded.
+        """
+        state = _FetchState(len(self.shards), self.workers * SHARDS_AHEAD)
+        for _ in range(min(self.workers, len(self.shards))):
+            t = threading.Thread(target=self._work, args=(state,))
+            t.daemon = True
+            t.start()
+
+        try:
+            for index, (_, last) in enumerate(self.shards):
+                matches = state.result(index)
+                for address, tx_data in matches:
+                    with self._lock:
+                        self.matched += 1
+                    yield address, tx_data
+                if self.checkpoint is not None:
+                    self.checkpoint.save(str(last))
+                with self._lock:
+                    self.shards_done += 1
+        finally:
+            state.stop()  # also when the caller stops iterating
+
+    def stats(self):
+        """Get the numbers of shards and of shards done, and the numbers of transactions fetched and yielded.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {'shards': len(self.shards), 'shards_done': self.shards_done,
+                    'transactions': self.transactions, 'matched': self.matched}
+
+    def _work(self, state):
+        while True:
+            index = state.take()
+            if index is None:
+                return
+            try:
+                state.done(index, self._fetch(state, *self.shards[index]))
+            except Exception as e:
+                logger.warning('backfill of ledgers {} - {} failed: {}'.format(self.shards[index][0],
+                                                                             self.shards[index][1], e))
+                state.done(index, error=e)
+
+    def _fetch(self, state, first, last):
+        """Get the matching transactions of a shard."""
+        matches = []
+        # the paging tokens of the transactions of a ledger follow the ledger sequence shifted by 32 bits
+        params = {'cursor': str(first << 32), 'limit': MAX_PAGE_LIMIT}
+        for tx in self.horizon.iterate('/transactions/', params=params, prefetch=False):
+            if tx['ledger'] > last or state.stopped:
+                break
+            with self._lock:
+                self.transactions += 1
+            tx['operations'] = get_operations(self.horizon, tx)
+            tx_data = TransactionData(tx, strict=False)
+            address = match_transaction(tx_data, self.watched, self.asset, self.only_payments)
+            if address is not None:
+                matches.append((address, tx_data))
+        return matches
+
+
+class _FetchState(object):
+    """The shards taken by the workers and the shards fetched, with at most `ahead` shards taken past the one being
+    yielded.
+    """
+    def __init__(self, num_shards, ahead):
+        self.num_shards = num_shards
+        self.ahead = ahead
+        self.stopped = False
+        self._next = 0  # the next shard to take
+        self._yielding = 0  # the shard being yielded
+        self._results = {}  # shard index -> (matches, error)
+        self._cond = threading.Condition()
+
+    def take(self):
+        """Get the next shard to fetch, waiting while too far ahead, or None when there are no more."""
+        with self._cond:
+            while not self.stopped and self._next < self.num_shards and self._next >= self._yielding + self.ahead:
+                self._cond.wait()
+            if self.stopped or self._next >= self.num_shards:
+                return None
+            self._next += 1
+            return self._next - 1
+
+    def done(self, index, matches=None, error=None):
+        with self._cond:
+            self._results[index] = (matches, error)
+            self._cond.notify_all()
+
+    def result(self, index):
+        """Wait for a shard to be fetched, and get its matching transactions.
+
+        :raises: the error the shard failed with.
+        """
+        with self._cond:
+            self._yielding = index
+            self._cond.notify_all()
+            while index not in self._results:
+                self._cond.wait()
+            matches, error = self._results.pop(index)
+        if error is not None:
+            raise error
+        return matches
+
+    def stop(self):
+        with self._cond:
+            self.stopped = True
+            self._cond.notify_all()
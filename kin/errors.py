@@ -6,6 +6,15 @@ from requests.exceptions import RequestException
 
 from .stellar.errors import *
 
+# transport exceptions, including the ones of the optional asyncio transport
+NETWORK_EXCEPTIONS = (RequestException,)
+try:
+    import asyncio
+    import aiohttp
+    NETWORK_EXCEPTIONS += (aiohttp.ClientError, asyncio.TimeoutError)
+except ImportError:
+    pass
+
 
 # All exceptions should subclass from SdkError in this module.
 class SdkError(Exception):
@@ -97,10 +106,12 @@ class InternalError(SdkError):
 
 def translate_error(err):
     """A high-level error translator."""
-    if isinstance(err, RequestException):
+    if isinstance(err, NETWORK_EXCEPTIONS):
         return NetworkError({'internal_error': str(err)})
     if isinstance(err, ChannelsBusyError):
-        return ThrottleError
+        return ThrottleError()
+    if isinstance(err, CircuitOpenError):
+        return ServerError('circuit_open')
     if isinstance(err, HorizonError):
         return translate_horizon_error(err)
     return InternalError(None, {'internal_error': str(err)})
@@ -160,9 +171,9 @@ def translate_transaction_error(tx_error):
 
 
 def translate_operation_error(op_result_codes):
-    """Operation error translator."""
-    # NOTE: we currently handle only one operation per transaction!
-    op_result_code = op_result_codes[0]
+    """Operation error translator. In a multi-operation transaction, the first failed operation is translated."""
+    failed_codes = [code for code in op_result_codes if code != PaymentResultCode.SUCCESS]
+    op_result_code = failed_codes[0] if failed_codes else op_result_codes[0]
     if op_result_code == OperationResultCode.BAD_AUTH \
             or op_result_code == CreateAccountResultCode.MALFORMED \
             or op_result_code == PaymentResultCode.NO_ISSUER \
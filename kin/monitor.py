@@ -0,0 +1,529 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+from collections import OrderedDict
+import json
+import sys
+import threading
+from time import time
+
+from .stellar.address_set import CompactAddressSet
+from .stellar.envelope import decode_operations
+from .stellar.horizon_models import TransactionData
+from .stellar.utils import is_valid_address
+
+import logging
+logger = logging.getLogger(__name__)
+
+if sys.version[0] == '2':
+    # noinspection PyUnresolvedReferences
+    import Queue as queue
+else:
+    # noinspection PyUnresolvedReferences
+    import queue as queue
+
+DEFAULT_MAX_ACCOUNT_STREAMS = 5  # above as many addresses, the global transactions stream is used
+RECENT_TRANSACTIONS = 10000  # hashes of the transactions delivered lately, so that a transaction is delivered once
+STREAM_RETRY_TIME = 1  # seconds before opening a stream again, after it failed to open
+DEFAULT_CHECKPOINT_EVENTS = 100  # transactions processed between checkpoints
+DEFAULT_CHECKPOINT_INTERVAL = 5  # seconds between checkpoints, while transactions are processed
+DEFAULT_QUEUE_SIZE = 1000  # transactions queued per callback worker, before the streams wait
+DISPATCH_TIMEOUT = 1  # seconds between checks for stop, while waiting for a full worker queue
+
+# stream modes
+ACCOUNT_STREAMS = 'accounts'  # a stream of the transactions of every watched account
+GLOBAL_STREAM = 'global'  # a single stream of all the transactions
+
+
+class TransactionMonitor(object):
+    """
+    The class :class:`kin.TransactionMonitor` monitors the transactions related to a set of accounts, calling a
+    callback with every matching transaction. Accounts can be added and removed while monitoring, without restarting.
+
+    While there are up to `max_account_streams` watched accounts, every account has a stream of its own
+    transactions. With more accounts, a single stream of all the transactions is matched against the watched
+    addresses instead. The streams are switched as accounts are added and removed, the new streams starting where
+    the slowest of the old ones was, so that no transaction is missed. A transaction seen on several streams is
+    delivered once.
+
+    The callback is called from the stream threads, one transaction at a time. It can add and remove accounts.
+    With `workers`, the callback is called from a pool of worker threads instead, so that a slow callback does not
+    stall the streams. The transactions of an address are always delivered by the same worker, in order. Every worker
+    has a queue of `queue_size` transactions. When it is full, the streams wait, and Horizon is read no faster than
+    the callbacks complete.
+
+    With a checkpoint store, the position of the monitor is saved every `checkpoint_events` transactions or
+    `checkpoint_interval` seconds, and on stop. A monitor created with the same store resumes from the saved position,
+    fetching the transactions it missed page by page, which is faster than streaming them, before streaming again.
+    Transactions processed after the last save are delivered again on resume. The saved position is that of the
+    slowest stream, and transactions still queued for the workers are not saved as processed. The stream of an
+    account with no new transactions is moved to the latest transaction when saving, so that it is not the slowest.
+    """
+
+    def __init__(self, horizon, callback_fn, addresses, asset=None, only_payments=False, cursor=None,
+                 max_account_streams=DEFAULT_MAX_ACCOUNT_STREAMS, checkpoint=None,
+                 checkpoint_events=DEFAULT_CHECKPOINT_EVENTS, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+                 workers=0, queue_size=DEFAULT_QUEUE_SIZE):
+        """Start monitoring. The streams are opened before returning, so that errors are raised to the caller,
+        unless resuming from a checkpoint.
+
+        :param horizon: the Horizon to stream the transactions from.
+        :type: :class:`kin.stellar.horizon.Horizon`
+
+        :param callback_fn: the function to call on each matching transaction as `callback_fn(address, tx_data)`.
+        :type: callable[[str, :class:`kin.TransactionData`], None]
+
+        :param addresses: the addresses of the accounts to monitor. A :class:`kin.CompactAddressSet` is used as is,
+            and is updated by :meth:`add_addresses` and :meth:`remove_addresses`.
+        :type: list of str or :class:`kin.CompactAddressSet`
+
+        :param asset: (optional) the asset of the operations to match. All the operations are matched if not given.
+        :type: :class:`stellar_base.asset.Asset`
+
+        :param boolean only_payments: (optional) whether to match payment operations only.
+
+        :param str cursor: (optional) the paging token to start monitoring after. Defaults to the saved position if
+            a checkpoint store is given and has one, and to the one before the latest transaction otherwise.
+
+        :param int max_account_streams: (optional) the largest number of accounts monitored with a stream each.
+
+        :param checkpoint: (optional) the store to save the monitor position to, and to resume from.
+        :type: :class:`kin.FileCheckpoint` or :class:`kin.SqliteCheckpoint`
+
+        :param int checkpoint_events: (optional) the number of transactions processed between checkpoints.
+
+        :param float checkpoint_interval: (optional) the number of seconds between checkpoints.
+
+        :param int workers: (optional) the number of threads to call the callback from. The callback is called from
+            the stream threads if not given.
+
+        :param int queue_size: (optional) the number of transactions queued per worker, before the streams wait.
+
+        :raises: ValueError: if one of the provided addresses has a wrong format.
+        :raises: ValueError: if the number of workers or the queue size is negative.
+        """
+        if workers < 0 or queue_size < 1:
+            raise ValueError('workers must not be negative, and the queue size must be positive')
+
+        self.horizon = horizon
+        self.callback_fn = callback_fn
+        self.asset = asset
+        self.only_payments = only_payments
+        self.max_account_streams = max_account_streams
+        self.checkpoint = checkpoint
+        self.checkpoint_events = checkpoint_events
+        self.checkpoint_interval = checkpoint_interval
+
+        if isinstance(addresses, CompactAddressSet):
+            self.watched = addresses  # validated when added
+        else:
+            for address in addresses:
+                if not is_valid_address(address):
+                    raise ValueError('invalid address: {}'.format(address))
+            self.watched = set(addresses)  # matched against every operation
+
+        self.events = 0  # transactions received, streamed or fetched
+        self.delivered = 0  # transactions delivered to the callback
+        self.duplicates = 0  # transactions seen again, on another stream
+        self.switches = 0  # switches between account streams and the global stream
+        self.caught_up = 0  # transactions fetched page by page, on resume
+        self.checkpoints = 0  # positions saved
+        self.max_queued = 0  # the most transactions queued for the workers at once
+        self.callback_time = 0.0  # total time spent in the callback, in seconds
+        self.max_callback_time = 0.0  # the longest callback call, in seconds
+
+        self._lock = threading.Lock()
+        self._deliver_lock = threading.RLock()  # the callback may add and remove accounts
+        self._recent = OrderedDict()  # hashes of the transactions delivered lately
+        self._streams = {}  # address, or None for the global stream -> stream
+        self._mode = None
+        self._stopped = False
+        self._checkpoint_lock = threading.Lock()  # positions are saved in order
+        self._unsaved = 0  # transactions processed since the last checkpoint
+        self._saved_at = time()
+        self._pending = {}  # paging token -> number of transactions queued for the workers
+
+        self._queues = [queue.Queue(queue_size) for _ in range(workers)]
+        self._workers = []
+        for q in self._queues:
+            t = threading.Thread(target=self._work, args=(q,))
+            t.daemon = True
+            t.start()
+            self._workers.append(t)
+
+        resume = not cursor and checkpoint is not None and checkpoint.load()
+        self._cursor = cursor or resume or self._initial_cursor()  # the position, when there are no streams
+        self._saved = resume or None  # the position last saved
+
+        try:
+            with self._lock:
+                self._update_streams(open_now=not resume, catch_up=bool(resume))
+        except Exception:
+            self.stop()
+            raise
+
+    def add_addresses(self, addresses):
+        """Add accounts to monitor. Their transactions are delivered from the current stream position on.
+
+        :param addresses: the addresses of the accounts to add.
+        :type: list of str
+
+        :raises: ValueError: if one of the provided addresses has a wrong format.
+        """
+        for address in addresses:
+            if not is_valid_address(address):
+                raise ValueError('invalid address: {}'.format(address))
+        with self._lock:
+            for address in addresses:
+                self.watched.add(address)
+            self._update_streams()
+
+    def remove_addresses(self, addresses):
+        """Stop monitoring accounts.
+
+        :param addresses: the addresses of the accounts to remove.
+        :type: list of str
+        """
+        with self._lock:
+            for address in addresses:
+                self.watched.discard(address)
+            self._update_streams()
+
+    def stop(self):
+        """Stop monitoring, closing the streams, and save the position. A transaction being delivered is delivered
+        to the end. With workers, waits for the queued transactions to be delivered.
+        """
+        if self.checkpoint is not None and not self._stopped:
+            self._advance_quiet_streams()  # before the position is taken
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._cursor = self._position()
+            for stream in self._streams.values():
+                stream.close()
+            self._streams = {}
+        for q in self._queues:
+            try:
+                q.put_nowait(None)  # after the queued transactions
+            except queue.Full:
+                pass  # the worker stops once its queue is empty. It may be the caller, so do not wait for it
+        for t in self._workers:
+            if t is not threading.current_thread():  # stopped from the callback
+                t.join()
+        self._save_checkpoint(force=True)
+
+    def stats(self):
+        """Get the number of watched accounts, the stream mode and number of streams, the numbers of events
+        received, transactions delivered and duplicate transactions, the number of stream switches, the number of
+        transactions fetched on resume, the number of positions saved, and the position. Also the number of workers,
+        the number of transactions queued for them now and at most, and the total and longest callback time.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {'addresses': len(self.watched), 'mode': self._mode, 'streams': len(self._streams),
+                    'events': self.events, 'delivered': self.delivered, 'duplicates': self.duplicates,
+                    'switches': self.switches, 'caught_up': self.caught_up, 'checkpoints': self.checkpoints,
+                    'cursor': self._position(), 'workers': len(self._workers),
+                    'queued': sum(q.qsize() for q in self._queues), 'max_queued': self.max_queued,
+                    'callback_time': self.callback_time, 'max_callback_time': self.max_callback_time}
+
+    def _initial_cursor(self):
+        """Determine the cursor before the latest transaction, as using cursor=now hangs due to nonstandard SSE
+        implementation in Horizon.
+        """
+        params = {'order': 'desc', 'limit': 2}
+        if len(self.watched) == 1:
+            reply = self.horizon.account_transactions(next(iter(self.watched)), params=params)
+        else:
+            reply = self.horizon.transactions(params=params)
+        records = reply['_embedded']['records']
+        return records[1]['paging_token'] if len(records) == 2 else None
+
+    def _update_streams(self, open_now=False, catch_up=False):
+        """Open and close streams to match the watched accounts, under the lock."""
+        if self._stopped:
+            return
+        mode = ACCOUNT_STREAMS if len(self.watched) <= self.max_account_streams else GLOBAL_STREAM
+        if self._mode is not None and mode != self._mode:
+            logger.info('monitor switching to {} stream mode, {} accounts'.format(mode, len(self.watched)))
+            self.switches += 1
+        self._mode = mode
+
+        wanted = set(self.watched) if mode == ACCOUNT_STREAMS else {None}
+        cursor = self._cursor = self._position()  # before closing the streams behind, kept when none are left
+        for key in list(self._streams):
+            if key not in wanted:
+                self._streams.pop(key).close()
+        for key in wanted:
+            if key not in self._streams:
+                stream = _Stream(key, cursor, catch_up)
+                if open_now:
+                    self._open(stream)  # errors are raised to the caller
+                self._streams[key] = stream
+                stream.thread = threading.Thread(target=self._run, args=(stream,))
+                stream.thread.daemon = True
+                stream.thread.start()
+
+    def _position(self):
+        """Get the paging token that all the streams processed up to, under the lock. The account streams run apart,
+        so it is the oldest of their positions.
+        """
+        cursors = [int(stream.cursor) for stream in self._streams.values() if stream.cursor]
+        return str(min(cursors)) if cursors else self._cursor
+
+    def _open(self, stream):
+        params = {'cursor': stream.cursor} if stream.cursor else {}
+        if stream.address:
+            stream.events = self.horizon.account_transactions(stream.address, sse=True, params=params)
+        else:
+            stream.events = self.horizon.transactions(sse=True, params=params)
+        if stream.closed:  # closed while opening
+            stream.close()
+
+    def _run(self, stream):
+        """Process the events of a stream until it is closed, opening it again if it ends."""
+        if stream.catch_up:
+            self._catch_up(stream)
+        while not stream.closed:
+            if stream.events is None:
+                try:
+                    self._open(stream)
+                except Exception as e:
+                    logger.warning('monitor stream {} not opened: {}'.format(stream.address or 'global', e))
+                    stream.closed_event.wait(STREAM_RETRY_TIME)
+                    continue
+            try:
+                for event in stream.events:
+                    if stream.closed:
+                        break
+                    if event.event == 'message':
+                        self._process(stream, json.loads(event.data))
+            except Exception as e:
+                logger.warning('monitor stream {} failed: {}'.format(stream.address or 'global', e))
+            stream.events = None  # opened again from its cursor, unless closed
+
+    def _catch_up(self, stream):
+        """Process the transactions after the stream cursor page by page, until the latest one."""
+        rel_url = '/accounts/{}/transactions/'.format(stream.address) if stream.address else '/transactions/'
+        while not stream.closed:
+            try:
+                for tx in self.horizon.iterate(rel_url, params={'cursor': stream.cursor}):
+                    if stream.closed:
+                        return
+                    with self._lock:
+                        self.caught_up += 1
+                    self._process(stream, tx)
+                return
+            except Exception as e:
+                logger.warning('monitor stream {} not caught up: {}'.format(stream.address or 'global', e))
+                stream.closed_event.wait(STREAM_RETRY_TIME)
+
+    def _process(self, stream, tx):
+        self._deliver(stream, tx)
+        with self._lock:
+            stream.cursor = tx['paging_token']
+            self.events += 1
+            self._unsaved += 1
+        self._save_checkpoint()
+
+    def _deliver(self, stream, tx):
+        try:
+            tx['operations'] = get_operations(self.horizon, tx)
+            tx_data = TransactionData(tx, strict=False)
+            address = match_transaction(tx_data, self.watched, self.asset, self.only_payments, stream.address)
+            if address is None:
+                return
+
+            with self._deliver_lock:
+                if stream.closed:
+                    return
+                if tx_data.hash in self._recent:
+                    self.duplicates += 1
+                    return
+                self._recent[tx_data.hash] = True
+                if len(self._recent) > RECENT_TRANSACTIONS:
+                    self._recent.popitem(last=False)
+                self.delivered += 1
+                if not self._queues:
+                    self._callback(address, tx_data)
+                    return
+            self._dispatch(address, tx_data, tx['paging_token'])
+        except Exception as ex:
+            logger.exception(ex)
+
+    def _dispatch(self, address, tx_data, paging_token):
+        """Queue a transaction for the worker of its address, waiting while the queue is full."""
+        q = self._queues[hash(address) % len(self._queues)]
+        with self._lock:
+            self._pending[paging_token] = self._pending.get(paging_token, 0) + 1
+        while True:
+            try:
+                q.put((address, tx_data, paging_token), timeout=DISPATCH_TIMEOUT)
+                break
+            except queue.Full:
+                if self._stopped:
+                    return  # not delivered, and not saved as processed
+        with self._lock:
+            self.max_queued = max(self.max_queued, sum(q.qsize() for q in self._queues))
+
+    def _work(self, q):
+        """Deliver the transactions of a worker queue, until stopped."""
+        while True:
+            try:
+                item = q.get(timeout=DISPATCH_TIMEOUT)
+            except queue.Empty:
+                if self._stopped:
+                    return  # stopped while the queue was full
+                continue
+            if item is None:
+                return
+            address, tx_data, paging_token = item
+            self._callback(address, tx_data)
+            with self._lock:
+                self._pending[paging_token] -= 1
+                if not self._pending[paging_token]:
+                    del self._pending[paging_token]
+
+    def _callback(self, address, tx_data):
+        start = time()
+        try:
+            self.callback_fn(address, tx_data)
+        except Exception as ex:
+            logger.exception(ex)
+        elapsed = time() - start
+        with self._lock:
+            self.callback_time += elapsed
+            self.max_callback_time = max(self.max_callback_time, elapsed)
+
+    def _save_checkpoint(self, force=False):
+        """Save the position, if due."""
+        if self.checkpoint is None:
+            return
+        with self._checkpoint_lock:
+            with self._lock:
+                due = force or self._unsaved >= self.checkpoint_events \
+                    or time() - self._saved_at >= self.checkpoint_interval
+            if not due:
+                return
+            self._advance_quiet_streams()
+            with self._lock:
+                cursor = self._position()  # behind the slowest stream
+                if self._pending:  # before the first transaction queued for the workers
+                    first = min(int(paging_token) for paging_token in self._pending)
+                    if cursor is None or first <= int(cursor):
+                        cursor = str(first - 1)
+                if not cursor or cursor == self._saved:
+                    return
+                self._unsaved = 0
+                self._saved_at = time()
+            try:
+                self.checkpoint.save(cursor)
+            except Exception as e:
+                logger.warning('monitor position {} not saved: {}'.format(cursor, e))
+                return
+            self._saved = cursor
+            self.checkpoints += 1
+
+    def _advance_quiet_streams(self):
+        """Move the account streams behind the others, whose accounts have no transactions after their cursors,
+        to the latest transaction. Otherwise, the stream of an account getting no transactions would hold the saved
+        position back for good.
+        """
+        with self._lock:
+            cursors = [int(stream.cursor) for stream in self._streams.values() if stream.cursor]
+            behind = [stream for stream in self._streams.values()
+                      if stream.address and stream.cursor and int(stream.cursor) < max(cursors)]
+        if not behind:
+            return
+        params = {'order': 'desc', 'limit': 1}
+        try:
+            # the latest transaction first: the account transactions up to it are all found after it
+            records = self.horizon.query('/transactions/', params, use_cache=False)['_embedded']['records']
+            if not records:
+                return
+            latest = records[0]['paging_token']
+            for stream in behind:
+                cursor = stream.cursor
+                records = self.horizon.query('/accounts/{}/transactions/'.format(stream.address), params,
+                                             use_cache=False)['_embedded']['records']
+                if records and int(records[0]['paging_token']) > int(cursor):
+                    continue  # not processed yet
+                with self._lock:
+                    if stream.cursor == cursor:  # nothing was processed meanwhile
+                        stream.cursor = latest
+        except Exception as e:
+            logger.warning('monitor streams not advanced: {}'.format(e))
+
+
+class _Stream(object):
+    """A transaction stream, of an account or of all the transactions, with the position it reached."""
+    def __init__(self, address, cursor, catch_up=False):
+        self.address = address
+        self.cursor = cursor
+        self.catch_up = catch_up  # process the transactions after the cursor page by page first
+        self.events = None
+        self.thread = None
+        self.closed_event = threading.Event()
+
+    @property
+    def closed(self):
+        return self.closed_event.is_set()
+
+    def close(self):
+        self.closed_event.set()
+        events = self.events
+        if events is not None and hasattr(events, 'close'):
+            events.close()
+
+
+def match_transaction(tx_data, watched, asset=None, only_payments=False, address=None):
+    """Get the watched address a transaction is delivered for.
+
+    :param tx_data: the transaction, with its operations.
+    :type: :class:`kin.TransactionData`
+
+    :param watched: the watched addresses, matched against the operation source and destination.
+    :type: set of str or :class:`kin.CompactAddressSet`
+
+    :param asset: (optional) the asset of the operations to match.
+    :type: :class:`stellar_base.asset.Asset`
+
+    :param boolean only_payments: (optional) whether to match payment operations only.
+
+    :param str address: (optional) the account the transaction is known to relate to, e.g. streamed for.
+
+    :return: the address, or None if the transaction does not match.
+    :rtype: str
+    """
+    for op_data in tx_data.operations:
+        if only_payments and op_data.type != 'payment':
+            continue
+        if asset:
+            if asset.is_native():
+                if op_data.asset_type != 'native':
+                    continue
+            elif op_data.asset_code != asset.code or op_data.asset_issuer != asset.issuer:
+                continue
+        if address:
+            return address
+        elif op_data.from_address in watched:
+            return op_data.from_address
+        elif op_data.to_address in watched:
+            return op_data.to_address
+    return None
+
+
+def get_operations(horizon, tx):
+    """Get the operations of a transaction record. They are decoded from the transaction envelope, so that
+    monitoring does not take a request per transaction, and fetched from Horizon only if the envelope is missing.
+
+    :rtype: list of dict
+    """
+    try:
+        return decode_operations(tx)
+    except ValueError as e:
+        logger.debug(e)
+        return list(horizon.iterate('/transactions/' + tx['hash'] + '/operations/', prefetch=False))
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+from collections import OrderedDict
+from functools import partial
+import threading
+from time import time
+
+from .errors import *
+from .stellar.channel_manager import PRIORITY_NORMAL
+
+import logging
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = 100  # max number of operations in a transaction
+DEFAULT_MAX_LATENCY = 1  # how long a payment can wait for its batch to fill up, in seconds
+
+
+class PaymentFuture(object):
+    """The pending result of a batched payment."""
+    def __init__(self):
+        self._event = threading.Event()
+        self._tx_hash = None
+        self._error = None
+
+    def done(self):
+        """Check whether the payment is completed, successfully or not."""
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """Wait for the payment to complete and return its transaction hash.
+
+        :param float timeout: (optional) how long to wait for the payment, in seconds. Waits until the payment
+            completes if not provided, which it always does, as its submit is bounded by the Horizon timeouts.
+            A payment not completed in time is not cancelled, and may still get into the ledger.
+
+        :return: the hash of the transaction containing the payment.
+        :rtype: str
+
+        :raises: :class:`kin.SdkError`: if the payment failed, or did not complete in time. The error of a failed
+            batch is raised as a copy for every payment, so that the callers do not share its traceback.
+        """
+        if not self._event.wait(timeout):
+            raise SdkError('payment not completed in time')
+        if self._error:
+            raise _copy_error(self._error)
+        return self._tx_hash
+
+    def set_result(self, tx_hash):
+        self._tx_hash = tx_hash
+        self._event.set()
+
+    def set_error(self, error):
+        self._error = error
+        self._event.set()
+
+
+class _Payment(object):
+    def __init__(self, asset, address, amount):
+        self.asset = asset
+        self.address = address
+        self.amount = amount
+        self.queued_at = time()
+        self.future = PaymentFuture()
+
+
+class PaymentBatcher(object):
+    """
+    The class :class:`kin.PaymentBatcher` collects concurrent payments and sends them in multi-operation transactions.
+    A batch is sent once it is full, or once its oldest payment has waited for `max_latency` seconds.
+    Payments share a transaction only if they have the same memo and priority. Of the batches ready to be sent, the
+    higher priority batches are sent first.
+    """
+    def __init__(self, channel_manager, max_batch_size=MAX_BATCH_SIZE, max_latency=DEFAULT_MAX_LATENCY):
+        if not 0 < max_batch_size <= MAX_BATCH_SIZE:
+            raise ValueError('batch size must be between 1 and {}'.format(MAX_BATCH_SIZE))
+
+        self.channel_manager = channel_manager
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+
+        self._pending = OrderedDict()  # (memo text, priority) -> list of payments, oldest batch first
+        self._cond = threading.Condition()
+        self._senders = 0
+        self._add_senders()
+
+    def submit(self, asset, address, amount, memo_text=None, priority=PRIORITY_NORMAL):
+        """Queue a payment to be sent in the next batch.
+
+        :param asset: the asset to send.
+        :type: :class:`stellar_base.asset.Asset`
+
+        :param str address: the account to send the asset to.
+
+        :param number amount: the asset amount to send.
+
+        :param str memo_text: (optional) a text to put into transaction memo.
+
+        :param int priority: (optional) the transaction priority, see
+            :meth:`kin.stellar.channel_manager.ChannelManager.send_transaction`.
+
+        :return: the pending payment result.
+        :rtype: :class:`kin.PaymentFuture`
+        """
+        memo_text = memo_text[:28] if memo_text else None  # max memo length is 28
+        payment = _Payment(asset, address, amount)
+        with self._cond:
+            self._add_senders()
+            payments = self._pending.setdefault((memo_text, priority), [])
+            payments.append(payment)
+            # wake up a sender if there is a new batch to time, or a batch is full
+            if len(payments) == 1 or len(payments) == self.max_batch_size:
+                self._cond.notify()
+        return payment.future
+
+    def _add_senders(self):
+        """Start a sender per channel transaction in flight, so that all channels can be busy at the same time.
+        Senders are added when channels are added to the channel manager.
+        """
+        while self._senders < self.channel_manager.num_channels * self.channel_manager.max_in_flight:
+            t = threading.Thread(target=self._sender)
+            t.daemon = True
+            t.start()
+            self._senders += 1
+
+    def _sender(self):
+        while True:
+            memo_text, priority, payments = self._next_batch()
+            try:
+                self._send_batch(memo_text, priority, payments)
+            except Exception as e:  # should not happen, but never leave the callers hanging
+                logger.exception(e)
+                for payment in payments:
+                    if not payment.future.done():
+                        payment.future.set_error(translate_error(e))
+
+    def _next_batch(self):
+        """Wait until a batch is ready to be sent, and take it out of the pending payments."""
+        with self._cond:
+            while True:
+                now = time()
+                timeout = None
+                ready = None  # the oldest batch of the highest priority ready to be sent
+                for key, payments in self._pending.items():
+                    deadline = payments[0].queued_at + self.max_latency
+                    if len(payments) >= self.max_batch_size or deadline <= now:
+                        if ready is None or key[1] < ready[1]:
+                            ready = key
+                    else:
+                        timeout = deadline - now if timeout is None else min(timeout, deadline - now)
+                if ready is None:
+                    self._cond.wait(timeout)
+                    continue
+
+                payments = self._pending[ready]
+                batch = payments[:self.max_batch_size]
+                del payments[:self.max_batch_size]
+                if payments:
+                    self._cond.notify()  # let another sender look at the leftovers
+                else:
+                    del self._pending[ready]
+                memo_text, priority = ready
+                return memo_text, priority, batch
+
+    def _send_batch(self, memo_text, priority, payments):
+        """Send the payments in a single transaction. If some of the payments fail, the rest are resent."""
+        while payments:
+            try:
+                reply = self.channel_manager.send_transaction(lambda builder:
+                                                              partial(self._add_payment_ops, builder, payments),
+                                                              memo_text=memo_text, priority=priority)
+            except HorizonError as e:
+                if e.type != HorizonErrorType.TRANSACTION_FAILED \
+                        or e.extras.result_codes.transaction != TransactionResultCode.FAILED:
+                    self._set_error(payments, translate_error(e))
+                    return
+
+                # fail the payments whose operations failed, and resend the rest
+                op_result_codes = e.extras.result_codes.operations
+                valid_payments = []
+                for payment, op_result_code in zip(payments, op_result_codes):
+                    if op_result_code == PaymentResultCode.SUCCESS:
+                        valid_payments.append(payment)
+                    else:
+                        payment.future.set_error(translate_operation_error([op_result_code]))
+                if len(valid_payments) == len(payments):  # cannot tell which payment is to blame
+                    self._set_error(payments, translate_error(e))
+                    return
+                payments = valid_payments
+                continue
+            except Exception as e:
+                self._set_error(payments, translate_error(e))
+                return
+
+            for payment in payments:
+                payment.future.set_result(reply['hash'])
+            return
+
+    @staticmethod
+    def _add_payment_ops(builder, payments, source=None):
+        for payment in payments:
+            builder.append_payment_op(payment.address, payment.amount, asset_type=payment.asset.code,
+                                      asset_issuer=payment.asset.issuer, source=source)
+
+    @staticmethod
+    def _set_error(payments, error):
+        for payment in payments:
+            payment.future.set_error(error)
+
+
+def _copy_error(error):
+    """Copy an error, so that every thread raises its own instance."""
+    copied = error.__class__.__new__(error.__class__)
+    copied.__dict__.update(error.__dict__)
+    copied.args = tuple(copied if arg is error else arg for arg in error.args)  # SdkError is its own argument
+    return copied
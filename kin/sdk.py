@@ -9,7 +9,10 @@ from stellar_base.keypair import Keypair
 
 from .config import *
 from .errors import *
-from .stellar.channel_manager import ChannelManager
+from .monitor import TransactionMonitor
+from .payment_batcher import PaymentBatcher
+from .stellar.address_set import CompactAddressSet
+from .stellar.channel_manager import ChannelManager, PRIORITY_NORMAL
 from .stellar.horizon import Horizon, HORIZON_LIVE, HORIZON_TEST
 from .stellar.horizon_models import AccountData, TransactionData
 from .stellar.utils import *
@@ -28,7 +31,9 @@ class SDK(object):
     """
 
     def __init__(self, secret_key='', horizon_endpoint_uri='', network='PUBLIC',
-                 channel_secret_keys=None, kin_asset=None):
+                 channel_secret_keys=None, kin_asset=None, batch_payments=False, query_cache=None,
+                 permanent_cache=None, rate_limiter=None, circuit_breaker=None, channel_max_in_flight=1,
+                 channel_scaler=None, channel_leases=None, journal=None, high_priority_channels=0):
         """Create a new instance of the KIN SDK for Stellar.
 
         If secret key is not provided, the SDK can still be used in "anonymous" mode with only the following
@@ -45,8 +50,10 @@ class SDK(object):
         :param str secret_key: (optional) a key to initialize the sdk wallet account with. If not provided, the wallet
             not not be initialized and methods needing the wallet will raise exception.
 
-        :param str horizon_endpoint_uri: (optional) a Horizon endpoint. If not provided, a default global endpoint will
-            be used, either a `TESTNET` or `PUBLIC`, depending on the `network` parameter.
+        :param horizon_endpoint_uri: (optional) a Horizon endpoint, or a list of endpoints of the same network to
+            route the requests over. If not provided, a default global endpoint will be used, either a `TESTNET` or
+            `PUBLIC`, depending on the `network` parameter.
+        :type: str or list of str
 
         :param str network: (optional) either `PUBLIC` or `TESTNET`, will set the Horizon endpoint in the absence of
             `horizon_endpoint_uri`. Defaults to `PUBLIC` if not specified.
@@ -57,6 +64,50 @@ class SDK(object):
         :param kin_asset: the KIN asset to work with. *For testing purposes only*.
         :type: :class:`stellar_base.asset.Asset`
 
+        :param boolean batch_payments: (optional) whether to pack concurrent payments into multi-operation
+            transactions. Increases payment throughput at the cost of some latency. Defaults to False.
+
+        :param query_cache: (optional) a cache for Horizon query replies, for example account data. Accounts changed
+            by the SDK transactions are evicted from the cache. No caching by default.
+        :type: :class:`kin.QueryCache`
+
+        :param permanent_cache: (optional) a cache for the Horizon replies that never change, like transaction data.
+            No caching by default.
+        :type: :class:`kin.PermanentCache`
+
+        :param rate_limiter: (optional) a limiter of the request rate to Horizon, following the Horizon rate limit.
+            Share one limiter between the SDK instances using the same Horizon. No limiting by default.
+        :type: :class:`kin.RateLimiter`
+
+        :param circuit_breaker: (optional) a circuit breaker failing requests fast while Horizon is overloaded, with
+            :class:`kin.ServerError`. No circuit breaking by default.
+        :type: :class:`kin.CircuitBreaker`
+
+        :param int channel_max_in_flight: (optional) the number of transactions every channel may have in flight at
+            once, each with its own reserved sequence number. A transaction waits for its ledger to close, so with
+            more transactions in flight the channels send more transactions per ledger. Defaults to 1.
+
+        :param channel_scaler: (optional) a channel scaler adding channels derived from the SDK wallet key while the
+            channels are busy, and merging them back into the wallet account once they are idle. The channels are
+            not scaled by default.
+        :type: :class:`kin.ChannelScaler`
+
+        :param channel_leases: (optional) a lease table letting several processes on the host, e.g. the workers of a
+            pre-fork server, share the same channels. A channel is used by one process at a time. Every process uses
+            all the channels by default.
+        :type: :class:`kin.ChannelLeases`
+
+        :param journal: (optional) a journal of the signed transactions, written before they are submitted. The
+            transactions left unresolved by a previous run, e.g. because the process died waiting for the submit
+            reply, are looked up on Horizon or resubmitted when the SDK is created, see `journal.replayed`.
+            Transactions are not journaled by default.
+        :type: :class:`kin.TransactionJournal`
+
+        :param int high_priority_channels: (optional) the number of channels, of those in `channel_secret_keys`,
+            reserved for the transactions sent with `kin.PRIORITY_HIGH`, so that they do not wait for the channels
+            busy with lower priority transactions. Must leave at least one channel for the other priorities.
+            No channels are reserved by default.
+
         :return: An instance of the SDK.
         :rtype: :class:`kin.SDK`
 
@@ -75,19 +126,20 @@ class SDK(object):
         else:
             self.kin_asset = KIN_ASSET_PROD if self.network == 'PUBLIC' else KIN_ASSET_TEST
 
-        # set connection pool size for channels + monitoring connection + extra
-        pool_size = max(1, len(channel_secret_keys)) + 2
+        # set connection pool size for channel transactions in flight + monitoring connection + extra
+        num_channels = max(1, len(channel_secret_keys), channel_scaler.max_channels if channel_scaler else 0)
+        pool_size = num_channels * channel_max_in_flight + 2
 
-        if horizon_endpoint_uri:
-            self.horizon = Horizon(horizon_uri=horizon_endpoint_uri, pool_size=pool_size, user_agent=SDK_USER_AGENT)
-        else:
-            if self.network == 'TESTNET':
-                self.horizon = Horizon(horizon_uri=HORIZON_TEST, pool_size=pool_size, user_agent=SDK_USER_AGENT)
-            else:
-                self.horizon = Horizon(horizon_uri=HORIZON_LIVE, pool_size=pool_size, user_agent=SDK_USER_AGENT)
+        if not horizon_endpoint_uri:
+            horizon_endpoint_uri = HORIZON_TEST if self.network == 'TESTNET' else HORIZON_LIVE
+        self.horizon = Horizon(horizon_uri=horizon_endpoint_uri, pool_size=pool_size, user_agent=SDK_USER_AGENT,
+                               cache=query_cache, permanent_cache=permanent_cache, rate_limiter=rate_limiter,
+                               circuit_breaker=circuit_breaker)
 
         # init sdk wallet account if a secret key is supplied
         self.base_keypair = None
+        self.payment_batcher = None
+        self.channel_scaler = None
         if secret_key:
             # check wallet key
             if not is_valid_secret_key(secret_key):
@@ -113,8 +165,21 @@ class SDK(object):
             else:
                 channel_secret_keys = [secret_key]
 
+            # resolve the transactions that were in flight when the previous run ended
+            if journal:
+                journal.replay(self.horizon)
+
             # init channel manager
-            self.channel_manager = ChannelManager(secret_key, channel_secret_keys, self.network, self.horizon)
+            self.channel_manager = ChannelManager(secret_key, channel_secret_keys, self.network, self.horizon,
+                                                  max_in_flight=channel_max_in_flight, leases=channel_leases,
+                                                  journal=journal, reserved_channels=high_priority_channels)
+            if channel_scaler:
+                channel_scaler.start(self.channel_manager)
+            self.channel_scaler = channel_scaler
+
+            # init payment batcher
+            if batch_payments:
+                self.payment_batcher = PaymentBatcher(self.channel_manager)
 
         logger.info('Kin SDK inited on network {}, horizon endpoint {}'.format(self.network, self.horizon.horizon_uri))
 
@@ -132,6 +197,7 @@ class SDK(object):
                 'uri': self.horizon.horizon_uri,
                 'online': False,
                 'error': None,
+                'endpoints': self.horizon.endpoint_pool.status() if self.horizon.endpoint_pool else None,
             },
             'transport': {
                 'pool_size': self.horizon.pool_size,
@@ -139,14 +205,25 @@ class SDK(object):
                 'request_timeout': self.horizon.request_timeout,
                 'retry_statuses': self.horizon.status_forcelist,
                 'backoff_factor': self.horizon.backoff_factor,
+                'coalesced_queries': self.horizon.single_flight.coalesced if self.horizon.single_flight else 0,
+                'rate_limiter': self.horizon.rate_limiter.stats() if self.horizon.rate_limiter else None,
+                'circuit_breaker': self.horizon.circuit_breaker.stats() if self.horizon.circuit_breaker else None,
             },
             'channels': None,
+            'cache': self.horizon.cache.stats() if self.horizon.cache else None,
+            'permanent_cache': self.horizon.permanent_cache.stats() if self.horizon.permanent_cache else None,
         }
         if self.base_keypair:
             status['address'] = self.get_address()
             status['channels'] = {
                 'all': self.channel_manager.num_channels,
-                'free': self.channel_manager.channel_builders.qsize()
+                'free': self.channel_manager.channel_builders.qsize(),
+                'reserved': len(self.channel_manager.reserved),
+                'max_in_flight': self.channel_manager.max_in_flight,
+                'scaler': self.channel_scaler.stats() if self.channel_scaler else None,
+                'health': self.channel_manager.health(),
+                'leases': self.channel_manager.leases.stats() if self.channel_manager.leases else None,
+                'journal': self.channel_manager.journal.stats() if self.channel_manager.journal else None,
             }
 
         # now check Horizon connection
@@ -220,7 +297,8 @@ class SDK(object):
         """
         return self._get_account_asset_balance(address, self.kin_asset)
 
-    def create_account(self, address, starting_balance=MIN_ACCOUNT_BALANCE, memo_text=None, activate=False):
+    def create_account(self, address, starting_balance=MIN_ACCOUNT_BALANCE, memo_text=None, activate=False,
+                       priority=PRIORITY_NORMAL):
         """Create an account identified by the provided address.
 
         :param str address: the address of the account to create.
@@ -232,6 +310,9 @@ class SDK(object):
 
         :param boolean activate: (optional) should the created account be activated
 
+        :param int priority: (optional) the transaction priority, one of `kin.PRIORITY_HIGH`, `kin.PRIORITY_NORMAL`
+            (default) or `kin.PRIORITY_LOW`. Higher priority transactions take the available channels first.
+
         :return: transaction hash
         :rtype: str
 
@@ -250,11 +331,14 @@ class SDK(object):
             reply = self.channel_manager.send_transaction(lambda builder:
                                                           partial(builder.append_create_account_op, address,
                                                                   starting_balance, pretrusted_asset=pretrusted_asset),
-                                                          memo_text=memo_text)
-            return reply['hash']
+                                                          memo_text=memo_text, priority=priority)
         except Exception as e:
             raise translate_error(e)
 
+        self.horizon.invalidate_account(self.base_address)
+        self.horizon.invalidate_account(address)
+        return reply['hash']
+
     def check_account_exists(self, address):
         """Check whether the account identified by the provided address exists.
 
@@ -284,7 +368,7 @@ class SDK(object):
         """
         return self._check_asset_trusted(address, self.kin_asset)
 
-    def send_native(self, address, amount, memo_text=None):
+    def send_native(self, address, amount, memo_text=None, priority=PRIORITY_NORMAL):
         """Send native currency (lumens) to the account identified by the provided address.
 
         :param str address: the account to send lumens to.
@@ -293,6 +377,9 @@ class SDK(object):
 
         :param str memo_text: (optional) a text to put into transaction memo.
 
+        :param int priority: (optional) the transaction priority, one of `kin.PRIORITY_HIGH`, `kin.PRIORITY_NORMAL`
+            (default) or `kin.PRIORITY_LOW`. Higher priority transactions take the available channels first.
+
         :return: transaction hash
         :rtype: str
 
@@ -302,9 +389,9 @@ class SDK(object):
         :raises: :class:`kin.AccountNotFoundError`: if the account does not exist.
         :raises: :class:`kin.LowBalanceError`: if there is not enough money to send and pay transaction fee.
         """
-        return self._send_asset(Asset.native(), address, amount, memo_text)
+        return self._send_asset(Asset.native(), address, amount, memo_text, priority)
 
-    def send_kin(self, address, amount, memo_text=None):
+    def send_kin(self, address, amount, memo_text=None, priority=PRIORITY_NORMAL):
         """Send KIN to the account identified by the provided address.
 
         :param str address: the account to send KIN to.
@@ -313,6 +400,9 @@ class SDK(object):
 
         :param str memo_text: (optional) a text to put into transaction memo.
 
+        :param int priority: (optional) the transaction priority, one of `kin.PRIORITY_HIGH`, `kin.PRIORITY_NORMAL`
+            (default) or `kin.PRIORITY_LOW`. Higher priority transactions take the available channels first.
+
         :return: transaction hash
         :rtype: str
 
@@ -323,7 +413,7 @@ class SDK(object):
         :raises: :class:`kin.AccountNotActivatedError`: if the account is not activated.
         :raises: :class:`kin.LowBalanceError`: if there is not enough money to send and pay transaction fee.
         """
-        return self._send_asset(self.kin_asset, address, amount, memo_text)
+        return self._send_asset(self.kin_asset, address, amount, memo_text, priority)
 
     def get_account_data(self, address):
         """Gets account data.
@@ -363,55 +453,75 @@ class SDK(object):
         try:
             tx = self.horizon.transaction(tx_hash)
 
-            # get transaction operations
-            tx_ops = self.horizon.transaction_operations(tx['hash'], params={'limit': 100})
-            tx['operations'] = tx_ops['_embedded']['records']
-
+            tx['operations'] = self._get_transaction_operations(tx['hash'])
             return TransactionData(tx, strict=False)
         except Exception as e:
             raise translate_error(e)
 
-    def monitor_kin_payments(self, callback_fn):
+    def monitor_kin_payments(self, callback_fn, checkpoint=None):
         """Monitor KIN payment transactions related to the SDK wallet account.
-        NOTE: the function starts a background thread.
+        NOTE: the function starts background threads, until the monitor is stopped.
 
         :param callback_fn: the function to call on each received payment as `callback_fn(address, tx_data)`.
         :type: callable[[str, :class:`kin.TransactionData`], None]
 
+        :param checkpoint: (optional) the store to save the monitor position to, and to resume from after a restart.
+        :type: :class:`kin.FileCheckpoint` or :class:`kin.SqliteCheckpoint`
+
+        :return: the monitor, to add and remove accounts and to stop monitoring.
+        :rtype: :class:`kin.TransactionMonitor`
+
         :raises: :class:`kin.SdkError` if the SDK wallet is not configured.
         """
-        self.monitor_accounts_kin_payments([self.get_address()], callback_fn)
+        return self.monitor_accounts_kin_payments([self.get_address()], callback_fn, checkpoint=checkpoint)
 
-    def monitor_accounts_kin_payments(self, addresses, callback_fn):
+    def monitor_accounts_kin_payments(self, addresses, callback_fn, checkpoint=None):
         """Monitor KIN payment transactions related to the accounts identified by provided addresses.
-        NOTE: the function starts a background thread.
+        NOTE: the function starts background threads, until the monitor is stopped.
 
-        :param list of str addresses: the addresses of the accounts to query.
+        :param addresses: the addresses of the accounts to query. A :class:`kin.CompactAddressSet` takes less memory
+            for very large watch lists, but its accounts are not checked to exist.
+        :type: list of str or :class:`kin.CompactAddressSet`
 
         :param callback_fn: the function to call on each received payment as `callback_fn(address, tx_data)`.
         :type: callable[[str, :class:`kin.TransactionData`], None]
 
+        :param checkpoint: (optional) the store to save the monitor position to, and to resume from after a restart.
+        :type: :class:`kin.FileCheckpoint` or :class:`kin.SqliteCheckpoint`
+
+        :return: the monitor, to add and remove accounts and to stop monitoring.
+        :rtype: :class:`kin.TransactionMonitor`
+
         :raises: ValueError: when no addresses are given.
         :raises: ValueError: if one of the provided addresses has a wrong format.
         :raises: :class:`kin.AccountNotFoundError`: if one of the provided accounts is not yet created.
         """
-        self._monitor_accounts_asset_transactions(self.kin_asset, addresses, callback_fn, only_payments=True)
+        return self._monitor_accounts_asset_transactions(self.kin_asset, addresses, callback_fn, only_payments=True,
+                                                         checkpoint=checkpoint)
 
     # noinspection PyTypeChecker
-    def monitor_accounts_transactions(self, addresses, callback_fn):
+    def monitor_accounts_transactions(self, addresses, callback_fn, checkpoint=None):
         """Monitor transactions related to the account identified by a provided addresses (all transaction types).
-        NOTE: the function starts a background thread.
+        NOTE: the function starts background threads, until the monitor is stopped.
 
-        :param list of str addresses: the addresses of the accounts to query.
+        :param addresses: the addresses of the accounts to query. A :class:`kin.CompactAddressSet` takes less memory
+            for very large watch lists, but its accounts are not checked to exist.
+        :type: list of str or :class:`kin.CompactAddressSet`
 
         :param callback_fn: the function to call on each received transaction as `callback_fn(address, tx_data)`.
         :type: callable[[str, :class:`kin.TransactionData`], None]
 
+        :param checkpoint: (optional) the store to save the monitor position to, and to resume from after a restart.
+        :type: :class:`kin.FileCheckpoint` or :class:`kin.SqliteCheckpoint`
+
+        :return: the monitor, to add and remove accounts and to stop monitoring.
+        :rtype: :class:`kin.TransactionMonitor`
+
         :raises: ValueError: when no addresses are given.
         :raises: ValueError: if one of the provided addresses has a wrong format.
         :raises: :class:`kin.AccountNotFoundError`: if one of the provided accounts is not yet created.
         """
-        self._monitor_accounts_asset_transactions(None, addresses, callback_fn)
+        return self._monitor_accounts_asset_transactions(None, addresses, callback_fn, checkpoint=checkpoint)
 
     # Helpers
 
@@ -443,6 +553,10 @@ class SDK(object):
 
         raise AccountNotActivatedError(address)
 
+    def _get_transaction_operations(self, tx_hash):
+        """Get all the operations of a transaction, however many pages they take."""
+        return list(self.horizon.iterate('/transactions/' + tx_hash + '/operations/', prefetch=False))
+
     def _trust_asset(self, asset, limit=None, memo_text=None):
         """Establish a trustline from the SDK wallet to the asset issuer.
 
@@ -471,10 +585,12 @@ class SDK(object):
                                                           partial(builder.append_trust_op, asset.issuer, asset.code,
                                                                   limit=limit),
                                                           memo_text=memo_text)
-            return reply['hash']
         except Exception as e:
             raise translate_error(e)
 
+        self.horizon.invalidate_account(self.base_address)
+        return reply['hash']
+
     def _check_asset_trusted(self, address, asset):
         """Check if the account has a trustline to the provided asset.
 
@@ -496,7 +612,7 @@ class SDK(object):
         except AccountNotActivatedError:
             return False
 
-    def _send_asset(self, asset, address, amount, memo_text=None):
+    def _send_asset(self, asset, address, amount, memo_text=None, priority=PRIORITY_NORMAL):
         """Send asset to the account identified by the provided address.
 
         :param str address: the account to send asset to.
@@ -508,6 +624,8 @@ class SDK(object):
 
         :param str memo_text: (optional) a text to put into transaction memo.
 
+        :param int priority: (optional) the transaction priority.
+
         :return: transaction hash
         :rtype: str
 
@@ -531,30 +649,46 @@ class SDK(object):
         if not asset.is_native() and not is_valid_address(asset.issuer):
             raise ValueError('invalid asset issuer: {}'.format(asset.issuer))
 
-        try:
-            reply = self.channel_manager.send_transaction(lambda builder:
-                                                          partial(builder.append_payment_op, address, amount,
-                                                                  asset_type=asset.code, asset_issuer=asset.issuer),
-                                                          memo_text=memo_text)
-            return reply['hash']
-        except Exception as e:
-            raise translate_error(e)
-
-    def _monitor_accounts_asset_transactions(self, asset, addresses, callback_fn, only_payments=False):
+        if self.payment_batcher:
+            future = self.payment_batcher.submit(asset, address, amount, memo_text, priority)
+            tx_hash = future.result()  # like an unbatched send, as the payment cannot be taken back
+        else:
+            try:
+                reply = self.channel_manager.send_transaction(lambda builder:
+                                                              partial(builder.append_payment_op, address, amount,
+                                                                      asset_type=asset.code,
+                                                                      asset_issuer=asset.issuer),
+                                                              memo_text=memo_text, priority=priority)
+                tx_hash = reply['hash']
+            except Exception as e:
+                raise translate_error(e)
+
+        self.horizon.invalidate_account(self.base_address)
+        self.horizon.invalidate_account(address)
+        return tx_hash
+
+    def _monitor_accounts_asset_transactions(self, asset, addresses, callback_fn, only_payments=False, checkpoint=None):
         """Monitor transactions related to the accounts identified by provided addresses. If asset is given, only
         the transactions for this asset will be returned.
-        NOTE: the functions starts a background thread.
+        NOTE: the function starts background threads, until the monitor is stopped.
 
         :param asset: (optional) the asset to query.
         :type: :class:`stellar_base.asset.Asset`
 
-        :param list of str addresses: the list of account addresses to query.
+        :param addresses: the account addresses to query.
+        :type: list of str or :class:`kin.CompactAddressSet`
 
         :param callback_fn: the function to call on each received transaction as `callback_fn(address, tx_data)`.
         :type: callable[[str, :class:`kin.TransactionData`], None]
 
         :param boolean only_payments: whether to return payment transactions only.
 
+        :param checkpoint: (optional) the store to save the monitor position to, and to resume from after a restart.
+        :type: :class:`kin.FileCheckpoint` or :class:`kin.SqliteCheckpoint`
+
+        :return: the monitor, to add and remove accounts and to stop monitoring.
+        :rtype: :class:`kin.TransactionMonitor`
+
         :raises: ValueError: if asset issuer is invalid.
         :raises: ValueError: when no addresses are given.
         :raises: ValueError: if one of the provided addresses has a wrong format.
@@ -566,73 +700,14 @@ class SDK(object):
         if not addresses:
             raise ValueError('no addresses to monitor')
 
-        for address in addresses:
-            if not is_valid_address(address):
-                raise ValueError('invalid address: {}'.format(address))
-
-        for address in addresses:
-            if not self.check_account_exists(address):
-                raise AccountNotFoundError(addresses)
+        if not isinstance(addresses, CompactAddressSet):  # not checked to exist, that takes a request per address
+            for address in addresses:
+                if not is_valid_address(address):
+                    raise ValueError('invalid address: {}'.format(address))
 
-        # Currently, due to nonstandard SSE implementation in Horizon, using cursor=now will hang.
-        # Instead, we determine the cursor ourselves.
-        params = {}
-        if len(addresses) == 1:
-            reply = self.horizon.account_transactions(addresses[0], params={'order': 'desc', 'limit': 2})
-        else:
-            reply = self.horizon.transactions(params={'order': 'desc', 'limit': 2})
+            for address in addresses:
+                if not self.check_account_exists(address):
+                    raise AccountNotFoundError(addresses)
 
-        if len(reply['_embedded']['records']) == 2:
-            cursor = TransactionData(reply['_embedded']['records'][1], strict=False).paging_token
-            params = {'cursor': cursor}
-
-        # make synchronous SSE request (will raise errors in the current thread)
-        if len(addresses) == 1:
-            events = self.horizon.account_transactions(addresses[0], sse=True, params=params)
-        else:
-            events = self.horizon.transactions(sse=True, params=params)
-
-        # asynchronous event processor
-        def event_processor():
-            import json
-            for event in events:
-                if event.event != 'message':
-                    continue
-                try:
-                    tx = json.loads(event.data)
-
-                    # get transaction operations
-                    tx_ops = self.horizon.transaction_operations(tx['hash'], params={'limit': 100})
-                    tx['operations'] = tx_ops['_embedded']['records']
-
-                    # deserialize
-                    tx_data = TransactionData(tx, strict=False)
-
-                    # iterate over transaction operations and see if there's a match
-                    for op_data in tx_data.operations:
-                        if only_payments and op_data.type != 'payment':
-                            continue
-                        if asset:
-                            if op_data.asset_type == 'native' and not asset.is_native():
-                                continue
-                            if op_data.asset_code != asset.code or op_data.asset_issuer != asset.issuer:
-                                continue
-                        if len(addresses) == 1:
-                            callback_fn(addresses[0], tx_data)
-                            break
-                        elif op_data.from_address in addresses:
-                            callback_fn(op_data.from_address, tx_data)
-                            break
-                        elif op_data.to_address in addresses:
-                            callback_fn(op_data.to_address, tx_data)
-                            break
-
-                except Exception as ex:
-                    logger.exception(ex)
-                    continue
-
-        # start monitoring thread
-        import threading
-        t = threading.Thread(target=event_processor)
-        t.daemon = True
-        t.start()
+        return TransactionMonitor(self.horizon, callback_fn, addresses, asset=asset, only_payments=only_payments,
+                                  checkpoint=checkpoint)
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+import binascii
+import math
+import threading
+
+from stellar_base.utils import calculate_checksum, encode_check
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_FALSE_POSITIVE_RATE = 0.01  # of the Bloom filter
+MIN_CAPACITY = 1024  # the Bloom filter is sized for at least as many addresses
+KEY_SIZE = 32  # bytes in a public key
+ACCOUNT_VERSION_BYTE = 6 << 3  # the version byte of account addresses, "G"
+
+# base32 digits of the stellar alphabet -> the digits int() parses
+_BASE32_DIGITS = dict((ord(c), ord('0123456789abcdefghijklmnopqrstuv'[i]))
+                      for i, c in enumerate('ABCDEFGHIJKLMNOPQRSTUVWXYZ234567'))
+
+
+class CompactAddressSet(object):
+    """
+    The class :class:`kin.CompactAddressSet` is a set of account addresses for monitoring very large watch lists,
+    taking a fraction of the memory of a set of address strings. The public keys are packed into a sorted buffer,
+    32 bytes per address, searched with a binary search. A Bloom filter in front of it rejects most of the other
+    addresses without decoding them.
+
+    For 1M addresses, the set takes 33 MB (32 MB of keys and 1.2 MB of Bloom filter), where a set of address strings
+    takes 139 MB. Checking an address not in the set takes about 2.5 microseconds, and an address in the set about
+    14 microseconds, where a set of address strings takes 0.3 microseconds either way (see `bench/address_set.py`).
+
+    Addresses can be added and removed while the set is in use. They are kept aside, and merged into the buffer once
+    there are many of them.
+    """
+
+    def __init__(self, addresses=(), false_positive_rate=DEFAULT_FALSE_POSITIVE_RATE):
+        """Create a new address set.
+
+        :param addresses: (optional) the initial addresses.
+        :type: iterable of str
+
+        :param float false_positive_rate: (optional) the rate of the addresses not in the set passing the Bloom
+            filter, and having to be searched for.
+
+        :raises: ValueError: if one of the addresses has a wrong format.
+        """
+        if not 0 < false_positive_rate < 1:
+            raise ValueError('false positive rate must be between 0 and 1')
+        self.false_positive_rate = false_positive_rate
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+        self._state = self._build(set(_decode_address(address) for address in addresses))
+
+    def __contains__(self, address):
+        packed, bloom, added, removed = self._state  # swapped at once on rebuild, no locking needed
+        try:
+            if not bloom.check(_address_hash(address)):
+                return False
+            key = _decode_address(address, verify=False)
+        except (ValueError, TypeError):
+            return False
+        if key in added:
+            return True
+        return key not in removed and _search(packed, key)
+
+    def __len__(self):
+        packed, _, added, removed = self._state
+        return len(packed) // KEY_SIZE + len(added) - len(removed)
+
+    def __iter__(self):
+        packed, _, added, removed = self._state
+        for i in range(0, len(packed), KEY_SIZE):
+            key = packed[i:i + KEY_SIZE]
+            if key not in removed:
+                yield encode_check('account', key).decode()
+        for key in list(added):
+            yield encode_check('account', key).decode()
+
+    def add(self, address):
+        """Add an address to the set.
+
+        :param str address: the address to add.
+
+        :raises: ValueError: if the address has a wrong format.
+        """
+        key = _decode_address(address)
+        with self._lock:
+            packed, bloom, added, removed = self._state
+            if key in removed:
+                removed.discard(key)
+            elif not _search(packed, key):
+                bloom.add(_key_hash(key))
+                added.add(key)
+            self._maybe_rebuild()
+
+    def discard(self, address):
+        """Remove an address from the set, if present.
+
+        :param str address: the address to remove.
+
+        :raises: ValueError: if the address has a wrong format.
+        """
+        key = _decode_address(address)
+        with self._lock:
+            packed, bloom, added, removed = self._state
+            if key in added:
+                added.discard(key)
+            elif _search(packed, key):
+                removed.add(key)
+            self._maybe_rebuild()
+
+    def stats(self):
+        """Get the number of addresses, the memory taken by the packed keys and by the Bloom filter in bytes, and
+        the number of times the addresses added and removed were merged.
+
+        :rtype: dict
+        """
+        packed, bloom, _, _ = self._state
+        return {'size': len(self), 'keys_bytes': len(packed), 'bloom_bytes': len(bloom.bits), 'rebuilds': self.rebuilds}
+
+    def _maybe_rebuild(self):
+        """Merge the addresses added and removed into the buffer once there are many of them, under the lock."""
+        packed, _, added, removed = self._state
+        if len(added) + len(removed) > max(MIN_CAPACITY, len(packed) // KEY_SIZE // 16):
+            keys = set(packed[i:i + KEY_SIZE] for i in range(0, len(packed), KEY_SIZE))
+            keys.difference_update(removed)
+            keys.update(added)
+            self._state = self._build(keys)
+            self.rebuilds += 1
+
+    def _build(self, keys):
+        # leave room for the addresses added until the next rebuild
+        bloom = _BloomFilter(max(MIN_CAPACITY, len(keys) + len(keys) // 16), self.false_positive_rate)
+        for key in keys:
+            bloom.add(_key_hash(key))
+        return b''.join(sorted(keys)), bloom, set(), set()
+
+
+class _BloomFilter(object):
+    """A Bloom filter of public keys. Public keys are random, so their bits are used as the hash, see
+    :func:`_address_hash`.
+    """
+
+    def __init__(self, capacity, false_positive_rate):
+        num_bits = int(math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.num_bits = num_bits
+        self.num_hashes = max(1, int(round(float(num_bits) / capacity * math.log(2))))
+        self.bits = bytearray((num_bits + 7) // 8)
+
+    def add(self, key_hash):
+        # double hashing, two 30 bit hashes from one 60 bit hash
+        h1, h2 = key_hash & 0x3FFFFFFF, (key_hash >> 30) | 1
+        for i in range(self.num_hashes):
+            bit = (h1 + i * h2) % self.num_bits
+            self.bits[bit >> 3] |= 1 << (bit & 7)
+
+    def check(self, key_hash):
+        bits, num_bits = self.bits, self.num_bits
+        h1, h2 = key_hash & 0x3FFFFFFF, (key_hash >> 30) | 1
+        for i in range(self.num_hashes):
+            bit = (h1 + i * h2) % num_bits
+            if not bits[bit >> 3] & (1 << (bit & 7)):
+                return False  # usually after the first few bits
+        return True
+
+
+def _address_hash(address):
+    """Get 60 bits of the public key of an address, without decoding the address: the base32 digits 2 to 13 of an
+    address encode the bits 2 to 61 of its key.
+
+    :raises: ValueError: if the address has a wrong format.
+    """
+    if isinstance(address, bytes):
+        address = address.decode()
+    if len(address) != 56:
+        raise ValueError('invalid address: {}'.format(address))
+    return int(address[2:14].translate(_BASE32_DIGITS), 32)
+
+
+def _key_hash(key):
+    """Get the same bits as :func:`_address_hash`, of a public key."""
+    return (int(binascii.hexlify(key[:8]), 16) >> 2) & 0xFFFFFFFFFFFFFFF
+
+
+def _decode_address(address, verify=True):
+    """Decode an account address into its public key, faster than :func:`stellar_base.utils.decode_check`.
+
+    :raises: ValueError: if the address has a wrong format.
+    """
+    if isinstance(address, bytes):
+        address = address.decode()
+    if len(address) != 56:
+        raise ValueError('invalid address: {}'.format(address))
+    try:
+        decoded = binascii.unhexlify('%070x' % int(address.translate(_BASE32_DIGITS), 32))
+    except (ValueError, TypeError):
+        raise ValueError('invalid address: {}'.format(address))
+    if verify and (bytearray(decoded)[0] != ACCOUNT_VERSION_BYTE or calculate_checksum(decoded[:-2]) != decoded[-2:]):
+        raise ValueError('invalid address: {}'.format(address))
+    return decoded[1:-2]
+
+
+def _search(packed, key):
+    """Binary search for a key in a sorted buffer of keys."""
+    lo, hi = 0, len(packed) // KEY_SIZE
+    while lo < hi:
+        mid = (lo + hi) // 2
+        other = packed[mid * KEY_SIZE:(mid + 1) * KEY_SIZE]
+        if other < key:
+            lo = mid + 1
+        elif other > key:
+            hi = mid
+        else:
+            return True
+    return False
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+import asyncio
+
+from stellar_base.keypair import Keypair
+
+from .builder import Builder
+from .channel_manager import CHANNEL_QUEUE_TIMEOUT
+from .errors import ChannelsBusyError, HorizonError, HorizonErrorType, TransactionResultCode
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class AsyncChannelManager(object):
+    """
+    The class :class:`kin.AsyncChannelManager` is an asyncio counterpart of :class:`kin.ChannelManager`.
+    Waiting for a free channel does not block the event loop.
+    """
+    def __init__(self, secret_key, channel_keys, network, horizon):
+        self.base_key = secret_key
+        self.base_address = Keypair.from_seed(secret_key).address().decode()
+        self.num_channels = len(channel_keys)
+        self.horizon = horizon
+        # create a channel transaction builder per channel. The channel sequence is tracked locally, and fetched
+        # asynchronously when unknown.
+        self._builders = [Builder(secret=channel_key, network=network, horizon=horizon, manage_sequence=True)
+                          for channel_key in channel_keys]
+        self._channel_builders = None
+
+    @property
+    def channel_builders(self):
+        """The queue of the free channel builders. It is created on first use, from the running event loop, as
+        before python 3.10 a queue is bound to the event loop current when it is created, and the manager may be
+        created outside of the loop it is used in.
+
+        :rtype: :class:`asyncio.Queue`
+        """
+        if self._channel_builders is None:
+            channel_builders = asyncio.Queue(self.num_channels)
+            for builder in self._builders:
+                channel_builders.put_nowait(builder)
+            self._channel_builders = channel_builders
+        return self._channel_builders
+
+    async def send_transaction(self, add_ops_fn, memo_text=None):
+        """Send a transaction using an available channel account.
+
+        :param add_ops_fn: a function to call, that will add operations to the transaction. The function should be
+            `partial`, because a `source` parameter will be added.
+        :type add_ops_fn: callable[builder]
+
+        :param str memo_text: (optional) a text to add as transaction memo.
+
+        :return: transaction object
+        :rtype: dict
+        """
+        # send and retry bad sequence errors
+        retry_count = self.horizon.num_retries
+        while True:
+            # get an available channel builder first (waiting with timeout)
+            try:
+                builder = await asyncio.wait_for(self.channel_builders.get(), CHANNEL_QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise ChannelsBusyError
+
+            retrying = False
+            sequence_used = False
+            try:
+                # operation source is always the base account
+                source = self.base_address if builder.address != self.base_address else None
+
+                # add operation (using external partial) and sign
+                add_ops_fn(builder)(source=source)
+                if memo_text:
+                    builder.add_text_memo(memo_text[:28])  # max memo length is 28
+
+                if builder.sequence is None:
+                    reply = await self.horizon.account(builder.address)
+                    builder.sequence = reply.get('sequence')
+
+                builder.sign()  # always sign with a channel key
+                if source:
+                    builder.sign(secret=self.base_key)  # sign with the base key if needed
+                reply = await self.horizon.submit(builder.gen_xdr(), tx_hash=builder.hash())
+                sequence_used = True
+                return reply
+            except HorizonError as e:
+                logging.warning('send transaction error with channel {}: {}'.format(builder.address, str(e)))
+                if e.type == HorizonErrorType.TRANSACTION_FAILED:
+                    tx_result_code = e.extras.result_codes.transaction
+                    # a transaction with failed operations is still applied, and its sequence is consumed
+                    if tx_result_code == TransactionResultCode.FAILED:
+                        sequence_used = True
+                    # our sequence is out of sync, resync it and retry
+                    elif tx_result_code == TransactionResultCode.BAD_SEQUENCE:
+                        builder.invalidate_sequence()
+                        if retry_count > 0:
+                            retrying = True
+                            retry_count -= 1
+                            logging.warning('send transaction retry attempt {}'.format(retry_count))
+                            continue
+                raise
+            finally:
+                # always clean the builder and return it to the queue.
+                # if the transaction got into the ledger, also increment the channel sequence.
+                if sequence_used:
+                    builder.next()
+                else:
+                    builder.clear()
+                self.channel_builders.put_nowait(builder)
+                if retrying:
+                    await asyncio.sleep(builder.horizon.backoff_factor)
@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+import asyncio
+import json
+
+from requests.adapters import DEFAULT_POOLSIZE
+from urllib3.util import Retry
+
+from stellar_base.horizon import HORIZON_LIVE, HORIZON_TEST
+
+from .errors import HorizonError, HorizonErrorType
+from .horizon import check_horizon_reply, is_ambiguous_submit, next_page_params, settled_reply, \
+    DEFAULT_REQUEST_TIMEOUT, DEFAULT_NUM_RETRIES, DEFAULT_BACKOFF_FACTOR, DEFAULT_SETTLE_TIMEOUT, MAX_PAGE_LIMIT, \
+    SETTLE_POLL_INTERVAL, USER_AGENT
+from .sse import Event, DEFAULT_READ_TIMEOUT
+from .throttling import backoff_time, retry_after
+
+import logging
+logger = logging.getLogger(__name__)
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+DEFAULT_SSE_RETRY = 3  # the most time to wait before reconnecting a dropped SSE stream, in seconds
+
+
+class AsyncHorizon(object):
+    """
+    This class is an asyncio counterpart of :class:`kin.stellar.horizon.Horizon`, built on aiohttp:
+        - all requests share one connection pool, no thread is held during a request
+        - the same request retry functionality, with jittered exponential backoff
+        - the same Horizon error checking and deserialization
+
+    Endpoint methods are coroutines. With `sse=True`, they return an asynchronous iterator of stream events.
+    """
+    def __init__(self, horizon_uri=None, pool_size=DEFAULT_POOLSIZE, num_retries=DEFAULT_NUM_RETRIES,
+                 request_timeout=DEFAULT_REQUEST_TIMEOUT, backoff_factor=DEFAULT_BACKOFF_FACTOR, user_agent=USER_AGENT,
+                 settle_timeout=DEFAULT_SETTLE_TIMEOUT, stream_timeout=DEFAULT_READ_TIMEOUT):
+        if aiohttp is None:
+            raise ValueError('async transport not supported, missing aiohttp module')
+
+        if horizon_uri is None:
+            self.horizon_uri = HORIZON_TEST
+        else:
+            self.horizon_uri = horizon_uri
+
+        self.pool_size = pool_size
+        self.num_retries = num_retries
+        self.request_timeout = request_timeout
+        self.backoff_factor = backoff_factor
+        self.settle_timeout = settle_timeout
+        self.stream_timeout = stream_timeout  # seconds without data before a stream is reopened
+        self.user_agent = user_agent
+
+        # adding 504 to the list of statuses to retry
+        self.status_forcelist = sorted(Retry.RETRY_AFTER_STATUS_CODES) + [504]
+
+        # the session is bound to an event loop, so it is created on first use
+        self._session = None
+
+    async def close(self):
+        """Close the pooled connections."""
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    async def submit(self, te, tx_hash=None):
+        """Submit the transaction using a pooled connection, and retry on failure. When the transaction hash is
+        given, a submit that timed out, on either side, or lost its connection is settled by looking the transaction
+        up before it is resubmitted, like :meth:`kin.stellar.horizon.Horizon.submit` does."""
+        params = {'tx': te.decode() if isinstance(te, bytes) else te}
+        url = self.horizon_uri + '/transactions/'
+
+        # POST is not retried by default, for a good reason.
+        # our custom retry mechanism follows, the same as the one of Horizon.submit
+        retry_count = 0
+        while True:
+            reply = reply_text = error = None
+            try:
+                async with self._get_session().post(url, data=params, timeout=self._timeout()) as reply:
+                    reply_text = await reply.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                reply, error = None, e
+
+            if reply is not None and reply.status not in self.status_forcelist:
+                return check_horizon_reply(_json(reply.status, reply_text))
+
+            if reply is not None:
+                logging.warning('horizon submit failed, reply: [{}] {}'.format(reply.status, reply_text))
+            else:
+                logging.warning('horizon submit exception: {}'.format(str(error)))
+
+            # the request may have been sent before the connection timed out or dropped
+            sent = isinstance(error, (asyncio.TimeoutError, aiohttp.ServerDisconnectedError))
+            if tx_hash and is_ambiguous_submit(reply.status if reply is not None else None, sent):
+                settled = await self._settle(tx_hash)
+                if settled is not None:
+                    return settled
+
+            if retry_count >= self.num_retries:
+                if error is not None:
+                    raise error
+                return check_horizon_reply(_json(reply.status, reply_text))
+            retry_count += 1
+            logging.warning('submit retry attempt {}'.format(retry_count))
+            # jittered, so that clients failing together do not retry together, but not before Horizon asks to
+            await asyncio.sleep(max(backoff_time(self.backoff_factor, retry_count - 1), retry_after(reply)))
+
+    async def _settle(self, tx_hash):
+        """Look up a transaction whose submit failed ambiguously, until it is found or `settle_timeout` passes."""
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self.settle_timeout
+        while True:
+            try:
+                tx = await self.transaction(tx_hash)
+                break
+            except HorizonError as e:
+                if e.type != HorizonErrorType.NOT_FOUND:
+                    return None
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass  # still unknown, look again
+            if loop.time() >= deadline:
+                return None
+            await asyncio.sleep(min(SETTLE_POLL_INTERVAL, deadline - loop.time()))
+        return settled_reply(tx)
+
+    async def query(self, rel_url, params=None, sse=False):
+        abs_url = self.horizon_uri + rel_url
+        reply = await self._query(abs_url, params, sse)
+        return check_horizon_reply(reply) if not sse else reply
+
+    async def iterate(self, rel_url, params=None, prefetch=True):
+        """Iterate over the records of a collection endpoint, following the `next` links page by page.
+        See :meth:`kin.stellar.horizon.Horizon.iterate`.
+
+        :return: an asynchronous generator of the collection records.
+        """
+        params = dict(params or {})
+        params.setdefault('limit', MAX_PAGE_LIMIT)
+
+        page = await self.query(rel_url, params)
+        while True:
+            next_params = next_page_params(page, params)
+            next_page = None
+            if next_params and prefetch:
+                next_page = asyncio.ensure_future(self.query(rel_url, next_params))
+
+            try:
+                for record in page['_embedded']['records']:
+                    yield record
+            except GeneratorExit:  # the caller stopped early
+                if next_page is not None:
+                    next_page.cancel()
+                raise
+
+            if not next_params:
+                return
+            page = await next_page if next_page is not None else await self.query(rel_url, next_params)
+            params = next_params
+
+    async def account(self, address):
+        url = '/accounts/' + address
+        return await self.query(url)
+
+    async def account_effects(self, address, params=None, sse=False):
+        url = '/accounts/' + address + '/effects/'
+        return await self.query(url, params, sse)
+
+    async def account_offers(self, address, params=None):
+        url = '/accounts/' + address + '/offers/'
+        return await self.query(url, params)
+
+    async def account_operations(self, address, params=None, sse=False):
+        url = '/accounts/' + address + '/operations/'
+        return await self.query(url, params, sse)
+
+    async def account_transactions(self, address, params=None, sse=False):
+        url = '/accounts/' + address + '/transactions/'
+        return await self.query(url, params, sse)
+
+    async def account_payments(self, address, params=None, sse=False):
+        url = '/accounts/' + address + '/payments/'
+        return await self.query(url, params, sse)
+
+    async def transactions(self, params=None, sse=False):
+        url = '/transactions/'
+        return await self.query(url, params, sse)
+
+    async def transaction(self, tx_hash):
+        url = '/transactions/' + tx_hash
+        return await self.query(url)
+
+    async def transaction_operations(self, tx_hash, params=None):
+        url = '/transactions/' + tx_hash + '/operations/'
+        return await self.query(url, params)
+
+    async def transaction_effects(self, tx_hash, params=None):
+        url = '/transactions/' + tx_hash + '/effects/'
+        return await self.query(url, params)
+
+    async def transaction_payments(self, tx_hash, params=None):
+        url = '/transactions/' + tx_hash + '/payments/'
+        return await self.query(url, params)
+
+    async def order_book(self, params=None):
+        url = '/order_book/'
+        return await self.query(url, params)
+
+    async def trades(self, params=None):
+        url = '/trades/'
+        return await self.query(url, params)
+
+    async def ledgers(self, params=None, sse=False):
+        url = '/ledgers/'
+        return await self.query(url, params, sse)
+
+    async def ledger(self, ledger_id):
+        url = '/ledgers/' + str(ledger_id)
+        return await self.query(url)
+
+    async def ledger_effects(self, ledger_id, params=None):
+        url = '/ledgers/' + str(ledger_id) + '/effects/'
+        return await self.query(url, params)
+
+    async def ledger_operations(self, ledger_id, params=None):
+        url = '/ledgers/' + str(ledger_id) + '/operations/'
+        return await self.query(url, params)
+
+    async def ledger_payments(self, ledger_id, params=None):
+        url = '/ledgers/' + str(ledger_id) + '/payments/'
+        return await self.query(url, params)
+
+    async def effects(self, params=None, sse=False):
+        url = '/effects/'
+        return await self.query(url, params, sse)
+
+    async def operations(self, params=None, sse=False):
+        url = '/operations/'
+        return await self.query(url, params, sse)
+
+    async def operation(self, op_id, params=None):
+        url = '/operations/' + str(op_id)
+        return await self.query(url, params)
+
+    async def operation_effects(self, op_id, params=None):
+        url = '/operations/' + str(op_id) + '/effects/'
+        return await self.query(url, params)
+
+    async def payments(self, params=None, sse=False):
+        url = '/payments/'
+        return await self.query(url, params, sse)
+
+    async def assets(self, params=None):
+        url = '/assets/'
+        return await self.query(url, params)
+
+    async def _query(self, url, params=None, sse=False):
+        params = _stringify(params)
+        if not sse:
+            return await self._get(url, params)
+
+        # SSE connection
+        events = AsyncSSEClient(self._get_session(), url, params=params, connect_timeout=self.request_timeout,
+                                read_timeout=self.stream_timeout)
+        await events.connect()
+        return events
+
+    async def _get(self, url, params):
+        """GET the url and decode the json reply, retrying connection errors and retriable statuses
+        with exponential backoff, like the retry handler of the synchronous session does."""
+        retry_count = 0
+        while True:
+            try:
+                async with self._get_session().get(url, params=params, timeout=self._timeout()) as reply:
+                    if reply.status not in self.status_forcelist or retry_count >= self.num_retries:
+                        return _json(reply.status, await reply.text())
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if retry_count >= self.num_retries:
+                    raise
+            retry_count += 1
+            await asyncio.sleep(self._backoff_time(retry_count))
+
+    def _backoff_time(self, retry_count):
+        # same as the retry handler of the synchronous session: no wait before the first retry, then jittered
+        # exponential
+        if retry_count <= 1:
+            return 0
+        return backoff_time(self.backoff_factor, retry_count - 1)
+
+    def _get_session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self._session = aiohttp.ClientSession(connector=connector, headers={'User-Agent': self.user_agent})
+        return self._session
+
+    def _timeout(self):
+        return aiohttp.ClientTimeout(total=self.request_timeout)
+
+    @staticmethod
+    def testnet():
+        return AsyncHorizon(horizon_uri=HORIZON_TEST)
+
+    @staticmethod
+    def livenet():
+        return AsyncHorizon(horizon_uri=HORIZON_LIVE)
+
+
+class AsyncSSEClient(object):
+    """An asynchronous iterator of server-sent events, the asyncio counterpart of
+    :class:`kin.stellar.sse.EventStream`. A stream that ends, breaks, or gets no data for `read_timeout` seconds is
+    reopened with the id of the last received event, so that no events are lost. Reconnects are delayed by a random
+    wait, up to the retry time set by the server, doubled on every consecutive failure."""
+    def __init__(self, session, url, params=None, retry=DEFAULT_SSE_RETRY, connect_timeout=None,
+                 read_timeout=DEFAULT_READ_TIMEOUT):
+        self.session = session
+        self.url = url
+        self.params = params
+        self.retry = retry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.last_id = None
+        self.reconnects = 0  # times the stream was reopened
+        self._failures = 0  # consecutive failed connections
+        self._reply = None
+
+    async def connect(self):
+        headers = {'Accept': 'text/event-stream', 'Cache-Control': 'no-cache'}
+        if self.last_id:
+            headers['Last-Event-ID'] = self.last_id
+        timeout = aiohttp.ClientTimeout(total=None, connect=self.connect_timeout, sock_read=self.read_timeout)
+        reply = await self.session.get(self.url, params=self.params, headers=headers, timeout=timeout)
+        try:
+            reply.raise_for_status()
+        except aiohttp.ClientError:
+            reply.close()
+            raise
+        self._reply = reply
+
+    def close(self):
+        if self._reply:
+            self._reply.close()
+            self._reply = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            if self._reply is None:
+                await asyncio.sleep(backoff_time(self.retry, self._failures))
+                self.reconnects += 1
+                try:
+                    await self.connect()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    self._failures += 1
+                    logging.warning('sse stream {} not reopened: {}'.format(self.url, str(e)))
+                    continue
+
+            try:
+                event = await self._read_event()
+                if event:
+                    self._failures = 0
+                    return event
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logging.warning('sse stream error: {}, reconnecting'.format(str(e)))
+            # the stream ended, broke or stalled, reconnect
+            self.close()
+
+    async def _read_event(self):
+        """Read lines up to the end of the next event. Returns None if the stream ends."""
+        event = Event()
+        data = []
+        while True:
+            line = await self._reply.content.readline()
+            if not line:
+                return None
+            line = line.decode('utf-8').rstrip('\r\n')
+
+            if not line:  # end of event
+                if event.id is not None:
+                    self.last_id = event.id
+                if data:  # events without data are not dispatched
+                    event.data = '\n'.join(data)
+                    return event
+                event = Event()
+                continue
+
+            if line.startswith(':'):  # comment
+                continue
+            field, _, value = line.partition(':')
+            if value.startswith(' '):
+                value = value[1:]
+            if field == 'data':
+                data.append(value)
+            elif field == 'event':
+                event.event = value
+            elif field == 'id':
+                event.id = value
+            elif field == 'retry' and value.isdigit():
+                event.retry = int(value)
+                self.retry = event.retry / 1000.0
+
+
+def _json(status, text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        raise Exception('invalid horizon reply: [{}] {}'.format(status, text))
+
+
+def _stringify(params):
+    """aiohttp only accepts string query values."""
+    if not params:
+        return params
+    return {key: str(value).lower() if isinstance(value, bool) else str(value) for key, value in params.items()}
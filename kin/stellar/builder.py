@@ -2,6 +2,8 @@
 
 # Copyright (C) 2018 Kin Foundation
 
+import binascii
+
 from stellar_base.builder import Builder as BaseBuilder
 from stellar_base.keypair import Keypair
 from stellar_base.memo import NoneMemo
@@ -15,7 +17,7 @@ class Builder(BaseBuilder):
     """
     This class overrides :class:`stellar_base.builder` to provide additional functionality.
     """
-    def __init__(self, secret=None, address=None, horizon=None, horizon_uri=None, network=None):
+    def __init__(self, secret=None, address=None, horizon=None, horizon_uri=None, network=None, manage_sequence=False):
         if secret:
             if not is_valid_secret_key(secret):
                 raise ValueError('invalid secret key')
@@ -40,6 +42,11 @@ class Builder(BaseBuilder):
         else:
             self.horizon = Horizon(HORIZON_LIVE) if self.network == 'PUBLIC' else Horizon(HORIZON_TEST)
 
+        # when the sequence is self-managed, it is fetched from Horizon only when unknown
+        self.manage_sequence = manage_sequence
+        if self.manage_sequence:
+            self.sequence = None
+
     def clear(self):
         """"Clears the builder so it can be reused."""
         self.ops = []
@@ -49,9 +56,25 @@ class Builder(BaseBuilder):
         self.tx = None
         self.te = None
 
+    def append_op(self, operation):
+        """
+        Alternative implementation that does not skip operations identical to the ones already added.
+        A transaction may legitimately contain identical payments, and comparing every pair is quadratic.
+        """
+        self.ops.append(operation)
+        return self
+
     def get_sequence(self):
         """Alternative implementation to expose exceptions"""
-        return self.horizon.account(self.address).get('sequence')
+        return self.horizon.account(self.address, use_cache=False).get('sequence')
+
+    def update_sequence(self):
+        """Update the account sequence number from Horizon."""
+        self.sequence = self.get_sequence()
+
+    def invalidate_sequence(self):
+        """Forget the self-managed sequence number, so that it will be fetched from Horizon on the next sign."""
+        self.sequence = None
 
     def next(self):
         """
@@ -63,12 +86,22 @@ class Builder(BaseBuilder):
 
     def sign(self, secret=None):
         """
-        Alternative implementation that does not use the self-managed sequence, but always fetches it from Horizon.
+        Alternative implementation that always fetches the sequence from Horizon, unless the sequence is
+        self-managed, in which case it is only fetched when unknown.
         """
         if not secret:  # only get the new sequence for my own account
-            self.sequence = self.get_sequence()
+            if not self.manage_sequence or self.sequence is None:
+                self.update_sequence()
         super(Builder, self).sign(secret)
 
+    def hash(self):
+        """Get the hex encoded hash of the signed transaction, the same as Horizon reports."""
+        return binascii.hexlify(self.te.hash_meta()).decode()
+
+    def submit(self):
+        """Alternative implementation that passes the transaction hash, to settle ambiguous submit failures."""
+        return self.horizon.submit(self.gen_xdr(), tx_hash=self.hash())
+
     def append_create_account_op(self, destination, starting_balance, source=None, pretrusted_asset=None):
         """
         Alternative implementation that allows to create a trustline in addition to the create account operation
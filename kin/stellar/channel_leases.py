@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+import errno
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # not available on windows
+    fcntl = None
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+LEASE_POLL_INTERVAL = 0.05  # how long to wait before trying again when all channels are leased elsewhere, in seconds
+
+
+class ChannelLeases(object):
+    """
+    The class :class:`kin.ChannelLeases` lets several processes on one host, e.g. the workers of a pre-fork server,
+    share the same channels without colliding on their sequence numbers. A channel is leased by one process at a
+    time, with an exclusive lock on a lease file in a shared directory. The lease is held while the process has
+    transactions of the channel in flight, and the lease file passes the channel sequence on to the next process.
+
+    The locks are released by the operating system when a process exits, so the leases of a crashed process expire
+    immediately. The sequence of a channel leased by a crashed process is fetched again from Horizon.
+    """
+
+    def __init__(self, directory):
+        """Create a new lease table.
+
+        :param str directory: the directory of the lease files, shared by the processes. It is created if missing.
+
+        :raises: ValueError: if file locks are not supported on this platform.
+        """
+        if fcntl is None:
+            raise ValueError('channel leases are not supported on this platform')
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        self.directory = directory
+        self.acquired = 0  # leases acquired
+        self.contended = 0  # leases not acquired, because another process held them
+
+        self._files = {}  # channel address -> locked lease file
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def acquire(self, address):
+        """Try to lease a channel, without waiting.
+
+        :param str address: the address of the channel.
+
+        :return: whether the channel was leased, and the next sequence of the channel as left by the previous lease
+            holder, or None if it is not known.
+        :rtype: tuple(boolean, int)
+        """
+        with self._lock:
+            self._check_fork()
+            if address in self._files:
+                raise ValueError('channel already leased: {}'.format(address))
+
+            f = open(os.path.join(self.directory, address), 'a+')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError as e:
+                f.close()
+                if e.errno not in (errno.EACCES, errno.EAGAIN):
+                    raise
+                self.contended += 1
+                return False, None
+
+            f.seek(0)
+            content = f.read().strip()
+            # the sequence is unknown while the lease is held, in case this process crashes
+            f.seek(0)
+            f.truncate()
+            f.flush()
+
+            self._files[address] = f
+            self.acquired += 1
+            return True, int(content) if content else None
+
+    def release(self, address, next_sequence):
+        """Release a leased channel.
+
+        :param str address: the address of the channel.
+
+        :param next_sequence: the next sequence of the channel, or None if it is not known.
+        :type: int or None
+        """
+        with self._lock:
+            self._check_fork()
+            f = self._files.pop(address, None)
+            if f is None:
+                return
+            try:
+                if next_sequence is not None:
+                    f.write(str(next_sequence))
+                    f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+                f.close()
+
+    def stats(self):
+        """Get the number of channels leased by this process, and the numbers of leases acquired and not acquired
+        because another process held them.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {'leased': len(self._files), 'acquired': self.acquired, 'contended': self.contended}
+
+    def _check_fork(self):
+        # a forked child shares the locks of its parent, it must not use or release them
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._files = {}
@@ -3,12 +3,16 @@
 # Copyright (C) 2018 Kin Foundation
 
 import sys
-from time import sleep
+import threading
+from time import sleep, time
 
 from stellar_base.keypair import Keypair
 
 from .builder import Builder
-from .errors import ChannelsBusyError, HorizonError, HorizonErrorType, TransactionResultCode
+from .channel_leases import LEASE_POLL_INTERVAL
+from .errors import ChannelsBusyError, CircuitOpenError, HorizonError, HorizonErrorType, TransactionResultCode
+from .horizon import settled_reply
+from .journal import APPLIED, FAILED, REJECTED
 
 import logging
 logger = logging.getLogger(__name__)
@@ -20,22 +24,181 @@ else:
     import queue as queue
 
 CHANNEL_QUEUE_TIMEOUT = 11  # how much time to wait until a channel is available, in seconds
+DEFAULT_MAX_FAILURES = 3  # consecutive channel failures before the channel is quarantined
+DEFAULT_QUARANTINE_TIME = 30  # seconds, doubled for every consecutive quarantine
+MAX_QUARANTINE_TIME = 300  # seconds
+LATENCY_SMOOTHING = 0.3  # weight of the newest measurement in the latency moving average
+DEFAULT_STARVATION_TIME = 5  # how long a send waits behind sends of higher priority at most, in seconds
+
+# transaction priorities, higher priority sends take the available channels first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_NAMES = {PRIORITY_HIGH: 'high', PRIORITY_NORMAL: 'normal', PRIORITY_LOW: 'low'}
+
+# transaction results and errors telling that the channel, rather than the transaction, is at fault: its sequence
+# is out of sync, it cannot pay the fee, it does not exist, or Horizon fails to handle it
+CHANNEL_FAULT_RESULTS = frozenset([TransactionResultCode.BAD_SEQUENCE, TransactionResultCode.INSUFFICIENT_BALANCE,
+                                   TransactionResultCode.NO_ACCOUNT])
+CHANNEL_FAULT_ERRORS = frozenset([HorizonErrorType.NOT_FOUND, HorizonErrorType.TIMEOUT,
+                                  HorizonErrorType.INTERNAL_SERVER_ERROR])
+# errors telling that the transaction was not accepted, rather than not knowing
+REJECTION_ERRORS = frozenset([HorizonErrorType.TRANSACTION_MALFORMED, HorizonErrorType.BAD_REQUEST])
 
 
 class ChannelManager(object):
-    """ The class :class:`kin.ChannelManager` wraps channel-related specifics of transaction sending."""
-    def __init__(self, secret_key, channel_keys, network, horizon):
+    """
+    The class :class:`kin.ChannelManager` wraps channel-related specifics of transaction sending.
+
+    With `max_in_flight` above 1, a channel sends several transactions at once, each with its own reserved sequence
+    number (see :class:`kin.stellar.channel_manager.ChannelSequence`), so that the channel is not idle while a
+    transaction waits for its ledger to close.
+
+    The health of every channel is tracked (see :class:`kin.stellar.channel_manager.ChannelHealth`). Healthy and fast
+    channels are preferred, and a channel failing `max_failures` times in a row is quarantined for a while, unless it
+    is the last channel in use.
+
+    Every transaction has a priority: when sends wait for a channel, the available channels go to the higher
+    priority sends first, so that e.g. a bulk airdrop does not delay user withdrawals. A send waiting longer than
+    `starvation_time` is served as a high priority send. The first `reserved_channels` channels can be reserved for
+    high priority sends, so that they find a channel at once even when the other channels are all busy.
+
+    Channels can be added and removed while transactions are sent, e.g. by a :class:`kin.ChannelScaler`.
+
+    Several processes can share the same channels with :class:`kin.ChannelLeases`: a channel is then only used by
+    the process holding its lease, and the channels leased by other processes are skipped.
+
+    With a :class:`kin.TransactionJournal`, every transaction is journaled before it is submitted, and marked with
+    its outcome once known, so that the transactions in flight when the process died can be resolved on restart.
+    """
+    def __init__(self, secret_key, channel_keys, network, horizon, max_in_flight=1, max_failures=DEFAULT_MAX_FAILURES,
+                 quarantine_time=DEFAULT_QUARANTINE_TIME, leases=None, journal=None, reserved_channels=0,
+                 starvation_time=DEFAULT_STARVATION_TIME):
+        if max_in_flight < 1:
+            raise ValueError('max in flight must be positive')
+        if max_failures < 1:
+            raise ValueError('max failures must be positive')
+        if not 0 <= reserved_channels < len(channel_keys):
+            raise ValueError('reserved channels must leave a channel for all priorities')
+
         self.base_key = secret_key
         self.base_address = Keypair.from_seed(secret_key).address().decode()
         self.num_channels = len(channel_keys)
-        self.channel_builders = queue.Queue(len(channel_keys))
+        self.max_in_flight = max_in_flight
+        self.channel_health = {}  # channel address -> ChannelHealth
+        self.reserved = set()  # addresses of the channels reserved for high priority
+        self.channel_builders = _ChannelQueue(self.channel_health, self.reserved, starvation_time)
+        self.channel_sequences = {}  # channel address -> ChannelSequence
+        self.max_failures = max_failures
+        self.quarantine_time = quarantine_time
+        self.leases = leases
+        self.journal = journal
+        self.network = network
         self.horizon = horizon
-        for channel_key in channel_keys:
-            # create a channel transaction builder.
-            builder = Builder(secret=channel_key, network=network, horizon=horizon)
+
+        # usage counters, see stats()
+        self.sends = 0  # channels taken to send a transaction, including retries
+        self.wait_time = 0.0  # total time spent waiting for a channel, in seconds
+        self.busy = 0  # sends that found no available channel in time
+        self.priorities = dict((priority, {'sends': 0, 'wait_time': 0.0, 'busy': 0}) for priority in PRIORITY_NAMES)
+        self.in_use = 0
+        self.peak_in_use = 0
+
+        self._removing = {}  # address of a channel being removed -> number of its builders taken out of use
+        self._quarantined = []  # builders of quarantined channels
+        self._leased = {}  # channel address -> number of builders using the lease of the channel
+        self._lock = threading.Condition()
+        for _ in range(max_in_flight):
+            for channel_key in channel_keys:
+                # create a channel transaction builder per transaction in flight. The channel sequence is tracked
+                # locally, so that it does not have to be fetched from Horizon for every transaction.
+                builder = Builder(secret=channel_key, network=network, horizon=horizon, manage_sequence=True)
+                if builder.address not in self.channel_sequences:
+                    self.channel_sequences[builder.address] = ChannelSequence(builder.get_sequence)
+                    self.channel_health[builder.address] = ChannelHealth(builder.address)
+                    if len(self.channel_health) <= reserved_channels:
+                        self.reserved.add(builder.address)
+                self.channel_builders.put(builder)
+
+    def add_channel(self, channel_key):
+        """Start sending transactions with another channel.
+
+        :param str channel_key: the secret key of the channel account.
+        """
+        builders = [Builder(secret=channel_key, network=self.network, horizon=self.horizon, manage_sequence=True)
+                    for _ in range(self.max_in_flight)]
+        with self._lock:
+            self.channel_sequences[builders[0].address] = ChannelSequence(builders[0].get_sequence)
+            self.channel_health[builders[0].address] = ChannelHealth(builders[0].address)
+            self.num_channels += 1
+        for builder in builders:
             self.channel_builders.put(builder)
 
-    def send_transaction(self, add_ops_fn, memo_text=None):
+    def remove_channel(self, address):
+        """Stop sending transactions with a channel, waiting for its transactions in flight to be done.
+
+        :param str address: the address of the channel account.
+
+        :raises: ValueError: if the channel is not in use.
+        """
+        with self._lock:
+            if address not in self.channel_sequences or address in self._removing:
+                raise ValueError('channel not in use: {}'.format(address))
+            self._removing[address] = 0
+            self.num_channels -= 1
+            idle = [builder for builder in self._quarantined if builder.address == address]
+            self._quarantined = [builder for builder in self._quarantined if builder.address != address]
+
+        # take the idle builders of the channel out of the queue, the busy ones are taken out when they are returned
+        idle.extend(self.channel_builders.drain())
+        for builder in idle:
+            self._put_builder(builder)
+
+        with self._lock:
+            while self._removing[address] < self.max_in_flight:
+                self._lock.wait()
+            del self._removing[address]
+            del self.channel_sequences[address]
+            del self.channel_health[address]
+            self.reserved.discard(address)
+
+    def stats(self, reset_peak=False):
+        """Get the channel usage: the number of channels and of channels reserved for high priority, the number of
+        transactions every channel may have in flight, the number of channel slots in use and the peak since the
+        last reset, and the total numbers of sends, seconds spent waiting for a channel and sends that found no
+        channel in time, also by priority.
+
+        :param boolean reset_peak: (optional) whether to start measuring a new peak.
+
+        :rtype: dict
+        """
+        with self._lock:
+            stats = {
+                'channels': self.num_channels,
+                'reserved': len(self.reserved),
+                'max_in_flight': self.max_in_flight,
+                'in_use': self.in_use,
+                'peak_in_use': self.peak_in_use,
+                'sends': self.sends,
+                'wait_time': self.wait_time,
+                'busy': self.busy,
+                'priorities': dict((PRIORITY_NAMES[priority], dict(counters))
+                                   for priority, counters in self.priorities.items()),
+            }
+            if reset_peak:
+                self.peak_in_use = self.in_use
+        return stats
+
+    def health(self):
+        """Get the health of the channels, see :meth:`kin.stellar.channel_manager.ChannelHealth.status`.
+
+        :rtype: list of dict
+        """
+        now = time()
+        with self._lock:
+            return [health.status(now) for health in self.channel_health.values()]
+
+    def send_transaction(self, add_ops_fn, memo_text=None, priority=PRIORITY_NORMAL):
         """Send a transaction using an available channel account.
 
         :param add_ops_fn: a function to call, that will add operations to the transaction. The function should be
@@ -44,20 +207,38 @@ class ChannelManager(object):
 
         :param str memo_text: (optional) a text to add as transaction memo.
 
+        :param int priority: (optional) the transaction priority, one of `PRIORITY_HIGH`, `PRIORITY_NORMAL` (default)
+            or `PRIORITY_LOW`.
+
         :return: transaction object
         :rtype: dict
+
+        :raises: ValueError: if the priority is not known.
         """
+        if priority not in PRIORITY_NAMES:
+            raise ValueError('invalid priority: {}'.format(priority))
+
         # send and retry bad sequence errors
         retry_count = self.horizon.num_retries
         while True:
             # get an available channel builder first (blocking with timeout)
-            try:
-                builder = self.channel_builders.get(True, CHANNEL_QUEUE_TIMEOUT)
-            except queue.Empty:
-                raise ChannelsBusyError
+            builder = self._take_builder(priority)
 
+            sequence = self.channel_sequences[builder.address]
+            reserved = None
+            submitted = False
+            sequence_used = None  # unknown until Horizon tells
             retrying = False
+            healthy = None  # whether the channel worked, None if the outcome does not tell
+            channel_step = True  # whether the current step depends on the channel rather than on the transaction
+            submit_start = None
+            tx_hash = None  # of the journaled transaction
+            outcome = None  # of the journaled transaction, None while not known
             try:
+                reserved = sequence.reserve()
+                builder.sequence = str(reserved)
+                channel_step = False
+
                 # operation source is always the base account
                 source = self.base_address if builder.address != self.base_address else None
 
@@ -69,21 +250,496 @@ class ChannelManager(object):
                 builder.sign()  # always sign with a channel key
                 if source:
                     builder.sign(secret=self.base_key)  # sign with the base key if needed
-                return builder.submit()
+
+                # an earlier transaction of the channel failed meanwhile, this one would fail with a bad sequence
+                if not sequence.wait_turn(reserved):
+                    sequence_used = False
+                    if retry_count > 0:
+                        retrying = True
+                        retry_count -= 1
+                        continue
+                    raise ChannelsBusyError
+
+                if self.journal:
+                    tx_hash = builder.hash()
+                    self.journal.record(tx_hash, builder.gen_xdr())
+
+                submitted = True
+                channel_step = True
+                submit_start = time()
+                try:
+                    reply = builder.submit()
+                except Exception as e:
+                    # tell the sender whether a journaled transaction got into the ledger, before it is sent again
+                    reply = self._settle(tx_hash, e) if tx_hash else None
+                    if reply is None:
+                        raise
+                sequence_used = True
+                healthy = True
+                outcome = APPLIED
+                return reply
             except HorizonError as e:
                 logging.warning('send transaction error with channel {}: {}'.format(builder.address, str(e)))
-                # retry bad sequence error
-                if e.type == HorizonErrorType.TRANSACTION_FAILED \
-                        and e.extras.result_codes.transaction == TransactionResultCode.BAD_SEQUENCE \
-                        and retry_count > 0:
+                if e.type == HorizonErrorType.TRANSACTION_FAILED:
+                    tx_result_code = e.extras.result_codes.transaction
+                    outcome = FAILED if tx_result_code == TransactionResultCode.FAILED else REJECTED
+                    if tx_result_code in CHANNEL_FAULT_RESULTS:
+                        healthy = False
+                    # a transaction with failed operations is still applied, and its sequence is consumed
+                    if tx_result_code == TransactionResultCode.FAILED:
+                        sequence_used = True
+                        healthy = True
+                    # our sequence is out of sync, resync it and retry
+                    elif tx_result_code == TransactionResultCode.BAD_SEQUENCE:
+                        sequence.resync()
+                        if retry_count > 0:
                             retrying = True
                             retry_count -= 1
                             logging.warning('send transaction retry attempt {}'.format(retry_count))
                             continue
+                    # otherwise the transaction was rejected, and its sequence is not consumed
+                    else:
+                        sequence_used = False
+                elif channel_step and e.type in CHANNEL_FAULT_ERRORS:
+                    healthy = False
+                elif e.type in REJECTION_ERRORS:
+                    outcome = REJECTED
+                raise
+            except CircuitOpenError:
+                raise  # Horizon is overloaded, not the channel
+            except Exception:
+                if channel_step:
+                    healthy = False  # a network error
                 raise
             finally:
-                # always clean the builder and return it to the queue
+                # always clean the builder and return it to the queue, and settle the reserved sequence.
+                # a transaction that failed before it was submitted did not use its sequence either.
+                if tx_hash and outcome:
+                    self.journal.resolve(tx_hash, outcome)
                 builder.clear()
-                self.channel_builders.put(builder)
+                if reserved is not None:
+                    sequence.release(reserved, sequence_used if submitted else False)
+                self._unlease(builder.address)
+                with self._lock:
+                    self.in_use -= 1
+                if healthy is not None:
+                    self._record(builder.address, healthy, time() - submit_start if healthy else None)
+                self._put_builder(builder)
                 if retrying:
                     sleep(builder.horizon.backoff_factor)
+
+    def _settle(self, tx_hash, error):
+        """Look up a journaled transaction whose submit failed without telling whether it got into the ledger, as
+        its sender may send it again. A transaction not found is abandoned, so that it is not resubmitted on replay.
+
+        :param str tx_hash: the hex encoded transaction hash.
+
+        :param error: the submit error.
+        :type: :class:`Exception`
+
+        :return: the submit reply, if the transaction got into the ledger, or None.
+        :rtype: dict
+
+        :raises: :class:`kin.stellar.errors.HorizonError`: if the transaction failed in the ledger.
+        """
+        if isinstance(error, HorizonError) and (error.type == HorizonErrorType.TRANSACTION_FAILED
+                                                or error.type in REJECTION_ERRORS):
+            return None  # not ambiguous
+        try:
+            return settled_reply(self.horizon.transaction(tx_hash))
+        except HorizonError as e:
+            if e.type == HorizonErrorType.TRANSACTION_FAILED:
+                raise
+            if e.type != HorizonErrorType.NOT_FOUND:
+                logger.warning('journaled transaction {} not looked up: {}'.format(tx_hash, e))
+        except Exception as e:
+            logger.warning('journaled transaction {} not looked up: {}'.format(tx_hash, e))
+        self.journal.abandon(tx_hash)
+        return None
+
+    def _take_builder(self, priority):
+        start = time()
+        deadline = start + CHANNEL_QUEUE_TIMEOUT
+        skipped = []  # builders of the channels leased by other processes
+        try:
+            while True:
+                readmit_at = self._readmit()
+                if skipped and self.channel_builders.empty():
+                    # all the available channels are leased elsewhere, wait for one of them to be released
+                    for builder in skipped:
+                        self._put_builder(builder)
+                    skipped = []
+                    sleep(max(0, min(LEASE_POLL_INTERVAL, deadline - time())))
+
+                timeout = max(0, min(deadline, readmit_at) - time())
+                try:
+                    builder = self.channel_builders.take(priority, timeout, start)
+                except queue.Empty:
+                    if time() < deadline:
+                        continue  # a quarantined channel is due for readmission
+                    self._count_send(priority, time() - start, busy=True)
+                    raise ChannelsBusyError
+                if not self._keep(builder) or self._quarantine(builder):
+                    continue
+                if self._lease(builder.address):
+                    break
+                skipped.append(builder)
+        finally:
+            for other in skipped:
+                self._put_builder(other)
+
+        self._count_send(priority, time() - start)
+        with self._lock:
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+        return builder
+
+    def _count_send(self, priority, wait_time, busy=False):
+        with self._lock:
+            self.sends += 1
+            self.wait_time += wait_time
+            counters = self.priorities[priority]
+            counters['sends'] += 1
+            counters['wait_time'] += wait_time
+            if busy:
+                self.busy += 1
+                counters['busy'] += 1
+
+    def _put_builder(self, builder):
+        # under the lock, so that a channel being removed does not miss the builder
+        with self._lock:
+            if self._keep(builder) and not self._quarantine(builder):
+                self.channel_builders.put(builder)
+
+    def _keep(self, builder):
+        """Check whether a builder is still in use, taking it out of use if its channel is being removed."""
+        with self._lock:
+            if builder.address not in self._removing:
+                return True
+            self._removing[builder.address] += 1
+            self._lock.notify_all()
+            return False
+
+    def _lease(self, address):
+        """Lease the channel for this process, if leases are used.
+
+        :return: whether the channel can be used.
+        """
+        if self.leases is None:
+            return True
+        with self._lock:
+            count = self._leased.get(address, 0)
+            if not count:
+                leased, next_sequence = self.leases.acquire(address)
+                if not leased:
+                    return False
+                # the channel may have been used by another process since
+                self.channel_sequences[address].restore(next_sequence)
+            self._leased[address] = count + 1
+            return True
+
+    def _unlease(self, address):
+        """Release the lease of the channel once this process has no transactions of the channel in flight."""
+        if self.leases is None:
+            return
+        with self._lock:
+            self._leased[address] -= 1
+            if not self._leased[address]:
+                del self._leased[address]
+                self.leases.release(address, self.channel_sequences[address].export())
+
+    def _quarantine(self, builder):
+        """Set the builder aside if its channel is quarantined.
+
+        :return: whether the builder was set aside.
+        """
+        with self._lock:
+            if not self.channel_health[builder.address].quarantined(time()):
+                return False
+            self._quarantined.append(builder)
+            return True
+
+    def _readmit(self):
+        """Put the builders of the channels whose quarantine is over back into the queue.
+
+        :return: the time the next quarantine is over, or infinity if no channel is quarantined.
+        """
+        now = time()
+        readmitted = []
+        next_readmission = float('inf')
+        with self._lock:
+            for builder in self._quarantined:
+                health = self.channel_health[builder.address]
+                if health.quarantined(now):
+                    next_readmission = min(next_readmission, health.quarantined_until)
+                else:
+                    # on probation: one more failure quarantines the channel again
+                    health.consecutive_failures = min(health.consecutive_failures, self.max_failures - 1)
+                    readmitted.append(builder)
+            if readmitted:
+                self._quarantined = [builder for builder in self._quarantined if builder not in readmitted]
+            for builder in readmitted:
+                logger.info('channel {} readmitted'.format(builder.address))
+                self.channel_builders.put(builder)
+        return next_readmission
+
+    def _record(self, address, success, latency=None):
+        """Record the outcome of a transaction of a channel, quarantining the channel after too many consecutive
+        failures, unless no other channel is available.
+        """
+        now = time()
+        with self._lock:
+            health = self.channel_health[address]
+            if success:
+                health.record_success(latency)
+                return
+
+            health.record_failure()
+            if health.consecutive_failures < self.max_failures or health.quarantined(now):
+                return
+            # a channel open to all priorities is not quarantined if only the reserved channels are left
+            available = [other for other in self.channel_health.values()
+                         if not other.quarantined(now) and other.address not in self._removing
+                         and (address in self.reserved or other.address not in self.reserved)]
+            if len(available) <= 1:
+                return
+            duration = min(MAX_QUARANTINE_TIME, self.quarantine_time * (2 ** health.quarantines))
+            health.quarantined_until = now + duration
+            health.quarantines += 1
+            logger.warning('channel {} quarantined for {} seconds after {} consecutive failures'.format(
+                address, duration, health.consecutive_failures))
+
+
+class ChannelHealth(object):
+    """
+    The class :class:`kin.stellar.channel_manager.ChannelHealth` tracks the health of a channel: its transaction
+    successes and failures, its average submit latency, and its quarantine.
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency = None  # moving average, in seconds
+        self.quarantines = 0  # consecutive quarantines
+        self.quarantined_until = 0
+
+    def quarantined(self, now):
+        return now < self.quarantined_until
+
+    def score(self):
+        """Get the rank of the channel, lower being better: channels with fewer consecutive failures first, then
+        faster channels first.
+        """
+        return self.consecutive_failures, self.latency or 0.0
+
+    def record_success(self, latency=None):
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.quarantines = 0
+        if latency is not None:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += LATENCY_SMOOTHING * (latency - self.latency)
+
+    def record_failure(self):
+        self.failures += 1
+        self.consecutive_failures += 1
+
+    def status(self, now):
+        """Get the channel health: its address, the success rate of its transactions (None before the first
+        transaction), the average submit latency in seconds, the number of consecutive failures, and the seconds
+        left in quarantine, 0 if not quarantined.
+
+        :rtype: dict
+        """
+        total = self.successes + self.failures
+        return {
+            'address': self.address,
+            'success_rate': float(self.successes) / total if total else None,
+            'latency': self.latency,
+            'consecutive_failures': self.consecutive_failures,
+            'quarantined': max(0.0, self.quarantined_until - now),
+        }
+
+
+class _ChannelQueue(queue.Queue):
+    """A queue of channel builders, handing out the builder of the best ranked channel first, see
+    :meth:`kin.stellar.channel_manager.ChannelHealth.score`. Waiting takers are served in priority order, see
+    :meth:`take`.
+    """
+
+    def __init__(self, channel_health, reserved, starvation_time):
+        self.channel_health = channel_health
+        self.reserved = reserved
+        self.starvation_time = starvation_time
+        self.waiting = dict((priority, 0) for priority in PRIORITY_NAMES)  # priority -> number of waiting takers
+        queue.Queue.__init__(self)  # an old style class in python 2
+
+    def _init(self, maxsize):
+        self.queue = []
+
+    def _put(self, builder):
+        self.queue.append(builder)
+        self.not_empty.notify_all()  # the next taker in line may not be able to use the builder
+
+    def _get(self):
+        return self.queue.pop(self._best(range(len(self.queue))))
+
+    def _best(self, candidates):
+        # the first best builder, so that equally ranked channels take turns
+        return min(candidates, key=lambda i: self.channel_health[self.queue[i].address].score())
+
+    def take(self, priority, timeout, since):
+        """Take a builder for a send of the given priority, waiting while takers of a higher priority wait, or while
+        there are no builders the priority may use. A taker waiting since longer than `starvation_time` is served as
+        a high priority taker, though it still may not use the reserved channels.
+
+        :param int priority: the priority of the send.
+
+        :param float timeout: how long to wait, in seconds.
+
+        :param float since: when the send started waiting for a channel.
+
+        :raises: :class:`queue.Empty`: if no builder was available in time.
+        """
+        deadline = time() + timeout
+        rank = priority
+        with self.not_empty:
+            self.waiting[rank] += 1
+            try:
+                while True:
+                    now = time()
+                    if rank != PRIORITY_HIGH and now - since >= self.starvation_time:
+                        self.waiting[rank] -= 1
+                        rank = PRIORITY_HIGH
+                        self.waiting[rank] += 1
+                    if not any(self.waiting[other] for other in range(rank)):
+                        candidates = [i for i in range(len(self.queue))
+                                      if priority == PRIORITY_HIGH or self.queue[i].address not in self.reserved]
+                        if candidates:
+                            return self.queue.pop(self._best(candidates))
+                    if now >= deadline:
+                        raise queue.Empty
+                    wait_until = deadline if rank == PRIORITY_HIGH else min(deadline, since + self.starvation_time)
+                    self.not_empty.wait(wait_until - now)
+            finally:
+                self.waiting[rank] -= 1
+                self.not_empty.notify_all()  # lower priority takers may be next in line
+
+    def drain(self):
+        """Take all the builders out of the queue.
+
+        :rtype: list
+        """
+        with self.mutex:
+            builders, self.queue = self.queue, []
+            return builders
+
+
+class ChannelSequence(object):
+    """
+    The class :class:`kin.stellar.channel_manager.ChannelSequence` hands out consecutive sequence numbers of a channel
+    account to concurrent transactions, and takes them back when the transactions fail:
+        - the sequence is fetched from Horizon on first use, and tracked locally afterwards
+        - the transactions are submitted in their sequence order, see :meth:`wait_turn`
+        - the sequence of the last reserved transaction is reused when the transaction is rejected
+        - otherwise, when a transaction fails without using its sequence, or it is not known whether it did, the
+          sequence is resynced from Horizon once all the transactions in flight are done
+    """
+
+    def __init__(self, fetch):
+        """Create a new channel sequence.
+
+        :param fetch: a function getting the channel account sequence from Horizon.
+        :type: callable[[], str]
+        """
+        self.fetch = fetch
+        self.next = None  # the account sequence the next transaction is built on, None if unknown
+        self.in_flight = 0
+        self.resyncs = 0
+
+        self._resync = False
+        self._unsent = set()  # reserved sequences that were not submitted yet
+        self._cond = threading.Condition()
+
+    def reserve(self):
+        """Reserve the sequence of a new transaction, waiting for the transactions in flight if a resync is pending.
+
+        :return: the account sequence to build the transaction on.
+        :rtype: int
+        """
+        with self._cond:
+            while self._resync and self.in_flight:
+                self._cond.wait()
+            if self.next is None or self._resync:
+                self.next = int(self.fetch())
+                if self._resync:
+                    self.resyncs += 1
+                self._resync = False
+            reserved = self.next
+            self.next += 1
+            self.in_flight += 1
+            self._unsent.add(reserved)
+            return reserved
+
+    def wait_turn(self, reserved):
+        """Wait until the transactions with earlier sequences are submitted or done.
+
+        :param int reserved: the reserved sequence.
+
+        :return: whether the transaction can still be submitted, i.e. no resync is pending.
+        :rtype: boolean
+        """
+        with self._cond:
+            while any(other < reserved for other in self._unsent):
+                self._cond.wait()
+            self._unsent.discard(reserved)
+            self._cond.notify_all()
+            return not self._resync
+
+    def release(self, reserved, used):
+        """Settle a reserved sequence once its transaction is done.
+
+        :param int reserved: the reserved sequence.
+
+        :param used: True if the transaction used the sequence, False if it did not, None if it is not known.
+        :type: boolean or None
+        """
+        with self._cond:
+            self.in_flight -= 1
+            self._unsent.discard(reserved)
+            if not used:
+                if used is False and reserved == self.next - 1 and not self._resync:
+                    self.next = reserved  # nothing was built on it, reuse it
+                else:
+                    self._resync = True
+            self._cond.notify_all()
+
+    def export(self):
+        """Get the account sequence the next transaction is built on, to pass it on to another process.
+
+        :return: the sequence, or None if it is not known.
+        :rtype: int
+        """
+        with self._cond:
+            return None if self._resync else self.next
+
+    def restore(self, next_sequence):
+        """Set the account sequence the next transaction is built on, as passed on by another process. Only when
+        no transactions are in flight.
+
+        :param next_sequence: the sequence, or None if it is not known and must be fetched from Horizon.
+        :type: int or None
+        """
+        with self._cond:
+            self.next = next_sequence
+            self._resync = False
+
+    def resync(self):
+        """Resync the sequence from Horizon once the transactions in flight are done, e.g. after a bad sequence."""
+        with self._cond:
+            self._resync = True
+            self._cond.notify_all()
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+from functools import partial
+from hashlib import sha256
+import threading
+
+from stellar_base.keypair import Keypair
+
+from .builder import Builder
+from .channel_manager import PRIORITY_HIGH
+from .errors import HorizonError, HorizonErrorType
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_MAX_CHANNELS = 100
+DEFAULT_STEP = 5  # channels added at once, created in a single transaction
+DEFAULT_INTERVAL = 5  # seconds between load checks
+DEFAULT_SCALE_UP_WAIT = 0.5  # average wait for a channel, in seconds, above which channels are added
+DEFAULT_SCALE_UP_AFTER = 2  # consecutive busy checks before channels are added
+DEFAULT_SCALE_DOWN_AFTER = 12  # consecutive idle checks before a channel is removed
+DEFAULT_CHANNEL_BALANCE = 10  # XLM, pays the fees of the channel transactions
+MAX_OPS = 100  # max number of operations in a transaction
+
+CHANNEL_KEY_SALT = b'kin-channel'
+
+
+def derive_channel_key(secret_key, index):
+    """Derive the secret key of a channel from the key of the base account. The same keys are derived every time,
+    so that channels left behind, e.g. by a process that crashed, are found and used again.
+
+    :param str secret_key: the secret key of the base account.
+
+    :param int index: the index of the channel.
+
+    :return: the secret key of the channel.
+    :rtype: str
+    """
+    raw_seed = Keypair.from_seed(secret_key).raw_seed()
+    channel_seed = sha256(raw_seed + CHANNEL_KEY_SALT + str(index).encode()).digest()
+    return Keypair.from_raw_seed(channel_seed).seed().decode()
+
+
+class ChannelScaler(object):
+    """
+    The class :class:`kin.ChannelScaler` adds channels to a :class:`kin.ChannelManager` when transactions wait too
+    long for a channel, and removes them when they are idle:
+        - when the average wait for a channel stays above `scale_up_wait`, or sends fail because no channel is
+          available, `step` channels are added. Their keys are derived from the base account key, and the channel
+          accounts are created and funded by the base account, with one transaction for all of them.
+        - when at least one channel stays idle for `scale_down_after` checks, the last added channel is removed,
+          and its account is merged back into the base account.
+
+    Only the channels added by the scaler are removed. Channel accounts that could not be merged back are found
+    and used again when channels are added later.
+
+    Merging a channel account assumes that this process owns the channel. Processes sharing the base key derive the
+    same channels, so they must share them with :class:`kin.ChannelLeases`: a channel is merged only while its lease
+    is held, and is left to the processes still using it otherwise.
+    """
+
+    def __init__(self, max_channels=DEFAULT_MAX_CHANNELS, step=DEFAULT_STEP, interval=DEFAULT_INTERVAL,
+                 scale_up_wait=DEFAULT_SCALE_UP_WAIT, scale_up_after=DEFAULT_SCALE_UP_AFTER,
+                 scale_down_after=DEFAULT_SCALE_DOWN_AFTER, channel_balance=DEFAULT_CHANNEL_BALANCE):
+        """Create a new channel scaler.
+
+        :param int max_channels: (optional) the maximal number of channels, including the channels not added by
+            the scaler.
+
+        :param int step: (optional) the number of channels to add at once.
+
+        :param number interval: (optional) the time between load checks, in seconds.
+
+        :param number scale_up_wait: (optional) the average wait for a channel, in seconds, above which the
+            channels are busy.
+
+        :param int scale_up_after: (optional) the number of consecutive checks the channels must be busy before
+            channels are added.
+
+        :param int scale_down_after: (optional) the number of consecutive checks a channel must be idle before
+            it is removed.
+
+        :param number channel_balance: (optional) the starting balance of the created channel accounts, in XLM.
+
+        :raises: ValueError: if some of the parameters are invalid.
+        """
+        if max_channels < 1:
+            raise ValueError('max channels must be positive')
+        if not 0 < step <= MAX_OPS:
+            raise ValueError('step must be between 1 and {}'.format(MAX_OPS))
+        if scale_up_after < 1 or scale_down_after < 1:
+            raise ValueError('scale up and scale down checks must be positive')
+
+        self.max_channels = max_channels
+        self.step = step
+        self.interval = interval
+        self.scale_up_wait = scale_up_wait
+        self.scale_up_after = scale_up_after
+        self.scale_down_after = scale_down_after
+        self.channel_balance = channel_balance
+
+        self.channel_manager = None
+        self.channel_keys = []  # keys of the channels added by the scaler, by their derivation index
+        self.created = 0  # channel accounts created
+        self.merged = 0  # channel accounts merged back
+        self.errors = 0
+
+        self._busy_checks = 0
+        self._idle_checks = 0
+        self._last_stats = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self, channel_manager):
+        """Start scaling the channels of a channel manager.
+
+        :param channel_manager: the channel manager.
+        :type: :class:`kin.ChannelManager`
+
+        :raises: ValueError: if the scaler is already started.
+        """
+        if self.channel_manager is not None:
+            raise ValueError('channel scaler already started')
+        self.channel_manager = channel_manager
+        self._last_stats = channel_manager.stats(reset_peak=True)
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        """Stop scaling the channels. The channels added are left in use."""
+        self._stopped.set()
+
+    def check(self):
+        """Check the channel load since the previous check, and add or remove channels if needed."""
+        stats = self.channel_manager.stats(reset_peak=True)
+        last, self._last_stats = self._last_stats, stats
+        sends = stats['sends'] - last['sends']
+        busy = stats['busy'] - last['busy']
+        wait = (stats['wait_time'] - last['wait_time']) / sends if sends else 0.0
+        idle_slots = stats['channels'] * stats['max_in_flight'] - stats['peak_in_use']
+
+        if busy or wait >= self.scale_up_wait:
+            self._idle_checks = 0
+            self._busy_checks += 1
+            if busy or self._busy_checks >= self.scale_up_after:
+                self._busy_checks = 0
+                self.scale_up()
+        elif idle_slots >= stats['max_in_flight'] and self.channel_keys:  # a whole channel was not used
+            self._busy_checks = 0
+            self._idle_checks += 1
+            if self._idle_checks >= self.scale_down_after:
+                self._idle_checks = 0
+                self.scale_down()
+        else:
+            self._busy_checks = 0
+            self._idle_checks = 0
+
+    def scale_up(self):
+        """Add up to `step` channels, creating the channel accounts that do not exist yet.
+
+        :return: the number of channels added.
+        :rtype: int
+        """
+        with self._lock:
+            count = min(self.step, self.max_channels - self.channel_manager.num_channels)
+            if count <= 0:
+                return 0
+            first = len(self.channel_keys)
+            keys = [derive_channel_key(self.channel_manager.base_key, index) for index in range(first, first + count)]
+
+            missing = [address for address in (Keypair.from_seed(key).address().decode() for key in keys)
+                       if not self._account_exists(address)]
+            if missing:
+                # ahead of the sends waiting for a channel, that the new channels are for
+                self.channel_manager.send_transaction(lambda builder: partial(self._add_create_ops, builder, missing),
+                                                      priority=PRIORITY_HIGH)
+                self.created += len(missing)
+
+            for key in keys:
+                self.channel_manager.add_channel(key)
+                self.channel_keys.append(key)
+            logger.info('added {} channels, created {}'.format(count, len(missing)))
+            return count
+
+    def scale_down(self):
+        """Remove the last added channel, and merge its account back into the base account, unless the channel is
+        leased by another process.
+
+        :return: whether a channel was removed.
+        :rtype: boolean
+        """
+        with self._lock:
+            if not self.channel_keys:
+                return False
+            key = self.channel_keys.pop()
+            address = Keypair.from_seed(key).address().decode()
+            self.channel_manager.remove_channel(address)
+
+            # other processes with the same base key derive the same channels. The lease is held through the merge,
+            # so that it does not break their transactions in flight
+            leases = self.channel_manager.leases
+            if leases is not None and not leases.acquire(address)[0]:
+                logger.info('removed channel {}, not merged: in use by another process'.format(address))
+                return True
+            try:
+                builder = Builder(secret=key, network=self.channel_manager.network,
+                                  horizon=self.channel_manager.horizon)
+                builder.append_account_merge_op(self.channel_manager.base_address)
+                builder.sign()
+                builder.submit()
+                self.merged += 1
+                logger.info('removed channel {}'.format(address))
+            except Exception as e:
+                # the account is found and used again by a later scale up
+                self.errors += 1
+                logger.warning('removed channel {}, merge failed: {}'.format(address, e))
+            finally:
+                if leases is not None:
+                    leases.release(address, None)  # merged, or its sequence is not known
+            return True
+
+    def stats(self):
+        """Get the number of channels added by the scaler, the maximal number of channels, and the numbers of
+        channel accounts created and merged back, and of scaling errors.
+
+        :rtype: dict
+        """
+        return {
+            'channels': len(self.channel_keys),
+            'max_channels': self.max_channels,
+            'created': self.created,
+            'merged': self.merged,
+            'errors': self.errors,
+        }
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.errors += 1
+                logger.warning('channel scaling failed: {}'.format(e))
+
+    def _account_exists(self, address):
+        try:
+            self.channel_manager.horizon.account(address, use_cache=False)
+            return True
+        except HorizonError as e:
+            if e.type == HorizonErrorType.NOT_FOUND:
+                return False
+            raise
+
+    def _add_create_ops(self, builder, addresses, source=None):
+        for address in addresses:
+            builder.append_create_account_op(address, self.channel_balance, source=source)
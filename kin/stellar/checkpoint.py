@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+import errno
+import os
+import sqlite3
+import threading
+
+from .utils import sync_directory
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class FileCheckpoint(object):
+    """
+    The class :class:`kin.FileCheckpoint` keeps the position of a transaction monitor in a file, so that the monitor
+    resumes from it after a restart. The file is replaced at once on every save, so that a crash leaves either the
+    previous position or the new one.
+
+    A checkpoint store is any object with the methods `load()` and `save(cursor)`.
+    """
+
+    def __init__(self, path):
+        """Create a checkpoint file store.
+
+        :param str path: the path of the checkpoint file. Created on the first save.
+        """
+        self.path = path
+
+    def load(self):
+        """Get the saved position.
+
+        :return: the paging token of the last processed transaction, or None if not saved yet.
+        :rtype: str
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                cursor = f.read().decode().strip()
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+        return cursor or None
+
+    def save(self, cursor):
+        """Save the position, waiting until it is synced to disk.
+
+        :param str cursor: the paging token of the last processed transaction.
+        """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(cursor.encode())
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, self.path)
+        sync_directory(os.path.dirname(os.path.abspath(self.path)))
+
+
+class SqliteCheckpoint(object):
+    """
+    The class :class:`kin.SqliteCheckpoint` keeps the positions of transaction monitors in an SQLite database, by
+    monitor name, so that several monitors can share a database.
+    """
+
+    def __init__(self, path, name='monitor'):
+        """Create a checkpoint SQLite store, creating the database if missing.
+
+        :param str path: the path of the database file.
+
+        :param str name: (optional) the name of the monitor whose position is kept.
+        """
+        self.path = path
+        self.name = name
+        self._lock = threading.Lock()  # the connection is shared by the monitor threads
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS checkpoints (name TEXT PRIMARY KEY, cursor TEXT NOT NULL)')
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._db.close()
+
+    def load(self):
+        """Get the saved position.
+
+        :return: the paging token of the last processed transaction, or None if not saved yet.
+        :rtype: str
+        """
+        with self._lock:
+            row = self._db.execute('SELECT cursor FROM checkpoints WHERE name = ?', (self.name,)).fetchone()
+        return row[0] if row else None
+
+    def save(self, cursor):
+        """Save the position, committing it.
+
+        :param str cursor: the paging token of the last processed transaction.
+        """
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO checkpoints (name, cursor) VALUES (?, ?)', (self.name, cursor))
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+import base64
+
+from stellar_base.stellarxdr import Xdr
+from stellar_base.utils import encode_check
+
+from .errors import OperationResultCode, TransactionResultCode
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+STROOPS = 10 ** 7  # stroops in one lumen (or asset unit)
+
+OPERATION_TYPES = {
+    Xdr.const.CREATE_ACCOUNT: 'create_account',
+    Xdr.const.PAYMENT: 'payment',
+    Xdr.const.PATH_PAYMENT: 'path_payment',
+    Xdr.const.MANAGE_OFFER: 'manage_offer',
+    Xdr.const.CREATE_PASSIVE_OFFER: 'create_passive_offer',
+    Xdr.const.SET_OPTIONS: 'set_options',
+    Xdr.const.CHANGE_TRUST: 'change_trust',
+    Xdr.const.ALLOW_TRUST: 'allow_trust',
+    Xdr.const.ACCOUNT_MERGE: 'account_merge',
+    Xdr.const.INFLATION: 'inflation',
+    Xdr.const.MANAGE_DATA: 'manage_data',
+}
+
+TRANSACTION_RESULT_CODES = {
+    Xdr.const.txSUCCESS: TransactionResultCode.SUCCESS,
+    Xdr.const.txFAILED: TransactionResultCode.FAILED,
+    Xdr.const.txTOO_EARLY: TransactionResultCode.TOO_EARLY,
+    Xdr.const.txTOO_LATE: TransactionResultCode.TOO_LATE,
+    Xdr.const.txMISSING_OPERATION: TransactionResultCode.MISSING_OPERATION,
+    Xdr.const.txBAD_SEQ: TransactionResultCode.BAD_SEQUENCE,
+    Xdr.const.txBAD_AUTH: TransactionResultCode.BAD_AUTH,
+    Xdr.const.txINSUFFICIENT_BALANCE: TransactionResultCode.INSUFFICIENT_BALANCE,
+    Xdr.const.txNO_ACCOUNT: TransactionResultCode.NO_ACCOUNT,
+    Xdr.const.txINSUFFICIENT_FEE: TransactionResultCode.INSUFFICIENT_FEE,
+    Xdr.const.txBAD_AUTH_EXTRA: TransactionResultCode.BAD_AUTH_EXTRA,
+    Xdr.const.txINTERNAL_ERROR: TransactionResultCode.INTERNAL_ERROR,
+}
+
+OPERATION_RESULT_CODES = {
+    Xdr.const.opBAD_AUTH: OperationResultCode.BAD_AUTH,
+    Xdr.const.opNO_ACCOUNT: OperationResultCode.NO_ACCOUNT,
+}
+
+
+def decode_operations(tx):
+    """Decode the operations of a transaction record from its envelope, as the operation records Horizon returns
+    for the transaction, so that they do not have to be fetched. The operation fields are the ones used by
+    :class:`kin.TransactionData`, and the type specific fields of the account, payment and trust operations.
+
+    :param dict tx: the transaction record, as returned by Horizon.
+
+    :return: the operation records.
+    :rtype: list of dict
+
+    :raises: ValueError: if the transaction record has no envelope, or the envelope is malformed.
+    """
+    try:
+        envelope_xdr = tx['envelope_xdr']
+        paging_token = int(tx['paging_token'])
+        te = Xdr.StellarXDRUnpacker(base64.b64decode(envelope_xdr)).unpack_TransactionEnvelope()
+    except Exception as e:
+        raise ValueError('cannot decode transaction {}: {!r}'.format(tx.get('hash'), e))
+
+    tx_source = format_address(te.tx.sourceAccount)
+    records = []
+    for index, op in enumerate(te.tx.operations, 1):
+        op_id = str(paging_token + index)  # the operation ids follow the transaction id
+        body = op.body
+        source = format_address(op.sourceAccount[0]) if op.sourceAccount else tx_source
+        record = {
+            'id': op_id,
+            'paging_token': op_id,
+            'source_account': source,
+            'type': OPERATION_TYPES.get(body.type, str(body.type)),
+            'type_i': body.type,
+            'created_at': tx.get('created_at'),
+            'transaction_hash': tx.get('hash'),
+        }
+        record.update(_operation_fields(body, source))
+        records.append(record)
+    return records
+
+
+def _operation_fields(body, source):
+    """Get the type specific fields of an operation record."""
+    if body.type == Xdr.const.CREATE_ACCOUNT:
+        op = body.createAccountOp
+        return {'starting_balance': format_amount(op.startingBalance), 'funder': source,
+                'account': format_address(op.destination)}
+    if body.type == Xdr.const.PAYMENT:
+        op = body.paymentOp
+        fields = _asset_fields(op.asset)
+        fields.update({'from': source, 'to': format_address(op.destination), 'amount': format_amount(op.amount)})
+        return fields
+    if body.type == Xdr.const.PATH_PAYMENT:
+        op = body.pathPaymentOp
+        fields = _asset_fields(op.destAsset)
+        fields.update(('source_' + key, value) for key, value in _asset_fields(op.sendAsset).items())
+        fields.update({'from': source, 'to': format_address(op.destination), 'amount': format_amount(op.destAmount),
+                       'source_max': format_amount(op.sendMax)})
+        return fields
+    if body.type == Xdr.const.CHANGE_TRUST:
+        op = body.changeTrustOp
+        fields = _asset_fields(op.line)
+        fields.update({'limit': format_amount(op.limit), 'trustee': fields.get('asset_issuer'), 'trustor': source})
+        return fields
+    if body.type == Xdr.const.ALLOW_TRUST:
+        op = body.allowTrustOp
+        code = op.asset.assetCode4 if op.asset.type == Xdr.const.ASSET_TYPE_CREDIT_ALPHANUM4 \
+            else op.asset.assetCode12
+        code = code.rstrip(b'\0').decode()
+        return {'asset_type': 'credit_alphanum4' if len(code) <= 4 else 'credit_alphanum12', 'asset_code': code,
+                'asset_issuer': source, 'trustee': source, 'trustor': format_address(op.trustor),
+                'authorize': bool(op.authorize)}
+    if body.type == Xdr.const.ACCOUNT_MERGE:
+        return {'account': source, 'into': format_address(body.destination)}
+    if body.type == Xdr.const.MANAGE_DATA:
+        op = body.manageDataOp
+        value = op.dataValue[0] if op.dataValue else None
+        return {'name': op.dataName.decode('utf-8', 'replace'),
+                'value': base64.b64encode(value).decode() if value is not None else None}
+    return {}
+
+
+def _asset_fields(asset):
+    if asset.type == Xdr.const.ASSET_TYPE_NATIVE:
+        return {'asset_type': 'native'}
+    if asset.type == Xdr.const.ASSET_TYPE_CREDIT_ALPHANUM4:
+        asset_type, alpha_num = 'credit_alphanum4', asset.alphaNum4
+    else:
+        asset_type, alpha_num = 'credit_alphanum12', asset.alphaNum12
+    return {'asset_type': asset_type, 'asset_code': alpha_num.assetCode.rstrip(b'\0').decode(),
+            'asset_issuer': format_address(alpha_num.issuer)}
+
+
+def format_address(account_id):
+    """Get the address of an XDR account id, as shown by Horizon."""
+    return encode_check('account', account_id.ed25519).decode()
+
+
+def format_amount(stroops):
+    """Get an amount in stroops as a decimal string of 7 digits, as shown by Horizon."""
+    return '{}.{:07d}'.format(*divmod(stroops, STROOPS))
+
+
+def decode_result_codes(result_xdr):
+    """Decode the result codes of a transaction from its result, as Horizon returns them for a failed submit.
+
+    :param str result_xdr: the base64 encoded transaction result.
+
+    :return: the transaction result code, and the result codes of the operations.
+    :rtype: dict
+
+    :raises: ValueError: if the result is malformed.
+    """
+    try:
+        result = Xdr.StellarXDRUnpacker(base64.b64decode(result_xdr)).unpack_TransactionResult().result
+    except Exception as e:
+        raise ValueError('cannot decode transaction result: {!r}'.format(e))
+    operations = []
+    if result.code in (Xdr.const.txSUCCESS, Xdr.const.txFAILED):
+        operations = [_operation_result_code(op_result) for op_result in result.results]
+    return {'transaction': TRANSACTION_RESULT_CODES.get(result.code, TransactionResultCode.INTERNAL_ERROR),
+            'operations': operations}
+
+
+def _operation_result_code(op_result):
+    if op_result.code != Xdr.const.opINNER:
+        return OPERATION_RESULT_CODES.get(op_result.code, OperationResultCode.NOT_SUPPORTED)
+    # the result of the operation type, e.g. tr.paymentResult, with a code like PAYMENT_UNDERFUNDED
+    tr = op_result.tr
+    code = next(value for key, value in vars(tr).items() if key != 'type').code
+    return _INNER_RESULT_CODES.get((tr.type, code), 'op_success' if code == 0 else OperationResultCode.INNER)
+
+
+def _inner_result_codes():
+    codes = {}
+    for op_type, name in OPERATION_TYPES.items():
+        prefix = name.upper() + '_'
+        for const, value in vars(Xdr.const).items():
+            if const.startswith(prefix) and isinstance(value, int) and value < 0:
+                codes[(op_type, value)] = 'op_' + const[len(prefix):].lower().replace('already_exist', 'already_exists')
+    # passive offers have the results of offers
+    codes.update(((Xdr.const.CREATE_PASSIVE_OFFER, code), name) for (op_type, code), name in list(codes.items())
+                 if op_type == Xdr.const.MANAGE_OFFER)
+    return codes
+
+
+_INNER_RESULT_CODES = _inner_result_codes()  # (operation type, result code) -> Horizon result code
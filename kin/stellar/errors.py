@@ -9,6 +9,10 @@ class ChannelsBusyError(Exception):
     pass
 
 
+class CircuitOpenError(Exception):
+    pass
+
+
 HORIZON_NS_PREFIX = 'https://stellar.org/horizon-errors/'
 
 '''
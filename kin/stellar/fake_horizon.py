@@ -0,0 +1,1309 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+import base64
+from bisect import bisect_left, bisect_right
+import binascii
+from collections import Counter, OrderedDict
+import hashlib
+import json
+import random
+import socket
+import sys
+import threading
+import time
+
+from stellar_base.keypair import Keypair
+from stellar_base.network import NETWORKS
+from stellar_base.stellarxdr import Xdr
+from stellar_base.utils import xdr_hash
+
+from .builder import Builder
+from .envelope import OPERATION_TYPES, STROOPS, format_address, format_amount
+from .errors import HORIZON_NS_PREFIX, HorizonError, HorizonErrorType, TransactionResultCode
+
+import logging
+logger = logging.getLogger(__name__)
+
+if sys.version[0] == '2':
+    # noinspection PyUnresolvedReferences
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    # noinspection PyUnresolvedReferences
+    from SocketServer import ThreadingMixIn
+    # noinspection PyUnresolvedReferences
+    from urllib import urlencode
+    # noinspection PyUnresolvedReferences
+    from urlparse import parse_qs, urlparse
+else:
+    # noinspection PyUnresolvedReferences
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    # noinspection PyUnresolvedReferences
+    from socketserver import ThreadingMixIn
+    # noinspection PyUnresolvedReferences
+    from urllib.parse import parse_qs, urlencode, urlparse
+
+
+BASE_FEE = 100  # in stroops, per operation
+BASE_RESERVE = 5000000  # in stroops
+ROOT_BALANCE = 100000000000 * STROOPS
+FRIENDBOT_AMOUNT = 10000 * STROOPS
+
+DEFAULT_PAGE_LIMIT = 10
+MAX_PAGE_LIMIT = 200
+SSE_RETRY = 1000  # the reconnect time advertised to stream clients, in milliseconds
+SSE_KEEPALIVE = 5  # how often to check an idle stream connection, in seconds
+
+PAYMENT_TYPES = ('create_account', 'payment', 'path_payment', 'account_merge')
+
+EFFECT_TYPES = {
+    'account_created': 0,
+    'account_removed': 1,
+    'account_credited': 2,
+    'account_debited': 3,
+    'signer_created': 10,
+    'trustline_created': 20,
+    'trustline_removed': 21,
+    'trustline_updated': 22,
+}
+
+MEMO_TYPES = {
+    Xdr.const.MEMO_NONE: 'none',
+    Xdr.const.MEMO_TEXT: 'text',
+    Xdr.const.MEMO_ID: 'id',
+    Xdr.const.MEMO_HASH: 'hash',
+    Xdr.const.MEMO_RETURN: 'return',
+}
+
+# problems returned for injected failures
+FAULTS = {
+    429: (HorizonErrorType.RATE_LIMIT_EXCEEDED, 'Rate Limit Exceeded'),
+    500: (HorizonErrorType.INTERNAL_SERVER_ERROR, 'Internal Server Error'),
+    503: (HorizonErrorType.SERVER_OVER_CAPACITY, 'Server Over Capacity'),
+    504: (HorizonErrorType.TIMEOUT, 'Timeout'),
+}
+
+
+class Problem(Exception):
+    """An error reply of the fake Horizon, in the Horizon problem format."""
+    def __init__(self, status, error_type, title, detail=None, extras=None):
+        super(Problem, self).__init__(title)
+        self.status = status
+        self.body = {'type': HORIZON_NS_PREFIX + error_type, 'title': title, 'status': status}
+        if detail:
+            self.body['detail'] = detail
+        if extras:
+            self.body['extras'] = extras
+
+    @staticmethod
+    def not_found():
+        return Problem(404, HorizonErrorType.NOT_FOUND, 'Resource Missing',
+                       'The resource at the url requested was not found.')
+
+    @staticmethod
+    def bad_request(detail=None):
+        return Problem(400, HorizonErrorType.BAD_REQUEST, 'Bad Request', detail)
+
+    @staticmethod
+    def tx_failed(envelope_xdr, tx_result_code, op_result_codes=None):
+        extras = {'envelope_xdr': envelope_xdr,
+                  'result_codes': {'transaction': tx_result_code, 'operations': op_result_codes or []},
+                  'result_xdr': ''}
+        return Problem(400, HorizonErrorType.TRANSACTION_FAILED, 'Transaction Failed',
+                       'The transaction failed when submitted to the stellar network.', extras)
+
+
+class FakeNetwork(object):
+    """
+    The class :class:`kin.stellar.fake_horizon.FakeNetwork` simulates the ledger state of a Stellar network:
+        - accounts with native balances, sequence numbers and trustlines
+        - transaction validation, with the result codes of stellar-core
+        - ledger closes, either on every submit or periodically
+        - the history of transactions, operations, payments, effects and ledgers
+
+    Supported operations are create_account, payment, change_trust and account_merge.
+    Signatures are checked against the master keys of the source accounts only, and failed transactions
+    are not recorded in the history.
+    """
+    def __init__(self, network='TESTNET', ledger_close_time=0, sequence_wait=0):
+        """Create a new network, holding the genesis ledger with the root account.
+
+        :param network: (optional) the network name to take the passphrase from, or a network to serve, which
+            several servers may share, acting as Horizon nodes of the same network.
+        :type: str or :class:`kin.stellar.fake_horizon.FakeNetwork`
+
+        :param number ledger_close_time: (optional) the time between ledger closes, in seconds. If 0, a ledger
+            is closed on every submit.
+
+        :param number sequence_wait: (optional) how long to hold a transaction whose sequence is ahead of its
+            account, waiting for the transactions before it to arrive, like Horizon does. Defaults to 0, failing it
+            with a bad sequence at once.
+        """
+        self.name = network
+        self.passphrase = NETWORKS[network]
+        self.network_id = xdr_hash(self.passphrase.encode())
+        self.ledger_close_time = ledger_close_time
+        self.sequence_wait = sequence_wait
+
+        # the root account holds all the lumens, its key is derived from the network passphrase
+        self.root_keypair = Keypair.from_raw_seed(self.network_id)
+        self.root_address = self.root_keypair.address().decode()
+
+        # the lock guards everything below. Waiting for a ledger close is done on the same condition
+        self.lock = threading.Condition(threading.RLock())
+        self.accounts = {self.root_address: _Account(self.root_address, ROOT_BALANCE, 0)}
+        self.ledger_sequence = 0
+        self.ledger_hash = b'\0' * 32
+        self.history = _new_history('ledgers')
+        self.account_history = {}
+        self.ledgers = {}
+        self.transactions = {}
+        self.operations = {}
+        self.pending = []  # transactions applied in the currently open ledger
+        self.stopped = False
+        self._thread = None
+
+        self.close_ledger()  # genesis
+
+    def start(self):
+        """Start closing ledgers periodically, if configured."""
+        if self.ledger_close_time and not self._thread:
+            self._thread = threading.Thread(target=self._close_ledgers)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stop closing ledgers and wake up everybody waiting."""
+        with self.lock:
+            self.stopped = True
+            self.lock.notify_all()
+
+    def fund(self, address, amount=FRIENDBOT_AMOUNT):
+        """Create an account funded by the root account, the way friendbot does.
+
+        :return: the submit reply.
+        :rtype: dict
+        """
+        with self.lock:
+            builder = Builder(secret=self.root_keypair.seed().decode(), network=self.name, horizon=self,
+                              manage_sequence=True)
+            builder.sequence = str(self.accounts[self.root_address].sequence)
+            builder.append_create_account_op(address, format_amount(amount))
+            builder.sign()
+            return self.submit(builder.gen_xdr())
+
+    def account(self, address):
+        with self.lock:
+            account = self.accounts.get(address)
+            if not account:
+                raise Problem.not_found()
+            return account.to_record()
+
+    def submit(self, envelope_xdr):
+        """Validate and apply the transaction, and wait for the ledger it is included in to close.
+
+        :param str envelope_xdr: the base64 encoded transaction envelope.
+
+        :return: the submit reply.
+        :rtype: dict
+
+        :raises: :class:`kin.stellar.fake_horizon.Problem`: if the transaction is malformed or failed.
+        """
+        if isinstance(envelope_xdr, bytes):
+            envelope_xdr = envelope_xdr.decode()
+        tx = _parse_transaction(envelope_xdr, self.network_id)
+
+        with self.lock:
+            deadline = time.time() + self.sequence_wait
+            while self._ahead_of_sequence(tx) and not self.stopped and time.time() < deadline:
+                self.lock.wait(deadline - time.time())
+
+            # transaction that already made it into the ledger are not resubmitted, like Horizon does
+            if tx.hash not in self.transactions and tx.hash not in [p.hash for p in self.pending]:
+                try:
+                    self._apply(tx)
+                finally:
+                    self.lock.notify_all()  # the sequence may have moved, for the transactions held
+                self.pending.append(tx)
+                if not self.ledger_close_time:
+                    self.close_ledger()
+
+            while tx.hash not in self.transactions and not self.stopped:
+                self.lock.wait(1)
+            if tx.hash not in self.transactions:
+                raise Problem(504, HorizonErrorType.TIMEOUT, 'Timeout')
+            return {'hash': tx.hash,
+                    'ledger': self.transactions[tx.hash].record['ledger'],
+                    'envelope_xdr': envelope_xdr,
+                    'result_xdr': '',
+                    'result_meta_xdr': ''}
+
+    def close_ledger(self):
+        """Close the current ledger, recording the transactions applied in it."""
+        with self.lock:
+            sequence = self.ledger_sequence + 1
+            created_at = _timestamp(time.time())
+            hasher = hashlib.sha256(self.ledger_hash)
+            for tx in self.pending:
+                hasher.update(binascii.unhexlify(tx.hash))
+            self.ledger_hash = hasher.digest()
+
+            ledger = _Entry({
+                'id': binascii.hexlify(self.ledger_hash).decode(),
+                'paging_token': str(_toid(sequence)),
+                'hash': binascii.hexlify(self.ledger_hash).decode(),
+                'sequence': sequence,
+                'transaction_count': len(self.pending),
+                'operation_count': sum(len(tx.operations) for tx in self.pending),
+                'closed_at': created_at,
+                'total_coins': format_amount(ROOT_BALANCE),
+                'base_fee_in_stroops': BASE_FEE,
+                'base_reserve_in_stroops': BASE_RESERVE,
+            }, _new_history())
+            self.ledgers[sequence] = ledger
+            self.history['ledgers'].add(ledger.record)
+
+            for tx_index, tx in enumerate(self.pending, 1):
+                self._record(tx, sequence, tx_index, created_at, ledger)
+            self.pending = []
+            self.ledger_sequence = sequence
+            self.lock.notify_all()
+
+    def get_history(self, scope, scope_id, kind):
+        """Get the index of records of some kind (transactions, operations...), either globally or of
+        an account, ledger, transaction or operation.
+
+        :raises: :class:`kin.stellar.fake_horizon.Problem`: if the scope does not exist.
+        """
+        with self.lock:
+            if scope is None:
+                return self.history[kind]
+            if scope == 'accounts':
+                if scope_id not in self.account_history:
+                    if scope_id not in self.accounts:
+                        raise Problem.not_found()
+                    self.account_history[scope_id] = _new_history()
+                return self.account_history[scope_id][kind]
+
+            entries = {'ledgers': self.ledgers, 'transactions': self.transactions, 'operations': self.operations}
+            if scope != 'transactions':
+                scope_id = _parse_int(scope_id)
+            entry = entries[scope].get(scope_id)
+            if entry is None:
+                raise Problem.not_found()
+            return entry.history[kind]
+
+    def get_record(self, scope, scope_id):
+        """Get a ledger, transaction or operation record.
+
+        :raises: :class:`kin.stellar.fake_horizon.Problem`: if there is no such record.
+        """
+        with self.lock:
+            entries = {'ledgers': self.ledgers, 'transactions': self.transactions, 'operations': self.operations}
+            if scope != 'transactions':
+                scope_id = _parse_int(scope_id)
+            entry = entries[scope].get(scope_id)
+            if entry is None:
+                raise Problem.not_found()
+            return entry.record
+
+    def wait_records(self, index, cursor, timeout):
+        """Get the records after the cursor, waiting up to timeout seconds for new ones."""
+        with self.lock:
+            records = index.after(cursor)
+            if not records and not self.stopped:
+                self.lock.wait(timeout)
+                records = index.after(cursor)
+            return records
+
+    def _close_ledgers(self):
+        while True:
+            with self.lock:
+                # the condition is notified on other changes too, close on time only
+                close_time = time.time() + self.ledger_close_time
+                while not self.stopped and time.time() < close_time:
+                    self.lock.wait(close_time - time.time())
+                if self.stopped:
+                    return
+                self.close_ledger()
+
+    def _apply(self, tx):
+        """Validate the transaction and apply it to the ledger state.
+
+        :raises: :class:`kin.stellar.fake_horizon.Problem`: if the transaction failed.
+        """
+        source = self.accounts.get(tx.source)
+        if not source:
+            raise Problem.tx_failed(tx.envelope_xdr, TransactionResultCode.NO_ACCOUNT)
+        if tx.sequence != source.sequence + 1:
+            raise Problem.tx_failed(tx.envelope_xdr, TransactionResultCode.BAD_SEQUENCE)
+        if not tx.operations:
+            raise Problem.tx_failed(tx.envelope_xdr, TransactionResultCode.MISSING_OPERATION)
+        now = time.time()
+        if tx.time_bounds and tx.time_bounds[0] and now < tx.time_bounds[0]:
+            raise Problem.tx_failed(tx.envelope_xdr, TransactionResultCode.TOO_EARLY)
+        if tx.time_bounds and tx.time_bounds[1] and now > tx.time_bounds[1]:
+            raise Problem.tx_failed(tx.envelope_xdr, TransactionResultCode.TOO_LATE)
+        fee = BASE_FEE * len(tx.operations)
+        if tx.fee < fee:
+            raise Problem.tx_failed(tx.envelope_xdr, TransactionResultCode.INSUFFICIENT_FEE)
+        tx_result_code = self._check_signatures(tx)
+        if tx_result_code:
+            raise Problem.tx_failed(tx.envelope_xdr, tx_result_code)
+        if source.balance - fee < source.min_balance():
+            raise Problem.tx_failed(tx.envelope_xdr, TransactionResultCode.INSUFFICIENT_BALANCE)
+
+        # from here on, the fee is charged and the sequence is consumed, even if an operation fails
+        source.balance -= fee
+        source.sequence = tx.sequence
+        tx.fee_paid = fee
+
+        delta = _LedgerDelta(self.accounts, self.ledger_sequence + 1)
+        op_result_codes = [_apply_operation(delta, op) for op in tx.operations]
+        if any(code != 'op_success' for code in op_result_codes):
+            raise Problem.tx_failed(tx.envelope_xdr, TransactionResultCode.FAILED, op_result_codes)
+        delta.commit()
+
+    def _ahead_of_sequence(self, tx):
+        source = self.accounts.get(tx.source)
+        return source is not None and tx.sequence > source.sequence + 1
+
+    def _check_signatures(self, tx):
+        """Every source account must sign with its master key, and every signature must be used."""
+        used = set()
+        for address in set([tx.source] + [op['source_account'] for op in tx.operations]):
+            if address not in self.accounts:
+                continue  # a missing operation source fails the operation
+            keypair = Keypair.from_address(address)
+            for i, signature in enumerate(tx.signatures):
+                if signature.hint != keypair.signature_hint():
+                    continue
+                try:
+                    keypair.verify(tx.hash_bytes, signature.signature)
+                except Exception:
+                    continue
+                used.add(i)
+                break
+            else:
+                return TransactionResultCode.BAD_AUTH
+        if len(used) != len(tx.signatures):
+            return TransactionResultCode.BAD_AUTH_EXTRA
+        return None
+
+    def _record(self, tx, ledger_sequence, tx_index, created_at, ledger):
+        """Add a transaction that got into the ledger to the history."""
+        paging_token = str(_toid(ledger_sequence, tx_index))
+        record = {
+            'id': tx.hash,
+            'paging_token': paging_token,
+            'hash': tx.hash,
+            'ledger': ledger_sequence,
+            'created_at': created_at,
+            'source_account': tx.source,
+            'source_account_sequence': str(tx.sequence),
+            'fee_paid': tx.fee_paid,
+            'operation_count': len(tx.operations),
+            'envelope_xdr': tx.envelope_xdr,
+            'result_xdr': '',
+            'result_meta_xdr': '',
+            'fee_meta_xdr': '',
+            'memo_type': tx.memo_type,
+            'signatures': [base64.b64encode(s.signature).decode() for s in tx.signatures],
+        }
+        if tx.memo_type != 'none':
+            record['memo'] = tx.memo
+        if tx.time_bounds:
+            record['valid_after'] = _timestamp(tx.time_bounds[0])
+            record['valid_before'] = _timestamp(tx.time_bounds[1]) if tx.time_bounds[1] else None
+
+        tx_entry = _Entry(record, _new_history())
+        self.transactions[tx.hash] = tx_entry
+        participants = set([tx.source])
+        scopes = [self.history, ledger.history]
+
+        for op_index, op in enumerate(tx.operations, 1):
+            op_id = _toid(ledger_sequence, tx_index, op_index)
+            op_record = _operation_record(op, str(op_id), created_at, tx.hash)
+            op_entry = _Entry(op_record, _new_history())
+            self.operations[op_id] = op_entry
+
+            op_participants = set(op['participants'])
+            participants.update(op_participants)
+            op_scopes = scopes + [tx_entry.history] + [self._account_history(a) for a in op_participants]
+            for scope in op_scopes:
+                scope['operations'].add(op_record)
+                if op['type'] in PAYMENT_TYPES:
+                    scope['payments'].add(op_record)
+
+            for effect_index, effect in enumerate(op['effects'], 1):
+                effect_record = dict(effect)
+                effect_record['id'] = effect_record['paging_token'] = '{:019d}-{:010d}'.format(op_id, effect_index)
+                effect_record['type_i'] = EFFECT_TYPES[effect['type']]
+                effect_record['created_at'] = created_at
+                effect_scopes = scopes + [tx_entry.history, op_entry.history,
+                                          self._account_history(effect['account'])]
+                for scope in effect_scopes:
+                    scope['effects'].add(effect_record)
+
+        for scope in scopes + [self._account_history(a) for a in participants]:
+            scope['transactions'].add(record)
+
+    def _account_history(self, address):
+        if address not in self.account_history:
+            self.account_history[address] = _new_history()
+        return self.account_history[address]
+
+
+class FakeHorizonServer(object):
+    """
+    The class :class:`kin.stellar.fake_horizon.FakeHorizonServer` serves the Horizon REST API on top of
+    a :class:`kin.stellar.fake_horizon.FakeNetwork`, in background threads of the current process:
+        - accounts, transactions, operations, payments, effects and ledgers endpoints, with paging
+        - SSE streams on all the collection endpoints
+        - transaction submit, and a friendbot
+        - injected failures: timeouts, rate limiting, server errors, and latency
+        - per route request counters
+
+    It is meant for tests and benchmarks that need a deterministic Horizon without a Stellar network::
+
+        with FakeHorizonServer() as server:
+            sdk = kin.SDK(horizon_endpoint_uri=server.url, network='TESTNET', ...)
+    """
+    def __init__(self, network='TESTNET', host='127.0.0.1', port=0, ledger_close_time=0, latency=0,
+                 rate_limit=None, rate_limit_window=3600, seed=None, sequence_wait=0):
+        """Create a new server. It does not listen until started.
+
+        :param network: (optional) the network name to take the passphrase from, or a network to serve, which
+            several servers may share, acting as Horizon nodes of the same network.
+        :type: str or :class:`kin.stellar.fake_horizon.FakeNetwork`
+
+        :param str host: (optional) the host to listen on.
+
+        :param int port: (optional) the port to listen on. A free port is picked if not specified.
+
+        :param number ledger_close_time: (optional) the time between ledger closes, in seconds. If 0, a ledger
+            is closed on every submit.
+
+        :param number latency: (optional) the time to wait before handling every request, in seconds.
+
+        :param int rate_limit: (optional) the number of requests allowed in a rate limit window.
+
+        :param number rate_limit_window: (optional) the rate limit window, in seconds.
+
+        :param seed: (optional) the seed of the random generator used for random failures.
+
+        :param number sequence_wait: (optional) how long to hold a transaction whose sequence is ahead of its
+            account, see :class:`kin.stellar.fake_horizon.FakeNetwork`.
+        """
+        self._own_network = not isinstance(network, FakeNetwork)
+        self.network = FakeNetwork(network, ledger_close_time, sequence_wait) if self._own_network else network
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.request_counts = Counter()  # route -> number of requests
+
+        self._lock = threading.Lock()
+        self._faults = []
+        self._random = random.Random(seed)
+        self._window_end = 0
+        self._window_count = 0
+        self._server = None
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(self.host, self.port)
+
+    def start(self):
+        """Start serving in a background thread.
+
+        :return: the server itself.
+        :rtype: :class:`kin.stellar.fake_horizon.FakeHorizonServer`
+        """
+        self._server = _HTTPServer((self.host, self.port), _RequestHandler)
+        self._server.horizon = self
+        self.port = self._server.server_address[1]
+        t = threading.Thread(target=self._server.serve_forever)
+        t.daemon = True
+        t.start()
+        self.network.start()
+        logger.info('fake horizon serving on {}'.format(self.url))
+        return self
+
+    def stop(self):
+        """Stop serving and close open streams. A shared network keeps running."""
+        if self._own_network:
+            self.network.stop()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def fund(self, address, amount=FRIENDBOT_AMOUNT):
+        """Create an account funded with lumens, in stroops."""
+        return self.network.fund(address, amount)
+
+    def fail_next(self, status, count=1, method=None, path=None, apply=False):
+        """Fail the next matching requests with an error reply.
+
+        :param int status: the reply status, one of 429 (rate limit), 500, 503 (over capacity) and 504 (timeout).
+
+        :param int count: (optional) the number of requests to fail.
+
+        :param str method: (optional) only fail requests of this method.
+
+        :param str path: (optional) only fail requests to paths starting with this prefix.
+
+        :param boolean apply: (optional) handle the request before replying with an error, like a submit timeout
+            of a transaction that still gets into the ledger.
+        """
+        with self._lock:
+            self._faults.append(_Fault(status, method, path, apply, count=count))
+
+    def fail_randomly(self, status, rate, method=None, path=None, apply=False):
+        """Fail a fraction of the matching requests with an error reply. See :meth:`fail_next`."""
+        with self._lock:
+            self._faults.append(_Fault(status, method, path, apply, rate=rate))
+
+    def clear_faults(self):
+        with self._lock:
+            self._faults = []
+
+    def handle(self, request, method):
+        url = urlparse(request.path)
+        path = url.path.rstrip('/')
+        params = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+        if method == 'POST':
+            body = request.rfile.read(int(request.headers.get('Content-Length', 0)))
+            params.update((key, values[-1]) for key, values in parse_qs(body.decode()).items())
+
+        route, args = _route(method, path)
+        with self._lock:
+            self.request_counts[method + ' ' + _path_template(path)] += 1
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        headers, limited = self._check_rate_limit()
+        try:
+            if limited:
+                raise _Fault(429).problem()
+            fault = self._take_fault(method, path)
+            if fault and not fault.apply:
+                raise fault.problem()
+
+            if route is None:
+                raise Problem.not_found()
+            reply = getattr(self, '_' + route)(params, *args)
+            if isinstance(reply, _Index):
+                if request.headers.get('Accept') == 'text/event-stream':
+                    return self._stream(request, reply, params)
+                reply = self._page(path, reply, params)
+
+            if fault:
+                raise fault.problem()
+            _send_json(request, 200, reply, headers)
+        except Problem as e:
+            if e.status == 429:
+                headers.setdefault('Retry-After', '1')
+            _send_json(request, e.status, e.body, headers, content_type='application/problem+json')
+
+    # routes
+
+    def _root(self, params):
+        return {'horizon_version': 'fake',
+                'network_passphrase': self.network.passphrase,
+                'history_latest_ledger': self.network.ledger_sequence,
+                'core_latest_ledger': self.network.ledger_sequence}
+
+    def _friendbot(self, params):
+        if 'addr' not in params:
+            raise Problem.bad_request('missing addr')
+        return self.network.fund(params['addr'])
+
+    def _account(self, params, address):
+        return self.network.account(address)
+
+    def _account_offers(self, params, address):
+        return {'_embedded': {'records': []}}
+
+    def _submit(self, params):
+        if 'tx' not in params:
+            raise Problem(400, HorizonErrorType.TRANSACTION_MALFORMED, 'Transaction Malformed')
+        return self.network.submit(params['tx'])
+
+    def _record(self, params, scope, scope_id):
+        return self.network.get_record(scope, scope_id)
+
+    def _history(self, params, scope, scope_id, kind):
+        return self.network.get_history(scope, scope_id, kind)
+
+    def _order_book(self, params):
+        def asset(prefix):
+            return dict((key[len(prefix):], value) for key, value in params.items() if key.startswith(prefix))
+        return {'bids': [], 'asks': [], 'base': asset('selling_'), 'counter': asset('buying_')}
+
+    def _page(self, path, index, params):
+        cursor = _parse_cursor(params.get('cursor'))
+        order = params.get('order', 'asc')
+        if order not in ('asc', 'desc'):
+            raise Problem.bad_request('invalid order')
+        limit = _parse_int(params.get('limit', DEFAULT_PAGE_LIMIT))
+        if not 0 < limit <= MAX_PAGE_LIMIT:
+            raise Problem.bad_request('invalid limit')
+
+        with self.network.lock:
+            records = index.page(cursor, order, limit)
+
+        def link(cursor, order):
+            return {'href': self.url + path + '?' + urlencode([('cursor', cursor), ('limit', limit),
+                                                               ('order', order)])}
+        first = records[0]['paging_token'] if records else params.get('cursor', '')
+        last = records[-1]['paging_token'] if records else params.get('cursor', '')
+        return {'_links': {'self': link(params.get('cursor', ''), order),
+                           'next': link(last, order),
+                           'prev': link(first, 'desc' if order == 'asc' else 'asc')},
+                '_embedded': {'records': records}}
+
+    def _stream(self, request, index, params):
+        cursor = _parse_cursor(request.headers.get('Last-Event-ID') or params.get('cursor'))
+        if cursor == _NOW:
+            with self.network.lock:
+                cursor = index.keys[-1] if index.keys else None
+
+        # events are sent in chunks, so that clients get them as soon as they are written
+        def write(data):
+            request.wfile.write('{:x}\r\n'.format(len(data)).encode() + data + b'\r\n')
+            request.wfile.flush()
+
+        request.send_response(200)
+        request.send_header('Content-Type', 'text/event-stream')
+        request.send_header('Cache-Control', 'no-cache')
+        request.send_header('Transfer-Encoding', 'chunked')
+        request.send_header('Connection', 'close')
+        request.end_headers()
+        request.close_connection = True
+        try:
+            write('retry: {}\nevent: open\ndata: "hello"\n\n'.format(SSE_RETRY).encode())
+            while not self.network.stopped:
+                records = self.network.wait_records(index, cursor, SSE_KEEPALIVE)
+                if not records:
+                    write(b':\n')  # a comment line, to find out the client is gone
+                    continue
+                events = ['id: {}\ndata: {}\n\n'.format(record['paging_token'], json.dumps(record))
+                          for record in records]
+                write(''.join(events).encode())
+                cursor = _parse_cursor(records[-1]['paging_token'])
+            write(b'')  # end of stream
+        except (IOError, socket.error):
+            pass  # client disconnected
+
+    def _check_rate_limit(self):
+        """Count the request in the current rate limit window.
+
+        :return: rate limit headers, and whether the request is over the limit.
+        :rtype: tuple(dict, boolean)
+        """
+        if not self.rate_limit:
+            return {}, False
+        with self._lock:
+            now = time.time()
+            if now >= self._window_end:
+                self._window_end = now + self.rate_limit_window
+                self._window_count = 0
+            self._window_count += 1
+            reset = int(self._window_end - now) + 1
+            headers = {'X-Ratelimit-Limit': str(self.rate_limit),
+                       'X-Ratelimit-Remaining': str(max(0, self.rate_limit - self._window_count)),
+                       'X-Ratelimit-Reset': str(reset)}
+            limited = self._window_count > self.rate_limit
+            if limited:
+                headers['Retry-After'] = str(reset)
+            return headers, limited
+
+    def _take_fault(self, method, path):
+        with self._lock:
+            for fault in self._faults:
+                if fault.matches(method, path):
+                    if fault.rate is not None:
+                        if self._random.random() < fault.rate:
+                            return fault
+                        continue
+                    fault.count -= 1
+                    if fault.count <= 0:
+                        self._faults.remove(fault)
+                    return fault
+        return None
+
+
+class FakeHorizon(object):
+    """
+    The class :class:`kin.stellar.fake_horizon.FakeHorizon` stands in for :class:`kin.stellar.horizon.Horizon`
+    on top of a :class:`kin.stellar.fake_horizon.FakeNetwork`, calling it directly instead of over HTTP:
+        - account and transaction lookups, and transaction submit
+        - errors raised as :class:`kin.stellar.errors.HorizonError`, like Horizon raises them
+        - injected transaction failures
+        - request counters, and the transactions that got into the ledger
+
+    It is meant for unit tests of the channel manager and the components above it::
+
+        horizon = FakeHorizon()
+        horizon.fund(address)
+        channel_manager = ChannelManager(secret_key, [secret_key], 'TESTNET', horizon)
+    """
+    num_retries = 3
+    backoff_factor = 0
+
+    def __init__(self, network='TESTNET'):
+        """Create a new fake Horizon.
+
+        :param network: (optional) the network name to take the passphrase from, or a network to use.
+        :type: str or :class:`kin.stellar.fake_horizon.FakeNetwork`
+        """
+        self.network = network if isinstance(network, FakeNetwork) else FakeNetwork(network)
+        self.account_calls = 0
+        self.submit_calls = 0
+        self.submitted = []  # the transactions that got into the ledger, parsed
+
+        self._lock = threading.Lock()
+        self._failures = []  # transaction result codes to fail the next submits with
+
+    def fund(self, address, amount=FRIENDBOT_AMOUNT):
+        """Create an account funded with lumens, in stroops."""
+        return self.network.fund(address, amount)
+
+    def fail_next(self, tx_result_code, count=1):
+        """Fail the next submits with a transaction result code. A transaction failing with `tx_failed` uses up
+        its sequence number, like a transaction whose operations failed in the ledger.
+
+        :param str tx_result_code: the transaction result code, see :class:`kin.stellar.errors.TransactionResultCode`.
+
+        :param int count: (optional) the number of submits to fail.
+        """
+        with self._lock:
+            self._failures.extend([tx_result_code] * count)
+
+    def bump_sequence(self, address):
+        """Use up a sequence number of an account, as if another client submitted a transaction of it."""
+        with self.network.lock:
+            self.network.accounts[address].sequence += 1
+
+    def account(self, address, use_cache=True):
+        with self._lock:
+            self.account_calls += 1
+        try:
+            return self.network.account(address)
+        except Problem as e:
+            raise HorizonError(e.body)
+
+    def transaction(self, tx_hash):
+        try:
+            return self.network.get_record('transactions', tx_hash)
+        except Problem as e:
+            raise HorizonError(e.body)
+
+    def submit(self, te, tx_hash=None):
+        if isinstance(te, bytes):
+            te = te.decode()
+        with self._lock:
+            self.submit_calls += 1
+            tx_result_code = self._failures.pop(0) if self._failures else None
+        try:
+            if tx_result_code:
+                raise self._failure(te, tx_result_code)
+            reply = self.network.submit(te)
+        except Problem as e:
+            raise HorizonError(e.body)
+        with self._lock:
+            self.submitted.append(_parse_transaction(te, self.network.network_id))
+        return reply
+
+    def _failure(self, envelope_xdr, tx_result_code):
+        tx = _parse_transaction(envelope_xdr, self.network.network_id)
+        op_result_codes = []
+        if tx_result_code == TransactionResultCode.FAILED:
+            with self.network.lock:
+                source = self.network.accounts.get(tx.source)
+                if source and tx.sequence == source.sequence + 1:
+                    source.balance -= BASE_FEE * len(tx.operations)
+                    source.sequence = tx.sequence
+            op_result_codes = ['op_underfunded'] * len(tx.operations)
+        return Problem.tx_failed(envelope_xdr, tx_result_code, op_result_codes)
+
+
+# internals
+
+class _Account(object):
+    def __init__(self, address, balance, sequence):
+        self.address = address
+        self.balance = balance  # in stroops
+        self.sequence = sequence
+        self.trustlines = OrderedDict()  # (code, issuer) -> [balance, limit] in stroops
+
+    def copy(self):
+        account = _Account(self.address, self.balance, self.sequence)
+        account.trustlines = OrderedDict((asset, list(line)) for asset, line in self.trustlines.items())
+        return account
+
+    def min_balance(self):
+        return (2 + len(self.trustlines)) * BASE_RESERVE
+
+    def to_record(self):
+        balances = [dict(_asset_fields(asset), balance=format_amount(line[0]), limit=format_amount(line[1]))
+                    for asset, line in self.trustlines.items()]
+        balances.append({'asset_type': 'native', 'balance': format_amount(self.balance)})
+        return {'id': self.address,
+                'account_id': self.address,
+                'paging_token': '',
+                'sequence': str(self.sequence),
+                'subentry_count': len(self.trustlines),
+                'thresholds': {'low_threshold': 0, 'med_threshold': 0, 'high_threshold': 0},
+                'flags': {'auth_required': False, 'auth_revocable': False},
+                'balances': balances,
+                'signers': [{'public_key': self.address, 'key': self.address, 'weight': 1,
+                             'type': 'ed25519_public_key'}],
+                'data': {}}
+
+
+class _LedgerDelta(object):
+    """Account changes of a transaction, committed to the ledger state only if all operations succeed."""
+    def __init__(self, accounts, ledger_sequence):
+        self.accounts = accounts
+        self.ledger_sequence = ledger_sequence
+        self.changed = {}
+
+    def get(self, address):
+        if address not in self.changed:
+            account = self.accounts.get(address)
+            self.changed[address] = account.copy() if account else None
+        return self.changed[address]
+
+    def create(self, address, balance):
+        # the sequence number of a new account starts at the ledger number, shifted
+        self.changed[address] = _Account(address, balance, self.ledger_sequence << 32)
+
+    def remove(self, address):
+        self.changed[address] = None
+
+    def commit(self):
+        for address, account in self.changed.items():
+            if account is None:
+                self.accounts.pop(address, None)
+            else:
+                self.accounts[address] = account
+
+
+def _apply_operation(delta, op):
+    """Apply the operation to the delta, unless it fails. Adds the participants and effects to the operation.
+
+    :return: the operation result code.
+    :rtype: str
+    """
+    op['participants'] = [op['source_account']]
+    op['effects'] = []
+    source = delta.get(op['source_account'])
+    if source is None:
+        return 'op_no_source_account'
+
+    op_type = op['type']
+    if op_type == 'create_account':
+        destination, amount = op['destination'], op['amount']
+        if amount <= 0 or destination == source.address:
+            return 'op_malformed'
+        if amount < 2 * BASE_RESERVE:
+            return 'op_low_reserve'
+        if delta.get(destination):
+            return 'op_already_exists'
+        if source.balance - amount < source.min_balance():
+            return 'op_underfunded'
+        source.balance -= amount
+        delta.create(destination, amount)
+        op['participants'].append(destination)
+        op['effects'] = [
+            {'type': 'account_created', 'account': destination, 'starting_balance': format_amount(amount)},
+            {'type': 'account_debited', 'account': source.address, 'asset_type': 'native',
+             'amount': format_amount(amount)},
+            {'type': 'signer_created', 'account': destination, 'public_key': destination, 'weight': 1},
+        ]
+
+    elif op_type == 'payment':
+        asset, amount = op['asset'], op['amount']
+        destination = delta.get(op['destination'])
+        if amount <= 0:
+            return 'op_malformed'
+        if destination is None:
+            return 'op_no_destination'
+        if asset is None:
+            if source.balance - amount < source.min_balance():
+                return 'op_underfunded'
+            source.balance -= amount
+            destination.balance += amount
+        else:
+            if delta.get(asset[1]) is None:
+                return 'op_no_issuer'
+            if destination.address != asset[1]:
+                line = destination.trustlines.get(asset)
+                if line is None:
+                    return 'op_no_trust'
+                if line[0] + amount > line[1]:
+                    return 'op_line_full'
+            if source.address != asset[1]:
+                line = source.trustlines.get(asset)
+                if line is None:
+                    return 'op_src_no_trust'
+                if line[0] < amount:
+                    return 'op_underfunded'
+            # the issuer creates and destroys the asset
+            if source.address != asset[1]:
+                source.trustlines[asset][0] -= amount
+            if destination.address != asset[1]:
+                destination.trustlines[asset][0] += amount
+        op['participants'].append(destination.address)
+        fields = _asset_fields(asset)
+        op['effects'] = [
+            dict(fields, type='account_credited', account=destination.address, amount=format_amount(amount)),
+            dict(fields, type='account_debited', account=source.address, amount=format_amount(amount)),
+        ]
+
+    elif op_type == 'change_trust':
+        asset, limit = op['asset'], op['limit']
+        if asset is None or asset[1] == source.address or limit < 0:
+            return 'op_malformed'
+        if delta.get(asset[1]) is None:
+            return 'op_no_issuer'
+        line = source.trustlines.get(asset)
+        if line is None:
+            if limit == 0:
+                return 'op_invalid_limit'
+            if source.balance < source.min_balance() + BASE_RESERVE:
+                return 'op_low_reserve'
+            source.trustlines[asset] = [0, limit]
+            effect_type = 'trustline_created'
+        elif limit == 0:
+            if line[0] > 0:
+                return 'op_invalid_limit'
+            del source.trustlines[asset]
+            effect_type = 'trustline_removed'
+        else:
+            if limit < line[0]:
+                return 'op_invalid_limit'
+            line[1] = limit
+            effect_type = 'trustline_updated'
+        op['effects'] = [dict(_asset_fields(asset), type=effect_type, account=source.address,
+                              limit=format_amount(limit))]
+
+    elif op_type == 'account_merge':
+        destination = delta.get(op['destination'])
+        if destination is None:
+            return 'op_no_account'
+        if destination.address == source.address:
+            return 'op_malformed'
+        if source.trustlines:
+            return 'op_has_sub_entries'
+        amount = source.balance
+        destination.balance += amount
+        delta.remove(source.address)
+        op['amount'] = amount
+        op['participants'].append(destination.address)
+        op['effects'] = [
+            {'type': 'account_debited', 'account': source.address, 'asset_type': 'native',
+             'amount': format_amount(amount)},
+            {'type': 'account_credited', 'account': destination.address, 'asset_type': 'native',
+             'amount': format_amount(amount)},
+            {'type': 'account_removed', 'account': source.address},
+        ]
+
+    else:
+        return 'op_not_supported'
+
+    return 'op_success'
+
+
+def _operation_record(op, op_id, created_at, tx_hash):
+    record = {'id': op_id,
+              'paging_token': op_id,
+              'source_account': op['source_account'],
+              'type': op['type'],
+              'type_i': op['type_i'],
+              'created_at': created_at,
+              'transaction_hash': tx_hash}
+    if op['type'] == 'create_account':
+        record.update(starting_balance=format_amount(op['amount']), funder=op['source_account'],
+                      account=op['destination'])
+    elif op['type'] == 'payment':
+        record.update(_asset_fields(op['asset']))
+        record.update({'from': op['source_account'], 'to': op['destination'], 'amount': format_amount(op['amount'])})
+    elif op['type'] == 'change_trust':
+        record.update(_asset_fields(op['asset']))
+        record.update(limit=format_amount(op['limit']), trustee=op['asset'][1], trustor=op['source_account'])
+    elif op['type'] == 'account_merge':
+        record.update(account=op['source_account'], into=op['destination'])
+    return record
+
+
+class _Transaction(object):
+    pass
+
+
+def _parse_transaction(envelope_xdr, network_id):
+    """Decode a transaction envelope.
+
+    :raises: :class:`kin.stellar.fake_horizon.Problem`: if the envelope is malformed.
+    """
+    try:
+        te = Xdr.StellarXDRUnpacker(base64.b64decode(envelope_xdr)).unpack_TransactionEnvelope()
+    except Exception as e:
+        raise Problem(400, HorizonErrorType.TRANSACTION_MALFORMED, 'Transaction Malformed', str(e),
+                      {'envelope_xdr': envelope_xdr})
+
+    packer = Xdr.StellarXDRPacker()
+    packer.pack_EnvelopeType(Xdr.const.ENVELOPE_TYPE_TX)
+    packer.pack_Transaction(te.tx)
+
+    tx = _Transaction()
+    tx.envelope_xdr = envelope_xdr
+    tx.hash_bytes = xdr_hash(network_id + packer.get_buffer())
+    tx.hash = binascii.hexlify(tx.hash_bytes).decode()
+    tx.source = format_address(te.tx.sourceAccount)
+    tx.sequence = te.tx.seqNum
+    tx.fee = te.tx.fee
+    tx.fee_paid = 0
+    tx.time_bounds = [te.tx.timeBounds[0].minTime, te.tx.timeBounds[0].maxTime] if te.tx.timeBounds else []
+    tx.signatures = te.signatures
+
+    memo = te.tx.memo
+    tx.memo_type = MEMO_TYPES[memo.type]
+    if memo.type == Xdr.const.MEMO_TEXT:
+        tx.memo = memo.text.decode('utf-8', 'replace')
+    elif memo.type == Xdr.const.MEMO_ID:
+        tx.memo = str(memo.id)
+    elif memo.type == Xdr.const.MEMO_HASH:
+        tx.memo = base64.b64encode(memo.hash).decode()
+    elif memo.type == Xdr.const.MEMO_RETURN:
+        tx.memo = base64.b64encode(memo.retHash).decode()
+
+    tx.operations = [_parse_operation(op, tx.source) for op in te.tx.operations]
+    return tx
+
+
+def _parse_operation(op, tx_source):
+    body = op.body
+    parsed = {'type': OPERATION_TYPES[body.type],
+              'type_i': body.type,
+              'source_account': format_address(op.sourceAccount[0]) if op.sourceAccount else tx_source}
+    if body.type == Xdr.const.CREATE_ACCOUNT:
+        parsed.update(destination=format_address(body.createAccountOp.destination),
+                      amount=body.createAccountOp.startingBalance)
+    elif body.type == Xdr.const.PAYMENT:
+        parsed.update(destination=format_address(body.paymentOp.destination),
+                      asset=_parse_asset(body.paymentOp.asset),
+                      amount=body.paymentOp.amount)
+    elif body.type == Xdr.const.CHANGE_TRUST:
+        parsed.update(asset=_parse_asset(body.changeTrustOp.line), limit=body.changeTrustOp.limit)
+    elif body.type == Xdr.const.ACCOUNT_MERGE:
+        parsed.update(destination=format_address(body.destination))
+    return parsed
+
+
+def _parse_asset(asset):
+    """Native asset is None, other assets are (code, issuer) tuples."""
+    if asset.type == Xdr.const.ASSET_TYPE_NATIVE:
+        return None
+    alpha_num = asset.alphaNum4 if asset.type == Xdr.const.ASSET_TYPE_CREDIT_ALPHANUM4 else asset.alphaNum12
+    return alpha_num.assetCode.rstrip(b'\0').decode(), format_address(alpha_num.issuer)
+
+
+def _asset_fields(asset):
+    if asset is None:
+        return {'asset_type': 'native'}
+    asset_type = 'credit_alphanum4' if len(asset[0]) <= 4 else 'credit_alphanum12'
+    return {'asset_type': asset_type, 'asset_code': asset[0], 'asset_issuer': asset[1]}
+
+
+class _Entry(object):
+    """A ledger, transaction or operation record, with the history of records it contains."""
+    def __init__(self, record, history):
+        self.record = record
+        self.history = history
+
+
+class _Index(object):
+    """A list of records ordered by their paging token."""
+    def __init__(self):
+        self.keys = []
+        self.records = []
+
+    def add(self, record):
+        self.keys.append(_parse_cursor(record['paging_token']))
+        self.records.append(record)
+
+    def page(self, cursor, order, limit):
+        if order == 'asc':
+            start = 0 if cursor is None else bisect_right(self.keys, cursor)
+            return self.records[start:start + limit]
+        end = len(self.keys) if cursor is None else bisect_left(self.keys, cursor)
+        return self.records[max(0, end - limit):end][::-1]
+
+    def after(self, cursor):
+        start = 0 if cursor is None else bisect_right(self.keys, cursor)
+        return self.records[start:]
+
+
+def _new_history(*extra_kinds):
+    return dict((kind, _Index()) for kind in ('transactions', 'operations', 'payments', 'effects') + extra_kinds)
+
+
+class _Fault(object):
+    def __init__(self, status, method=None, path=None, apply=False, count=1, rate=None):
+        if status not in FAULTS:
+            raise ValueError('unsupported fault status: {}'.format(status))
+        self.status = status
+        self.method = method
+        self.path = path
+        self.apply = apply
+        self.count = count
+        self.rate = rate
+
+    def matches(self, method, path):
+        return (self.method is None or self.method == method) and (self.path is None or path.startswith(self.path))
+
+    def problem(self):
+        error_type, title = FAULTS[self.status]
+        return Problem(self.status, error_type, title)
+
+
+_NOW = (float('inf'),)
+
+
+def _parse_cursor(cursor):
+    """Paging tokens are either numbers, or number pairs (of effects). They are compared as tuples."""
+    if cursor is None or cursor == '':
+        return None
+    if cursor == 'now':
+        return _NOW
+    try:
+        return tuple(int(part) for part in str(cursor).split('-'))
+    except ValueError:
+        raise Problem.bad_request('invalid cursor')
+
+
+def _parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise Problem.bad_request('invalid number: {}'.format(value))
+
+
+def _toid(ledger_sequence, tx_index=0, op_index=0):
+    """Total order id, the way Horizon numbers its records."""
+    return (ledger_sequence << 32) | (tx_index << 12) | op_index
+
+
+
+
+def _timestamp(seconds):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(seconds))
+
+
+# routes: (method, path pattern, handler, handler arguments)
+_ROUTES = [
+    ('GET', [], 'root', ()),
+    ('GET', ['friendbot'], 'friendbot', ()),
+    ('POST', ['transactions'], 'submit', ()),
+    ('GET', ['accounts', None], 'account', (1,)),
+    ('GET', ['accounts', None, 'offers'], 'account_offers', (1,)),
+    ('GET', ['order_book'], 'order_book', ()),
+]
+
+
+def _path_template(path):
+    """The request path with resource ids replaced, for example /accounts/{id}/transactions."""
+    parts = [part for part in path.split('/') if part]
+    return '/' + '/'.join(part if i % 2 == 0 else '{id}' for i, part in enumerate(parts))
+
+
+def _route(method, path):
+    """Find the handler of a request.
+
+    :return: handler name and arguments, or None and an empty tuple if there is none.
+    """
+    parts = [part for part in path.split('/') if part]
+    for route_method, pattern, handler, arg_positions in _ROUTES:
+        if route_method == method and len(pattern) == len(parts) \
+                and all(p is None or p == part for p, part in zip(pattern, parts)):
+            return handler, tuple(parts[i] for i in arg_positions)
+
+    if method != 'GET':
+        return None, ()
+    kinds = ('transactions', 'operations', 'payments', 'effects')
+    # collections: /transactions, /accounts/{id}/transactions, /ledgers/{seq}/operations...
+    if len(parts) == 1 and parts[0] in kinds + ('ledgers',):
+        return 'history', (None, None, parts[0])
+    if len(parts) == 3 and parts[2] in kinds and parts[0] in ('accounts', 'ledgers', 'transactions', 'operations'):
+        return 'history', (parts[0], parts[1], parts[2])
+    # single records: /transactions/{hash}, /ledgers/{seq}, /operations/{id}
+    if len(parts) == 2 and parts[0] in ('ledgers', 'transactions', 'operations'):
+        return 'record', (parts[0], parts[1])
+    return None, ()
+
+
+class _HTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like Horizon
+    disable_nagle_algorithm = True  # headers and body are written separately, don't delay the body
+
+    def do_GET(self):
+        self.server.horizon.handle(self, 'GET')
+
+    def do_POST(self):
+        self.server.horizon.handle(self, 'POST')
+
+    def log_message(self, format, *args):
+        logger.debug('%s - %s', self.address_string(), format % args)
+
+
+def _send_json(request, status, body, headers=None, content_type='application/hal+json'):
+    data = json.dumps(body).encode('utf-8')
+    request.send_response(status)
+    request.send_header('Content-Type', content_type + '; charset=utf-8')
+    request.send_header('Content-Length', str(len(data)))
+    for name, value in (headers or {}).items():
+        request.send_header(name, value)
+    request.end_headers()
+    request.wfile.write(data)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Run a fake Horizon server.')
+    parser.add_argument('--network', default='TESTNET', help='network name')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--ledger-close-time', type=float, default=0, help='seconds, 0 to close on every submit')
+    parser.add_argument('--latency', type=float, default=0, help='seconds to wait before every reply')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = FakeHorizonServer(network=args.network, host=args.host, port=args.port,
+                               ledger_close_time=args.ledger_close_time, latency=args.latency).start()
+    print('root account secret key: {}'.format(server.network.root_keypair.seed().decode()))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,68 +2,97 @@
 
 # Copyright (C) 2018 Kin Foundation
 
+import base64
 import requests
 from requests.adapters import HTTPAdapter, DEFAULT_POOLSIZE
-from requests.exceptions import RequestException
+from requests.exceptions import ConnectionError, ConnectTimeout, ReadTimeout, RequestException
 import sys
-from time import sleep
+import threading
+from time import sleep, time
 from urllib3.util import Retry
 
 from stellar_base.horizon import HORIZON_LIVE, HORIZON_TEST
 
-from .errors import HorizonError
+from .envelope import decode_result_codes
+from .errors import HORIZON_NS_PREFIX, HorizonError, HorizonErrorType, TransactionResultCode
+from .horizon_pool import EndpointPool
+from .single_flight import SingleFlight
+from .sse import EventStream, DEFAULT_READ_TIMEOUT
+from .throttling import JitteredRetry, backoff_time, retry_after
 
 import logging
 logger = logging.getLogger(__name__)
 
-try:
-    from sseclient import SSEClient
-except ImportError:
-    SSEClient = None
-
 if sys.version[0] == '2':
     # noinspection PyUnresolvedReferences
     from urllib import urlencode
+    # noinspection PyUnresolvedReferences
+    from urlparse import urlparse, parse_qs
 else:
     # noinspection PyUnresolvedReferences
-    from urllib.parse import urlencode
+    from urllib.parse import urlencode, urlparse, parse_qs
 
 
 DEFAULT_REQUEST_TIMEOUT = 11  # two ledgers + 1 sec, let's retry faster and not wait 60 secs.
 DEFAULT_NUM_RETRIES = 5
 DEFAULT_BACKOFF_FACTOR = 0.5
 USER_AGENT = 'py-stellar-base'
+MAX_PAGE_LIMIT = 200  # the largest page Horizon serves
+DEFAULT_SETTLE_TIMEOUT = 6  # a ledger close and a margin
+SETTLE_POLL_INTERVAL = 1
 
 
 class Horizon(object):
     """
     This class redefines :class:`stellar_base.horizon.Horizon` to provide additional functionality:
         - persistent connection to Horizon and connection pool
-        - configurable request retry functionality
+        - configurable request retry functionality, with jittered exponential backoff
+        - optional client-side rate limiting and circuit breaking, see :class:`kin.RateLimiter` and
+          :class:`kin.CircuitBreaker`
         - Horizon error checking and deserialization
+        - optional caching of query replies, see :class:`kin.QueryCache` and :class:`kin.PermanentCache`
+        - coalescing of identical concurrent queries into one request
+        - routing over several endpoints, see :class:`kin.stellar.horizon_pool.EndpointPool`
+
+    `horizon_uri` is either a single endpoint, or a list of endpoints to route the requests over.
     """
     def __init__(self, horizon_uri=None, pool_size=DEFAULT_POOLSIZE, num_retries=DEFAULT_NUM_RETRIES,
-                 request_timeout=DEFAULT_REQUEST_TIMEOUT, backoff_factor=DEFAULT_BACKOFF_FACTOR, user_agent=USER_AGENT):
+                 request_timeout=DEFAULT_REQUEST_TIMEOUT, backoff_factor=DEFAULT_BACKOFF_FACTOR, user_agent=USER_AGENT,
+                 cache=None, permanent_cache=None, coalesce_queries=True, rate_limiter=None, circuit_breaker=None,
+                 settle_timeout=DEFAULT_SETTLE_TIMEOUT, stream_timeout=DEFAULT_READ_TIMEOUT):
         if horizon_uri is None:
-            self.horizon_uri = HORIZON_TEST
+            self.horizon_uris = [HORIZON_TEST]
+        elif isinstance(horizon_uri, (list, tuple)):
+            if not horizon_uri:
+                raise ValueError('no horizon endpoints')
+            self.horizon_uris = list(horizon_uri)
         else:
-            self.horizon_uri = horizon_uri
+            self.horizon_uris = [horizon_uri]
+        self.horizon_uri = self.horizon_uris[0]
 
         self.pool_size = pool_size
         self.num_retries = num_retries
         self.request_timeout = request_timeout
         self.backoff_factor = backoff_factor
+        self.settle_timeout = settle_timeout
+        self.stream_timeout = stream_timeout  # seconds without data before a stream is reopened
+        self.cache = cache
+        self.permanent_cache = permanent_cache
+        self.single_flight = SingleFlight() if coalesce_queries else None
+        self.rate_limiter = rate_limiter
+        self.circuit_breaker = circuit_breaker
 
         # adding 504 to the list of statuses to retry
-        self.status_forcelist = list(Retry.RETRY_AFTER_STATUS_CODES).append(504)
+        self.status_forcelist = sorted(Retry.RETRY_AFTER_STATUS_CODES) + [504]
 
         # configure standard session
 
-        # configure retry handler
-        retry = Retry(total=self.num_retries, backoff_factor=self.backoff_factor, redirect=0,
-                      status_forcelist=self.status_forcelist)
-        # init transport adapter
-        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+        # configure retry handler. the last reply is returned when retries are exhausted, to be raised as a HorizonError
+        retry = JitteredRetry(total=self.num_retries, backoff_factor=self.backoff_factor, redirect=0,
+                              status_forcelist=self.status_forcelist, raise_on_status=False)
+        # init transport adapter, with a connection pool per endpoint
+        adapter = HTTPAdapter(pool_connections=max(self.pool_size, len(self.horizon_uris)),
+                              pool_maxsize=self.pool_size, max_retries=retry)
 
         # init session
         session = requests.Session()
@@ -77,7 +106,8 @@ class Horizon(object):
 
         # configure SSE session (differs from our standard session)
 
-        sse_retry = Retry(total=1000000, redirect=0, status_forcelist=self.status_forcelist)
+        sse_retry = JitteredRetry(total=1000000, backoff_factor=self.backoff_factor, redirect=0,
+                                  status_forcelist=self.status_forcelist, raise_on_status=False)
         sse_adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=sse_retry)
         sse_session = requests.Session()
         sse_session.headers.update({'User-Agent': user_agent})
@@ -85,43 +115,184 @@ class Horizon(object):
         sse_session.mount('https://', sse_adapter)
         self._sse_session = sse_session
 
-    def submit(self, te):
-        """Submit the transaction using a pooled connection, and retry on failure."""
+        # with several endpoints, probe their health with a session that does not retry
+        self.endpoint_pool = None
+        if len(self.horizon_uris) > 1:
+            probe_session = requests.Session()
+            probe_session.headers.update({'User-Agent': user_agent})
+            self._probe_session = probe_session
+            self.endpoint_pool = EndpointPool(self.horizon_uris, self._probe)
+
+    def close(self):
+        """Stop probing the endpoints and close the pooled connections."""
+        if self.endpoint_pool is not None:
+            self.endpoint_pool.close()
+            self._probe_session.close()
+        self._session.close()
+        self._sse_session.close()
+
+    def submit(self, te, tx_hash=None):
+        """Submit the transaction using a pooled connection, and retry on failure.
+
+        When the hash of the transaction is given, a submit that fails without telling whether the transaction got
+        into the ledger (a timeout or a dropped connection) is settled first, by looking the transaction up for up to
+        `settle_timeout` seconds. The transaction is resubmitted only if it is not found.
+
+        :param str te: the base64 encoded transaction envelope.
+
+        :param str tx_hash: (optional) the hex encoded transaction hash, see :meth:`kin.stellar.builder.Builder.hash`.
+
+        :return: the submit reply, with the transaction `hash` and `ledger`.
+        :rtype: dict
+        """
         params = {'tx': te}
         url = self.horizon_uri + '/transactions/'
 
+        # transactions of the same source account go to the same endpoint, so that they arrive in sequence order
+        source = transaction_source(te) if self.endpoint_pool else None
+
         # POST is not included in Retry's method_whitelist for a good reason.
         # our custom retry mechanism follows
-        reply = None
-        retry_count = self.num_retries
+        retry_count = 0
         while True:
+            endpoint = self.endpoint_pool.sticky(source) if self.endpoint_pool else None
+            if endpoint:
+                url = endpoint.uri + '/transactions/'
+            reply = error = None
+            start = time()
+            self._before_request()  # an open circuit is not retried
             try:
                 reply = self._session.post(url, data=params, timeout=self.request_timeout)
-                return check_horizon_reply(reply.json())
-            except (RequestException, ValueError) as e:
-                if reply:
-                    msg = 'horizon submit exception: {}, reply: [{}] {}'.format(str(e), reply.status_code, reply.text)
-                else:
-                    msg = 'horizon submit exception: {}'.format(str(e))
-                logging.warning(msg)
-
-                if reply and reply.status_code not in self.status_forcelist:
-                    raise Exception('invalid horizon reply: [{}] {}'.format(reply.status_code, reply.text))
-                # retry
-                if retry_count <= 0:
-                    raise
-                retry_count -= 1
-                logging.warning('submit retry attempt {}'.format(retry_count))
-                sleep(self.backoff_factor)
-
-    def query(self, rel_url, params=None, sse=False):
-        abs_url = self.horizon_uri + rel_url
-        reply = self._query(abs_url, params, sse)
-        return check_horizon_reply(reply) if not sse else reply
-
-    def account(self, address):
+            except RequestException as e:
+                error = e
+            finally:
+                self._after_request(reply)
+
+            if reply is not None and reply.status_code not in self.status_forcelist:
+                if endpoint:
+                    self.endpoint_pool.succeeded(endpoint, time() - start)
+                return check_horizon_reply(_json(reply))
+
+            if endpoint:
+                self.endpoint_pool.failed(endpoint, error or reply.status_code)
+            if reply is not None:
+                logging.warning('horizon submit failed, reply: [{}] {}'.format(reply.status_code, reply.text))
+            else:
+                logging.warning('horizon submit exception: {}'.format(str(error)))
+
+            if tx_hash and _is_ambiguous(reply, error):
+                settled = self._settle(tx_hash)
+                if settled is not None:
+                    return settled
+
+            if retry_count >= self.num_retries:
+                if error is not None:
+                    raise error
+                return check_horizon_reply(_json(reply))
+            retry_count += 1
+            logging.warning('submit retry attempt {}'.format(retry_count))
+            # jittered, so that clients failing together do not retry together, but not before Horizon asks to
+            sleep(max(backoff_time(self.backoff_factor, retry_count - 1), retry_after(reply)))
+
+    def _settle(self, tx_hash):
+        """Look up a transaction whose submit failed ambiguously, until it is found or `settle_timeout` passes.
+
+        :return: a submit reply if the transaction got into the ledger, or None if it was not found.
+        :rtype: dict
+
+        :raises: :class:`kin.stellar.errors.HorizonError`: if the transaction got into the ledger, but failed.
+        """
+        deadline = time() + self.settle_timeout
+        while True:
+            try:
+                tx = self.transaction(tx_hash)
+                logging.info('horizon submit settled, transaction {} in ledger {}'.format(tx_hash, tx.get('ledger')))
+                break
+            except HorizonError as e:
+                if e.type != HorizonErrorType.NOT_FOUND:
+                    return None
+            except RequestException:
+                pass  # still unknown, look again
+            if time() >= deadline:
+                return None
+            sleep(min(SETTLE_POLL_INTERVAL, deadline - time()))
+        return settled_reply(tx)
+
+    def query(self, rel_url, params=None, sse=False, use_cache=True):
+        if sse:
+            return self._stream(rel_url, params)
+
+        if use_cache:
+            if self.permanent_cache is not None and self.permanent_cache.cacheable(rel_url):
+                reply = self.permanent_cache.get(rel_url, params)
+                if reply is None:
+                    reply = check_horizon_reply(self._fetch(rel_url, params))
+                    self.permanent_cache.put(rel_url, reply, params)
+                return reply
+
+            if self.cache is not None:
+                version = self.cache.version
+                reply = self.cache.get(rel_url, params)
+                if reply is None:
+                    reply = check_horizon_reply(self._fetch(rel_url, params))
+                    self.cache.put(rel_url, reply, params, version=version)
+                return reply
+
+        return check_horizon_reply(self._fetch(rel_url, params))
+
+    def iterate(self, rel_url, params=None, prefetch=True):
+        """Iterate over the records of a collection endpoint, following the `next` links page by page.
+        At most two pages are held in memory: the one being consumed, and the next one, which is fetched in the
+        background meanwhile.
+
+        :param str rel_url: the collection url relative to the Horizon endpoint, like `/accounts/<address>/payments/`.
+
+        :param dict params: (optional) the query parameters: `cursor`, `order`, and `limit` for the page size.
+            The page size defaults to the maximal `MAX_PAGE_LIMIT`.
+
+        :param boolean prefetch: (optional) whether to fetch the next page while the current one is consumed.
+            Defaults to True.
+
+        :return: a generator of the collection records.
+        :rtype: generator of dict
+
+        :raises: :class:`kin.stellar.errors.HorizonError`: if Horizon returns an error, e.g. for a bad cursor.
+        """
+        params = dict(params or {})
+        params.setdefault('limit', MAX_PAGE_LIMIT)
+
+        page = self.query(rel_url, params)
+        while True:
+            records = page['_embedded']['records']
+            next_params = next_page_params(page, params)
+
+            # a short page is the last one, no need to ask for another
+            next_page = None
+            if next_params:
+                next_page = _PageFetcher(self.query, rel_url, next_params)
+                if prefetch:
+                    next_page.start()
+
+            for record in records:
+                yield record
+
+            if next_page is None:
+                return
+            page = next_page.result()
+            params = next_params
+
+    def invalidate_account(self, address):
+        """Evict the cached replies of the account, after a transaction has changed it."""
+        if self.cache is not None:
+            self.cache.invalidate('/accounts/' + address)
+        if self.single_flight is not None:
+            # queries already in flight may have been answered before the change
+            url = '/accounts/' + address
+            self.single_flight.forget(lambda key: key[0] == url or key[0].startswith(url + '/'))
+
+    def account(self, address, use_cache=True):
         url = '/accounts/' + address
-        return self.query(url)
+        return self.query(url, use_cache=use_cache)
 
     def account_effects(self, address, params=None, sse=False):
         url = '/accounts/' + address + '/effects/'
@@ -215,19 +386,48 @@ class Horizon(object):
         url = '/assets/'
         return self.query(url, params)
 
-    def _query(self, url, params=None, sse=False):
-        if not sse:
+    def _fetch(self, rel_url, params=None):
+        """Get a reply from Horizon, or join an identical request in flight."""
+        if self.single_flight is None:
+            return self._read(rel_url, params)
+        key = (rel_url, urlencode(sorted(params.items())) if params else '')
+        return self.single_flight.do(key, lambda: self._read(rel_url, params))
+
+    def _read(self, rel_url, params=None):
+        if self.endpoint_pool is None:
+            return self._get(self.horizon_uri + rel_url, params)
+        return self.endpoint_pool.read(lambda uri: self._get(uri + rel_url, params))
+
+    def _stream(self, rel_url, params=None):
+        uri = self.endpoint_pool.ranked()[0].uri if self.endpoint_pool else self.horizon_uri
+        return EventStream(uri + rel_url, session=self._sse_session, params=params,
+                           connect_timeout=self.request_timeout, read_timeout=self.stream_timeout)
+
+    def _get(self, url, params=None):
+        self._before_request()
+        reply = None
+        try:
             reply = self._session.get(url, params=params, timeout=self.request_timeout)
-            try:
-                return reply.json()
-            except ValueError:
-                raise Exception('invalid horizon reply: [{}] {}'.format(reply.status_code, reply.text))
-
-        # SSE connection
-        if SSEClient is None:
-            raise ValueError('SSE not supported, missing sseclient module')
-
-        return SSEClient(url, session=self._sse_session, params=params)
+        finally:
+            self._after_request(reply)
+        return _json(reply)
+
+    def _before_request(self):
+        """Fail fast if the circuit is open, and wait for the rate limiter."""
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.before_request()
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+    def _after_request(self, reply):
+        """Feed the reply, or None if the request failed without one, to the rate limiter and the circuit breaker."""
+        if self.rate_limiter is not None and reply is not None:
+            self.rate_limiter.update(reply)
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_reply(reply)
+
+    def _probe(self, uri):
+        return self._probe_session.get(uri + '/', timeout=self.request_timeout).json()
 
     @staticmethod
     def testnet():
@@ -242,3 +442,106 @@ def check_horizon_reply(reply):
     if 'status' not in reply:
         return reply
     raise HorizonError(reply)
+
+
+def settled_reply(tx):
+    """Get the submit reply of a transaction found in the ledger.
+
+    :param dict tx: the transaction record.
+
+    :return: the submit reply, with the transaction `hash` and `ledger`.
+    :rtype: dict
+
+    :raises: :class:`kin.stellar.errors.HorizonError`: if the transaction failed in the ledger, so that its fee was
+        charged and its sequence number used, but its operations were not applied, as for a failed submit.
+    """
+    if tx.get('successful', True):  # failed transactions are not recorded by Horizon versions without the field
+        return {key: tx.get(key) for key in ('hash', 'ledger', 'envelope_xdr', 'result_xdr', 'result_meta_xdr')}
+    try:
+        result_codes = decode_result_codes(tx.get('result_xdr'))
+    except ValueError as e:
+        logging.warning(e)
+        result_codes = {'transaction': TransactionResultCode.FAILED, 'operations': []}
+    raise HorizonError({
+        'type': HORIZON_NS_PREFIX + HorizonErrorType.TRANSACTION_FAILED,
+        'title': 'Transaction Failed',
+        'status': 400,
+        'detail': 'The transaction failed when submitted to the stellar network.',
+        'extras': {'envelope_xdr': tx.get('envelope_xdr'), 'result_xdr': tx.get('result_xdr'),
+                   'result_codes': result_codes},
+    })
+
+
+def is_ambiguous_submit(status, maybe_sent=False):
+    """Check whether a failed submit may still have got the transaction into the ledger.
+
+    :param int status: the reply status, or None if there was no reply.
+
+    :param boolean maybe_sent: (optional) whether the request may have been sent before the connection timed out or
+        dropped, when there was no reply.
+
+    :rtype: boolean
+    """
+    if status is not None:
+        return status == 504  # horizon timed out waiting for the ledger
+    return maybe_sent
+
+
+def _is_ambiguous(reply, error):
+    sent = isinstance(error, (ReadTimeout, ConnectionError)) and not isinstance(error, ConnectTimeout)
+    return is_ambiguous_submit(reply.status_code if reply is not None else None, sent)
+
+
+def _json(reply):
+    try:
+        return reply.json()
+    except ValueError:
+        raise Exception('invalid horizon reply: [{}] {}'.format(reply.status_code, reply.text))
+
+
+def transaction_source(te):
+    """Get the raw public key of the source account of a base64 encoded transaction envelope."""
+    # the envelope starts with the transaction, which starts with the source account: the key type, then the key
+    return base64.b64decode(te)[4:36]
+
+
+def next_page_params(page, params):
+    """Get the query parameters of the page following the given one, or None if the given page is the last.
+
+    The cursor is taken from the `next` link of the page. Only the query of the link is used, as Horizon behind
+    a proxy may link to a host that is not reachable by us.
+    """
+    records = page['_embedded']['records']
+    if not records or len(records) < int(params.get('limit', MAX_PAGE_LIMIT)):
+        return None
+
+    href = page.get('_links', {}).get('next', {}).get('href')
+    cursor = parse_qs(urlparse(href).query).get('cursor') if href else None
+    return dict(params, cursor=cursor[0] if cursor else records[-1]['paging_token'])
+
+
+class _PageFetcher(threading.Thread):
+    """Fetches a page in a background thread, or in the calling thread if it was not started."""
+    def __init__(self, query, rel_url, params):
+        super(_PageFetcher, self).__init__()
+        self.daemon = True
+        self.query = query
+        self.rel_url = rel_url
+        self.params = params
+        self.page = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.page = self.query(self.rel_url, self.params)
+        except Exception as e:
+            self.error = e
+
+    def result(self):
+        if self.ident is None:
+            self.run()
+        else:
+            self.join()
+        if self.error is not None:
+            raise self.error
+        return self.page
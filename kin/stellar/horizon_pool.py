@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+import threading
+from time import time
+
+from .errors import CircuitOpenError
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_PROBE_INTERVAL = 5  # seconds, about one ledger
+DEFAULT_MAX_FAILURES = 3  # consecutive failures before an endpoint is ejected
+DEFAULT_MAX_LEDGER_LAG = 1  # ledgers an endpoint may be behind the freshest one and still serve reads
+LATENCY_SMOOTHING = 0.3  # weight of the newest measurement in the latency moving average
+
+
+class EndpointPool(object):
+    """
+    The class :class:`kin.stellar.horizon_pool.EndpointPool` routes requests over several Horizon endpoints:
+        - reads go to the endpoint with the lowest latency among the endpoints having the freshest ledger
+        - an endpoint failing repeatedly is ejected, until a health probe succeeds again
+        - submits of the same source account stick to one endpoint while it is healthy, so that the transactions
+          of a channel reach the network in their sequence order
+
+    A background thread probes all endpoints periodically, measuring their latency and latest ledger.
+    """
+
+    def __init__(self, uris, probe, probe_interval=DEFAULT_PROBE_INTERVAL, max_failures=DEFAULT_MAX_FAILURES,
+                 max_ledger_lag=DEFAULT_MAX_LEDGER_LAG):
+        """Create a new endpoint pool and start probing the endpoints.
+
+        :param list of str uris: the Horizon endpoints, in order of preference until they are measured.
+
+        :param probe: a function getting the Horizon root resource of an endpoint uri.
+        :type: callable[[str], dict]
+
+        :param number probe_interval: (optional) the time between probes, in seconds.
+
+        :param int max_failures: (optional) the number of consecutive failures after which an endpoint is ejected.
+
+        :param int max_ledger_lag: (optional) the number of ledgers an endpoint may be behind and still serve reads.
+
+        :raises: ValueError: if no endpoints are given.
+        """
+        if not uris:
+            raise ValueError('no horizon endpoints')
+
+        self.endpoints = [_Endpoint(uri, i) for i, uri in enumerate(uris)]
+        self.probe = probe
+        self.probe_interval = probe_interval
+        self.max_failures = max_failures
+        self.max_ledger_lag = max_ledger_lag
+
+        self._sticky = {}  # submit key -> endpoint
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        self._prober = threading.Thread(target=self._probe_all)
+        self._prober.daemon = True
+        self._prober.start()
+
+    def close(self):
+        """Stop probing the endpoints."""
+        self._stopped.set()
+
+    def ranked(self):
+        """Get the endpoints ordered from the best to serve a read to the worst."""
+        with self._lock:
+            freshest = max(endpoint.ledger for endpoint in self.endpoints)
+            return sorted(self.endpoints, key=lambda endpoint: (
+                endpoint.ejected,
+                endpoint.ledger < freshest - self.max_ledger_lag,
+                endpoint.latency if endpoint.latency is not None else float('inf'),
+                endpoint.index))
+
+    def read(self, fn):
+        """Call the function with the best endpoint, failing over to the next ones on errors, like network
+        errors or invalid and server error replies.
+
+        :param fn: the function to call with an endpoint uri, returning a Horizon reply.
+        :type: callable[[str], dict]
+
+        :return: the reply of the first endpoint that did not fail, or the last error reply if they all did.
+        :rtype: dict
+
+        :raises: the error of the last endpoint, if they all failed.
+        :raises: :class:`kin.stellar.errors.CircuitOpenError`: if the circuit breaker of the caller is open.
+        """
+        reply = None
+        endpoints = self.ranked()
+        for i, endpoint in enumerate(endpoints):
+            start = time()
+            try:
+                reply = fn(endpoint.uri)
+            except CircuitOpenError:
+                raise  # not the fault of the endpoint, and the other endpoints are not tried either
+            except Exception as e:
+                self.failed(endpoint, e)
+                if i == len(endpoints) - 1:
+                    raise
+                continue
+            if _is_server_error(reply):
+                self.failed(endpoint, reply.get('status'))
+                continue
+            self.succeeded(endpoint, time() - start)
+            return reply
+        return reply
+
+    def sticky(self, key):
+        """Get the endpoint to submit transactions of the given key (e.g. the source account) to. The same
+        endpoint is returned as long as it is not ejected.
+
+        :param key: the hashable key.
+
+        :return: the endpoint, having a `uri` attribute.
+        """
+        with self._lock:
+            endpoint = self._sticky.get(key)
+            if endpoint is not None and not endpoint.ejected:
+                return endpoint
+        endpoint = self.ranked()[0]
+        with self._lock:
+            self._sticky[key] = endpoint
+        return endpoint
+
+    def succeeded(self, endpoint, latency):
+        """Record a successful request to the endpoint."""
+        with self._lock:
+            endpoint.failures = 0
+            if endpoint.latency is None:
+                endpoint.latency = latency
+            else:
+                endpoint.latency += LATENCY_SMOOTHING * (latency - endpoint.latency)
+
+    def failed(self, endpoint, error):
+        """Record a failed request to the endpoint, ejecting the endpoint after too many consecutive failures."""
+        with self._lock:
+            endpoint.failures += 1
+            if not endpoint.ejected and endpoint.failures >= self.max_failures:
+                endpoint.ejected = True
+                logger.warning('horizon endpoint {} ejected: {}'.format(endpoint.uri, error))
+
+    def status(self):
+        """Get the state of the endpoints.
+
+        :return: a list of the endpoint states, with the uri, whether the endpoint is ejected, the number of
+            consecutive failures, the average latency in seconds and the latest ledger.
+        :rtype: list of dict
+        """
+        with self._lock:
+            return [{
+                'uri': endpoint.uri,
+                'ejected': endpoint.ejected,
+                'failures': endpoint.failures,
+                'latency': endpoint.latency,
+                'ledger': endpoint.ledger,
+            } for endpoint in self.endpoints]
+
+    def probe_endpoint(self, endpoint):
+        """Probe an endpoint, updating its latency and latest ledger. An ejected endpoint is readmitted when
+        its probe succeeds.
+        """
+        start = time()
+        try:
+            reply = self.probe(endpoint.uri)
+        except Exception as e:
+            self.failed(endpoint, e)
+            return
+        if _is_server_error(reply):
+            self.failed(endpoint, reply.get('status'))
+            return
+
+        self.succeeded(endpoint, time() - start)
+        with self._lock:
+            endpoint.ledger = reply.get('history_latest_ledger') or 0
+            if endpoint.ejected:
+                endpoint.ejected = False
+                logger.info('horizon endpoint {} readmitted'.format(endpoint.uri))
+
+    def _probe_all(self):
+        while not self._stopped.is_set():
+            for endpoint in self.endpoints:
+                self.probe_endpoint(endpoint)
+            self._stopped.wait(self.probe_interval)
+
+
+class _Endpoint(object):
+    def __init__(self, uri, index):
+        self.uri = uri
+        self.index = index
+        self.ejected = False
+        self.failures = 0
+        self.latency = None  # moving average, in seconds
+        self.ledger = 0  # latest ledger seen by the last probe
+
+
+def _is_server_error(reply):
+    return isinstance(reply, dict) and isinstance(reply.get('status'), int) and reply['status'] >= 500
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+import errno
+import json
+import os
+import threading
+from time import time
+
+try:
+    import fcntl
+except ImportError:  # not available on windows
+    fcntl = None
+
+from .errors import HorizonError, HorizonErrorType, TransactionResultCode
+from .utils import sync_directory
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# transaction outcomes
+APPLIED = 'applied'  # in the ledger, all operations succeeded
+FAILED = 'failed'  # in the ledger, some operations failed. The fee was charged and the sequence consumed
+REJECTED = 'rejected'  # not in the ledger, and never will be
+
+
+class TransactionJournal(object):
+    """
+    The class :class:`kin.TransactionJournal` is an append-only journal of signed transactions, so that after a crash
+    it can be told which transactions got into the ledger. Every transaction is journaled with its envelope before it
+    is submitted, and marked with its outcome once known. Transactions left unresolved, e.g. because the process died
+    waiting for the submit reply, are replayed on restart (see :meth:`replay`).
+
+    A transaction whose outcome is not known when its sender gets an error, e.g. a timeout, may be sent again by the
+    sender. It is marked as abandoned (see :meth:`abandon`), and is only looked up on replay, never resubmitted, so
+    that it is not sent twice.
+
+    A journal belongs to a single process: it is locked while open, on the platforms that support file locks.
+
+    Journaling a transaction waits until the journal is synced to disk. Transactions journaled at the same time share
+    a single sync ("group commit"), so that the journal keeps up with many concurrent senders. Outcomes are not synced
+    on their own: an outcome lost in a crash is found again by the replay.
+    """
+
+    def __init__(self, path):
+        """Open a journal, creating it if missing. The resolved transactions are dropped from the journal.
+
+        :param str path: the path of the journal file.
+
+        :raises: ValueError: if the journal is open in another process.
+        """
+        self.path = path
+        self.records = 0  # journal records written
+        self.syncs = 0  # disk syncs of the journal
+        self.replayed = {}  # transaction hash -> outcome, of the replayed transactions
+
+        self._lock_file = _lock(path + '.lock')
+        self._pending, self._abandoned = self._load(path)  # transaction hash -> envelope, of the unresolved ones
+        self._compact()
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+
+        self._lock = threading.Lock()
+        self._written = 0  # records written
+        self._synced = 0  # records synced to disk
+        self._syncing = False
+        self._sync_cond = threading.Condition()
+
+    def close(self):
+        """Close the journal."""
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            if self._lock_file is not None:
+                self._lock_file.close()  # releases the lock
+                self._lock_file = None
+
+    def record(self, tx_hash, envelope_xdr):
+        """Journal a signed transaction before it is submitted, waiting until the journal is synced to disk.
+
+        :param str tx_hash: the hex encoded transaction hash.
+
+        :param str envelope_xdr: the base64 encoded transaction envelope.
+        """
+        if isinstance(envelope_xdr, bytes):
+            envelope_xdr = envelope_xdr.decode()
+        with self._lock:
+            self._pending[tx_hash] = envelope_xdr
+        self._sync(self._write({'hash': tx_hash, 'envelope': envelope_xdr, 'time': time()}))
+
+    def resolve(self, tx_hash, outcome):
+        """Mark a journaled transaction with its outcome.
+
+        :param str tx_hash: the hex encoded transaction hash.
+
+        :param str outcome: the outcome, one of `APPLIED`, `FAILED` or `REJECTED`.
+        """
+        with self._lock:
+            if self._pending.pop(tx_hash, None) is None:
+                return
+            self._abandoned.discard(tx_hash)
+        self._write({'hash': tx_hash, 'outcome': outcome})
+
+    def abandon(self, tx_hash):
+        """Mark a journaled transaction whose outcome is not known, when its sender got an error and may send it
+        again. It stays unresolved, but is only looked up on replay, not resubmitted.
+
+        :param str tx_hash: the hex encoded transaction hash.
+        """
+        with self._lock:
+            if tx_hash not in self._pending or tx_hash in self._abandoned:
+                return
+            self._abandoned.add(tx_hash)
+        self._write({'hash': tx_hash, 'abandoned': True})
+
+    def pending(self):
+        """Get the unresolved transactions.
+
+        :return: the transaction hashes and envelopes.
+        :rtype: dict
+        """
+        with self._lock:
+            return dict(self._pending)
+
+    def replay(self, horizon):
+        """Resolve the transactions left unresolved. A transaction found on Horizon is resolved by its result, and
+        the others are resubmitted. Resubmitting is idempotent, as a transaction gets into the ledger at most once.
+        Abandoned transactions are not resubmitted, as their senders may have sent them again: those not found are
+        rejected. Transactions that cannot be resolved, e.g. because Horizon cannot be reached, stay unresolved.
+
+        :param horizon: the Horizon to look the transactions up in and submit them to.
+        :type: :class:`kin.stellar.horizon.Horizon`
+
+        :return: the transaction hashes and outcomes, of the resolved transactions.
+        :rtype: dict
+        """
+        outcomes = {}
+        with self._lock:
+            abandoned = set(self._abandoned)
+        for tx_hash, envelope_xdr in self.pending().items():
+            try:
+                if tx_hash in abandoned:
+                    outcome = lookup(horizon, tx_hash) or REJECTED
+                else:
+                    outcome = _replay(horizon, tx_hash, envelope_xdr)
+            except Exception as e:
+                logger.warning('journaled transaction {} not resolved: {}'.format(tx_hash, e))
+                continue
+            logger.info('journaled transaction {} {}'.format(tx_hash, outcome))
+            self.resolve(tx_hash, outcome)
+            outcomes[tx_hash] = outcome
+        self.replayed.update(outcomes)
+        return outcomes
+
+    def stats(self):
+        """Get the number of unresolved transactions, and the numbers of records written and of disk syncs.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {'pending': len(self._pending), 'records': self.records, 'syncs': self.syncs}
+
+    def _write(self, entry):
+        """Append a record to the journal.
+
+        :return: the number of records written, including this one.
+        """
+        line = (json.dumps(entry, sort_keys=True) + '\n').encode()
+        with self._lock:
+            os.write(self._fd, line)  # a single unbuffered append, records of concurrent writers do not interleave
+            self._written += 1
+            self.records += 1
+            return self._written
+
+    def _sync(self, written):
+        """Wait until the first records written are synced to disk, syncing them if no other thread is."""
+        with self._sync_cond:
+            while self._synced < written:
+                if self._syncing:
+                    self._sync_cond.wait()
+                    continue
+
+                # sync all the records written so far, for this thread and the threads that wrote meanwhile
+                self._syncing = True
+                with self._lock:
+                    target = self._written
+                    fd = self._fd
+                self._sync_cond.release()
+                try:
+                    os.fsync(fd)
+                finally:
+                    self._sync_cond.acquire()
+                    self._syncing = False
+                    self._sync_cond.notify_all()
+                self._synced = max(self._synced, target)
+                self.syncs += 1
+
+    def _compact(self):
+        """Rewrite the journal with the unresolved transactions only."""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for tx_hash, envelope_xdr in self._pending.items():
+                entry = {'hash': tx_hash, 'envelope': envelope_xdr}
+                if tx_hash in self._abandoned:
+                    entry['abandoned'] = True
+                f.write((json.dumps(entry, sort_keys=True) + '\n').encode())
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, self.path)
+        sync_directory(os.path.dirname(os.path.abspath(self.path)))
+
+    @staticmethod
+    def _load(path):
+        """Read the unresolved transactions, and the hashes of those abandoned."""
+        pending = {}
+        abandoned = set()
+        try:
+            f = open(path, 'rb')
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return pending, abandoned
+
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line.decode())
+                except ValueError:
+                    continue  # the last record, torn by a crash
+                tx_hash = entry['hash']
+                if 'envelope' in entry:
+                    pending[tx_hash] = entry['envelope']
+                if entry.get('abandoned'):
+                    if tx_hash in pending:
+                        abandoned.add(tx_hash)
+                elif 'envelope' not in entry:
+                    pending.pop(tx_hash, None)
+                    abandoned.discard(tx_hash)
+        return pending, abandoned
+
+
+def _replay(horizon, tx_hash, envelope_xdr):
+    """Resolve a journaled transaction.
+
+    :return: the transaction outcome.
+    :rtype: str
+    """
+    outcome = lookup(horizon, tx_hash)
+    if outcome:
+        return outcome
+    try:
+        horizon.submit(envelope_xdr, tx_hash=tx_hash)
+        return APPLIED
+    except HorizonError as e:
+        if e.type != HorizonErrorType.TRANSACTION_FAILED:
+            raise
+        tx_result_code = e.extras.result_codes.transaction
+        if tx_result_code == TransactionResultCode.FAILED:
+            return FAILED
+        # the sequence was used, possibly by this very transaction, that Horizon did not show yet
+        if tx_result_code == TransactionResultCode.BAD_SEQUENCE:
+            return lookup(horizon, tx_hash) or REJECTED
+        return REJECTED
+
+
+def lookup(horizon, tx_hash):
+    """Look a transaction up on Horizon.
+
+    :param horizon: the Horizon to look the transaction up in.
+    :type: :class:`kin.stellar.horizon.Horizon`
+
+    :param str tx_hash: the hex encoded transaction hash.
+
+    :return: the transaction outcome, `APPLIED` or `FAILED`, or None if not found.
+    :rtype: str
+
+    :raises: :class:`kin.stellar.errors.HorizonError`: if the transaction cannot be looked up.
+    """
+    try:
+        tx = horizon.transaction(tx_hash)
+    except HorizonError as e:
+        if e.type == HorizonErrorType.NOT_FOUND:
+            return None
+        raise
+    return APPLIED if tx.get('successful', True) else FAILED
+
+
+def _lock(path):
+    """Lock a file, so that a journal is not opened by two processes.
+
+    :return: the locked file, unlocked when closed.
+
+    :raises: ValueError: if the file is locked by another process.
+    """
+    f = open(path, 'a')
+    if fcntl is None:
+        return f
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError as e:
+        f.close()
+        if e.errno not in (errno.EACCES, errno.EAGAIN):
+            raise
+        raise ValueError('journal in use by another process: {}'.format(path))
+    return f
@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+from collections import OrderedDict
+from copy import deepcopy
+import json
+import sqlite3
+import sys
+import threading
+from time import time
+
+if sys.version[0] == '2':
+    # noinspection PyUnresolvedReferences
+    from urllib import urlencode
+else:
+    # noinspection PyUnresolvedReferences
+    from urllib.parse import urlencode
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_CACHE_TTLS = {
+    '/accounts/{id}': 5,  # about one ledger
+}
+
+# resources that never change once their ledger is closed
+PERMANENT_ENDPOINTS = frozenset([
+    '/transactions/{id}',
+    '/transactions/{id}/operations',
+    '/ledgers/{id}',
+    '/operations/{id}',
+])
+
+
+class QueryCache(object):
+    """
+    The class :class:`kin.QueryCache` is a bounded LRU cache of Horizon GET replies, used by
+    :meth:`kin.stellar.horizon.Horizon.query`. Every endpoint has its own time to live, the endpoints being path
+    templates like `/accounts/{id}` or `/ledgers/{id}/operations`. Replies of endpoints without a time to live,
+    error replies and SSE streams are not cached.
+
+    Cached resources are evicted explicitly with :meth:`invalidate`, for example after a transaction changes
+    an account.
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, ttls=None, default_ttl=0):
+        """Create a new cache.
+
+        :param int max_size: (optional) the maximal number of cached replies. The least recently used replies are
+            evicted first.
+
+        :param dict ttls: (optional) the time to live in seconds of each endpoint template. Defaults to
+            `DEFAULT_CACHE_TTLS`, caching single accounts only.
+
+        :param number default_ttl: (optional) the time to live of the endpoints missing in `ttls`. Defaults to 0,
+            not caching them.
+
+        :raises: ValueError: if the cache size is not positive.
+        """
+        if max_size <= 0:
+            raise ValueError('cache size must be positive')
+
+        self.max_size = max_size
+        self.ttls = dict(DEFAULT_CACHE_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # incremented on every invalidation, so that a reply fetched before it is not cached after it
+        self.version = 0
+
+        self._entries = OrderedDict()  # key -> (expiry time, reply), least recently used first
+        self._resources = {}  # resource -> keys of its cached replies
+        self._invalidated = OrderedDict()  # resource -> version of its last invalidation
+        self._cleared = 0  # version of the last clear
+        self._lock = threading.Lock()
+
+    def ttl(self, rel_url):
+        """Get the time to live of replies from the given url."""
+        return self.ttls.get(endpoint(rel_url), self.default_ttl)
+
+    def get(self, rel_url, params=None):
+        """Get a cached reply.
+
+        :param str rel_url: the url relative to the Horizon endpoint.
+
+        :param dict params: (optional) the query parameters.
+
+        :return: a copy of the cached reply, or None if the reply is not cached or has expired.
+        :rtype: dict
+        """
+        if self.ttl(rel_url) <= 0:
+            return None
+
+        key = _key(rel_url, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            # mark as the most recently used
+            del self._entries[key]
+            self._entries[key] = entry
+            self.hits += 1
+        return deepcopy(entry[1])
+
+    def put(self, rel_url, reply, params=None, version=None):
+        """Cache a reply.
+
+        :param str rel_url: the url relative to the Horizon endpoint.
+
+        :param dict reply: the reply to cache.
+
+        :param dict params: (optional) the query parameters.
+
+        :param int version: (optional) the cache :attr:`version` from before the reply was requested. The reply is
+            not cached if its resource was invalidated since.
+        """
+        ttl = self.ttl(rel_url)
+        if ttl <= 0:
+            return
+
+        key = _key(rel_url, params)
+        resource = _resource(key[0])
+        entry = (time() + ttl, deepcopy(reply))
+        with self._lock:
+            if version is not None and max(self._cleared, self._invalidated.get(resource, 0)) > version:
+                return
+            if key in self._entries:
+                del self._entries[key]
+            self._entries[key] = entry
+            self._resources.setdefault(resource, set()).add(key)
+
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, rel_url):
+        """Evict the cached replies of a resource, including its sub-resources. For example, invalidating
+        `/accounts/<address>` evicts the account, its transactions, payments etc.
+
+        :param str rel_url: the resource url relative to the Horizon endpoint.
+        """
+        resource = _resource(_path(rel_url))
+        with self._lock:
+            self.version += 1
+            if resource in self._invalidated:
+                del self._invalidated[resource]
+            self._invalidated[resource] = self.version
+            while len(self._invalidated) > self.max_size:
+                self._invalidated.popitem(last=False)
+
+            for key in list(self._resources.get(resource, ())):
+                self._remove(key)
+
+    def clear(self):
+        """Evict all cached replies."""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self._resources.clear()
+            self._invalidated.clear()
+            self._cleared = self.version
+
+    def stats(self):
+        """Get the cache statistics.
+
+        :return: the numbers of hits, misses, evictions of least recently used replies, and the cache size.
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _remove(self, key):
+        del self._entries[key]
+        resource = _resource(key[0])
+        keys = self._resources[resource]
+        keys.discard(key)
+        if not keys:
+            del self._resources[resource]
+
+
+class PermanentCache(object):
+    """
+    The class :class:`kin.PermanentCache` caches the Horizon replies that never change once their ledger is closed:
+    transactions, transaction operations, ledgers and operations (see `PERMANENT_ENDPOINTS`). The replies are kept
+    in a bounded in-memory LRU, and optionally in an sqlite database that survives restarts. Replies evicted from
+    memory are still found in the database.
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, path=None):
+        """Create a new cache.
+
+        :param int max_size: (optional) the maximal number of replies kept in memory. The least recently used replies
+            are evicted first.
+
+        :param str path: (optional) the path of an sqlite database file to store the replies in. It is created if
+            missing. If not provided, the replies are kept in memory only.
+
+        :raises: ValueError: if the cache size is not positive.
+        """
+        if max_size <= 0:
+            raise ValueError('cache size must be positive')
+
+        self.max_size = max_size
+        self.path = path
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()  # key -> json encoded reply, least recently used first
+        self._lock = threading.Lock()
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            # losing the last writes on a crash is fine for a cache, but a corrupted database is not
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS replies (key TEXT PRIMARY KEY, reply TEXT NOT NULL)')
+            self._db.commit()
+
+    @staticmethod
+    def cacheable(rel_url):
+        """Check whether the replies from the given url can be cached permanently."""
+        return endpoint(rel_url) in PERMANENT_ENDPOINTS
+
+    def get(self, rel_url, params=None):
+        """Get a cached reply.
+
+        :param str rel_url: the url relative to the Horizon endpoint.
+
+        :param dict params: (optional) the query parameters.
+
+        :return: a copy of the cached reply, or None if the reply is not cached.
+        :rtype: dict
+        """
+        if not self.cacheable(rel_url):
+            return None
+
+        key = _db_key(rel_url, params)
+        with self._lock:
+            data = self._entries.pop(key, None)
+            if data is not None:
+                self._entries[key] = data
+                self.hits += 1
+            elif self._db is not None:
+                row = self._db.execute('SELECT reply FROM replies WHERE key = ?', (key,)).fetchone()
+                if row:
+                    data = row[0]
+                    self._remember(key, data)
+                    self.disk_hits += 1
+            if data is None:
+                self.misses += 1
+                return None
+        return json.loads(data)
+
+    def put(self, rel_url, reply, params=None):
+        """Cache a reply.
+
+        :param str rel_url: the url relative to the Horizon endpoint.
+
+        :param dict reply: the reply to cache.
+
+        :param dict params: (optional) the query parameters.
+        """
+        if not self.cacheable(rel_url):
+            return
+
+        key = _db_key(rel_url, params)
+        data = json.dumps(reply)
+        with self._lock:
+            self._remember(key, data)
+            if self._db is not None:
+                self._db.execute('INSERT OR IGNORE INTO replies (key, reply) VALUES (?, ?)', (key, data))
+                self._db.commit()
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self):
+        """Get the cache statistics.
+
+        :return: the numbers of memory hits, database hits, misses, evictions from memory, and the memory size.
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _remember(self, key, data):
+        self._entries.pop(key, None)
+        self._entries[key] = data
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+def endpoint(rel_url):
+    """Get the endpoint template of a relative url, e.g. `/accounts/{id}/payments` for
+    `/accounts/<address>/payments/`.
+    """
+    parts = _path(rel_url).split('/')[1:]
+    return '/' + '/'.join('{id}' if i % 2 else part for i, part in enumerate(parts))
+
+
+def _path(rel_url):
+    return '/' + rel_url.strip('/')
+
+
+def _resource(path):
+    """Get the top level resource of a path, e.g. `/accounts/<address>` for `/accounts/<address>/payments`."""
+    return '/'.join(path.split('/')[:3])
+
+
+def _key(rel_url, params):
+    return _path(rel_url), urlencode(sorted(params.items())) if params else ''
+
+
+def _db_key(rel_url, params):
+    path, query = _key(rel_url, params)
+    return path + '?' + query if query else path
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+from copy import deepcopy
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight(object):
+    """
+    The class :class:`kin.stellar.single_flight.SingleFlight` collapses concurrent calls having the same key into
+    one call. The first caller makes the call, and the callers arriving while it is in flight wait for it and share
+    its result or exception. Each waiter gets its own copy of the result, so that they can modify it freely.
+    """
+
+    def __init__(self):
+        self.calls = 0  # calls actually made
+        self.coalesced = 0  # calls that waited for another call instead
+        self._flights = {}  # key -> _Flight
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Call the function, unless a call with the same key is already in flight, in which case wait for its result.
+
+        :param key: the hashable key identifying identical calls.
+
+        :param fn: the function to call.
+        :type: callable[[], object]
+
+        :return: the result of the call.
+
+        :raises: the exception raised by the call.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self.calls += 1
+                leader = True
+            else:
+                flight.waiters += 1
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return deepcopy(flight.result)
+
+        result = None
+        try:
+            result = fn()
+            return result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            # keep a pristine copy for the waiters, as the caller may modify the result
+            if flight.waiters and flight.error is None:
+                flight.result = deepcopy(result)
+            flight.done.set()
+
+    def forget(self, match):
+        """Let the calls arriving from now on not join the matching calls in flight, e.g. because the data they
+        fetch has just been changed. The callers already waiting still get the results of those calls.
+
+        :param match: a function telling whether a key matches.
+        :type: callable[[object], boolean]
+        """
+        with self._lock:
+            for key in [key for key in self._flights if match(key)]:
+                del self._flights[key]
+
+    def stats(self):
+        """Get the numbers of calls made, calls coalesced into them, and calls currently in flight.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._flights),
+            }
+
+
+class _Flight(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0
+        self.result = None
+        self.error = None
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+import socket
+import threading
+
+import requests
+
+from .throttling import backoff_time
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_RETRY = 3  # seconds before reconnecting, unless the server sets it
+DEFAULT_CONNECT_TIMEOUT = 11  # seconds, same as the request timeout of Horizon
+DEFAULT_READ_TIMEOUT = 60  # seconds without any data, keep-alive comments included, before a stream is stalled
+CHUNK_SIZE = 64 * 1024  # the most bytes read at once. Chunked replies are read a chunk at a time, as they come
+
+
+class Event(object):
+    """A server-sent event, same as :class:`sseclient.Event`."""
+    __slots__ = ('data', 'event', 'id', 'retry')
+
+    def __init__(self, data='', event='message', id=None, retry=None):
+        self.data = data
+        self.event = event
+        self.id = id
+        self.retry = retry
+
+
+class EventStream(object):
+    """
+    An iterator of the server-sent events of a url. The events are parsed from the byte chunks of the reply as they
+    come, copying only the chunks an event is split between.
+
+    A stream that ends, breaks, or gets no data for `read_timeout` seconds is reopened with the id of the last event
+    received, so that no event is lost. Reconnects are delayed by a random wait, up to the retry time set by the
+    server, doubled on every consecutive failure, so that clients do not all reconnect at once. The stream can be
+    closed from another thread, ending the iteration.
+    """
+
+    def __init__(self, url, session=None, params=None, last_id=None, retry=DEFAULT_RETRY,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT):
+        """Open a stream. The first connection is made before returning, so that errors are raised to the caller.
+
+        :param str url: the url of the stream.
+
+        :param session: (optional) the session to connect with.
+        :type: :class:`requests.Session`
+
+        :param dict params: (optional) the query parameters.
+
+        :param str last_id: (optional) the id of the last event received, to resume after.
+
+        :param float retry: (optional) the seconds to wait before reconnecting, until the server sets it.
+
+        :param float connect_timeout: (optional) the seconds to wait for a connection.
+
+        :param float read_timeout: (optional) the seconds to wait for data, before the stream is reopened. Waits
+            forever if None.
+
+        :raises: :class:`requests.RequestException`: if the stream cannot be opened.
+        """
+        self.url = url
+        self.session = session or requests.Session()
+        self.params = params
+        self.last_id = last_id
+        self.retry = retry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.reconnects = 0  # times the stream was reopened
+        self.resp = None
+        self._closed = threading.Event()
+        self._connect()
+        self._events = self._read()
+
+    @property
+    def closed(self):
+        return self._closed.is_set()
+
+    def close(self):
+        """Close the stream, from any thread. The iteration ends."""
+        self._closed.set()
+        _shutdown(self.resp)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._events)
+
+    next = __next__  # python 2
+
+    def _connect(self):
+        headers = {'Accept': 'text/event-stream', 'Cache-Control': 'no-cache'}
+        if self.last_id:
+            headers['Last-Event-ID'] = self.last_id
+        resp = self.session.get(self.url, params=self.params, headers=headers, stream=True,
+                                timeout=(self.connect_timeout, self.read_timeout))
+        try:
+            resp.raise_for_status()
+        except Exception:
+            resp.close()
+            raise
+        self.resp = resp
+        if self.closed:  # closed while connecting
+            _shutdown(resp)
+
+    def _read(self):
+        """Generate the events, reconnecting until closed."""
+        failures = 0  # consecutive failed connections
+        while not self.closed:
+            if self.resp is None:
+                if self._closed.wait(backoff_time(self.retry, failures)):
+                    return
+                self.reconnects += 1
+                try:
+                    self._connect()
+                except Exception as e:
+                    failures += 1
+                    logger.warning('sse stream {} not reopened: {}'.format(self.url, e))
+                    continue
+
+            try:
+                for event in parse_events(self.resp.iter_content(chunk_size=CHUNK_SIZE)):
+                    if event.id is not None:
+                        self.last_id = event.id
+                    if event.retry is not None:
+                        self.retry = event.retry / 1000.0
+                    if event.data is not None:  # events without data are not dispatched
+                        failures = 0
+                        yield event
+                    if self.closed:
+                        break
+            except Exception as e:
+                if not self.closed:
+                    logger.warning('sse stream {} failed: {}, reconnecting'.format(self.url, e))
+            # the stream ended or broke
+            resp, self.resp = self.resp, None
+            _shutdown(resp)
+
+
+def parse_events(chunks):
+    """Parse server-sent events from byte chunks. Events and lines can be split anywhere between the chunks.
+
+    :param chunks: the byte chunks of the stream.
+    :type: iterable of bytes
+
+    :return: a generator of the events, with data None for the events without data lines.
+    :rtype: generator of :class:`Event`
+    """
+    pending = b''  # the start of an event split between chunks
+    for chunk in chunks:
+        if pending:
+            chunk = pending + chunk
+        if b'\r' in chunk:
+            # "\r\n" and "\r" end lines too. A "\r" at the end may be followed by "\n" in the next chunk
+            held = chunk[-1:] == b'\r'
+            if held:
+                chunk = chunk[:-1]
+            chunk = chunk.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+            if held:
+                chunk += b'\r'
+        start = 0
+        while True:
+            end = chunk.find(b'\n\n', start)
+            if end < 0:
+                break
+            if end > start:
+                yield _parse_event(chunk[start:end])
+            start = end + 2
+        pending = chunk[start:]
+
+
+def _parse_event(block):
+    data = None
+    event = Event(data=None)
+    for line in block.split(b'\n'):
+        if line[:1] == b':':  # comment
+            continue
+        field, _, value = line.partition(b':')
+        if value[:1] == b' ':
+            value = value[1:]
+        if field == b'data':
+            data = value if data is None else data + b'\n' + value
+        elif field == b'event':
+            event.event = value.decode('utf-8', 'replace')
+        elif field == b'id':
+            event.id = value.decode('utf-8', 'replace')
+        elif field == b'retry' and value.isdigit():
+            event.retry = int(value)
+    if data is not None:
+        event.data = data.decode('utf-8', 'replace')
+    return event
+
+
+def _shutdown(resp):
+    """Shut down the connection of a streamed reply, waking up a thread blocked reading it."""
+    if resp is None:
+        return
+    try:
+        fp = resp.raw._fp.fp
+        sock = getattr(fp, '_sock', None) or getattr(getattr(fp, 'raw', None), '_sock', None)
+        if sock is not None:
+            sock.shutdown(socket.SHUT_RDWR)
+    except (AttributeError, socket.error):
+        pass  # already closed
+    resp.close()
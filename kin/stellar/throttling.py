@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*
+
+# Copyright (C) 2018 Kin Foundation
+
+import random
+import threading
+from time import sleep, time
+
+from urllib3.util import Retry
+
+from .errors import CircuitOpenError
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# the backoff cap of urllib3, renamed in 1.26 and 2.x
+MAX_BACKOFF = getattr(Retry, 'DEFAULT_BACKOFF_MAX', None) or getattr(Retry, 'BACKOFF_MAX', 120)  # seconds
+DEFAULT_BURST = 10  # requests
+DEFAULT_FAILURE_THRESHOLD = 5  # consecutive failures
+DEFAULT_RESET_TIMEOUT = 10  # seconds
+
+# statuses telling that Horizon is overloaded: rate limited, bad gateway, over capacity and timeout
+OVERLOAD_STATUSES = frozenset([429, 502, 503, 504])
+
+
+def backoff_time(backoff_factor, retry_number):
+    """Get a random wait before a retry, up to an exponential backoff ("full jitter"), so that clients failing
+    together do not retry together.
+
+    :param number backoff_factor: the maximal wait before the first retry, in seconds.
+
+    :param int retry_number: the number of retries made so far.
+
+    :return: the time to wait, in seconds.
+    :rtype: float
+    """
+    return random.uniform(0, min(MAX_BACKOFF, backoff_factor * (2 ** retry_number)))
+
+
+def retry_after(reply):
+    """Get the time to wait requested by the Retry-After header of a reply, or 0.
+
+    :param reply: the HTTP reply, or None.
+    :type: :class:`requests.Response`
+
+    :return: the time to wait, in seconds.
+    :rtype: float
+    """
+    try:
+        return max(0.0, float(reply.headers.get('Retry-After', 0)))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0  # no reply, or an HTTP date, which Horizon does not send
+
+
+class JitteredRetry(Retry):
+    """The urllib3 retry configuration, with jittered exponential backoff. See :func:`backoff_time`."""
+    def get_backoff_time(self):
+        return random.uniform(0, super(JitteredRetry, self).get_backoff_time())
+
+
+class RateLimiter(object):
+    """
+    The class :class:`kin.RateLimiter` is a token bucket limiting the rate of requests to Horizon. One limiter can be
+    shared by several :class:`kin.stellar.horizon.Horizon` instances, to limit all of them together.
+
+    The limiter follows the rate limit headers of Horizon replies: the remaining requests of the rate limit window
+    are spread over the rest of the window, and when Horizon asks to retry after some time, no request is sent
+    until then.
+    """
+
+    def __init__(self, rate=None, burst=DEFAULT_BURST):
+        """Create a new rate limiter.
+
+        :param number rate: (optional) the number of requests per second. If not provided, requests are not limited
+            until Horizon reports its rate limit.
+
+        :param int burst: (optional) the number of requests that can be sent at once, after a quiet period.
+
+        :raises: ValueError: if the rate or the burst are not positive.
+        """
+        if rate is not None and rate <= 0:
+            raise ValueError('rate must be positive')
+        if burst < 1:
+            raise ValueError('burst must be positive')
+
+        self.rate = rate
+        self.burst = burst
+        self.waits = 0  # requests that had to wait
+
+        self._tokens = float(burst)
+        self._last = time()
+        self._blocked_until = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until a request can be sent."""
+        waited = False
+        while True:
+            with self._lock:
+                now = time()
+                if self.rate is not None:
+                    self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                elif self.rate is None or self._tokens >= 1:
+                    if self.rate is not None:
+                        self._tokens -= 1
+                    if waited:
+                        self.waits += 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self.rate
+            waited = True
+            sleep(wait)
+
+    def update(self, reply):
+        """Adjust the rate to the rate limit headers of a Horizon reply.
+
+        :param reply: the HTTP reply.
+        :type: :class:`requests.Response`
+        """
+        headers = reply.headers
+        now = time()
+        with self._lock:
+            try:
+                remaining = int(headers['X-Ratelimit-Remaining'])
+                reset = max(1, int(headers['X-Ratelimit-Reset']))
+            except (KeyError, TypeError, ValueError):
+                pass
+            else:
+                if remaining <= 0:
+                    self._blocked_until = max(self._blocked_until, now + reset)
+                else:
+                    self.rate = float(remaining) / reset
+                    self._tokens = min(self._tokens, remaining)
+
+            wait = retry_after(reply)
+            if wait:
+                self._blocked_until = max(self._blocked_until, now + wait)
+
+    def stats(self):
+        """Get the current rate, and the number of requests that had to wait.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {'rate': self.rate, 'waits': self.waits}
+
+
+class CircuitBreaker(object):
+    """
+    The class :class:`kin.CircuitBreaker` stops sending requests to an overloaded Horizon. After several consecutive
+    failures (network errors, and rate limit, over capacity or timeout replies), the circuit opens, and requests fail
+    immediately with :class:`kin.stellar.errors.CircuitOpenError`. After a while, one probe request is let through
+    ("half-open"): if it succeeds, the circuit closes, and if it fails, the circuit stays open for another while.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        """Create a new circuit breaker.
+
+        :param int failure_threshold: (optional) the number of consecutive failures opening the circuit.
+
+        :param number reset_timeout: (optional) the time in seconds the circuit stays open before a probe is sent.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = self.CLOSED
+        self.failures = 0  # consecutive failures
+        self.rejected = 0  # requests failed fast
+
+        self._opened_at = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """Check whether a request can be sent.
+
+        :raises: :class:`kin.stellar.errors.CircuitOpenError`: if the circuit is open.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+        raise CircuitOpenError('horizon overloaded, circuit open')
+
+    def record(self, success):
+        """Record the outcome of a request that was let through.
+
+        :param boolean success: whether the request succeeded, i.e. Horizon was not overloaded.
+        """
+        with self._lock:
+            if success:
+                if self.state != self.CLOSED:
+                    logger.info('horizon circuit closed')
+                self.state = self.CLOSED
+                self.failures = 0
+                return
+
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning('horizon circuit open after {} failures'.format(self.failures))
+                self.state = self.OPEN
+                self._opened_at = time()
+                self._probing = False
+
+    def record_reply(self, reply):
+        """Record the outcome of a request by its HTTP reply, or None if it failed without a reply."""
+        self.record(reply is not None and reply.status_code not in OVERLOAD_STATUSES)
+
+    def stats(self):
+        """Get the circuit state, the number of consecutive failures, and the number of requests failed fast.
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures, 'rejected': self.rejected}
@@ -2,6 +2,8 @@
 
 # Copyright (C) 2018 Kin Foundation
 
+import os
+
 from stellar_base.utils import decode_check
 
 
@@ -57,3 +59,20 @@ def is_valid_transaction_hash(tx_hash):
         return True
     except:
         return False
+
+
+def sync_directory(directory):
+    """Sync a directory, so that a file renamed into it survives a crash. Not supported on all platforms.
+
+    :param str directory: the directory to sync.
+    """
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -32,6 +32,9 @@ setup(
         'Programming Language :: Python :: 3',
     ],
     install_requires=requires,
+    extras_require={
+        'async': ['aiohttp>=3.3'],  # python 3.6+ only
+    },
     tests_require=tests_requires,
     python_requires='>=2.7',
 )
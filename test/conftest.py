@@ -1,20 +1,29 @@
+from functools import partial
 import json
 import pytest
 import requests
+import sys
+import time
 
 from stellar_base.asset import Asset
 from stellar_base.keypair import Keypair
 
 import kin
 from kin.stellar.builder import Builder
+from kin.stellar.fake_horizon import FakeHorizon, FakeHorizonServer
 
 import logging
 logging.basicConfig()
 #logging.getLogger().setLevel(logging.DEBUG)
 
+# asyncio support requires python 3.6+
+collect_ignore = ['test_async_horizon.py', 'test_async_sdk.py'] if sys.version_info < (3, 6) else []
+
 
 def pytest_addoption(parser):
     parser.addoption("--testnet", action="store_true", default=False, help="whether testing on testnet instead of local")
+    parser.addoption("--fake-horizon", action="store_true", default=False,
+                     help="whether testing on an in-process fake horizon instead of local")
 
 
 @pytest.fixture(scope='session')
@@ -23,7 +32,12 @@ def testnet(request):
 
 
 @pytest.fixture(scope='session')
-def setup(testnet):
+def fake(request):
+    return request.config.getoption("--fake-horizon")
+
+
+@pytest.fixture(scope='session')
+def setup(testnet, fake):
     class Struct:
         """Handy variable holder"""
         def __init__(self, **entries): self.__dict__.update(entries)
@@ -35,23 +49,37 @@ def setup(testnet):
     # global testnet
     if testnet:
         from stellar_base.horizon import HORIZON_TEST
-        return Struct(type='testnet',
-                      network='TESTNET',
-                      sdk_keypair=sdk_keypair,
-                      issuer_keypair=issuer_keypair,
-                      test_asset=test_asset,
-                      horizon_endpoint_uri=HORIZON_TEST)
+        yield Struct(type='testnet',
+                     network='TESTNET',
+                     sdk_keypair=sdk_keypair,
+                     issuer_keypair=issuer_keypair,
+                     test_asset=test_asset,
+                     horizon_endpoint_uri=HORIZON_TEST)
+        return
 
     # local testnet (zulucrypto docker)
     # https://github.com/zulucrypto/docker-stellar-integration-test-network
     from stellar_base.network import NETWORKS
     NETWORKS['CUSTOM'] = 'Integration Test Network ; zulucrypto'
-    return Struct(type='local',
-                  network='CUSTOM',
-                  sdk_keypair=sdk_keypair,
-                  issuer_keypair=issuer_keypair,
-                  test_asset=test_asset,
-                  horizon_endpoint_uri='http://localhost:8000')
+
+    # in-process fake horizon, simulating the same network
+    if fake:
+        server = FakeHorizonServer(network='CUSTOM').start()
+        yield Struct(type='fake',
+                     network='CUSTOM',
+                     sdk_keypair=sdk_keypair,
+                     issuer_keypair=issuer_keypair,
+                     test_asset=test_asset,
+                     horizon_endpoint_uri=server.url)
+        server.stop()
+        return
+
+    yield Struct(type='local',
+                 network='CUSTOM',
+                 sdk_keypair=sdk_keypair,
+                 issuer_keypair=issuer_keypair,
+                 test_asset=test_asset,
+                 horizon_endpoint_uri='http://localhost:8000')
 
 
 @pytest.fixture(scope='session')
@@ -90,7 +118,7 @@ class Helpers:
     def fund_account(setup, address):
         for attempt in range(3):
             try:
-                if setup.type == 'local':
+                if setup.type in ('local', 'fake'):
                     r = requests.get(setup.horizon_endpoint_uri + '/friendbot?addr=' + address)
                 else:
                     r = requests.get('https://friendbot.stellar.org/?addr=' + address)
@@ -133,9 +161,52 @@ class Helpers:
         reply = builder.submit()
         return reply.get('hash')
 
+    @staticmethod
+    def random_addresses(n):
+        """A helper to generate addresses of accounts that do not exist"""
+        return [Keypair.random().address().decode() for _ in range(n)]
+
+    @staticmethod
+    def wait_for(condition, timeout=5):
+        """A helper to wait until a condition holds, returning whether it did in time"""
+        deadline = time.time() + timeout
+        while not condition():
+            if time.time() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    @staticmethod
+    def funded_key(horizon):
+        """A helper to create an account on a fake Horizon, returning its secret key"""
+        keypair = Keypair.random()
+        horizon.fund(keypair.address().decode())
+        return keypair.seed()
+
+    @staticmethod
+    def send(channel_manager):
+        """A helper to send a payment through a channel manager, from its base account to itself"""
+        return channel_manager.send_transaction(lambda builder: partial(builder.append_payment_op,
+                                                                        channel_manager.base_address, 1))
+
+    @staticmethod
+    def run(coro):
+        """A helper to run a coroutine to completion"""
+        import asyncio  # python 3.6+ only
+        return asyncio.get_event_loop().run_until_complete(coro)
+
 
 @pytest.fixture
 def helpers():
     return Helpers
 
 
+@pytest.fixture
+def server():
+    with FakeHorizonServer() as server:
+        yield server
+
+
+@pytest.fixture
+def fake_horizon():
+    return FakeHorizon()
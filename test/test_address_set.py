@@ -0,0 +1,80 @@
+import pytest
+import threading
+
+from stellar_base.asset import Asset
+from stellar_base.keypair import Keypair
+
+import kin
+from kin.stellar import address_set as address_set_module
+from kin.stellar.address_set import CompactAddressSet
+from kin.stellar.fake_horizon import FakeHorizonServer
+
+
+def test_create(helpers):
+    addresses = helpers.random_addresses(100)
+    address_set = CompactAddressSet(addresses)
+    assert len(address_set) == 100
+    assert all(address in address_set for address in addresses)
+    assert not any(address in address_set for address in helpers.random_addresses(100))
+    assert sorted(address_set) == sorted(addresses)
+    assert None not in address_set
+    assert 'bad' not in address_set
+    assert addresses[0].encode() in address_set
+    assert address_set.stats() == {'size': 100, 'keys_bytes': 3200, 'bloom_bytes': 1227, 'rebuilds': 0}
+
+    with pytest.raises(ValueError, match='invalid address'):
+        CompactAddressSet(['bad'])
+    with pytest.raises(ValueError, match='invalid address'):
+        CompactAddressSet([addresses[0][:-1] + ('A' if addresses[0][-1] != 'A' else 'B')])  # bad checksum
+    with pytest.raises(ValueError, match='invalid address'):
+        CompactAddressSet([Keypair.random().seed().decode()])
+    with pytest.raises(ValueError, match='false positive rate must be between 0 and 1'):
+        CompactAddressSet(false_positive_rate=0)
+
+
+def test_add_discard(monkeypatch, helpers):
+    monkeypatch.setattr(address_set_module, 'MIN_CAPACITY', 10)
+    addresses = helpers.random_addresses(20)
+    address_set = CompactAddressSet(addresses[:10])
+    address_set.discard(addresses[0])
+    address_set.discard(addresses[10])  # not in the set
+    address_set.add(addresses[0])
+    address_set.add(addresses[1])  # already in the set
+    for address in addresses[10:15]:
+        address_set.add(address)
+    address_set.discard(addresses[14])
+    assert address_set.stats()['rebuilds'] == 0
+    assert len(address_set) == 14
+    assert [address in address_set for address in addresses] == [True] * 14 + [False] * 6
+
+    # the addresses added and removed are merged once there are many
+    for address in addresses[2:9]:
+        address_set.discard(address)
+    assert address_set.stats() == {'size': 7, 'keys_bytes': 224, 'bloom_bytes': 12, 'rebuilds': 1}
+    assert sorted(address_set) == sorted(addresses[:2] + addresses[9:14])
+    assert [address in address_set for address in addresses] == [True] * 2 + [False] * 7 + [True] * 5 + [False] * 6
+
+
+def test_monitor(helpers):
+    with FakeHorizonServer() as server:
+        keypair = Keypair.random()
+        server.fund(keypair.address().decode())
+        sdk = kin.SDK(secret_key=keypair.seed().decode(), horizon_endpoint_uri=server.url, network='TESTNET',
+                      kin_asset=Asset.native())
+        addresses = helpers.random_addresses(3)
+        for address in addresses:
+            server.fund(address)
+
+        received = []
+        done = threading.Event()
+
+        def callback(address, tx_data):
+            received.append((address, tx_data.memo))
+            if len(received) == 2:
+                done.set()
+
+        sdk.monitor_accounts_transactions(CompactAddressSet(addresses[:2]), callback)
+        for i, address in enumerate(addresses):
+            sdk.send_native(address, 1, memo_text=str(i))
+        assert done.wait(5)
+        assert received == [(addresses[0], '0'), (addresses[1], '1')]
@@ -0,0 +1,282 @@
+import asyncio
+import json
+import pytest
+import time
+
+aiohttp = pytest.importorskip('aiohttp')
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from stellar_base.horizon import HORIZON_TEST, HORIZON_LIVE
+from kin.stellar.errors import *
+from kin.stellar.async_horizon import AsyncHorizon
+from kin.stellar.horizon import DEFAULT_REQUEST_TIMEOUT, DEFAULT_NUM_RETRIES, DEFAULT_BACKOFF_FACTOR
+
+
+class LocalHorizon(object):
+    """A tiny aiohttp application answering a few Horizon endpoints."""
+    def __init__(self):
+        self.requests = []
+        self.fail_count = 0  # number of requests to fail with 503 first
+        self.stream_drops = 1  # number of times the event stream is dropped after the first event
+        self.stream_stalls = 0  # number of times the event stream goes silent after its events
+
+        app = web.Application()
+        app.router.add_get('/accounts/{address}', self.account)
+        app.router.add_get('/transactions/', self.transactions)
+        app.router.add_post('/transactions/', self.submit)
+        self.server = TestServer(app)
+
+    async def account(self, request):
+        self.requests.append(request)
+        if self.fail_count > 0:
+            self.fail_count -= 1
+            return web.Response(status=503, text='busy')
+        address = request.match_info['address']
+        if address == 'bad':
+            return web.json_response({'type': HORIZON_NS_PREFIX + HorizonErrorType.NOT_FOUND, 'status': 404,
+                                      'title': 'Resource Missing'}, status=404)
+        return web.json_response({'id': address, 'sequence': '1'})
+
+    async def submit(self, request):
+        self.requests.append(request)
+        data = await request.post()
+        return web.json_response({'hash': 'hash', 'envelope_xdr': data['tx']})
+
+    async def transactions(self, request):
+        self.requests.append(request)
+        if request.headers.get('Accept') != 'text/event-stream':
+            return web.json_response({'_embedded': {'records': [{'id': '1'}]}, 'cursor': request.query.get('cursor')})
+
+        last_id = int(request.headers.get('Last-Event-ID', 0))
+        reply = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await reply.prepare(request)
+        await reply.write(b'retry: 10\nevent: open\ndata: "hello"\n\n')
+        for i in range(last_id + 1, last_id + 4):
+            await reply.write('id: {}\ndata: {{"id": "{}",\ndata: "more": true}}\n\n'.format(i, i).encode())
+            if self.stream_drops > 0:
+                self.stream_drops -= 1
+                break
+        if self.stream_stalls > 0:
+            self.stream_stalls -= 1
+            await asyncio.sleep(1)
+        return reply
+
+
+@pytest.fixture
+def local_horizon(helpers):
+    horizon = LocalHorizon()
+    helpers.run(horizon.server.start_server())
+    yield horizon
+    helpers.run(horizon.server.close())
+
+
+@pytest.fixture
+def async_horizon(local_horizon, helpers):
+    horizon = AsyncHorizon(horizon_uri=str(local_horizon.server.make_url('')), backoff_factor=0.01)
+    yield horizon
+    helpers.run(horizon.close())
+
+
+def test_defaults():
+    horizon = AsyncHorizon.testnet()
+    assert horizon.horizon_uri == HORIZON_TEST
+
+    horizon = AsyncHorizon.livenet()
+    assert horizon.horizon_uri == HORIZON_LIVE
+
+    horizon = AsyncHorizon()
+    assert horizon.horizon_uri == HORIZON_TEST
+    assert horizon.request_timeout == DEFAULT_REQUEST_TIMEOUT
+    assert horizon.num_retries == DEFAULT_NUM_RETRIES
+    assert horizon.backoff_factor == DEFAULT_BACKOFF_FACTOR
+    assert horizon.status_forcelist == [413, 429, 503, 504]
+
+
+def test_account(local_horizon, async_horizon, helpers):
+    reply = helpers.run(async_horizon.account('GADDRESS'))
+    assert reply['id'] == 'GADDRESS'
+
+    with pytest.raises(HorizonError) as exc_info:
+        helpers.run(async_horizon.account('bad'))
+    assert exc_info.value.type == HorizonErrorType.NOT_FOUND
+
+    # all requests used the same connection
+    assert len(async_horizon._session.connector._conns) == 1
+
+
+def test_query_params(async_horizon, helpers):
+    reply = helpers.run(async_horizon.transactions(params={'cursor': 10, 'order': 'desc'}))
+    assert reply['cursor'] == '10'
+
+
+def test_retry(local_horizon, async_horizon, helpers):
+    local_horizon.fail_count = 2
+    reply = helpers.run(async_horizon.account('GADDRESS'))
+    assert reply['id'] == 'GADDRESS'
+    assert len(local_horizon.requests) == 3
+
+    # too many failures
+    local_horizon.requests = []
+    local_horizon.fail_count = DEFAULT_NUM_RETRIES + 1
+    with pytest.raises(Exception, match='invalid horizon reply: \\[503\\] busy'):
+        helpers.run(async_horizon.account('GADDRESS'))
+    assert len(local_horizon.requests) == DEFAULT_NUM_RETRIES + 1
+
+
+def test_submit(async_horizon, helpers):
+    reply = helpers.run(async_horizon.submit(b'envelope'))
+    assert reply['hash'] == 'hash'
+    assert reply['envelope_xdr'] == 'envelope'
+
+
+@pytest.fixture
+def fake_network():
+    """A fake Horizon, and a builder of payments from a funded account."""
+    from stellar_base.keypair import Keypair
+    from kin.stellar.builder import Builder
+    from kin.stellar.fake_horizon import FakeHorizonServer
+    from kin.stellar.horizon import Horizon
+
+    with FakeHorizonServer() as server:
+        keypair = Keypair.random()
+        server.fund(keypair.address().decode())
+        builder = Builder(secret=keypair.seed(), horizon=Horizon(horizon_uri=server.url), network='TESTNET',
+                          manage_sequence=True)
+
+        def sign_payment():
+            builder.append_payment_op(keypair.address().decode(), 1)
+            builder.sign()
+            te, tx_hash = builder.gen_xdr(), builder.hash()
+            builder.next()
+            return te, tx_hash
+
+        yield server, sign_payment
+
+
+def test_submit_retry(fake_network, helpers):
+    server, sign_payment = fake_network
+    horizon = AsyncHorizon(horizon_uri=server.url, num_retries=2, backoff_factor=0)
+
+    # retried, not before the time Horizon asks for
+    server.fail_next(429, method='POST')
+    start = time.time()
+    reply = helpers.run(horizon.submit(sign_payment()[0]))
+    assert reply['ledger']
+    assert time.time() - start >= 1
+    assert server.request_counts['POST /transactions'] == 2
+
+    # too many failures, the last error is raised
+    server.fail_next(503, count=3, method='POST')
+    with pytest.raises(HorizonError) as exc_info:
+        helpers.run(horizon.submit(sign_payment()[0]))
+    assert exc_info.value.type == HorizonErrorType.SERVER_OVER_CAPACITY
+    assert server.request_counts['POST /transactions'] == 5
+    helpers.run(horizon.close())
+
+
+def test_settle_submit(fake_network, helpers):
+    server, sign_payment = fake_network
+    horizon = AsyncHorizon(horizon_uri=server.url, backoff_factor=0, settle_timeout=0.2)
+
+    # Horizon timed out, but the transaction got into the ledger: it is found instead of resubmitted
+    server.fail_next(504, method='POST', apply=True)
+    te, tx_hash = sign_payment()
+    reply = helpers.run(horizon.submit(te, tx_hash=tx_hash))
+    assert reply['hash'] == tx_hash
+    assert reply['ledger']
+    assert server.request_counts['POST /transactions'] == 1
+    assert server.request_counts['GET /transactions/{id}'] == 1
+
+    # it did not, it is resubmitted once the settle timeout passes
+    server.fail_next(504, method='POST')
+    te, tx_hash = sign_payment()
+    assert helpers.run(horizon.submit(te, tx_hash=tx_hash))['hash'] == tx_hash
+    assert server.request_counts['POST /transactions'] == 3
+    helpers.run(horizon.close())
+
+
+def test_concurrent_queries(async_horizon, helpers):
+    async def query_all():
+        return await asyncio.gather(*[async_horizon.account('GADDRESS{}'.format(i)) for i in range(100)])
+    replies = helpers.run(query_all())
+    assert [reply['id'] for reply in replies] == ['GADDRESS{}'.format(i) for i in range(100)]
+
+
+def test_sse(local_horizon, async_horizon, helpers):
+    async def read_events(count):
+        events = await async_horizon.transactions(sse=True)
+        received = []
+        async for event in events:
+            received.append(event)
+            if len(received) == count:
+                break
+        events.close()
+        return received
+
+    events = helpers.run(read_events(5))
+    assert events[0].event == 'open'
+    assert events[0].data == '"hello"'
+
+    # the stream was dropped after the first event, and resumed from it
+    messages = [event for event in events if event.event == 'message']
+    assert [json.loads(event.data)['id'] for event in messages] == ['1', '2', '3']
+    assert json.loads(messages[0].data)['more'] is True
+    assert local_horizon.requests[1].headers['Last-Event-ID'] == '1'
+
+
+def test_sse_stalled(monkeypatch, local_horizon, helpers):
+    waits = []
+    monkeypatch.setattr('kin.stellar.async_horizon.backoff_time', lambda factor, retries: waits.append(retries) or 0)
+    local_horizon.stream_drops = 0
+    local_horizon.stream_stalls = 1
+    horizon = AsyncHorizon(horizon_uri=str(local_horizon.server.make_url('')), stream_timeout=0.2)
+
+    async def read_events(count):
+        events = await horizon.transactions(sse=True)
+        received = []
+        async for event in events:
+            received.append(event)
+            if len(received) == count:
+                break
+        events.close()
+        await horizon.close()
+        return received
+
+    # the server goes silent after the first events, the stream is reopened before the server ends it
+    start = time.time()
+    events = helpers.run(read_events(6))
+    assert time.time() - start < 1
+    assert [event.id for event in events if event.event == 'message'] == ['1', '2', '3', '4']
+    assert local_horizon.requests[1].headers['Last-Event-ID'] == '3'
+    assert waits == [0]
+
+
+def test_iterate(helpers):
+    from stellar_base.keypair import Keypair
+    from kin.stellar.fake_horizon import FakeHorizonServer
+
+    async def iterate(horizon, rel_url, params, stop=None):
+        records = []
+        async for record in horizon.iterate(rel_url, params):
+            records.append(record)
+            if len(records) == stop:
+                break
+        await asyncio.sleep(0.1)
+        return records
+
+    with FakeHorizonServer() as server:
+        for _ in range(5):
+            server.fund(Keypair.random().address().decode())
+        horizon = AsyncHorizon(horizon_uri=server.url)
+
+        records = helpers.run(iterate(horizon, '/transactions/', {'limit': 2}))
+        assert [int(r['paging_token']) for r in records] == sorted(int(r['paging_token']) for r in records)
+        assert len(records) == 5
+        assert server.request_counts['GET /transactions'] == 3
+
+        # only the page following the current one is prefetched
+        records = helpers.run(iterate(horizon, '/transactions/', {'limit': 2, 'order': 'desc'}, stop=3))
+        assert len(records) == 3
+        assert server.request_counts['GET /transactions'] == 6
+        helpers.run(horizon.close())
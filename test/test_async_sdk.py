@@ -0,0 +1,177 @@
+import asyncio
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from stellar_base.asset import Asset
+from stellar_base.keypair import Keypair
+
+import kin
+from kin.stellar.async_channel_manager import AsyncChannelManager
+from kin.stellar.errors import *
+from kin.stellar.fake_horizon import FakeHorizonServer
+
+
+class AsyncFakeHorizon(object):
+    """Exposes the fake Horizon methods as coroutines, yielding to the event loop on every request."""
+    def __init__(self, fake_horizon):
+        self.fake_horizon = fake_horizon
+        self.num_retries = fake_horizon.num_retries
+        self.backoff_factor = fake_horizon.backoff_factor
+
+    async def account(self, address):
+        await asyncio.sleep(0.01)
+        return self.fake_horizon.account(address)
+
+    async def submit(self, te, tx_hash=None):
+        await asyncio.sleep(0.01)
+        return self.fake_horizon.submit(te, tx_hash)
+
+
+@pytest.fixture
+def channel_manager(fake_horizon, helpers):
+    base_key = helpers.funded_key(fake_horizon)
+    channel_keys = [helpers.funded_key(fake_horizon) for _ in range(5)]
+    return AsyncChannelManager(base_key, channel_keys, 'TESTNET', AsyncFakeHorizon(fake_horizon))
+
+
+def test_channel_manager_concurrent(channel_manager, fake_horizon, helpers):
+    async def send_all():
+        return await asyncio.gather(*[helpers.send(channel_manager) for _ in range(50)])
+
+    replies = helpers.run(send_all())
+    assert len(set(reply['hash'] for reply in replies)) == 50
+    assert fake_horizon.account_calls == 5  # one per channel
+    assert channel_manager.channel_builders.qsize() == 5
+
+
+def test_channel_manager_bad_sequence(channel_manager, fake_horizon, helpers):
+    helpers.run(helpers.send(channel_manager))
+    for tx in fake_horizon.submitted:
+        fake_horizon.bump_sequence(tx.source)
+    assert helpers.run(helpers.send(channel_manager))
+    assert fake_horizon.account_calls == 2
+
+
+def test_channel_manager_busy(channel_manager, monkeypatch, helpers):
+    import kin.stellar.async_channel_manager
+    monkeypatch.setattr(kin.stellar.async_channel_manager, 'CHANNEL_QUEUE_TIMEOUT', 0.1)
+
+    async def take_all_and_send():
+        for _ in range(channel_manager.num_channels):
+            await channel_manager.channel_builders.get()
+        await helpers.send(channel_manager)
+
+    with pytest.raises(ChannelsBusyError):
+        helpers.run(take_all_and_send())
+
+
+def test_sdk_not_configured(helpers):
+    sdk = kin.AsyncSDK(horizon_endpoint_uri='http://localhost:8000', network='TESTNET')
+    with pytest.raises(kin.SdkError, match='address not configured'):
+        sdk.get_address()
+    with pytest.raises(kin.SdkError, match='address not configured'):
+        helpers.run(sdk.get_kin_balance())
+    with pytest.raises(kin.SdkError, match='address not configured'):
+        helpers.run(sdk.create_account('address'))
+    with pytest.raises(kin.SdkError, match='address not configured'):
+        helpers.run(sdk.send_kin('address', 1))
+    with pytest.raises(kin.SdkError, match='address not configured'):
+        sdk.monitor_kin_payments()
+
+
+def test_sdk_create_fail():
+    with pytest.raises(ValueError, match='invalid secret key: bad'):
+        kin.AsyncSDK(secret_key='bad')
+    with pytest.raises(ValueError, match='invalid channel key: bad'):
+        kin.AsyncSDK(secret_key=Keypair.random().seed(), channel_secret_keys=['bad'])
+
+
+def test_sdk_invalid_params(helpers):
+    sdk = kin.AsyncSDK(secret_key=Keypair.random().seed(), network='TESTNET')
+    assert sdk.horizon.horizon_uri == kin.stellar.horizon.HORIZON_TEST
+
+    address = Keypair.random().address().decode()
+    with pytest.raises(ValueError, match='invalid address: bad'):
+        helpers.run(sdk.get_account_data('bad'))
+    with pytest.raises(ValueError, match='invalid address: bad'):
+        helpers.run(sdk.send_kin('bad', 1))
+    with pytest.raises(ValueError, match='amount must be positive'):
+        helpers.run(sdk.send_kin(address, 0))
+    with pytest.raises(ValueError, match='invalid asset issuer: bad'):
+        helpers.run(sdk._send_asset(Asset('TMP', 'bad'), address, 1))
+    with pytest.raises(ValueError, match='invalid transaction hash: bad'):
+        helpers.run(sdk.get_transaction_data('bad'))
+
+    async def monitor(addresses):
+        async for _ in sdk.monitor_accounts_transactions(addresses):
+            pass
+    with pytest.raises(ValueError, match='no addresses to monitor'):
+        helpers.run(monitor([]))
+    with pytest.raises(ValueError, match='invalid address: bad'):
+        helpers.run(monitor(['bad']))
+
+
+def test_sdk_network_error(helpers):
+    sdk = kin.AsyncSDK(secret_key=Keypair.random().seed(), horizon_endpoint_uri='http://localhost:666')
+    sdk.horizon.num_retries = 0
+    with pytest.raises(kin.NetworkError):
+        helpers.run(sdk.check_setup())
+
+    status = helpers.run(sdk.get_status())
+    assert status['horizon']['online'] is False
+    assert status['channels'] == {'all': 1, 'free': 1}
+    helpers.run(sdk.close())
+
+
+def test_sdk_created_outside_loop(server):
+    keypair = Keypair.random()
+    server.fund(keypair.address().decode())
+    receiver = Keypair.random().address().decode()
+    server.fund(receiver)
+    # created before the loop it is used in, with a single channel that the sends wait for
+    sdk = kin.AsyncSDK(secret_key=keypair.seed().decode(), horizon_endpoint_uri=server.url, network='TESTNET',
+                       kin_asset=Asset.native())
+
+    async def send_both():
+        tx_hashes = await asyncio.gather(sdk.send_native(receiver, 1), sdk.send_native(receiver, 2))
+        await sdk.close()
+        return tx_hashes
+
+    loop = asyncio.new_event_loop()
+    try:
+        tx_hashes = loop.run_until_complete(send_both())
+    finally:
+        loop.close()
+    assert len(set(tx_hashes)) == 2
+
+
+def test_monitor_native(helpers):
+    with FakeHorizonServer() as server:
+        keypair = Keypair.random()
+        server.fund(keypair.address().decode())
+        sender = kin.SDK(secret_key=keypair.seed().decode(), horizon_endpoint_uri=server.url, network='TESTNET',
+                         kin_asset=Asset.native())
+        receiver = Keypair.random()
+        server.fund(receiver.address().decode())
+        sdk = kin.AsyncSDK(secret_key=receiver.seed().decode(), horizon_endpoint_uri=server.url, network='TESTNET',
+                           kin_asset=Asset.native())
+
+        async def first_payment():
+            async for address, tx_data in sdk.monitor_kin_payments():
+                return address, tx_data
+
+        async def monitor():
+            task = asyncio.ensure_future(first_payment())
+            await asyncio.sleep(0.5)  # the stream is open
+            tx_hash = await asyncio.get_event_loop().run_in_executor(
+                None, sender.send_native, receiver.address().decode(), 1.5)
+            address, tx_data = await asyncio.wait_for(task, 5)
+            await sdk.close()
+            return tx_hash, address, tx_data
+
+        # payments of the native asset have no asset code
+        tx_hash, address, tx_data = helpers.run(monitor())
+        assert address == receiver.address().decode()
+        assert tx_data.hash == tx_hash
+        assert tx_data.operations[0].amount == 1.5
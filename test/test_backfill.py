@@ -0,0 +1,78 @@
+import pytest
+
+from stellar_base.asset import Asset
+from stellar_base.keypair import Keypair
+
+import kin
+from kin.stellar.fake_horizon import FakeHorizonServer
+
+
+@pytest.fixture
+def network():
+    """A sender and two watched accounts, with payments to the watched accounts and others over 20 ledgers."""
+    with FakeHorizonServer() as server:
+        keypair = Keypair.random()
+        server.fund(keypair.address().decode())
+        sdk = kin.SDK(secret_key=keypair.seed().decode(), horizon_endpoint_uri=server.url, network='TESTNET',
+                      kin_asset=Asset.native())
+        watched = [Keypair.random().address().decode() for _ in range(2)]
+        other = Keypair.random().address().decode()
+        for address in watched + [other]:
+            server.fund(address)
+
+        first = server.network.ledger_sequence + 1
+        expected = []
+        for i in range(10):
+            tx_hash = sdk.send_native(watched[i % 2], 1, memo_text=str(i))
+            expected.append((watched[i % 2], tx_hash))
+            sdk.send_native(other, 1)
+            if i % 3 == 0:
+                server.network.close_ledger()  # an empty ledger
+        last = server.network.ledger_sequence
+        yield server, sdk, watched, first, last, expected
+
+
+def test_backfill(network):
+    server, sdk, watched, first, last, expected = network
+    backfill = kin.LedgerBackfill(sdk.horizon, watched, first, last, only_payments=True, shard_size=3, workers=3)
+    server.request_counts.clear()
+    found = [(address, tx_data.hash) for address, tx_data in backfill]
+
+    assert found == expected
+    assert backfill.stats() == {'shards': 8, 'shards_done': 8, 'transactions': 20, 'matched': 10}
+    # a request per shard, as every shard fits in a page
+    assert server.request_counts['GET /transactions'] == 8
+
+    # a sub range, matched against a single address
+    found = list(kin.LedgerBackfill(sdk.horizon, watched[:1], first + 4, last, workers=1))
+    assert [tx_data.memo for _, tx_data in found] == ['2', '4', '6', '8']
+
+
+def test_resume(network, tmpdir):
+    server, sdk, watched, first, last, expected = network
+    checkpoint = kin.FileCheckpoint(str(tmpdir.join('checkpoint')))
+
+    # stopped while yielding the third shard
+    backfill = kin.LedgerBackfill(sdk.horizon, watched, first, last, shard_size=3, checkpoint=checkpoint)
+    found = []
+    for address, tx_data in backfill:
+        found.append((address, tx_data.hash))
+        if backfill.stats()['shards_done'] == 2:
+            break
+    assert checkpoint.load() == str(first + 5)
+
+    # the third shard is fetched again
+    backfill = kin.LedgerBackfill(sdk.horizon, watched, first, last, shard_size=3, checkpoint=checkpoint)
+    assert backfill.stats()['shards'] == 6
+    found = found[:-1] + [(address, tx_data.hash) for address, tx_data in backfill]
+    assert found == expected
+    assert checkpoint.load() == str(last)
+
+
+def test_invalid():
+    with pytest.raises(ValueError, match='invalid ledger range'):
+        kin.LedgerBackfill(None, [], 10, 9)
+    with pytest.raises(ValueError, match='must be positive'):
+        kin.LedgerBackfill(None, [], 1, 9, workers=0)
+    with pytest.raises(ValueError, match='invalid address'):
+        kin.LedgerBackfill(None, ['bad'], 1, 9)
@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+import pytest
+
+from stellar_base.keypair import Keypair
+
+from kin.stellar.channel_leases import ChannelLeases
+from kin.stellar.channel_manager import ChannelManager
+
+
+def test_acquire_release(tmpdir):
+    directory = str(tmpdir.join('leases'))
+    leases = ChannelLeases(directory)
+    other = ChannelLeases(directory)  # as if in another process
+
+    assert leases.acquire('a') == (True, None)
+    with pytest.raises(ValueError, match='channel already leased'):
+        leases.acquire('a')
+    assert other.acquire('a') == (False, None)
+    assert other.acquire('b') == (True, None)
+
+    leases.release('a', 105)
+    assert other.acquire('a') == (True, 105)
+    assert tmpdir.join('leases', 'a').read() == ''  # unknown while leased
+    other.release('a', None)
+    assert leases.acquire('a') == (True, None)
+
+    assert leases.stats() == {'leased': 1, 'acquired': 2, 'contended': 0}
+    assert other.stats() == {'leased': 1, 'acquired': 2, 'contended': 1}
+
+
+def _lease_and_crash(directory):
+    ChannelLeases(directory).acquire('a')
+    os._exit(1)
+
+
+def test_crashed_process(tmpdir):
+    directory = str(tmpdir)
+    leases = ChannelLeases(directory)
+    assert leases.acquire('a') == (True, None)
+    leases.release('a', 105)
+
+    process = multiprocessing.Process(target=_lease_and_crash, args=(directory,))
+    process.start()
+    process.join()
+    assert process.exitcode == 1
+
+    # the lease expired with the process, and the sequence it may have used is not known
+    assert leases.acquire('a') == (True, None)
+
+
+def test_channel_manager(fake_horizon, tmpdir, helpers):
+    base_key = helpers.funded_key(fake_horizon)
+    channel_key = helpers.funded_key(fake_horizon)
+    base_address = Keypair.from_seed(base_key).address().decode()
+    channel_address = Keypair.from_seed(channel_key).address().decode()
+
+    # two processes sharing the same channel
+    managers = [ChannelManager(base_key, [base_key], 'TESTNET', fake_horizon, leases=ChannelLeases(str(tmpdir)))
+                for _ in range(2)]
+    for i in range(4):
+        assert helpers.send(managers[i % 2])
+    # the sequence was passed on with the lease, there were no bad sequences
+    assert fake_horizon.account_calls == 1
+    assert fake_horizon.submit_calls == 4
+
+    # a channel leased by another process is skipped
+    leases = ChannelLeases(str(tmpdir))
+    assert leases.acquire(base_address)[0]
+    channel_manager = ChannelManager(base_key, [base_key, channel_key], 'TESTNET', fake_horizon,
+                                     leases=ChannelLeases(str(tmpdir)))
+    for _ in range(2):
+        assert helpers.send(channel_manager)
+    sources = [tx.source for tx in fake_horizon.submitted[-2:]]
+    assert sources == [channel_address] * 2
+    assert channel_manager.channel_builders.qsize() == 2
+    assert channel_manager.leases.stats() == {'leased': 0, 'acquired': 2, 'contended': 2}
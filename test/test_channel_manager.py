@@ -0,0 +1,240 @@
+from functools import partial
+import pytest
+import threading
+import time
+
+from stellar_base.keypair import Keypair
+
+from kin.stellar.channel_manager import ChannelManager, ChannelSequence, PRIORITY_HIGH, PRIORITY_NORMAL, \
+    PRIORITY_LOW
+from kin.stellar.errors import *
+from kin.stellar.channel_manager import queue
+from kin.stellar.fake_horizon import FakeHorizonServer
+from kin.stellar.horizon import Horizon
+
+
+@pytest.fixture
+def channel_manager(fake_horizon, helpers):
+    base_key = helpers.funded_key(fake_horizon)
+    return ChannelManager(base_key, [base_key], 'TESTNET', fake_horizon)
+
+
+def test_sequence_fetched_once(channel_manager, fake_horizon, helpers):
+    for _ in range(5):
+        assert helpers.send(channel_manager)
+    assert fake_horizon.submit_calls == 5
+    assert fake_horizon.account_calls == 1  # fetched on first use only
+
+
+def test_sequence_resync_on_bad_sequence(channel_manager, fake_horizon, helpers):
+    assert helpers.send(channel_manager)
+
+    # someone else used our account
+    fake_horizon.bump_sequence(channel_manager.base_address)
+
+    assert helpers.send(channel_manager)
+    assert fake_horizon.account_calls == 2
+    assert helpers.send(channel_manager)
+    assert fake_horizon.account_calls == 2
+
+
+def test_sequence_consumed_by_failed_transaction(channel_manager, fake_horizon, helpers):
+    assert helpers.send(channel_manager)
+
+    fake_horizon.fail_next(TransactionResultCode.FAILED)
+    with pytest.raises(HorizonError):
+        helpers.send(channel_manager)
+
+    # the failed transaction used up a sequence number, but no resync should be needed
+    assert helpers.send(channel_manager)
+    assert fake_horizon.account_calls == 1
+
+
+def test_sequence_kept_on_rejected_transaction(channel_manager, fake_horizon, helpers):
+    assert helpers.send(channel_manager)
+
+    fake_horizon.fail_next(TransactionResultCode.INSUFFICIENT_FEE)
+    with pytest.raises(HorizonError):
+        helpers.send(channel_manager)
+
+    assert helpers.send(channel_manager)
+    assert fake_horizon.account_calls == 1
+
+
+def test_channel_sequence():
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        return '100'
+
+    sequence = ChannelSequence(fetch)
+    assert [sequence.reserve() for _ in range(3)] == [100, 101, 102]
+    assert len(fetches) == 1
+
+    # the last reservation is rejected, its sequence is reused
+    sequence.release(102, False)
+    assert sequence.reserve() == 102
+
+    # an earlier one is rejected, the later ones are doomed
+    assert sequence.wait_turn(100)
+    sequence.release(101, False)
+    assert not sequence.wait_turn(102)
+
+    # the resync waits for the transactions in flight
+    reserved = []
+    t = threading.Thread(target=lambda: reserved.append(sequence.reserve()))
+    t.start()
+    time.sleep(0.05)
+    assert not reserved
+    sequence.release(100, True)
+    sequence.release(102, None)
+    t.join()
+    assert reserved == [100]
+    assert len(fetches) == 2
+    assert sequence.resyncs == 1
+
+
+def test_pipelined_sends():
+    with FakeHorizonServer(ledger_close_time=0.5, sequence_wait=1) as server:
+        keypair = Keypair.random()
+        address = keypair.address().decode()
+        server.fund(address)
+        channel_manager = ChannelManager(keypair.seed(), [keypair.seed()], 'TESTNET',
+                                         Horizon(horizon_uri=server.url), max_in_flight=5)
+        assert channel_manager.channel_builders.qsize() == 5
+
+        replies = []
+        def pay():
+            replies.append(channel_manager.send_transaction(lambda builder: partial(builder.append_payment_op,
+                                                                                   address, 1)))
+
+        threads = [threading.Thread(target=pay) for _ in range(10)]
+        start = time.time()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        # one or two ledgers rather than ten
+        assert time.time() - start < 1.5
+        assert len(replies) == 10
+        assert server.request_counts['POST /transactions'] == 10
+        assert server.request_counts['GET /accounts/{id}'] == 1
+        assert channel_manager.channel_sequences[address].resyncs == 0
+
+
+def test_pipelined_rollback(fake_horizon, helpers):
+    base_key = helpers.funded_key(fake_horizon)
+    channel_manager = ChannelManager(base_key, [base_key], 'TESTNET', fake_horizon, max_in_flight=3)
+    assert helpers.send(channel_manager)
+
+    # a rejected transaction gives its sequence back
+    fake_horizon.fail_next(TransactionResultCode.INSUFFICIENT_FEE)
+    with pytest.raises(HorizonError):
+        helpers.send(channel_manager)
+    assert helpers.send(channel_manager)
+    assert fake_horizon.account_calls == 1
+
+    # someone else used our account
+    fake_horizon.bump_sequence(channel_manager.base_address)
+    assert helpers.send(channel_manager)
+    assert fake_horizon.account_calls == 2
+    assert channel_manager.channel_sequences[channel_manager.base_address].resyncs == 1
+
+
+def test_channel_health(fake_horizon, helpers):
+    base_key = helpers.funded_key(fake_horizon)
+    channel_key = helpers.funded_key(fake_horizon)
+    channel_manager = ChannelManager(base_key, [base_key, channel_key], 'TESTNET', fake_horizon, max_failures=2,
+                                     quarantine_time=0.2)
+    assert helpers.send(channel_manager)
+    health = channel_manager.health()
+    assert [h['success_rate'] for h in health].count(1) == 1
+    assert [h['latency'] is None for h in health] == [h['success_rate'] is None for h in health]
+
+    # the other channel is preferred after a failure, and the channel failing twice in a row is quarantined
+    fake_horizon.fail_next(TransactionResultCode.INSUFFICIENT_BALANCE, count=3)
+    for _ in range(3):
+        with pytest.raises(HorizonError):
+            helpers.send(channel_manager)
+    health = sorted(channel_manager.health(), key=lambda h: h['quarantined'])
+    assert [h['consecutive_failures'] for h in health] == [1, 2]
+    assert health[0]['quarantined'] == 0
+    assert 0 < health[1]['quarantined'] <= 0.2
+
+    # the last channel in use is not quarantined
+    fake_horizon.fail_next(TransactionResultCode.INSUFFICIENT_BALANCE, count=2)
+    for _ in range(2):
+        with pytest.raises(HorizonError):
+            helpers.send(channel_manager)
+    assert [h['quarantined'] == 0 for h in channel_manager.health()].count(True) == 1
+    assert channel_manager.channel_builders.qsize() == 1
+
+    # readmitted on probation, and preferred over the channel that kept failing
+    time.sleep(0.2)
+    assert helpers.send(channel_manager)
+    assert channel_manager.channel_builders.qsize() == 2
+    health = sorted(channel_manager.health(), key=lambda h: h['consecutive_failures'])
+    assert [h['consecutive_failures'] for h in health] == [0, 3]
+    assert all(h['quarantined'] == 0 for h in health)
+
+
+def test_priorities(fake_horizon, helpers):
+    base_key = helpers.funded_key(fake_horizon)
+    channel_key = helpers.funded_key(fake_horizon)
+    with pytest.raises(ValueError, match='reserved channels must leave a channel for all priorities'):
+        ChannelManager(base_key, [base_key], 'TESTNET', fake_horizon, reserved_channels=1)
+    channel_manager = ChannelManager(base_key, [base_key, channel_key], 'TESTNET', fake_horizon, reserved_channels=1,
+                                     starvation_time=0.5)
+    with pytest.raises(ValueError, match='invalid priority: 3'):
+        channel_manager.send_transaction(None, priority=3)
+    builders = channel_manager.channel_builders
+
+    # the reserved channel is only used by high priority sends
+    builder = builders.take(PRIORITY_LOW, 0, time.time())
+    assert builder.address not in channel_manager.reserved
+    with pytest.raises(queue.Empty):
+        builders.take(PRIORITY_NORMAL, 0.05, time.time())
+    reserved = builders.take(PRIORITY_HIGH, 0, time.time())
+    assert reserved.address in channel_manager.reserved
+
+    def take_later(priority, since, taken):
+        def take():
+            taken.append((priority, builders.take(priority, 5, since)))
+        waiting = sum(builders.waiting.values())
+        t = threading.Thread(target=take)
+        t.start()
+        while sum(builders.waiting.values()) == waiting:
+            time.sleep(0.01)
+        return t
+
+    # a channel returned goes to the waiting send of the highest priority
+    taken = []
+    threads = [take_later(priority, time.time(), taken) for priority in (PRIORITY_LOW, PRIORITY_NORMAL)]
+    builders.put(builder)
+    time.sleep(0.1)
+    assert [priority for priority, _ in taken] == [PRIORITY_NORMAL]
+    builders.put(taken[0][1])
+    for t in threads:
+        t.join()
+    assert [priority for priority, _ in taken] == [PRIORITY_NORMAL, PRIORITY_LOW]
+
+    # unless a lower priority send waited too long
+    taken = []
+    threads = [take_later(PRIORITY_LOW, time.time() - 1, taken), take_later(PRIORITY_NORMAL, time.time(), taken)]
+    builders.put(builder)
+    time.sleep(0.1)
+    assert [priority for priority, _ in taken] == [PRIORITY_LOW]
+    builders.put(taken[0][1])
+    for t in threads:
+        t.join()
+    assert [priority for priority, _ in taken] == [PRIORITY_LOW, PRIORITY_NORMAL]
+
+    builders.put(taken[1][1])
+    builders.put(reserved)
+    assert helpers.send(channel_manager)
+    stats = channel_manager.stats()
+    assert stats['reserved'] == 1
+    assert stats['priorities']['normal']['sends'] == 1
+    assert stats['priorities']['high']['sends'] == 0
@@ -0,0 +1,189 @@
+import pytest
+
+from stellar_base.asset import Asset
+from stellar_base.keypair import Keypair
+
+import kin
+from kin.stellar.channel_manager import ChannelManager, PRIORITY_HIGH
+from kin.stellar.channel_scaler import ChannelScaler, derive_channel_key
+from kin.stellar.errors import *
+from kin.stellar.horizon import Horizon
+
+
+@pytest.fixture
+def channel_manager(server):
+    keypair = Keypair.random()
+    server.fund(keypair.address().decode())
+    return ChannelManager(keypair.seed().decode(), [keypair.seed().decode()], 'TESTNET',
+                          Horizon(horizon_uri=server.url))
+
+
+def test_derive_channel_key():
+    base_key = Keypair.random().seed().decode()
+    assert derive_channel_key(base_key, 0) == derive_channel_key(base_key, 0)
+    assert derive_channel_key(base_key, 0) != derive_channel_key(base_key, 1)
+    assert derive_channel_key(base_key, 0) != derive_channel_key(Keypair.random().seed().decode(), 0)
+    assert Keypair.from_seed(derive_channel_key(base_key, 0))
+
+
+def test_create():
+    with pytest.raises(ValueError, match='max channels must be positive'):
+        ChannelScaler(max_channels=0)
+    with pytest.raises(ValueError, match='step must be between 1 and 100'):
+        ChannelScaler(step=101)
+    with pytest.raises(ValueError, match='scale up and scale down checks must be positive'):
+        ChannelScaler(scale_down_after=0)
+
+
+def test_add_remove_channel(channel_manager, server, helpers):
+    channel_key = derive_channel_key(channel_manager.base_key, 0)
+    channel_address = Keypair.from_seed(channel_key).address().decode()
+    server.fund(channel_address)
+
+    channel_manager.add_channel(channel_key)
+    assert channel_manager.num_channels == 2
+    assert channel_manager.channel_builders.qsize() == 2
+    for _ in range(4):
+        assert helpers.send(channel_manager)
+
+    channel_manager.remove_channel(channel_address)
+    assert channel_manager.num_channels == 1
+    assert channel_manager.channel_builders.qsize() == 1
+    assert channel_address not in channel_manager.channel_sequences
+    with pytest.raises(ValueError, match='channel not in use'):
+        channel_manager.remove_channel(channel_address)
+
+    stats = channel_manager.stats()
+    assert stats['sends'] == 4
+    assert stats['busy'] == 0
+    assert stats['in_use'] == 0
+    assert stats['peak_in_use'] == 1
+
+
+def test_scale_up_down(channel_manager, server, monkeypatch, helpers):
+    horizon = channel_manager.horizon
+    priorities = []
+    send_transaction = channel_manager.send_transaction
+
+    def spy(add_ops_fn, **kwargs):
+        priorities.append(kwargs.get('priority'))
+        return send_transaction(add_ops_fn, **kwargs)
+    monkeypatch.setattr(channel_manager, 'send_transaction', spy)
+
+    scaler = ChannelScaler(max_channels=4, step=2, interval=1000, scale_down_after=2)
+    scaler.start(channel_manager)
+    with pytest.raises(ValueError, match='channel scaler already started'):
+        scaler.start(channel_manager)
+
+    # the channels are created in one transaction
+    assert scaler.scale_up() == 2
+    assert server.request_counts['POST /transactions'] == 1
+    assert priorities == [PRIORITY_HIGH]  # ahead of the sends waiting for the channels
+    assert channel_manager.num_channels == 3
+    channel_addresses = [Keypair.from_seed(key).address().decode() for key in scaler.channel_keys]
+    for address in channel_addresses:
+        assert float(horizon.account(address)['balances'][0]['balance']) == 10
+    for _ in range(3):
+        assert helpers.send(channel_manager)
+
+    # up to the max channels
+    assert scaler.scale_up() == 1
+    assert scaler.scale_up() == 0
+    assert scaler.stats() == {'channels': 3, 'max_channels': 4, 'created': 3, 'merged': 0, 'errors': 0}
+
+    # channels left behind are used again
+    other_manager = ChannelManager(channel_manager.base_key, [channel_manager.base_key], 'TESTNET', horizon)
+    other_scaler = ChannelScaler(step=2, interval=1000)
+    other_scaler.start(other_manager)
+    assert other_scaler.scale_up() == 2
+    assert other_scaler.created == 0
+    other_scaler.close()
+
+    # the last channel is removed and merged back
+    balance = float(horizon.account(channel_manager.base_address)['balances'][0]['balance'])
+    assert scaler.scale_down()
+    assert channel_manager.num_channels == 3
+    with pytest.raises(HorizonError) as exc_info:
+        horizon.account(Keypair.from_seed(derive_channel_key(channel_manager.base_key, 2)).address().decode())
+    assert exc_info.value.type == HorizonErrorType.NOT_FOUND
+    assert float(horizon.account(channel_manager.base_address)['balances'][0]['balance']) > balance + 9
+    assert scaler.stats()['merged'] == 1
+    scaler.close()
+
+
+def test_scale_down_leased(server, tmpdir):
+    keypair = Keypair.random()
+    server.fund(keypair.address().decode())
+    horizon = Horizon(horizon_uri=server.url)
+    channel_manager = ChannelManager(keypair.seed().decode(), [keypair.seed().decode()], 'TESTNET', horizon,
+                                     leases=kin.ChannelLeases(str(tmpdir)))
+    scaler = ChannelScaler(step=1, interval=1000)
+    scaler.start(channel_manager)
+    assert scaler.scale_up() == 1
+    channel_address = Keypair.from_seed(scaler.channel_keys[0]).address().decode()
+
+    # a channel leased by another process is removed, but not merged
+    other = kin.ChannelLeases(str(tmpdir))
+    assert other.acquire(channel_address)[0]
+    assert scaler.scale_down()
+    assert channel_manager.num_channels == 1
+    assert horizon.account(channel_address)
+    assert scaler.stats()['merged'] == 0
+    other.release(channel_address, None)
+
+    # and merged once it is free
+    assert scaler.scale_up() == 1
+    assert scaler.stats()['created'] == 1
+    assert scaler.scale_down()
+    with pytest.raises(HorizonError) as exc_info:
+        horizon.account(channel_address)
+    assert exc_info.value.type == HorizonErrorType.NOT_FOUND
+    assert scaler.stats()['merged'] == 1
+    assert other.acquire(channel_address)[0]  # the lease is released after the merge
+    scaler.close()
+
+
+def test_check(channel_manager):
+    scaler = ChannelScaler(max_channels=10, step=2, interval=1000, scale_up_after=2, scale_down_after=2)
+    scaler.start(channel_manager)
+
+    # a send found no channel in time
+    channel_manager.busy += 1
+    scaler.check()
+    assert channel_manager.num_channels == 3
+
+    # waits above the threshold must last
+    channel_manager.sends += 1
+    channel_manager.wait_time += 1
+    scaler.check()
+    assert channel_manager.num_channels == 3
+    channel_manager.sends += 1
+    channel_manager.wait_time += 1
+    scaler.check()
+    assert channel_manager.num_channels == 5
+
+    # idle channels are removed one at a time
+    scaler.check()
+    assert channel_manager.num_channels == 5
+    scaler.check()
+    assert channel_manager.num_channels == 4
+    for _ in range(6):
+        scaler.check()
+    assert channel_manager.num_channels == 1
+    assert scaler.stats()['merged'] == 4
+    scaler.close()
+
+
+def test_sdk(server):
+    keypair = Keypair.random()
+    server.fund(keypair.address().decode())
+    scaler = ChannelScaler(interval=1000)
+    sdk = kin.SDK(secret_key=keypair.seed().decode(), horizon_endpoint_uri=server.url, network='TESTNET',
+                  kin_asset=Asset.native(), channel_scaler=scaler, batch_payments=True)
+    assert sdk.horizon.pool_size == 102
+    assert sdk.get_status()['channels']['scaler']['channels'] == 0
+
+    scaler.scale_up()
+    assert sdk.get_status()['channels']['all'] == 6
+    assert sdk.get_status()['channels']['scaler']['created'] == 5
+    scaler.close()
@@ -0,0 +1,179 @@
+import pytest
+
+from stellar_base.asset import Asset
+from stellar_base.keypair import Keypair
+
+import kin
+from kin.stellar.fake_horizon import FakeHorizonServer
+
+
+def test_file_checkpoint(tmpdir):
+    path = str(tmpdir.join('checkpoint'))
+    assert kin.FileCheckpoint(path).load() is None
+    kin.FileCheckpoint(path).save('123')
+    checkpoint = kin.FileCheckpoint(path)
+    assert checkpoint.load() == '123'
+    checkpoint.save('456')
+    assert kin.FileCheckpoint(path).load() == '456'
+    assert tmpdir.listdir() == [tmpdir.join('checkpoint')]
+
+
+def test_sqlite_checkpoint(tmpdir):
+    path = str(tmpdir.join('checkpoints.db'))
+    deposits = kin.SqliteCheckpoint(path, name='deposits')
+    withdrawals = kin.SqliteCheckpoint(path, name='withdrawals')
+    assert deposits.load() is None
+    deposits.save('123')
+    withdrawals.save('456')
+    deposits.save('789')
+    deposits.close()
+    withdrawals.close()
+    assert kin.SqliteCheckpoint(path, name='deposits').load() == '789'
+    assert kin.SqliteCheckpoint(path, name='withdrawals').load() == '456'
+
+
+@pytest.mark.parametrize('store, max_account_streams', [('file', 5), ('sqlite', 0)])
+def test_resume(tmpdir, store, max_account_streams, helpers):
+    def checkpoint():
+        if store == 'file':
+            return kin.FileCheckpoint(str(tmpdir.join('checkpoint')))
+        return kin.SqliteCheckpoint(str(tmpdir.join('checkpoints.db')))
+
+    with FakeHorizonServer() as server:
+        keypair = Keypair.random()
+        server.fund(keypair.address().decode())
+        sdk = kin.SDK(secret_key=keypair.seed().decode(), horizon_endpoint_uri=server.url, network='TESTNET',
+                      kin_asset=Asset.native())
+        address = Keypair.random().address().decode()
+        server.fund(address)
+        received = []
+
+        def callback(address, tx_data):
+            received.append(tx_data.memo)
+
+        def monitor(checkpoint_events):
+            return kin.TransactionMonitor(sdk.horizon, callback, [address], only_payments=True,
+                                          max_account_streams=max_account_streams, checkpoint=checkpoint(),
+                                          checkpoint_events=checkpoint_events, checkpoint_interval=60)
+
+        # saved every second transaction, and on stop
+        first = monitor(checkpoint_events=2)
+        for memo in 'abc':
+            sdk.send_native(address, 1, memo_text=memo)
+        assert helpers.wait_for(lambda: received == ['a', 'b', 'c'])
+        saved = first.stats()['checkpoints']
+        assert saved >= 1
+        first.stop()
+        assert first.stats()['checkpoints'] <= saved + 1
+        assert checkpoint().load() == first.stats()['cursor']
+
+        # the transactions sent while stopped are fetched page by page
+        sdk.send_native(address, 1, memo_text='d')
+        sdk.send_native(address, 1, memo_text='e')
+        second = monitor(checkpoint_events=100)
+        assert helpers.wait_for(lambda: received[3:] == ['d', 'e'])
+        sdk.send_native(address, 1, memo_text='f')
+        assert helpers.wait_for(lambda: received[3:] == ['d', 'e', 'f'])
+        assert second.stats()['caught_up'] >= 2
+        second.stop()
+        assert checkpoint().load() == second.stats()['cursor']
+
+
+def test_resume_behind(tmpdir, helpers):
+    with FakeHorizonServer() as server:
+        keypair = Keypair.random()
+        server.fund(keypair.address().decode())
+        sdk = kin.SDK(secret_key=keypair.seed().decode(), horizon_endpoint_uri=server.url, network='TESTNET',
+                      kin_asset=Asset.native())
+        slow, fast = [Keypair.random().address().decode() for _ in range(2)]
+        for address in (slow, fast):
+            server.fund(address)
+        checkpoint = kin.FileCheckpoint(str(tmpdir.join('checkpoint')))
+        received = []
+
+        def monitor():
+            return kin.TransactionMonitor(sdk.horizon, lambda address, tx_data: received.append(tx_data.memo),
+                                          [slow, fast], only_payments=True, checkpoint=checkpoint,
+                                          checkpoint_events=1)
+
+        first = monitor()
+        sdk.send_native(slow, 1, memo_text='a')
+        assert helpers.wait_for(lambda: received == ['a'])
+
+        # the stream of the slow account falls behind the other one
+        server.fail_next(500, count=1000, method='GET', path='/accounts/' + slow)
+        first._streams[slow].events.close()
+        sdk.send_native(slow, 1, memo_text='b')
+        sdk.send_native(fast, 1, memo_text='c')
+        assert helpers.wait_for(lambda: received == ['a', 'c'])
+        first.stop()
+        server.clear_faults()
+
+        # the position saved is that of the slow stream, and 'b' is delivered on resume
+        second = monitor()
+        assert helpers.wait_for(lambda: sorted(received[2:]) == ['b', 'c'])
+        second.stop()
+
+
+def test_save_without_streams(tmpdir, helpers):
+    with FakeHorizonServer() as server:
+        keypair = Keypair.random()
+        server.fund(keypair.address().decode())
+        sdk = kin.SDK(secret_key=keypair.seed().decode(), horizon_endpoint_uri=server.url, network='TESTNET',
+                      kin_asset=Asset.native())
+        address = Keypair.random().address().decode()
+        server.fund(address)
+        checkpoint = kin.FileCheckpoint(str(tmpdir.join('checkpoint')))
+        received = []
+        monitor = kin.TransactionMonitor(sdk.horizon, lambda address, tx_data: received.append(tx_data.memo),
+                                         [address], only_payments=True, checkpoint=checkpoint, checkpoint_events=100,
+                                         checkpoint_interval=60)
+        sdk.send_native(address, 1, memo_text='a')
+        assert helpers.wait_for(lambda: received == ['a'])
+        cursor = monitor.stats()['cursor']
+
+        # the position saved with no streams open is the last one, not the initial one
+        monitor.remove_addresses([address])
+        monitor.stop()
+        assert checkpoint.load() == cursor
+
+        # and nothing is delivered again on resume
+        resumed = kin.TransactionMonitor(sdk.horizon, lambda address, tx_data: received.append(tx_data.memo),
+                                         [address], only_payments=True, checkpoint=checkpoint)
+        sdk.send_native(address, 1, memo_text='b')
+        assert helpers.wait_for(lambda: received[-1:] == ['b'])
+        assert received == ['a', 'b']
+        resumed.stop()
+
+
+def test_quiet_account(tmpdir, helpers):
+    with FakeHorizonServer() as server:
+        keypair = Keypair.random()
+        server.fund(keypair.address().decode())
+        sdk = kin.SDK(secret_key=keypair.seed().decode(), horizon_endpoint_uri=server.url, network='TESTNET',
+                      kin_asset=Asset.native())
+        quiet, busy = [Keypair.random().address().decode() for _ in range(2)]
+        for address in (quiet, busy):
+            server.fund(address)
+        checkpoint = kin.FileCheckpoint(str(tmpdir.join('checkpoint')))
+        received = []
+        monitor = kin.TransactionMonitor(sdk.horizon, lambda address, tx_data: received.append(tx_data.memo),
+                                         [quiet, busy], only_payments=True, checkpoint=checkpoint,
+                                         checkpoint_events=1, checkpoint_interval=60)
+        assert monitor.stats()['streams'] == 2
+
+        # the stream of the account getting no transactions does not hold the saved position back
+        tx_hashes = [sdk.send_native(busy, 1, memo_text=memo) for memo in 'abcde']
+        assert helpers.wait_for(lambda: received == list('abcde'))
+        paging_token = sdk.horizon.transaction(tx_hashes[-1])['paging_token']
+        assert helpers.wait_for(lambda: checkpoint.load() == paging_token)
+        monitor.stop()
+        assert checkpoint.load() == paging_token
+
+        # a transaction of the quiet account is still delivered on resume
+        sdk.send_native(quiet, 1, memo_text='f')
+        resumed = kin.TransactionMonitor(sdk.horizon, lambda address, tx_data: received.append(tx_data.memo),
+                                         [quiet, busy], only_payments=True, checkpoint=checkpoint)
+        assert helpers.wait_for(lambda: received[5:] == ['f'])
+        resumed.stop()
+        assert received == list('abcdef')
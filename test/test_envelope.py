@@ -0,0 +1,134 @@
+import pytest
+
+from stellar_base.keypair import Keypair
+
+from kin.stellar.builder import Builder
+from kin.stellar.envelope import decode_operations
+from kin.stellar.fake_horizon import FakeHorizonServer
+from kin.stellar.horizon import Horizon
+from kin.stellar.horizon_models import TransactionData
+
+
+# transaction records, and the records of their operations without the links, as Horizon returns them. The payment
+# is that of the testnet transaction in kin.stellar.errors, the paging tokens and times are made up
+PAYMENT_TX = {
+    'id': '792814c8cdf5c822008e0254d4536a5b29b0989fa87cc4498857233657712b3f',
+    'paging_token': '575482325475328',
+    'hash': '792814c8cdf5c822008e0254d4536a5b29b0989fa87cc4498857233657712b3f',
+    'created_at': '2018-06-04T12:10:45Z',
+    'envelope_xdr': 'AAAAAJgXswhWU+pdHmHIurQuHk4ziNlKFxEJltbMOpF6EqETAAAAZAAAed0AAAAQAAAAAAAAAAAAAAABAAAAAAAAAAEAAAAAxb'
+                    'IcFBPzPZbzjWdkSB5FCSIva+WdQ2Oi70GUmFvFmOcAAAABVEVTVAAAAAD284i665ald1Kiq064FGlL+Aeych/b9UQngBHR37'
+                    'ZeiwAAAAAF9eEAAAAAAAAAAAF6EqETAAAAQN5x3xaOaeDS5EF3tE0X9zXymhqkOg95Tyfgu//TCbv9XN49CHoH5K+BUH04o1'
+                    'ZAZdHbnBABxh44bu7zbFLgQQU=',
+}
+PAYMENT_OPS = [{
+    'id': '575482325475329',
+    'paging_token': '575482325475329',
+    'source_account': 'GCMBPMYIKZJ6UXI6MHELVNBODZHDHCGZJILRCCMW23GDVEL2CKQRGZH4',
+    'type': 'payment',
+    'type_i': 1,
+    'created_at': '2018-06-04T12:10:45Z',
+    'transaction_hash': '792814c8cdf5c822008e0254d4536a5b29b0989fa87cc4498857233657712b3f',
+    'asset_type': 'credit_alphanum4',
+    'asset_code': 'TEST',
+    'asset_issuer': 'GD3PHCF25OLKK52SUKVU5OAUNFF7QB5SOIP5X5KEE6ABDUO7WZPIXE2F',
+    'from': 'GCMBPMYIKZJ6UXI6MHELVNBODZHDHCGZJILRCCMW23GDVEL2CKQRGZH4',
+    'to': 'GDC3EHAUCPZT3FXTRVTWISA6IUESEL3L4WOUGY5C55AZJGC3YWMOOZ3X',
+    'amount': '10.0000000',
+}]
+
+ACCOUNT_TX = {
+    'id': 'd44e0cb0cdf5fefcc8ff91bede19d76e5c247936f2cf1016ed3a52bbac6b0179',
+    'paging_token': '12884905984',
+    'hash': 'd44e0cb0cdf5fefcc8ff91bede19d76e5c247936f2cf1016ed3a52bbac6b0179',
+    'created_at': '2018-06-04T12:11:00Z',
+    'envelope_xdr': 'AAAAAFFmhQkeLTOZh9WS8ijMJ4pK4OlQVPSyMBtL8r9J7/dTAAABLAAAed0AAAAQAAAAAAAAAAEAAAADb3BzAAAAAAMAAAAAAA'
+                    'AAAAAAAAADXZe1SAhEh5z1nP4Qfs5nzjpG2mvWSxxdWv8Ob4QyHQAAAAAHc1lAAAAAAQAAAAADXZe1SAhEh5z1nP4Qfs5nzj'
+                    'pG2mvWSxxdWv8Ob4QyHQAAAAEAAAAA5HuG+YBqnpcWJVnXkbSjA90e7EYlu33h35HtV2rBHl0AAAAAAAAAAAAAAAEAAAABAA'
+                    'AAAOR7hvmAap6XFiVZ15G0owPdHuxGJbt94d+R7VdqwR5dAAAACAAAAABRZoUJHi0zmYfVkvIozCeKSuDpUFT0sjAbS/K/Se'
+                    '/3UwAAAAAAAAABSe/3UwAAAEARoMey0OnnF4uIhLDY5gNMyJY6PfLL1AQLCmHh15x3KRxoFhpLkRmDzKI9qXegSon5oNBbs0'
+                    'OnJGXsvpW3lzsC',
+}
+ACCOUNT_OPS = [{
+    'id': '12884905985',
+    'paging_token': '12884905985',
+    'source_account': 'GBIWNBIJDYWTHGMH2WJPEKGME6FEVYHJKBKPJMRQDNF7FP2J573VG5NV',
+    'type': 'create_account',
+    'type_i': 0,
+    'created_at': '2018-06-04T12:11:00Z',
+    'transaction_hash': 'd44e0cb0cdf5fefcc8ff91bede19d76e5c247936f2cf1016ed3a52bbac6b0179',
+    'starting_balance': '12.5000000',
+    'funder': 'GBIWNBIJDYWTHGMH2WJPEKGME6FEVYHJKBKPJMRQDNF7FP2J573VG5NV',
+    'account': 'GABV3F5VJAEEJB446WOP4ED6ZZT44OSG3JV5MSY4LVNP6DTPQQZB3V5C',
+}, {
+    'id': '12884905986',
+    'paging_token': '12884905986',
+    'source_account': 'GABV3F5VJAEEJB446WOP4ED6ZZT44OSG3JV5MSY4LVNP6DTPQQZB3V5C',
+    'type': 'payment',
+    'type_i': 1,
+    'created_at': '2018-06-04T12:11:00Z',
+    'transaction_hash': 'd44e0cb0cdf5fefcc8ff91bede19d76e5c247936f2cf1016ed3a52bbac6b0179',
+    'asset_type': 'native',
+    'from': 'GABV3F5VJAEEJB446WOP4ED6ZZT44OSG3JV5MSY4LVNP6DTPQQZB3V5C',
+    'to': 'GDSHXBXZQBVJ5FYWEVM5PENUUMB52HXMIYS3W7PB36I62V3KYEPF3PDD',
+    'amount': '0.0000001',
+}, {
+    'id': '12884905987',
+    'paging_token': '12884905987',
+    'source_account': 'GDSHXBXZQBVJ5FYWEVM5PENUUMB52HXMIYS3W7PB36I62V3KYEPF3PDD',
+    'type': 'account_merge',
+    'type_i': 8,
+    'created_at': '2018-06-04T12:11:00Z',
+    'transaction_hash': 'd44e0cb0cdf5fefcc8ff91bede19d76e5c247936f2cf1016ed3a52bbac6b0179',
+    'account': 'GDSHXBXZQBVJ5FYWEVM5PENUUMB52HXMIYS3W7PB36I62V3KYEPF3PDD',
+    'into': 'GBIWNBIJDYWTHGMH2WJPEKGME6FEVYHJKBKPJMRQDNF7FP2J573VG5NV',
+}]
+
+
+@pytest.mark.parametrize('tx, operations', [(PAYMENT_TX, PAYMENT_OPS), (ACCOUNT_TX, ACCOUNT_OPS)])
+def test_decode_horizon_records(tx, operations):
+    # the ids of the operations follow the paging token of the transaction, and the operation sources default to
+    # the transaction source
+    assert decode_operations(tx) == operations
+
+
+def test_decode_fake_horizon_records():
+    with FakeHorizonServer() as server:
+        horizon = Horizon(horizon_uri=server.url)
+        issuer = Keypair.random()
+        server.fund(issuer.address().decode())
+        account = Keypair.random()
+        address = account.address().decode()
+        merged = Keypair.random()
+
+        def send(keypair, *ops):
+            builder = Builder(secret=keypair.seed().decode(), horizon=horizon, network='TESTNET')
+            for op in ops:
+                op(builder)
+            builder.add_text_memo('ops')
+            builder.sign()
+            return horizon.submit(builder.gen_xdr())['hash']
+
+        tx_hashes = [
+            send(issuer, lambda b: b.append_create_account_op(address, 10)),
+            send(account, lambda b: b.append_trust_op(issuer.address().decode(), 'TEST', limit=1000)),
+            send(issuer, lambda b: b.append_payment_op(address, 1.5, asset_type='TEST',
+                                                       asset_issuer=issuer.address().decode()),
+                 lambda b: b.append_payment_op(address, 0.0000001)),
+            send(issuer, lambda b: b.append_create_account_op(merged.address().decode(), 10)),
+            send(merged, lambda b: b.append_account_merge_op(issuer.address().decode())),
+        ]
+
+        for tx_hash in tx_hashes:
+            tx = horizon.transaction(tx_hash)
+            operations = list(horizon.iterate('/transactions/' + tx_hash + '/operations/', prefetch=False))
+            decoded = decode_operations(tx)
+            # the same as the records of the operations endpoint, but for the links
+            assert decoded == [dict((k, v) for k, v in op.items() if k != '_links') for op in operations]
+            tx['operations'] = decoded
+            assert TransactionData(tx, strict=False).operations[0].transaction_hash == tx_hash
+
+        with pytest.raises(ValueError, match='cannot decode transaction'):
+            decode_operations({'hash': tx_hashes[0], 'paging_token': '1', 'envelope_xdr': 'bad'})
+        with pytest.raises(ValueError, match='cannot decode transaction'):
+            decode_operations({'hash': tx_hashes[0]})
@@ -1,7 +1,7 @@
 from requests.exceptions import RequestException
 
 import kin
-from kin.errors import translate_error, translate_horizon_error
+from kin.errors import translate_error, translate_horizon_error, translate_operation_error
 from kin.stellar.errors import *
 
 
@@ -18,6 +18,9 @@ def test_translate_error():
     assert isinstance(e, kin.NetworkError)
     assert e.extra['internal_error'] == 'error'
 
+    e = translate_error(ChannelsBusyError())
+    assert isinstance(e, kin.ThrottleError)
+
     e = translate_error(Exception('error'))
     assert isinstance(e, kin.InternalError)
     assert e.extra['internal_error'] == 'error'
@@ -134,3 +137,10 @@ def test_translate_operation_error():
         assert e.message == fixture[2]
         assert e.extra == fixture[3]
 
+
+
+def test_translate_operation_error_multiple_operations():
+    e = translate_operation_error([PaymentResultCode.SUCCESS, PaymentResultCode.NO_DESTINATION,
+                                   PaymentResultCode.UNDERFUNDED])
+    assert isinstance(e, kin.AccountNotFoundError)
+    assert e.error_code == PaymentResultCode.NO_DESTINATION
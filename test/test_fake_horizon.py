@@ -0,0 +1,243 @@
+import json
+import pytest
+import requests
+import threading
+
+from stellar_base.keypair import Keypair
+
+from kin.stellar.builder import Builder
+from kin.stellar.errors import *
+from kin.stellar.fake_horizon import FakeHorizonServer
+from kin.stellar.horizon import Horizon
+
+
+@pytest.fixture
+def horizon(server):
+    return Horizon(horizon_uri=server.url, backoff_factor=0)
+
+
+def new_account(server):
+    keypair = Keypair.random()
+    server.fund(keypair.address().decode())
+    return keypair
+
+
+def build(horizon, keypair, destination, amount, sequence=None):
+    builder = Builder(secret=keypair.seed(), horizon=horizon, network='TESTNET', manage_sequence=sequence is not None)
+    builder.sequence = sequence
+    builder.append_payment_op(destination, amount)
+    builder.sign()
+    return builder.gen_xdr()
+
+
+def tx_result_codes(exc_info):
+    result_codes = exc_info.value.extras.result_codes
+    return result_codes.transaction, result_codes.operations
+
+
+def test_accounts(server, horizon):
+    with pytest.raises(HorizonError) as exc_info:
+        horizon.account(Keypair.random().address().decode())
+    assert exc_info.value.type == HorizonErrorType.NOT_FOUND
+
+    keypair = new_account(server)
+    reply = horizon.account(keypair.address().decode())
+    assert reply['balances'] == [{'asset_type': 'native', 'balance': '10000.0000000'}]
+    assert int(reply['sequence']) == reply_ledger(horizon) << 32
+
+
+def reply_ledger(horizon):
+    return horizon.ledgers(params={'order': 'desc', 'limit': 1})['_embedded']['records'][0]['sequence']
+
+
+def test_submit(server, horizon):
+    source = new_account(server)
+    destination = new_account(server).address().decode()
+
+    reply = horizon.submit(build(horizon, source, destination, 10.5))
+    tx = horizon.transaction(reply['hash'])
+    assert tx['ledger'] == reply['ledger']
+    assert tx['operation_count'] == 1
+    assert horizon.account(destination)['balances'][-1]['balance'] == '10010.5000000'
+
+    ops = horizon.transaction_operations(reply['hash'])['_embedded']['records']
+    assert ops[0]['type'] == 'payment'
+    assert ops[0]['amount'] == '10.5000000'
+    assert ops[0]['to'] == destination
+
+    # resubmitting returns the original result
+    assert horizon.submit(tx['envelope_xdr'])['hash'] == reply['hash']
+
+
+def test_submit_failures(server, horizon):
+    source = new_account(server)
+    sequence = horizon.account(source.address().decode())['sequence']
+    destination = new_account(server).address().decode()
+
+    with pytest.raises(HorizonError) as exc_info:
+        horizon.submit(build(horizon, source, destination, 1, sequence=str(int(sequence) + 1)))
+    assert tx_result_codes(exc_info) == (TransactionResultCode.BAD_SEQUENCE, [])
+
+    with pytest.raises(HorizonError) as exc_info:
+        horizon.submit(build(horizon, source, destination, 100000))
+    assert tx_result_codes(exc_info) == (TransactionResultCode.FAILED, [PaymentResultCode.UNDERFUNDED])
+
+    with pytest.raises(HorizonError) as exc_info:
+        horizon.submit(build(horizon, source, Keypair.random().address().decode(), 1))
+    assert tx_result_codes(exc_info) == (TransactionResultCode.FAILED, [PaymentResultCode.NO_DESTINATION])
+
+    # failed transactions still consume the sequence and the fee
+    reply = horizon.account(source.address().decode())
+    assert int(reply['sequence']) == int(sequence) + 2
+    assert reply['balances'][-1]['balance'] == '9999.9999800'
+
+    # signed by somebody else
+    builder = Builder(address=source.address().decode(), horizon=horizon, network='TESTNET')
+    builder.sequence = reply['sequence']
+    builder.append_payment_op(destination, 1)
+    builder.sign(secret=Keypair.random().seed())
+    with pytest.raises(HorizonError) as exc_info:
+        horizon.submit(builder.gen_xdr())
+    assert tx_result_codes(exc_info) == (TransactionResultCode.BAD_AUTH, [])
+
+
+def test_submit_faults(server, horizon):
+    source = new_account(server)
+    destination = new_account(server).address().decode()
+
+    def submit(te):
+        return requests.post(server.url + '/transactions', data={'tx': te})
+
+    te = build(horizon, source, destination, 1)
+    server.fail_next(504, count=2, method='POST')
+    assert submit(te).status_code == 504
+    assert submit(te).status_code == 504
+    assert submit(te).status_code == 200
+    assert server.request_counts['POST /transactions'] == 3
+
+    # a timeout of a transaction that still got into the ledger, resubmitting returns its result
+    te = build(horizon, source, destination, 1)
+    server.fail_next(504, method='POST', apply=True)
+    reply = submit(te)
+    assert reply.json()['type'] == HORIZON_NS_PREFIX + HorizonErrorType.TIMEOUT
+    tx_hash = submit(te).json()['hash']
+    assert horizon.transaction(tx_hash)
+
+    # only matching requests fail
+    server.fail_next(503, path='/ledgers')
+    assert requests.get(server.url + '/transactions').status_code == 200
+    assert requests.get(server.url + '/ledgers').status_code == 503
+
+
+def test_in_process(fake_horizon):
+    source = Keypair.random()
+    fake_horizon.fund(source.address().decode())
+    destination = Keypair.random().address().decode()
+
+    # the Horizon errors of the network are raised as they are
+    with pytest.raises(HorizonError) as exc_info:
+        fake_horizon.account(destination)
+    assert exc_info.value.type == HorizonErrorType.NOT_FOUND
+    with pytest.raises(HorizonError) as exc_info:
+        fake_horizon.submit(build(fake_horizon, source, destination, 1))
+    assert tx_result_codes(exc_info) == (TransactionResultCode.FAILED, [PaymentResultCode.NO_DESTINATION])
+
+    # an injected failure uses up the sequence only if the transaction failed
+    fake_horizon.fund(destination)
+    fake_horizon.fail_next(TransactionResultCode.INSUFFICIENT_FEE)
+    fake_horizon.fail_next(TransactionResultCode.FAILED)
+    te = build(fake_horizon, source, destination, 1)
+    for tx_result_code in (TransactionResultCode.INSUFFICIENT_FEE, TransactionResultCode.FAILED):
+        with pytest.raises(HorizonError) as exc_info:
+            fake_horizon.submit(te)
+        assert tx_result_codes(exc_info)[0] == tx_result_code
+    with pytest.raises(HorizonError) as exc_info:
+        fake_horizon.submit(te)
+    assert tx_result_codes(exc_info)[0] == TransactionResultCode.BAD_SEQUENCE
+
+    fake_horizon.bump_sequence(source.address().decode())
+    reply = fake_horizon.submit(build(fake_horizon, source, destination, 1))
+    assert fake_horizon.transaction(reply['hash'])['ledger'] == reply['ledger']
+    assert [tx.hash for tx in fake_horizon.submitted] == [reply['hash']]
+    assert (fake_horizon.account_calls, fake_horizon.submit_calls) == (4, 5)
+
+
+def test_rate_limit():
+    with FakeHorizonServer(rate_limit=2) as server:
+        reply = requests.get(server.url + '/ledgers')
+        assert reply.headers['X-Ratelimit-Limit'] == '2'
+        assert reply.headers['X-Ratelimit-Remaining'] == '1'
+        assert requests.get(server.url + '/ledgers').status_code == 200
+
+        reply = requests.get(server.url + '/ledgers')
+        assert reply.status_code == 429
+        assert reply.json()['type'] == HORIZON_NS_PREFIX + HorizonErrorType.RATE_LIMIT_EXCEEDED
+        assert int(reply.headers['Retry-After']) > 3500
+
+
+def test_paging(server, horizon):
+    keypair = new_account(server)
+    address = keypair.address().decode()
+    for _ in range(5):
+        horizon.submit(build(horizon, keypair, address, 1))
+
+    reply = horizon.account_transactions(address, params={'limit': 4})
+    records = reply['_embedded']['records']
+    assert len(records) == 4
+    assert records[0]['operation_count'] == 1  # the friendbot transaction
+
+    reply = requests.get(reply['_links']['next']['href']).json()
+    assert [r['paging_token'] for r in reply['_embedded']['records']] == \
+        [r['paging_token'] for r in horizon.account_transactions(address, params={'order': 'desc', 'limit': 2})
+         ['_embedded']['records']][::-1]
+
+    with pytest.raises(HorizonError) as exc_info:
+        horizon.transactions(params={'cursor': 'bad'})
+    assert exc_info.value.type == HorizonErrorType.BAD_REQUEST
+
+
+def test_ledger_close_time():
+    with FakeHorizonServer(ledger_close_time=0.2) as server:
+        horizon = Horizon(horizon_uri=server.url)
+        keypairs = [Keypair.random() for _ in range(5)]
+        threads = [threading.Thread(target=server.fund, args=(keypair.address().decode(),))
+                   for keypair in keypairs]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        # all the transactions were submitted during one ledger
+        ledgers = set(horizon.account_transactions(keypair.address().decode())['_embedded']['records'][0]['ledger']
+                      for keypair in keypairs)
+        assert len(ledgers) == 1
+        assert horizon.ledger(ledgers.pop())['transaction_count'] == 5
+
+
+@pytest.mark.parametrize('account_stream', [False, True])
+def test_sse(server, horizon, account_stream):
+    keypair = new_account(server)
+    address = keypair.address().decode()
+    horizon.submit(build(horizon, keypair, address, 1))
+    cursor = horizon.account_transactions(address)['_embedded']['records'][0]['paging_token']
+
+    if account_stream:
+        events = horizon.account_transactions(address, sse=True, params={'cursor': cursor})
+    else:
+        events = horizon.transactions(sse=True, params={'cursor': cursor})
+
+    def submit():
+        horizon.submit(build(horizon, keypair, address, 2))
+        server.fund(Keypair.random().address().decode())
+    threading.Thread(target=submit).start()
+
+    messages = []
+    for event in events:
+        if event.event == 'message':
+            messages.append(json.loads(event.data))
+        if len(messages) == (2 if account_stream else 3):
+            break
+    assert [tx['source_account'] for tx in messages[:2]] == [address, address]
+    assert int(messages[0]['paging_token']) > int(cursor)
+    if not account_stream:
+        assert messages[2]['source_account'] == server.network.root_address
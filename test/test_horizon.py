@@ -1,4 +1,5 @@
 import pytest
+import time
 from requests.adapters import DEFAULT_POOLSIZE
 
 from stellar_base.horizon import HORIZON_TEST, HORIZON_LIVE
@@ -6,6 +7,7 @@ from kin.stellar.errors import *
 from kin.stellar.horizon import (
     Horizon,
     check_horizon_reply,
+    is_ambiguous_submit,
     DEFAULT_REQUEST_TIMEOUT,
     DEFAULT_NUM_RETRIES,
     DEFAULT_BACKOFF_FACTOR,
@@ -57,6 +59,7 @@ def test_create_default():
     assert adapter.max_retries.total == DEFAULT_NUM_RETRIES
     assert adapter.max_retries.backoff_factor == DEFAULT_BACKOFF_FACTOR
     assert adapter.max_retries.redirect == 0
+    assert adapter.max_retries.status_forcelist == [413, 429, 503, 504]
     assert adapter._pool_connections == DEFAULT_POOLSIZE
     assert adapter._pool_maxsize == DEFAULT_POOLSIZE
 
@@ -346,3 +349,170 @@ def test_horizon_error_hashable(test_sdk):
                     type=HORIZON_NS_PREFIX + HorizonErrorType.BAD_REQUEST)
     e = HorizonError(err_dict)
     {e: 1}  # shouldn't fail on unhashable type
+
+
+@pytest.fixture
+def payments_server():
+    """A fake Horizon with an account having 8 transactions: the friendbot one and 7 payments to itself."""
+    from stellar_base.keypair import Keypair
+    from kin.stellar.builder import Builder
+    from kin.stellar.fake_horizon import FakeHorizonServer
+
+    server = FakeHorizonServer().start()
+    keypair = Keypair.random()
+    server.address = keypair.address().decode()
+    server.fund(server.address)
+    builder = Builder(secret=keypair.seed(), horizon=Horizon(server.url), network='TESTNET')
+    for _ in range(7):
+        builder.append_payment_op(server.address, 1)
+        builder.sign()
+        server.network.submit(builder.gen_xdr())
+        builder.clear()
+    yield server
+    server.stop()
+
+
+@pytest.mark.parametrize('prefetch', [False, True])
+def test_iterate(payments_server, prefetch):
+    horizon = Horizon(payments_server.url)
+    rel_url = '/accounts/' + payments_server.address + '/transactions/'
+    all_records = horizon.query(rel_url, params={'limit': 200})['_embedded']['records']
+    assert len(all_records) == 8
+
+    records = horizon.iterate(rel_url, params={'limit': 3}, prefetch=prefetch)
+    assert next(records) == all_records[0]
+    if prefetch:
+        time.sleep(0.1)  # the second page is fetched in the background meanwhile
+        assert payments_server.request_counts['GET /accounts/{id}/transactions'] == 3
+    assert list(records) == all_records[1:]
+    # the short last page ends the iteration without another request
+    assert payments_server.request_counts['GET /accounts/{id}/transactions'] == 4
+
+    records = list(horizon.iterate(rel_url, params={'limit': 4, 'order': 'desc'}, prefetch=prefetch))
+    assert records == all_records[::-1]
+
+    records = list(horizon.iterate(rel_url, params={'cursor': all_records[5]['paging_token']}, prefetch=prefetch))
+    assert records == all_records[6:]
+
+    with pytest.raises(HorizonError):
+        list(horizon.iterate(rel_url, params={'limit': 4, 'cursor': 'bad'}, prefetch=prefetch))
+
+
+def test_coalesce_queries():
+    from stellar_base.keypair import Keypair
+    from kin.stellar.fake_horizon import FakeHorizonServer
+    import threading
+
+    with FakeHorizonServer(latency=0.2) as server:
+        address = Keypair.random().address().decode()
+        server.fund(address)
+        missing = Keypair.random().address().decode()
+        horizon = Horizon(horizon_uri=server.url)
+
+        replies = []
+        errors = []
+
+        def query(address):
+            try:
+                replies.append(horizon.account(address))
+            except HorizonError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=query, args=(a,)) for a in [address] * 10 + [missing] * 5]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(replies) == 10
+        assert all(reply == replies[0] for reply in replies)
+        assert len(errors) == 5
+        assert server.request_counts['GET /accounts/{id}'] == 2
+        assert horizon.single_flight.stats() == {'calls': 2, 'coalesced': 13, 'in_flight': 0}
+
+        horizon = Horizon(horizon_uri=server.url, coalesce_queries=False)
+        assert horizon.single_flight is None
+        threads = [threading.Thread(target=query, args=(address,)) for _ in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert server.request_counts['GET /accounts/{id}'] == 5
+
+
+def test_is_ambiguous_submit():
+    assert is_ambiguous_submit(504)
+    assert not is_ambiguous_submit(503)
+    assert not is_ambiguous_submit(400, maybe_sent=True)
+    assert is_ambiguous_submit(None, maybe_sent=True)
+    assert not is_ambiguous_submit(None)
+
+
+def test_settle_submit():
+    from stellar_base.keypair import Keypair
+    from kin.stellar.builder import Builder
+    from kin.stellar.fake_horizon import FakeHorizonServer
+
+    with FakeHorizonServer() as server:
+        keypair = Keypair.random()
+        address = keypair.address().decode()
+        server.fund(address)
+        horizon = Horizon(horizon_uri=server.url, backoff_factor=0, settle_timeout=0.2)
+        builder = Builder(secret=keypair.seed(), horizon=horizon, network='TESTNET', manage_sequence=True)
+
+        def submit():
+            builder.append_payment_op(address, 1)
+            builder.sign()
+            reply = builder.submit()
+            assert reply['hash'] == builder.hash()
+            builder.next()
+            return reply
+
+        submit()
+        assert server.request_counts['GET /transactions/{id}'] == 0
+
+        # the transaction got into the ledger despite the timeout, it is found instead of resubmitted
+        server.fail_next(504, method='POST', apply=True)
+        assert submit()['ledger']
+        assert server.request_counts['POST /transactions'] == 2
+        assert server.request_counts['GET /transactions/{id}'] == 1
+
+        # it did not, it is resubmitted once the settle timeout passes
+        server.fail_next(504, method='POST')
+        submit()
+        assert server.request_counts['POST /transactions'] == 4
+        assert server.request_counts['GET /transactions/{id}'] >= 2
+
+        # not ambiguous, resubmitted without a lookup
+        count = server.request_counts['GET /transactions/{id}']
+        server.fail_next(503, method='POST')
+        submit()
+        assert server.request_counts['GET /transactions/{id}'] == count
+
+
+def test_settle_failed():
+    from stellar_base.keypair import Keypair
+    from kin.stellar.builder import Builder
+    from kin.stellar.fake_horizon import FakeHorizonServer
+
+    with FakeHorizonServer() as server:
+        keypair = Keypair.random()
+        address = keypair.address().decode()
+        server.fund(address)
+        horizon = Horizon(horizon_uri=server.url, backoff_factor=0, settle_timeout=0.2)
+        builder = Builder(secret=keypair.seed(), horizon=horizon, network='TESTNET')
+        builder.append_payment_op(Keypair.random().address().decode(), 1)
+        builder.sign()
+
+        # the transaction is found in the ledger, failed: a payment to a missing account
+        result_xdr = 'AAAAAAAAAGT/////AAAAAQAAAAAAAAAB////+wAAAAA='
+        horizon.transaction = lambda tx_hash: {'hash': tx_hash, 'ledger': 3, 'successful': False,
+                                               'envelope_xdr': builder.gen_xdr().decode(), 'result_xdr': result_xdr}
+        server.fail_next(504, method='POST')
+        with pytest.raises(HorizonError) as exc_info:
+            builder.submit()
+        assert exc_info.value.type == HorizonErrorType.TRANSACTION_FAILED
+        assert exc_info.value.extras.result_xdr == result_xdr
+        assert exc_info.value.extras.result_codes.transaction == TransactionResultCode.FAILED
+        assert exc_info.value.extras.result_codes.operations == [PaymentResultCode.NO_DESTINATION]
+        assert server.request_counts['POST /transactions'] == 1  # not resubmitted
@@ -0,0 +1,163 @@
+import pytest
+import threading
+import time
+
+from stellar_base.keypair import Keypair
+
+import kin
+from kin.stellar.builder import Builder
+from kin.stellar.fake_horizon import FakeHorizonServer, FakeNetwork
+from kin.stellar.horizon import Horizon, transaction_source
+from kin.stellar.horizon_pool import EndpointPool
+
+
+class Probe(object):
+    """Answers probes with configured ledgers, or raises configured errors."""
+    def __init__(self, **replies):
+        self.replies = replies
+
+    def __call__(self, uri):
+        reply = self.replies[uri]
+        if isinstance(reply, Exception):
+            raise reply
+        return {'history_latest_ledger': reply}
+
+
+def new_pool(probe, uris=('a', 'b', 'c')):
+    pool = EndpointPool(list(uris), probe, probe_interval=1000)
+    pool.close()
+    time.sleep(0.05)  # the first probe round
+    return pool
+
+
+def uris(endpoints):
+    return [endpoint.uri for endpoint in endpoints]
+
+
+def test_create():
+    with pytest.raises(ValueError, match='no horizon endpoints'):
+        EndpointPool([], Probe())
+    with pytest.raises(ValueError, match='no horizon endpoints'):
+        Horizon(horizon_uri=[])
+
+    horizon = Horizon(horizon_uri='http://a')
+    assert horizon.endpoint_pool is None
+    horizon = Horizon(horizon_uri=['http://a', 'http://b'])
+    assert horizon.horizon_uri == 'http://a'
+    assert uris(horizon.endpoint_pool.endpoints) == ['http://a', 'http://b']
+    horizon.close()
+
+
+def test_ranking():
+    pool = new_pool(Probe(a=10, b=12, c=11))
+    assert [e['ledger'] for e in pool.status()] == [10, 12, 11]
+
+    # lagging endpoints go last
+    for endpoint in pool.endpoints:
+        endpoint.latency = 0.1
+    pool.endpoints[1].latency = 0.2
+    assert uris(pool.ranked()) == ['c', 'b', 'a']
+
+    # the fastest of the fresh endpoints goes first
+    pool.endpoints[1].latency = 0.05
+    assert uris(pool.ranked()) == ['b', 'c', 'a']
+
+
+def test_ejection():
+    probe = Probe(a=10, b=10, c=10)
+    pool = new_pool(probe)
+    a = pool.endpoints[0]
+    for endpoint in pool.endpoints:
+        endpoint.latency = 0.1
+    pool.endpoints[2].latency = 10  # tried last
+
+    def read(uri):
+        if uri == 'a':
+            raise IOError('connection refused')
+        if uri == 'b':
+            return {'status': 503}
+        return {'uri': uri}
+
+    for _ in range(pool.max_failures):
+        assert pool.read(read) == {'uri': 'c'}
+    assert [e['ejected'] for e in pool.status()] == [True, True, False]
+    assert uris(pool.ranked()) == ['c', 'a', 'b']
+
+    # a failing probe keeps the endpoint out, a successful one brings it back
+    probe.replies['a'] = IOError('connection refused')
+    pool.probe_endpoint(a)
+    assert a.ejected
+    probe.replies['a'] = 10
+    pool.probe_endpoint(a)
+    assert not a.ejected
+    assert a.failures == 0
+
+    # when all fail, the last error is raised
+    with pytest.raises(IOError):
+        pool.read(lambda uri: read('a'))
+
+
+def test_sticky():
+    pool = new_pool(Probe(a=10, b=10, c=10))
+    for endpoint in pool.endpoints:
+        endpoint.latency = 0.1
+    assert pool.sticky('channel1').uri == 'a'
+    pool.endpoints[0].latency = 1
+    assert pool.sticky('channel1').uri == 'a'
+    assert pool.sticky('channel2').uri != 'a'
+
+    pool.endpoints[0].ejected = True
+    assert pool.sticky('channel1').uri != 'a'
+
+
+def test_failover():
+    network = FakeNetwork()
+    servers = [FakeHorizonServer(network=network).start() for _ in range(2)]
+    keypair = Keypair.random()
+    address = keypair.address().decode()
+    servers[0].fund(address)
+
+    horizon = Horizon(horizon_uri=[server.url for server in servers], num_retries=0, backoff_factor=0)
+    time.sleep(0.1)
+    assert all(e['ledger'] == network.ledger_sequence for e in horizon.endpoint_pool.status())
+
+    # submits of a source account go to the same endpoint
+    builder = Builder(secret=keypair.seed(), horizon=horizon, network='TESTNET', manage_sequence=True)
+    for _ in range(4):
+        builder.append_payment_op(address, 1)
+        builder.sign()
+        assert transaction_source(builder.gen_xdr()) == keypair.raw_public_key()
+        assert builder.submit()['hash']
+        builder.next()
+    counts = [server.request_counts['POST /transactions'] for server in servers]
+    assert sorted(counts) == [0, 4]
+
+    # a failing endpoint is ejected, the other one serves the reads
+    sticky = horizon.endpoint_pool.sticky(keypair.raw_public_key())
+    failing = servers[[server.url for server in servers].index(sticky.uri)]
+    failing.fail_next(503, count=100)
+    for endpoint in horizon.endpoint_pool.endpoints:
+        endpoint.latency = 0 if endpoint is sticky else 1  # tried first
+    for _ in range(horizon.endpoint_pool.max_failures):
+        assert horizon.account(address, use_cache=False)['id'] == address
+    assert sticky.ejected
+
+    # and the submits move to it
+    builder.append_payment_op(address, 1)
+    builder.sign()
+    assert builder.submit()['hash']
+    assert sum(server.request_counts['POST /transactions'] for server in servers) == 5
+
+    horizon.close()
+    for server in servers:
+        server.stop()
+
+
+def test_sdk_status():
+    with FakeHorizonServer() as server:
+        sdk = kin.SDK(horizon_endpoint_uri=[server.url, server.url + '/'])
+        time.sleep(0.1)
+        endpoints = sdk.get_status()['horizon']['endpoints']
+        assert [e['uri'] for e in endpoints] == [server.url, server.url + '/']
+        assert all(not e['ejected'] and e['latency'] is not None for e in endpoints)
+        sdk.horizon.close()
@@ -0,0 +1,170 @@
+from functools import partial
+import pytest
+import threading
+import time
+
+from stellar_base.asset import Asset
+from stellar_base.keypair import Keypair
+
+import kin
+from kin.stellar import journal as journal_module
+from kin.stellar.builder import Builder
+from kin.stellar.channel_manager import ChannelManager
+from kin.stellar.errors import *
+from kin.stellar.fake_horizon import FakeHorizonServer
+from kin.stellar.horizon import Horizon
+from kin.stellar.journal import TransactionJournal, APPLIED, REJECTED
+
+
+def test_record_resolve(tmpdir):
+    path = str(tmpdir.join('journal'))
+    journal = TransactionJournal(path)
+    with pytest.raises(ValueError):  # not shared
+        TransactionJournal(path)
+    journal.record('a', b'envelope a')
+    journal.record('b', 'envelope b')
+    journal.record('c', 'envelope c')
+    journal.resolve('b', APPLIED)
+    journal.resolve('x', APPLIED)  # not journaled
+    assert journal.pending() == {'a': 'envelope a', 'c': 'envelope c'}
+    assert journal.stats() == {'pending': 2, 'records': 4, 'syncs': 3}
+    journal.close()
+
+    # a record torn by a crash is skipped
+    with open(path, 'ab') as f:
+        f.write(b'{"hash": "d", "env')
+
+    # resolved transactions are dropped when reopened
+    journal = TransactionJournal(path)
+    assert journal.pending() == {'a': 'envelope a', 'c': 'envelope c'}
+    assert len(tmpdir.join('journal').readlines()) == 2
+    journal.resolve('a', REJECTED)
+    journal.close()
+    assert TransactionJournal(path).pending() == {'c': 'envelope c'}
+
+
+def test_group_commit(tmpdir, monkeypatch):
+    fsync = journal_module.os.fsync
+
+    def slow_fsync(fd):
+        time.sleep(0.05)
+        fsync(fd)
+    monkeypatch.setattr(journal_module.os, 'fsync', slow_fsync)
+
+    journal = TransactionJournal(str(tmpdir.join('journal')))
+    threads = [threading.Thread(target=journal.record, args=(str(i), 'envelope')) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # the transactions journaled while a sync was in progress shared the next sync
+    stats = journal.stats()
+    assert stats['records'] == 20
+    assert stats['syncs'] <= 3
+    journal.close()
+
+
+def test_channel_manager(fake_horizon, tmpdir, helpers):
+    journal = TransactionJournal(str(tmpdir.join('journal')))
+    base_key = helpers.funded_key(fake_horizon)
+    channel_manager = ChannelManager(base_key, [base_key], 'TESTNET', fake_horizon, journal=journal)
+
+    def send(address=None):
+        address = address or channel_manager.base_address
+        return channel_manager.send_transaction(lambda builder: partial(builder.append_payment_op, address, 1))
+
+    assert send()
+    fake_horizon.fail_next(TransactionResultCode.INSUFFICIENT_FEE)
+    with pytest.raises(HorizonError):
+        send()
+    with pytest.raises(HorizonError):
+        send(Keypair.random().address().decode())  # a missing account
+    assert journal.stats() == {'pending': 0, 'records': 6, 'syncs': 3}
+
+    # the outcome of a transaction whose submit failed is not known
+    fake_horizon.submit = lambda te, tx_hash=None: 1 / 0
+    with pytest.raises(ZeroDivisionError):
+        send()
+    assert journal.stats()['pending'] == 1
+    assert len(journal._abandoned) == 1
+
+
+def test_replay(tmpdir):
+    with FakeHorizonServer() as server:
+        keypair = Keypair.random()
+        address = keypair.address().decode()
+        server.fund(address)
+        horizon = Horizon(horizon_uri=server.url)
+
+        def sign(amount):
+            builder = Builder(secret=keypair.seed().decode(), horizon=horizon, network='TESTNET')
+            builder.append_payment_op(address, amount)
+            builder.sign()
+            return builder
+
+        # the process died waiting for the submit replies
+        journal = TransactionJournal(str(tmpdir.join('journal')))
+        applied = sign(1)
+        conflicting = sign(2)  # with the same sequence
+        for builder in (applied, conflicting):
+            journal.record(builder.hash(), builder.gen_xdr())
+        horizon.submit(applied.gen_xdr())
+        not_submitted = sign(3)
+        journal.record(not_submitted.hash(), not_submitted.gen_xdr())
+        journal.close()
+
+        journal = TransactionJournal(str(tmpdir.join('journal')))
+        sdk = kin.SDK(secret_key=keypair.seed().decode(), horizon_endpoint_uri=server.url, network='TESTNET',
+                      kin_asset=Asset.native(), journal=journal)
+        assert journal.replayed == {applied.hash(): APPLIED, conflicting.hash(): REJECTED,
+                                    not_submitted.hash(): APPLIED}
+        assert horizon.transaction(not_submitted.hash())
+        assert server.request_counts['POST /transactions'] == 3
+        assert sdk.get_status()['channels']['journal']['pending'] == 0
+
+        # a replay resolves nothing twice
+        assert journal.replay(horizon) == {}
+
+
+def test_abandon(tmpdir, monkeypatch):
+    with FakeHorizonServer() as server:
+        keypair = Keypair.random()
+        address = keypair.address().decode()
+        server.fund(address)
+        horizon = Horizon(horizon_uri=server.url)
+        path = str(tmpdir.join('journal'))
+        journal = TransactionJournal(path)
+        channel_manager = ChannelManager(keypair.seed().decode(), [keypair.seed().decode()], 'TESTNET', horizon,
+                                         journal=journal)
+
+        def send():
+            return channel_manager.send_transaction(lambda builder: partial(builder.append_payment_op, address, 1))
+
+        def fail_submit(apply):
+            def submit(te, tx_hash=None):
+                if apply:
+                    server.network.submit(te)
+                raise HorizonError({'type': HorizonErrorType.SERVER_OVER_CAPACITY, 'status': 503})
+            monkeypatch.setattr(horizon, 'submit', submit)
+
+        # the transaction got into the ledger although its submit failed
+        fail_submit(apply=True)
+        reply = send()
+        assert horizon.transaction(reply['hash'])
+        assert journal.stats()['pending'] == 0
+
+        # the sender is told that the transaction failed, and may send it again
+        fail_submit(apply=False)
+        with pytest.raises(HorizonError):
+            send()
+        assert journal.stats()['pending'] == 1
+        journal.close()
+
+        # an abandoned transaction is not resubmitted on replay
+        monkeypatch.undo()
+        journal = TransactionJournal(path)
+        tx_hash, = journal.pending()
+        assert journal.replay(horizon) == {tx_hash: REJECTED}
+        assert server.request_counts['POST /transactions'] == 0
+        journal.close()
@@ -0,0 +1,247 @@
+import pytest
+import threading
+import time
+
+from stellar_base.asset import Asset
+from stellar_base.keypair import Keypair
+
+import kin
+from kin.monitor import ACCOUNT_STREAMS, GLOBAL_STREAM
+from kin.stellar.builder import Builder
+from kin.stellar.horizon import Horizon
+
+
+@pytest.fixture
+def sdk(server):
+    keypair = Keypair.random()
+    server.fund(keypair.address().decode())
+    return kin.SDK(secret_key=keypair.seed().decode(), horizon_endpoint_uri=server.url, network='TESTNET',
+                   kin_asset=Asset.native())
+
+
+def test_add_remove(server, sdk, helpers):
+    addresses = helpers.random_addresses(4)
+    for address in addresses:
+        server.fund(address)
+
+    received = []
+    monitor = kin.TransactionMonitor(sdk.horizon, lambda address, tx_data: received.append((address, tx_data.memo)),
+                                     addresses[:1], only_payments=True, max_account_streams=2)
+    assert monitor.stats()['mode'] == ACCOUNT_STREAMS
+
+    sdk.send_native(addresses[0], 1, memo_text='a')
+    assert helpers.wait_for(lambda: received == [(addresses[0], 'a')])
+
+    # switched to the global stream
+    monitor.add_addresses(addresses[1:3])
+    stats = monitor.stats()
+    assert (stats['mode'], stats['streams'], stats['switches']) == (GLOBAL_STREAM, 1, 1)
+    sdk.send_native(addresses[2], 1, memo_text='b')
+    assert helpers.wait_for(lambda: received[-1:] == [(addresses[2], 'b')])
+
+    # and back to a stream per account
+    monitor.remove_addresses(addresses[:2])
+    stats = monitor.stats()
+    assert (stats['mode'], stats['streams'], stats['switches']) == (ACCOUNT_STREAMS, 1, 2)
+    sdk.send_native(addresses[0], 1, memo_text='c')
+    sdk.send_native(addresses[2], 1, memo_text='d')
+    assert helpers.wait_for(lambda: received[-1:] == [(addresses[2], 'd')])
+    assert received == [(addresses[0], 'a'), (addresses[2], 'b'), (addresses[2], 'd')]
+
+    with pytest.raises(ValueError, match='invalid address'):
+        monitor.add_addresses(['bad'])
+    monitor.stop()
+
+
+def test_remove_all(server, sdk, helpers):
+    address = helpers.random_addresses(1)[0]
+    server.fund(address)
+    received = []
+    monitor = kin.TransactionMonitor(sdk.horizon, lambda address, tx_data: received.append(tx_data.memo), [address],
+                                     only_payments=True)
+    sdk.send_native(address, 1, memo_text='a')
+    assert helpers.wait_for(lambda: received == ['a'])
+    cursor = int(monitor.stats()['cursor'])
+
+    # with no streams left, the position is kept
+    monitor.remove_addresses([address])
+    assert monitor.stats()['streams'] == 0
+    assert int(monitor.stats()['cursor']) == cursor
+
+    # and the stream of the account added again starts there, not at the initial position
+    monitor.add_addresses([address])
+    sdk.send_native(address, 1, memo_text='b')
+    assert helpers.wait_for(lambda: received[-1:] == ['b'])
+    assert received == ['a', 'b']
+    assert monitor.stats()['duplicates'] == 0
+    assert int(monitor.stats()['cursor']) > cursor
+    monitor.stop()
+
+
+def test_switch_behind(server, sdk, helpers):
+    # two addresses delivered by different workers
+    slow = helpers.random_addresses(1)[0]
+    fast = slow
+    while hash(fast) % 2 == hash(slow) % 2:
+        fast = helpers.random_addresses(1)[0]
+    other = helpers.random_addresses(1)[0]
+    for address in (slow, fast, other):
+        server.fund(address)
+    received = []
+    release = threading.Event()
+
+    def callback(address, tx_data):
+        if address == slow:
+            release.wait()
+        received.append(tx_data.memo)
+
+    monitor = kin.TransactionMonitor(sdk.horizon, callback, [slow, fast], only_payments=True, max_account_streams=2,
+                                     workers=2, queue_size=1)
+
+    # 'a' is in the callback, 'b' is queued, and the slow account stream waits to queue 'c', behind the other one
+    for memo in 'abcd':
+        sdk.send_native(slow, 1, memo_text=memo)
+    sdk.send_native(fast, 1, memo_text='e')
+    assert helpers.wait_for(lambda: received == ['e'])
+
+    # the global stream starts where the slow account stream was, and 'd' is not missed
+    monitor.add_addresses([other])
+    assert monitor.stats()['mode'] == GLOBAL_STREAM
+    release.set()
+    assert helpers.wait_for(lambda: sorted(received) == ['a', 'b', 'c', 'd', 'e'])
+    time.sleep(0.1)
+    assert received == ['e', 'a', 'b', 'c', 'd']
+    monitor.stop()
+
+
+def test_deliver_once(server, sdk, helpers):
+    addresses = helpers.random_addresses(2)
+    for address in addresses:
+        server.fund(address)
+
+    received = []
+    monitor = sdk.monitor_accounts_kin_payments(addresses, lambda address, tx_data: received.append(tx_data.memo))
+    assert monitor.stats()['streams'] == 2
+
+    # a transaction of both accounts is seen on both streams
+    keypair = Keypair.random()
+    server.fund(keypair.address().decode())
+    builder = Builder(secret=keypair.seed().decode(), horizon=Horizon(horizon_uri=server.url), network='TESTNET')
+    for address in addresses:
+        builder.append_payment_op(address, 1)
+    builder.add_text_memo('both')
+    builder.sign()
+    builder.submit()
+    sdk.send_native(addresses[0], 1, memo_text='one')
+
+    assert helpers.wait_for(lambda: 'one' in received and monitor.stats()['duplicates'] == 1)
+    assert sorted(received) == ['both', 'one']
+    monitor.stop()
+
+
+def test_stop(server, sdk, helpers):
+    address = helpers.random_addresses(1)[0]
+    server.fund(address)
+    received = []
+    monitor = sdk.monitor_kin_payments(lambda address, tx_data: received.append(tx_data.memo))
+    threads = [stream.thread for stream in monitor._streams.values()]
+    assert len(threads) == 1
+
+    monitor.stop()
+    assert monitor.stats()['streams'] == 0
+    assert helpers.wait_for(lambda: not threads[0].is_alive())
+    sdk.send_native(address, 1, memo_text='late')  # from the monitored wallet
+    time.sleep(0.2)
+    assert received == []
+
+
+def test_workers(server, sdk, helpers):
+    # two addresses delivered by different workers
+    slow = helpers.random_addresses(1)[0]
+    fast = slow
+    while hash(fast) % 2 == hash(slow) % 2:
+        fast = helpers.random_addresses(1)[0]
+    for address in (slow, fast):
+        server.fund(address)
+
+    received = []
+
+    def callback(address, tx_data):
+        if address == slow:
+            time.sleep(0.2)
+        received.append(tx_data.memo)
+
+    monitor = kin.TransactionMonitor(sdk.horizon, callback, [slow, fast], only_payments=True, workers=2)
+    sdk.send_native(slow, 1, memo_text='slow 1')
+    sdk.send_native(slow, 1, memo_text='slow 2')
+    sdk.send_native(fast, 1, memo_text='fast')
+    assert helpers.wait_for(lambda: len(received) == 3)
+
+    # a slow callback does not hold up the other addresses, and an address is delivered in order
+    assert received == ['fast', 'slow 1', 'slow 2']
+    stats = monitor.stats()
+    assert stats['workers'] == 2
+    assert stats['max_callback_time'] >= 0.2
+    assert stats['callback_time'] >= 0.4
+    monitor.stop()
+
+
+class MemoryCheckpoint(object):
+    def __init__(self):
+        self.cursor = None
+
+    def load(self):
+        return self.cursor
+
+    def save(self, cursor):
+        self.cursor = cursor
+
+
+def test_backpressure(server, sdk, helpers):
+    address = helpers.random_addresses(1)[0]
+    server.fund(address)
+    received = []
+    release = threading.Event()
+
+    def callback(address, tx_data):
+        release.wait()
+        received.append(tx_data.memo)
+
+    checkpoint = MemoryCheckpoint()
+    monitor = kin.TransactionMonitor(sdk.horizon, callback, [address], only_payments=True, workers=1, queue_size=1,
+                                     checkpoint=checkpoint, checkpoint_events=1)
+    tokens = [sdk.horizon.transaction(sdk.send_native(address, 1, memo_text=memo))['paging_token'] for memo in 'abc']
+
+    # 'a' is in the callback, 'b' is queued, and the stream waits to queue 'c'
+    assert helpers.wait_for(lambda: monitor.stats()['cursor'] == tokens[1])
+    time.sleep(0.1)
+    stats = monitor.stats()
+    assert (stats['cursor'], stats['queued'], stats['max_queued']) == (tokens[1], 1, 1)
+    assert checkpoint.cursor == str(int(tokens[0]) - 1)  # 'a' is not processed yet
+
+    release.set()
+    assert helpers.wait_for(lambda: received == ['a', 'b', 'c'])
+    monitor.stop()
+    assert checkpoint.cursor == tokens[2]
+
+
+def test_stop_from_worker(server, sdk, helpers):
+    address = helpers.random_addresses(1)[0]
+    server.fund(address)
+    received = []
+
+    def callback(address, tx_data):
+        if tx_data.memo == 'a':
+            # stopped by the only worker, while its queue is full
+            assert helpers.wait_for(lambda: monitor.stats()['queued'] == 1)
+            monitor.stop()
+        received.append(tx_data.memo)
+
+    monitor = kin.TransactionMonitor(sdk.horizon, callback, [address], only_payments=True, workers=1, queue_size=1)
+    for memo in 'abc':
+        sdk.send_native(address, 1, memo_text=memo)
+
+    # the queued transaction is delivered, and the worker stops
+    assert helpers.wait_for(lambda: received[:2] == ['a', 'b'])
+    assert helpers.wait_for(lambda: not monitor._workers[0].is_alive())
+
@@ -0,0 +1,176 @@
+import pytest
+import threading
+import time
+
+from stellar_base.asset import Asset
+from stellar_base.keypair import Keypair
+
+import kin
+from kin.payment_batcher import PaymentBatcher, MAX_BATCH_SIZE
+from kin.stellar.channel_manager import ChannelManager
+
+
+@pytest.fixture
+def channel_manager(fake_horizon, helpers):
+    base_key = helpers.funded_key(fake_horizon)
+    channel_keys = [helpers.funded_key(fake_horizon), helpers.funded_key(fake_horizon)]
+    return ChannelManager(base_key, channel_keys, 'TESTNET', fake_horizon)
+
+
+def new_address(fake_horizon):
+    address = Keypair.random().address().decode()
+    fake_horizon.fund(address)
+    return address
+
+
+def test_create_fail(channel_manager):
+    with pytest.raises(ValueError, match='batch size must be between 1 and 100'):
+        PaymentBatcher(channel_manager, max_batch_size=0)
+    with pytest.raises(ValueError, match='batch size must be between 1 and 100'):
+        PaymentBatcher(channel_manager, max_batch_size=MAX_BATCH_SIZE + 1)
+
+
+def test_flush_on_size(channel_manager, fake_horizon):
+    batcher = PaymentBatcher(channel_manager, max_batch_size=10, max_latency=60)
+    futures = [batcher.submit(Asset.native(), new_address(fake_horizon), 1) for _ in range(20)]
+
+    tx_hashes = [future.result(5) for future in futures]
+    assert len(set(tx_hashes)) == 2
+    assert fake_horizon.submit_calls == 2
+    assert [len(tx.operations) for tx in fake_horizon.submitted] == [10, 10]
+
+
+def test_flush_on_latency(channel_manager, fake_horizon):
+    batcher = PaymentBatcher(channel_manager, max_batch_size=10, max_latency=0.1)
+    futures = [batcher.submit(Asset.native(), new_address(fake_horizon), 1) for _ in range(3)]
+
+    tx_hashes = [future.result(5) for future in futures]
+    assert len(set(tx_hashes)) == 1
+    assert len(fake_horizon.submitted[0].operations) == 3
+
+
+def test_same_payments(channel_manager, fake_horizon):
+    batcher = PaymentBatcher(channel_manager, max_batch_size=2, max_latency=60)
+    address = new_address(fake_horizon)
+    futures = [batcher.submit(Asset.native(), address, 1) for _ in range(2)]
+    assert futures[0].result(5) == futures[1].result(5)
+    assert len(fake_horizon.submitted[0].operations) == 2
+
+
+def test_memo_batches(channel_manager, fake_horizon):
+    batcher = PaymentBatcher(channel_manager, max_batch_size=2, max_latency=60)
+    futures = [batcher.submit(Asset.native(), new_address(fake_horizon), 1, memo_text=memo)
+               for memo in ['a', 'b', 'a', 'b']]
+
+    tx_hashes = [future.result(5) for future in futures]
+    assert tx_hashes[0] == tx_hashes[2]
+    assert tx_hashes[1] == tx_hashes[3]
+    assert tx_hashes[0] != tx_hashes[1]
+    assert sorted(tx.memo for tx in fake_horizon.submitted) == ['a', 'b']
+
+
+def test_priority_batches(channel_manager, fake_horizon):
+    batcher = PaymentBatcher(channel_manager, max_batch_size=2, max_latency=60)
+    futures = [batcher.submit(Asset.native(), new_address(fake_horizon), 1, priority=priority)
+               for priority in [kin.PRIORITY_LOW, kin.PRIORITY_HIGH, kin.PRIORITY_LOW, kin.PRIORITY_HIGH]]
+
+    tx_hashes = [future.result(5) for future in futures]
+    assert tx_hashes[0] == tx_hashes[2]
+    assert tx_hashes[1] == tx_hashes[3]
+    assert tx_hashes[0] != tx_hashes[1]
+    stats = channel_manager.stats()['priorities']
+    assert stats['low']['sends'] == stats['high']['sends'] == 1
+
+
+def test_failed_payments(channel_manager, fake_horizon):
+    batcher = PaymentBatcher(channel_manager, max_batch_size=4, max_latency=60)
+    missing = [Keypair.random().address().decode() for _ in range(2)]
+    addresses = [new_address(fake_horizon), missing[0], new_address(fake_horizon), missing[1]]
+    futures = [batcher.submit(Asset.native(), address, 1) for address in addresses]
+
+    # failed payments get their own errors
+    for i in [1, 3]:
+        with pytest.raises(kin.AccountNotFoundError) as exc_info:
+            futures[i].result(5)
+        assert exc_info.value.error_code == kin.PaymentResultCode.NO_DESTINATION
+
+    # the rest are resent in a separate transaction
+    assert futures[0].result(5) == futures[2].result(5)
+    assert fake_horizon.submit_calls == 2
+    assert len(fake_horizon.submitted[0].operations) == 2
+
+
+def test_failed_transaction(channel_manager, fake_horizon):
+    batcher = PaymentBatcher(channel_manager, max_batch_size=2, max_latency=60)
+    fake_horizon.fail_next(kin.TransactionResultCode.INSUFFICIENT_FEE)
+    futures = [batcher.submit(Asset.native(), new_address(fake_horizon), 1) for _ in range(2)]
+
+    errors = []
+    for future in futures:
+        with pytest.raises(kin.RequestError) as exc_info:
+            future.result(5)
+        assert exc_info.value.error_code == kin.TransactionResultCode.INSUFFICIENT_FEE
+        errors.append(exc_info.value)
+    # every caller gets its own error, and gets it again
+    assert errors[0] is not errors[1]
+    assert str(errors[0]) == str(errors[1]) == str(pytest.raises(kin.RequestError, futures[0].result, 5).value)
+
+
+def test_channels_busy(channel_manager, fake_horizon, monkeypatch):
+    monkeypatch.setattr(kin.stellar.channel_manager, 'CHANNEL_QUEUE_TIMEOUT', 0.1)
+    batcher = PaymentBatcher(channel_manager, max_batch_size=1, max_latency=60)
+    channel_manager.channel_builders.drain()  # all the channels are busy
+    future = batcher.submit(Asset.native(), new_address(fake_horizon), 1)
+
+    with pytest.raises(kin.ThrottleError):
+        future.result(5)
+    assert fake_horizon.submit_calls == 0
+
+
+def test_result_timeout(channel_manager, fake_horizon):
+    batcher = PaymentBatcher(channel_manager, max_batch_size=2, max_latency=60)
+    future = batcher.submit(Asset.native(), new_address(fake_horizon), 1)
+    assert not future.done()
+    with pytest.raises(kin.SdkError, match='payment not completed in time'):
+        future.result(0.1)
+
+
+def test_slow_submit(server, monkeypatch):
+    keypair = Keypair.random()
+    server.fund(keypair.address().decode())
+    sdk = kin.SDK(secret_key=keypair.seed().decode(), horizon_endpoint_uri=server.url, network='TESTNET',
+                  kin_asset=Asset.native(), batch_payments=True)
+    sdk.payment_batcher.max_latency = 0.05
+    monkeypatch.setattr(kin.stellar.channel_manager, 'CHANNEL_QUEUE_TIMEOUT', 0.05)
+    sdk.horizon.request_timeout, sdk.horizon.num_retries, sdk.horizon.settle_timeout = 0.1, 0, 0
+    submit = sdk.horizon.submit
+
+    def slow_submit(te, tx_hash=None):
+        time.sleep(0.5)
+        return submit(te, tx_hash)
+    monkeypatch.setattr(sdk.horizon, 'submit', slow_submit)
+
+    # the submit outlasts the batch latency, the channel wait and the request timeout together,
+    # and the payment is still waited for
+    address = Keypair.random().address().decode()
+    server.fund(address)
+    tx_hash = sdk.send_native(address, 1)
+    assert sdk.horizon.transaction(tx_hash)['hash'] == tx_hash
+
+
+def test_concurrent_payments(channel_manager, fake_horizon):
+    batcher = PaymentBatcher(channel_manager, max_batch_size=MAX_BATCH_SIZE, max_latency=0.1)
+    tx_hashes = []
+
+    def pay():
+        tx_hashes.append(batcher.submit(Asset.native(), new_address(fake_horizon), 1).result(5))
+
+    threads = [threading.Thread(target=pay) for _ in range(250)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(tx_hashes) == 250
+    assert sum(len(tx.operations) for tx in fake_horizon.submitted) == 250
+    assert all(len(tx.operations) <= MAX_BATCH_SIZE for tx in fake_horizon.submitted)
@@ -0,0 +1,192 @@
+import pytest
+from time import sleep
+
+from stellar_base.asset import Asset
+from stellar_base.keypair import Keypair
+
+import kin
+from kin.stellar.errors import *
+from kin.stellar.horizon import Horizon
+from kin.stellar.query_cache import QueryCache, PermanentCache, endpoint
+
+
+def new_address(server):
+    address = Keypair.random().address().decode()
+    server.fund(address)
+    return address
+
+
+def test_create():
+    cache = QueryCache()
+    assert cache.ttl('/accounts/address') == 5
+    assert cache.ttl('/accounts/address/payments/') == 0
+    assert cache.stats() == {'size': 0, 'max_size': 10000, 'hits': 0, 'misses': 0, 'evictions': 0}
+
+    with pytest.raises(ValueError, match='cache size must be positive'):
+        QueryCache(max_size=0)
+
+
+def test_endpoint():
+    assert endpoint('') == '/'
+    assert endpoint('/transactions/') == '/transactions'
+    assert endpoint('/accounts/address') == '/accounts/{id}'
+    assert endpoint('/accounts/address/payments/') == '/accounts/{id}/payments'
+    assert endpoint('/ledgers/10/operations/') == '/ledgers/{id}/operations'
+
+
+def test_get_put():
+    cache = QueryCache(ttls={'/accounts/{id}': 5, '/accounts/{id}/payments': 5})
+    assert cache.get('/accounts/a') is None
+    cache.put('/accounts/a', {'id': 'a'})
+    cache.put('/accounts/a/payments/', {'records': 1}, params={'order': 'desc', 'limit': 2})
+    cache.put('/ledgers/1', {'sequence': 1})  # not cached
+
+    assert cache.get('/accounts/a') == {'id': 'a'}
+    assert cache.get('/accounts/a/payments', params={'limit': 2, 'order': 'desc'}) == {'records': 1}
+    assert cache.get('/accounts/a/payments') is None
+    assert cache.get('/ledgers/1') is None
+    assert cache.stats() == {'size': 2, 'max_size': 10000, 'hits': 2, 'misses': 2, 'evictions': 0}
+
+    # cached replies are copies
+    cache.get('/accounts/a')['id'] = 'b'
+    assert cache.get('/accounts/a') == {'id': 'a'}
+
+
+def test_expiration():
+    cache = QueryCache(ttls={'/accounts/{id}': 0.1, '/ledgers/{id}': 10})
+    cache.put('/accounts/a', {'id': 'a'})
+    cache.put('/ledgers/1', {'sequence': 1})
+    sleep(0.1)
+    assert cache.get('/accounts/a') is None
+    assert cache.get('/ledgers/1') == {'sequence': 1}
+    assert cache.stats()['size'] == 1
+
+
+def test_lru():
+    cache = QueryCache(max_size=2)
+    cache.put('/accounts/a', {'id': 'a'})
+    cache.put('/accounts/b', {'id': 'b'})
+    assert cache.get('/accounts/a')
+    cache.put('/accounts/c', {'id': 'c'})
+
+    assert cache.get('/accounts/b') is None
+    assert cache.get('/accounts/a')
+    assert cache.get('/accounts/c')
+    assert cache.stats()['evictions'] == 1
+
+
+def test_invalidate():
+    cache = QueryCache(default_ttl=5)
+    cache.put('/accounts/a', {'id': 'a'})
+    cache.put('/accounts/a/payments', {'records': 1})
+    cache.put('/accounts/b', {'id': 'b'})
+
+    version = cache.version
+    cache.invalidate('/accounts/a/')
+    assert cache.get('/accounts/a') is None
+    assert cache.get('/accounts/a/payments') is None
+    assert cache.get('/accounts/b')
+
+    # a reply requested before the invalidation is stale
+    cache.put('/accounts/a', {'id': 'a'}, version=version)
+    cache.put('/accounts/b/payments', {'records': 2}, version=version)
+    assert cache.get('/accounts/a') is None
+    assert cache.get('/accounts/b/payments')
+
+    cache.clear()
+    cache.put('/accounts/b', {'id': 'b'}, version=version + 1)
+    assert cache.stats()['size'] == 0
+
+
+def test_horizon(server):
+    address = new_address(server)
+    cache = QueryCache()
+    horizon = Horizon(horizon_uri=server.url, cache=cache)
+
+    assert horizon.account(address) == horizon.account(address)
+    assert server.request_counts['GET /accounts/{id}'] == 1
+    assert horizon.account(address, use_cache=False)
+    assert server.request_counts['GET /accounts/{id}'] == 2
+    assert cache.stats()['hits'] == 1
+
+    # errors are not cached
+    missing = Keypair.random().address().decode()
+    for _ in range(2):
+        with pytest.raises(HorizonError):
+            horizon.account(missing)
+    assert server.request_counts['GET /accounts/{id}'] == 4
+
+    horizon.invalidate_account(address)
+    horizon.account(address)
+    assert server.request_counts['GET /accounts/{id}'] == 5
+
+
+def test_sdk_invalidation(server):
+    keypair = Keypair.random()
+    server.fund(keypair.address().decode())
+    cache = QueryCache()
+    sdk = kin.SDK(secret_key=keypair.seed().decode(), horizon_endpoint_uri=server.url, network='TESTNET',
+                  kin_asset=Asset.native(), query_cache=cache)
+    address = new_address(server)
+
+    balance = sdk.get_native_balance()
+    assert sdk.get_account_native_balance(address) == 10000
+    assert sdk.get_account_native_balance(address) == 10000
+    count = server.request_counts['GET /accounts/{id}']
+
+    sdk.send_native(address, 10)
+    assert sdk.get_account_native_balance(address) == 10010
+    assert sdk.get_native_balance() < balance - 10
+
+    new = Keypair.random().address().decode()
+    assert not sdk.check_account_exists(new)
+    sdk.create_account(new)
+    assert sdk.check_account_exists(new)
+
+    assert sdk.get_status()['cache']['hits'] == 2
+    # the sends fetched the channel sequence once, bypassing the cache
+    assert server.request_counts['GET /accounts/{id}'] == count + 5
+
+
+def test_permanent_cache(tmpdir):
+    path = str(tmpdir.join('cache.db'))
+    cache = PermanentCache(max_size=1, path=path)
+    assert cache.cacheable('/transactions/hash')
+    assert cache.cacheable('/transactions/hash/operations/')
+    assert cache.cacheable('/ledgers/1')
+    assert cache.cacheable('/operations/1')
+    assert not cache.cacheable('/transactions/')
+    assert not cache.cacheable('/accounts/address')
+
+    cache.put('/accounts/address', {'id': 'address'})
+    assert cache.get('/accounts/address') is None
+
+    cache.put('/transactions/a', {'hash': 'a'})
+    cache.put('/transactions/a/operations', {'records': 1}, params={'limit': 100})
+    assert cache.get('/transactions/a/operations', params={'limit': 100}) == {'records': 1}
+    assert cache.get('/transactions/a/operations') is None
+    assert cache.get('/transactions/a') == {'hash': 'a'}  # evicted from memory, found in the database
+    assert cache.stats() == {'size': 1, 'max_size': 1, 'hits': 1, 'disk_hits': 1, 'misses': 1, 'evictions': 2}
+    cache.close()
+
+    # survives restarts
+    cache = PermanentCache(path=path)
+    assert cache.get('/transactions/a') == {'hash': 'a'}
+    cache.close()
+
+
+def test_permanent_cache_sdk(server, tmpdir):
+    address = new_address(server)
+    tx_hash = Horizon(horizon_uri=server.url).account_transactions(address)['_embedded']['records'][0]['hash']
+
+    for _ in range(2):
+        cache = PermanentCache(path=str(tmpdir.join('cache.db')))
+        sdk = kin.SDK(horizon_endpoint_uri=server.url, permanent_cache=cache)
+        for _ in range(2):
+            tx_data = sdk.get_transaction_data(tx_hash)
+            assert tx_data.hash == tx_hash
+            assert tx_data.operations[0].type == 'create_account'
+        cache.close()
+    assert server.request_counts['GET /transactions/{id}'] == 1
+    assert server.request_counts['GET /transactions/{id}/operations'] == 1
+    assert sdk.get_status()['permanent_cache']['disk_hits'] == 2
@@ -120,6 +120,8 @@ def test_get_status(setup, test_sdk):
     assert status['channels']
     assert status['channels']['all'] == 1
     assert status['channels']['free'] == 1
+    assert status['channels']['health'][0]['address'] == setup.sdk_keypair.address().decode()
+    assert status['channels']['health'][0]['quarantined'] == 0
     assert status['transport']
     assert status['transport']['pool_size'] == sdk.horizon.pool_size
     assert status['transport']['num_retries'] == sdk.horizon.num_retries
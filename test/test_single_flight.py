@@ -0,0 +1,83 @@
+import pytest
+import threading
+import time
+
+from kin.stellar.single_flight import SingleFlight
+
+
+def call_all(single_flight, key, fn, count):
+    results = [None] * count
+
+    def call(i):
+        try:
+            results[i] = single_flight.do(key, fn)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def test_coalesce():
+    single_flight = SingleFlight()
+    release = threading.Event()
+
+    def fn():
+        release.wait()
+        return {'id': 'a'}
+
+    threads, results = call_all(single_flight, 'key', fn, 10)
+    time.sleep(0.1)
+    assert single_flight.stats() == {'calls': 1, 'coalesced': 9, 'in_flight': 1}
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert results == [{'id': 'a'}] * 10
+    assert len(set(id(result) for result in results)) == 10  # everybody got a copy
+    assert single_flight.stats() == {'calls': 1, 'coalesced': 9, 'in_flight': 0}
+
+    # the next call is a new one
+    assert single_flight.do('key', lambda: 1) == 1
+    assert single_flight.do('other', lambda: 2) == 2
+    assert single_flight.stats()['calls'] == 3
+
+
+def test_error():
+    single_flight = SingleFlight()
+    release = threading.Event()
+
+    def fn():
+        release.wait()
+        raise ValueError('failed')
+
+    threads, results = call_all(single_flight, 'key', fn, 5)
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+    assert all(isinstance(result, ValueError) for result in results)
+    assert single_flight.stats() == {'calls': 1, 'coalesced': 4, 'in_flight': 0}
+
+
+def test_forget():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    values = iter(['old', 'new'])
+
+    def fn():
+        value = next(values)
+        if value == 'old':
+            release.wait()
+        return value
+
+    threads, results = call_all(single_flight, 'key', fn, 2)
+    time.sleep(0.1)
+    single_flight.forget(lambda key: key == 'key')
+    assert single_flight.do('key', fn) == 'new'
+    release.set()
+    for t in threads:
+        t.join()
+    assert results == ['old', 'old']
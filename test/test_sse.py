@@ -0,0 +1,92 @@
+import json
+import threading
+
+from stellar_base.keypair import Keypair
+
+from kin.stellar.fake_horizon import FakeHorizonServer
+from kin.stellar.sse import EventStream, parse_events, _shutdown
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_parse_events():
+    data = (b'retry: 1000\nevent: open\ndata: "hello"\n\n'
+            b': keep-alive\n\n'
+            b'id: 1\ndata: {"a":\ndata:1}\n\n'
+            b'id: 2\r\ndata:no space\r\n\r\n'
+            b'id: 3\rdata: \xd7\xa9\r\r'
+            b'retry: soon\nid: 4\n\n'
+            b'data: incomplete\n')
+    expected = [('open', '"hello"', None, 1000), ('message', None, None, None), ('message', '{"a":\n1}', '1', None),
+                ('message', 'no space', '2', None), ('message', u'\u05e9', '3', None), ('message', None, '4', None)]
+
+    # events and lines split anywhere between the chunks, \r\n included
+    for size in (1, 2, 3, 7, len(data)):
+        events = [(e.event, e.data, e.id, e.retry) for e in parse_events(split(data, size))]
+        assert events == expected
+
+
+def test_stream(monkeypatch, helpers):
+    monkeypatch.setattr('kin.stellar.sse.backoff_time', lambda factor, retries: 0)
+    with FakeHorizonServer() as server:
+        received = []
+
+        def hashes(n):
+            return [tx_hash for tx_hash in received if tx_hash][:n]
+
+        def read(stream):
+            for event in stream:
+                record = json.loads(event.data)
+                received.append(record['hash'] if isinstance(record, dict) else None)
+
+        stream = EventStream(server.url + '/transactions', params={'cursor': 'now'}, read_timeout=None)
+        thread = threading.Thread(target=read, args=(stream,))
+        thread.daemon = True
+        thread.start()
+
+        server.fund(Keypair.random().address().decode())
+        assert helpers.wait_for(lambda: len(hashes(2)) == 1)
+        last_id = stream.last_id
+
+        # a broken stream is reopened after the last event, and no transaction is missed or seen twice
+        _shutdown(stream.resp)
+        server.fund(Keypair.random().address().decode())
+        assert helpers.wait_for(lambda: len(hashes(3)) == 2)
+        assert stream.reconnects == 1
+        assert int(stream.last_id) > int(last_id)
+        assert received.count(None) == 2  # the open event, once per connection
+        assert len(set(hashes(3))) == 2
+
+        stream.close()
+        thread.join(5)
+        assert not thread.is_alive()
+        assert stream.closed
+
+
+def test_read_timeout(monkeypatch, helpers):
+    monkeypatch.setattr('kin.stellar.sse.backoff_time', lambda factor, retries: 0)
+    with FakeHorizonServer() as server:
+        server.fund(Keypair.random().address().decode())
+        received = []
+
+        def read(stream):
+            for event in stream:
+                if event.id:
+                    received.append(json.loads(event.data)['hash'])
+
+        # the server is silent for longer than the timeout, the stream is reopened after the last event
+        stream = EventStream(server.url + '/transactions', read_timeout=0.2)
+        thread = threading.Thread(target=read, args=(stream,))
+        thread.daemon = True
+        thread.start()
+        assert helpers.wait_for(lambda: len(received) == 1)
+        assert helpers.wait_for(lambda: stream.reconnects >= 2)
+
+        server.fund(Keypair.random().address().decode())
+        assert helpers.wait_for(lambda: len(received) == 2)
+        stream.close()
+        thread.join(5)
+        assert not thread.is_alive()
+        assert len(set(received)) == 2
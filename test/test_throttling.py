@@ -0,0 +1,174 @@
+import pytest
+import time
+
+from stellar_base.keypair import Keypair
+
+import kin
+from kin.stellar.builder import Builder
+from kin.stellar.errors import *
+from kin.stellar.fake_horizon import FakeHorizonServer
+from kin.stellar.horizon import Horizon
+from kin.stellar.throttling import RateLimiter, CircuitBreaker, JitteredRetry, backoff_time
+
+
+class Reply(object):
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def test_backoff_time():
+    assert backoff_time(0, 5) == 0
+    waits = [backoff_time(1, 3) for _ in range(100)]
+    assert all(0 <= wait <= 8 for wait in waits)
+    assert len(set(waits)) > 1  # jittered
+    assert backoff_time(1, 100) <= 120
+
+    retry = JitteredRetry(total=5, backoff_factor=1).increment(method='GET').increment(method='GET')
+    assert 0 <= retry.get_backoff_time() <= 2
+    assert isinstance(retry, JitteredRetry)
+
+
+def test_rate_limiter():
+    with pytest.raises(ValueError, match='rate must be positive'):
+        RateLimiter(rate=0)
+
+    # no limit until one is known
+    limiter = RateLimiter()
+    start = time.time()
+    for _ in range(100):
+        limiter.acquire()
+    assert time.time() - start < 0.1
+
+    # a burst, then the rate
+    limiter = RateLimiter(rate=50, burst=5)
+    start = time.time()
+    for _ in range(10):
+        limiter.acquire()
+    assert 0.08 < time.time() - start < 0.2
+    assert limiter.stats() == {'rate': 50, 'waits': 5}
+
+
+def test_rate_limiter_headers():
+    limiter = RateLimiter(burst=1)
+    limiter.update(Reply(headers={'X-Ratelimit-Remaining': '20', 'X-Ratelimit-Reset': '2'}))
+    assert limiter.rate == 10
+
+    # nothing remaining, wait for the reset
+    limiter.update(Reply(headers={'X-Ratelimit-Remaining': '0', 'X-Ratelimit-Reset': '1'}))
+    start = time.time()
+    limiter.acquire()
+    assert time.time() - start > 0.9
+
+    limiter.update(Reply(429, headers={'Retry-After': '1'}))
+    start = time.time()
+    limiter.acquire()
+    assert time.time() - start > 0.9
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+    breaker.before_request()
+    breaker.record_reply(Reply(503))
+    breaker.record(True)  # resets the consecutive failures
+    breaker.record_reply(None)
+    breaker.record_reply(Reply(429))
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+    # a single probe after the timeout
+    time.sleep(0.1)
+    breaker.before_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    breaker.record_reply(Reply(504))
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.1)
+    breaker.before_request()
+    breaker.record_reply(Reply(404))  # not an overload
+    assert breaker.stats() == {'state': 'closed', 'failures': 0, 'rejected': 2}
+    breaker.before_request()
+
+    err = kin.errors.translate_error(CircuitOpenError())
+    assert isinstance(err, kin.ServerError)
+    assert err.error_code == 'circuit_open'
+
+
+def build(server, horizon):
+    keypair = Keypair.random()
+    address = keypair.address().decode()
+    server.fund(address)
+    builder = Builder(secret=keypair.seed(), horizon=horizon, network='TESTNET')
+    builder.append_payment_op(address, 1)
+    builder.sign()
+    return builder.gen_xdr()
+
+
+def test_submit_retries(server):
+    horizon = Horizon(horizon_uri=server.url, num_retries=2, backoff_factor=0.01)
+
+    # overload replies are retried
+    server.fail_next(504, method='POST')
+    server.fail_next(429, method='POST')
+    assert horizon.submit(build(server, horizon))['hash']
+    assert server.request_counts['POST /transactions'] == 3
+
+    # until the retries are exhausted, raising the last error
+    server.fail_next(503, count=3, method='POST')
+    with pytest.raises(HorizonError) as exc_info:
+        horizon.submit(build(server, horizon))
+    assert exc_info.value.type == HorizonErrorType.SERVER_OVER_CAPACITY
+    assert server.request_counts['POST /transactions'] == 6
+
+
+def test_horizon_rate_limit():
+    with FakeHorizonServer(rate_limit=5, rate_limit_window=1) as server:
+        limiter = RateLimiter()
+        horizon = Horizon(horizon_uri=server.url, num_retries=0, rate_limiter=limiter)
+        address = Keypair.random().address().decode()
+        server.fund(address)
+
+        # never over the limit
+        start = time.time()
+        for _ in range(8):
+            assert horizon.account(address)['id'] == address
+        assert time.time() - start > 0.5
+        assert limiter.waits > 0
+
+
+def test_horizon_circuit_breaker(server):
+    address = Keypair.random().address().decode()
+    server.fund(address)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.2)
+    horizon = Horizon(horizon_uri=server.url, num_retries=0, circuit_breaker=breaker)
+
+    server.fail_next(503, count=2)
+    for _ in range(2):
+        with pytest.raises(HorizonError) as exc_info:
+            horizon.account(address)
+        assert exc_info.value.type == HorizonErrorType.SERVER_OVER_CAPACITY
+    with pytest.raises(CircuitOpenError):
+        horizon.account(address)
+    assert server.request_counts['GET /accounts/{id}'] == 2
+
+    # fails fast, without a request
+    with pytest.raises(CircuitOpenError):
+        horizon.submit('te')
+    assert server.request_counts['POST /transactions'] == 0
+
+    time.sleep(0.2)
+    assert horizon.account(address)['id'] == address
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_sdk_status(server):
+    limiter = kin.RateLimiter(rate=100)
+    breaker = kin.CircuitBreaker()
+    sdk = kin.SDK(horizon_endpoint_uri=server.url, rate_limiter=limiter, circuit_breaker=breaker)
+    status = sdk.get_status()
+    assert status['transport']['retry_statuses'] == [413, 429, 503, 504]
+    assert status['transport']['rate_limiter'] == {'rate': 100, 'waits': 0}
+    assert status['transport']['circuit_breaker'] == {'state': 'closed', 'failures': 0, 'rejected': 0}